@@ -0,0 +1,33 @@
+"""
+Rebuild the trigram search index for all models that define [trigram_fields].
+
+Usage:  python manage.py rebuild_trigrams [--model seeker.canwit]
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+# ======= imports from my own application ======
+from lila.basic.utils import ErrHandle
+from lila.basic.models import SearchTrigram
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trigram index used by wildcard searches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help="Only rebuild this model (label like 'seeker.canwit')")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            if options['model']:
+                lst_model = [apps.get_model(x) for x in options['model']]
+            else:
+                lst_model = [x for x in apps.get_models() if len(getattr(x, "trigram_fields", [])) > 0]
+            for model in lst_model:
+                count = SearchTrigram.rebuild(model)
+                oErr.Status("rebuild_trigrams: {} object(s) of {} indexed".format(count, model._meta.label_lower))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("rebuild_trigrams")
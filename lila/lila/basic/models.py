@@ -3,18 +3,27 @@
 """
 from django.db import models, transaction
 from django.contrib.auth.models import User, Group
-from django.db.models import Q
+from django.core.cache import cache
+from django.db.models import Q, Count
+from django.db.models.signals import post_save, post_delete, m2m_changed, class_prepared
 from django.db.models.functions import Lower
 from django.db.models.query import QuerySet 
 from django.utils import timezone
 
 import json
+import hashlib
+import re
 
 # provide error handling
 from .utils import ErrHandle
+from lila.settings import USE_REDIS
 
 LONG_STRING=255
 MAX_TEXT_LEN = 200
+RESULT_TIMEOUT = 86400      # Seconds that a cached search result may be kept (it is invalidated earlier by versions)
+TRIGRAM_BUILT = "v2"        # Trigram of the row that marks the index of a model/field as complete 
+                            #   (never 3 characters long; a new value forces a rebuild before the index is used)
+TRIGRAM_CHUNK = 500         # Number of objects (or rows) handled at once when (re)building the index
 
 def get_current_datetime():
     """Get the current time"""
@@ -34,6 +43,11 @@ class UserSearch(models.Model):
     # [1] The usage history
     history = models.TextField("History", default="{}")    
     
+    # Search results are only cached when the cache (and the versions in it) is shared by all processes
+    cache_results = USE_REDIS
+    # Labels of the models whose changes bump a version counter (see track_models)
+    tracked = set()
+
     class Meta:
         verbose_name = "User search"
         verbose_name_plural = "User searches"
@@ -108,6 +122,261 @@ class UserSearch(models.Model):
         # Return what we found
         return qd
 
+    def get_model_versions(models_list):
+        """Get the current version counters of the models in the list"""
+
+        keys = [ "modelversion_{}".format(x._meta.label_lower) for x in models_list ]
+        oVersions = cache.get_many(keys)
+        lBack = [ "{}".format(oVersions.get(x, 0)) for x in keys ]
+        return lBack
+
+    def bump_model_version(sender, **kwargs):
+        """Signal receiver: any change in a model invalidates the cached results depending on it"""
+
+        key = "modelversion_{}".format(sender._meta.label_lower)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The key does not exist yet
+            cache.set(key, 1, None)
+        except:
+            # The cache may not be available: never let a save() fail because of it
+            pass
+
+    def track_models(models_list):
+        """Let any save or delete of the models in the list bump their version counter"""
+
+        for model in models_list:
+            label = model._meta.label_lower
+            if not label in UserSearch.tracked:
+                if model._meta.auto_created:
+                    # The intermediate table of a ManyToManyField changes through add(), remove() etc.
+                    m2m_changed.connect(UserSearch.bump_model_version, sender=model, 
+                                        dispatch_uid="usersearch_m2m_changed_{}".format(label))
+                else:
+                    post_save.connect(UserSearch.bump_model_version, sender=model, 
+                                      dispatch_uid="usersearch_post_save_{}".format(label))
+                    post_delete.connect(UserSearch.bump_model_version, sender=model, 
+                                        dispatch_uid="usersearch_post_delete_{}".format(label))
+                UserSearch.tracked.add(label)
+
+    def is_tracked(models_list):
+        """Check whether the version counters of all models in the list are kept up to date"""
+
+        return all([x._meta.label_lower in UserSearch.tracked for x in models_list])
+
+    def get_result_key(search_id, model, scope="", order="", depends=None):
+        """Get the cache key for the results of a search on [model]"""
+
+        if depends is None or len(depends) == 0:
+            depends = [model]
+        lVersions = UserSearch.get_model_versions(depends)
+        sCombi = "{}|{}|{}".format(scope, order, ".".join(lVersions))
+        sHash = hashlib.md5(sCombi.encode("utf-8")).hexdigest()
+        sKey = "usersearch_{}_{}_{}".format(search_id, model._meta.label_lower, sHash)
+        return sKey
+
+    def get_result(search_id, model, scope="", order="", depends=None):
+        """Get the cached entrycount and ordered id list for this search, if available"""
+
+        oErr = ErrHandle()
+        oBack = None
+        try:
+            sKey = UserSearch.get_result_key(search_id, model, scope, order, depends)
+            oBack = cache.get(sKey)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("UserSearch/get_result")
+        return oBack
+
+    def set_result(search_id, model, entrycount, id_list=None, scope="", order="", depends=None):
+        """Store the entrycount and the (optional) ordered id list for this search"""
+
+        oErr = ErrHandle()
+        bResult = True
+        try:
+            sKey = UserSearch.get_result_key(search_id, model, scope, order, depends)
+            cache.set(sKey, dict(entrycount=entrycount, id_list=id_list), RESULT_TIMEOUT)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("UserSearch/set_result")
+            bResult = False
+        return bResult
+
+
+class SearchTrigram(models.Model):
+    """Inverted index of the character trigrams in the searchable text fields of a model
+
+    A model takes part by defining [trigram_fields], the list of its fields that are indexed.
+    The index is used to narrow down the candidates of a wildcard search, before the
+    (expensive) regular expression is applied.
+    """
+
+    # [1] The model that is indexed: its label_lower (e.g. 'seeker.canwit')
+    model = models.CharField("Model", max_length = LONG_STRING)
+    # [1] The field of that model
+    field = models.CharField("Field", max_length = LONG_STRING)
+    # [1] The trigram (or TRIGRAM_BUILT)
+    trigram = models.CharField("Trigram", blank=True, default="", max_length = LONG_STRING)
+    # [1] The id of the object containing the trigram
+    objid = models.IntegerField("Object id", default=0)
+
+    class Meta:
+        verbose_name = "Search trigram"
+        verbose_name_plural = "Search trigrams"
+        indexes = [
+            models.Index(fields=['model', 'field', 'trigram', 'objid']),
+            models.Index(fields=['objid']),
+            ]
+
+    def __str__(self):
+        return "{}.{}: {}".format(self.model, self.field, self.trigram)
+
+    def normalize(sText):
+        """Fold the spelling variants that the ftext/ftrans searches treat as equal: e=ae, j=i, u=v, k=c"""
+
+        oTranslation = str.maketrans(dict(j="i", v="u", k="c"))
+        # Any run of a's before an 'e' goes: the search 'a?e' may match the last of them
+        sBack = "" if sText is None else re.sub("a+e", "e", sText.lower()).translate(oTranslation)
+        return sBack
+
+    def get_trigrams(sText):
+        """Get the set of trigrams in a (normalized) text"""
+
+        return set(sText[i:i+3] for i in range(len(sText) - 2))
+
+    def get_query_trigrams(sValue):
+        """Get the trigrams that any text matching the wildcard search [sValue] must contain
+
+        Returns None if the index cannot be used for this search
+        """
+
+        sValue = sValue.strip().lower()
+        if "#" in sValue:
+            # The parts between the '#' signs are used as a regular expression
+            if re.search(r"[.^$*+?{}\[\]\\|()]", sValue):
+                return None
+            lst_part = sValue.split("#")
+        else:
+            # Only the literal parts of the wildcard pattern
+            lst_part = re.split(r"\[[^\]]*\]|[*?\[\]]", sValue)
+        trigrams = set()
+        for sPart in lst_part:
+            # An 'a' at the end of a part may be followed by an 'e' in the text (and be normalized away there)
+            sPart = SearchTrigram.normalize(sPart).rstrip("a")
+            trigrams |= SearchTrigram.get_trigrams(sPart)
+        if len(trigrams) == 0:
+            trigrams = None
+        return trigrams
+
+    def is_built(model, field):
+        """Check whether the index for this model/field is complete"""
+
+        return SearchTrigram.objects.filter(model=model._meta.label_lower, field=field, trigram=TRIGRAM_BUILT).exists()
+
+    def get_candidates(model, field, sValue):
+        """Get a queryset of the ids of [model] that may match the wildcard search [sValue] in [field]
+
+        Returns None if the index cannot be used
+        """
+
+        oErr = ErrHandle()
+        qs = None
+        try:
+            if field in getattr(model, "trigram_fields", []):
+                trigrams = SearchTrigram.get_query_trigrams(sValue)
+                if not trigrams is None and SearchTrigram.is_built(model, field):
+                    qs = SearchTrigram.objects.filter(model=model._meta.label_lower, field=field, trigram__in=trigrams)
+                    qs = qs.values('objid').annotate(hits=Count('id')).filter(hits=len(trigrams)).values('objid')
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("SearchTrigram/get_candidates")
+        return qs
+
+    def update_object(obj):
+        """Make sure the index reflects the current text fields of [obj]"""
+
+        oErr = ErrHandle()
+        try:
+            label = obj._meta.label_lower
+            with transaction.atomic():
+                for field in obj.trigram_fields:
+                    trigrams = SearchTrigram.get_trigrams(SearchTrigram.normalize(getattr(obj, field)))
+                    qs = SearchTrigram.objects.filter(model=label, field=field, objid=obj.id).exclude(trigram=TRIGRAM_BUILT)
+                    current = set(qs.values_list('trigram', flat=True))
+                    if current != trigrams:
+                        # Only remove and add the differences
+                        if len(current - trigrams) > 0:
+                            qs.filter(trigram__in=list(current - trigrams)).delete()
+                        lst_add = [SearchTrigram(model=label, field=field, trigram=x, objid=obj.id) for x in trigrams - current]
+                        SearchTrigram.objects.bulk_create(lst_add, batch_size=TRIGRAM_CHUNK)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("SearchTrigram/update_object")
+        return None
+
+    def add_objects(lst_obj):
+        """Add *new* objects (e.g. from a bulk_create), that are not indexed yet, to the index"""
+
+        oErr = ErrHandle()
+        try:
+            lst_add = []
+            for obj in lst_obj:
+                label = obj._meta.label_lower
+                for field in getattr(obj, "trigram_fields", []):
+                    for trigram in SearchTrigram.get_trigrams(SearchTrigram.normalize(getattr(obj, field))):
+                        lst_add.append(SearchTrigram(model=label, field=field, trigram=trigram, objid=obj.id))
+            SearchTrigram.objects.bulk_create(lst_add, batch_size=TRIGRAM_CHUNK)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("SearchTrigram/add_objects")
+        return None
+
+    def prepare_model(sender, **kwargs):
+        """Signal receiver: models that define [trigram_fields] get their deleted objects removed from the index"""
+
+        if len(getattr(sender, "trigram_fields", [])) > 0:
+            post_delete.connect(SearchTrigram.remove_object, sender=sender, 
+                                dispatch_uid="searchtrigram_post_delete_{}".format(sender._meta.label_lower))
+
+    def remove_object(sender, instance, **kwargs):
+        """Signal receiver: remove a deleted object from the index"""
+
+        SearchTrigram.objects.filter(model=sender._meta.label_lower, objid=instance.id).exclude(trigram=TRIGRAM_BUILT).delete()
+
+    def rebuild(model):
+        """Rebuild the complete index for [model]; returns the number of indexed objects"""
+
+        oErr = ErrHandle()
+        count = 0
+        try:
+            label = model._meta.label_lower
+            fields = model.trigram_fields
+            with transaction.atomic():
+                SearchTrigram.objects.filter(model=label).delete()
+                lst_add = []
+                qs = model.objects.all().order_by('id').values_list('id', *fields)
+                for item in qs.iterator(chunk_size=TRIGRAM_CHUNK):
+                    for idx, field in enumerate(fields):
+                        for trigram in SearchTrigram.get_trigrams(SearchTrigram.normalize(item[idx+1])):
+                            lst_add.append(SearchTrigram(model=label, field=field, trigram=trigram, objid=item[0]))
+                    count += 1
+                    if len(lst_add) >= TRIGRAM_CHUNK * 10:
+                        SearchTrigram.objects.bulk_create(lst_add, batch_size=TRIGRAM_CHUNK)
+                        lst_add = []
+                # Mark the index of each field as complete
+                for field in fields:
+                    lst_add.append(SearchTrigram(model=label, field=field, trigram=TRIGRAM_BUILT, objid=0))
+                SearchTrigram.objects.bulk_create(lst_add, batch_size=TRIGRAM_CHUNK)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("SearchTrigram/rebuild")
+        return count
+
+
+# Deleted objects are removed from the trigram index (for the models that take part)
+class_prepared.connect(SearchTrigram.prepare_model, dispatch_uid="searchtrigram_class_prepared")
+
 
 # =================== HELPER classes ==================================
 
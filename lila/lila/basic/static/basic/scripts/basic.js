@@ -976,6 +976,10 @@ var ru = (function ($, ru) {
                   elInfo = elTarget.replace("_data_import", "-import_info");
                   // Make info visible again
                   $(elInfo).removeClass("hidden");
+                  // Show the result of a background job
+                  if ("html" in response) {
+                    $(elTarget).html(response.html);
+                  }
                   // Close myself
                   //$(elTarget).html("READY");
                   $(".save-warning").html("");
@@ -1526,6 +1530,11 @@ var ru = (function ($, ru) {
                       $("#" + sTargetDiv).html(response.html);
                       $("#" + sTargetDiv).removeClass("hidden");
                       $(".save-warning").html("");
+                      // A background job reports its result through the progress URL
+                      if ("progressurl" in response && (progrurl === null || progrurl === undefined)) {
+                        loc_progr = [];
+                        window.setTimeout(function () { ru.basic.check_progress(response.progressurl, sTargetDiv); }, 2000);
+                      }
                     }
                     break;
                   default:
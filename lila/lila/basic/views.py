@@ -4,14 +4,17 @@ Definition of views for the BASIC app.
 
 from django.apps import apps
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
 # from django.urls import reverse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
 from django.db.models import Q, Prefetch, Count, F
 from django.db.models.functions import Lower
 from django.db.models.query import QuerySet 
+from django.db.models.sql.query import Query
 from django.forms.models import model_to_dict
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse
@@ -22,10 +25,13 @@ from django.views.generic import ListView, View
 
 import json
 import fnmatch
+import hashlib
 import os
 import base64
 import csv
+import tempfile
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils.cell import get_column_letter
 from io import StringIO
 
@@ -35,7 +41,7 @@ from datetime import datetime
 # provide error handling
 from .utils import ErrHandle
 
-from lila.basic.models import UserSearch
+from lila.basic.models import UserSearch, SearchTrigram
 
 
 # Some constants that can be used
@@ -43,6 +49,12 @@ paginateSize = 100  # Was: 20; See issue #36
 paginateSelect = 15
 paginateValues = (100, 50, 20, 10, 5, 2, 1, )
 
+# Number of objects fetched at once when exporting a listview
+export_chunk_size = 500
+
+# Parameters that do not influence the list of results of a listview
+idpaging_skip = ['page', 'paginate_by', 'w', 'action', 'dtype', 'usersearch', 'csrfmiddlewaretoken']
+
 # Global debugging 
 bDebug = False
 
@@ -228,8 +240,11 @@ def adapt_search(val, regex_function=None):
     #val = '^' + fnmatch.translate(val) + '$'
     return val
 
-def make_search_list(filters, oFields, search_list, qd, lstExclude):
-    """Using the information in oFields and search_list, produce a revised filters array and a lstQ for a Queryset"""
+def make_search_list(filters, oFields, search_list, qd, lstExclude, model=None):
+    """Using the information in oFields and search_list, produce a revised filters array and a lstQ for a Queryset
+
+    If [model] is given, wildcard searches on its trigram-indexed fields first narrow down the candidates
+    """
 
     def enable_filter(filter_id, head_id=None):
         oErr = ErrHandle()
@@ -382,8 +397,12 @@ def make_search_list(filters, oFields, search_list, qd, lstExclude):
                             if isinstance(val, int):
                                 s_q = Q(**{"{}".format(dbfield): val})
                             elif "*" in val or "#" in val:
+                                qs_cand = None if model is None else SearchTrigram.get_candidates(model, dbfield, val)
                                 val = adapt_search(val, regex_function)
                                 s_q = Q(**{"{}__iregex".format(dbfield): val})
+                                if not qs_cand is None:
+                                    # Only apply the regular expression to the objects that have all the trigrams
+                                    s_q = Q(id__in=qs_cand) & s_q
                             elif "$" in dbfield:
                                 val = adapt_search(val, regex_function)
                             else:
@@ -431,6 +450,76 @@ def make_search_list(filters, oFields, search_list, qd, lstExclude):
     # Return what we have created
     return filters, lstQ, qd, lstExclude
 
+def get_path_models(model, path):
+    """Get the models that a field path (e.g. 'manuitems__itemsermons__austats__code') passes through"""
+
+    lBack = []
+    for part in path.split("__"):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            # A lookup (e.g. 'gte') or a name that only exists for the form
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        # The intermediate table of a many-to-many relation
+        through = getattr(field, "through", None) or getattr(field.remote_field, "through", None)
+        if not through is None:
+            lBack.append(through)
+        model = field.related_model
+        lBack.append(model)
+    return lBack
+
+def get_search_models(model, search_list):
+    """Get the models that the field paths in [search_list] (see make_search_list) pass through"""
+
+    lBack = []
+    for part in search_list:
+        for search_item in part['filterlist']:
+            for key in ['fkfield', 'dbfield']:
+                sPaths = search_item.get(key)
+                if not sPaths is None:
+                    for path in sPaths.split("|"):
+                        infield = search_item.get('infield')
+                        if key == 'fkfield' and not infield is None:
+                            path = "{}__{}".format(path, infield)
+                        for item in get_path_models(model, path):
+                            if not item in lBack: lBack.append(item)
+    return lBack
+
+def get_query_models(query, lst_model=None):
+    """Get the models of all tables that [query] (a Query or QuerySet) reads, including its subqueries"""
+
+    def walk_expression(expression):
+        if expression is None or isinstance(expression, (str, int, float, bool)):
+            return
+        elif isinstance(expression, QuerySet):
+            get_query_models(expression.query, lst_model)
+        elif isinstance(expression, Query):
+            get_query_models(expression, lst_model)
+        elif isinstance(expression, (list, tuple, set)):
+            for item in expression: walk_expression(item)
+        elif hasattr(expression, "children"):
+            for item in expression.children: walk_expression(item)
+        else:
+            # Lookups (lhs, rhs) and expressions such as Exists or Subquery
+            for attr in ['lhs', 'rhs', 'query', 'queryset']:
+                walk_expression(getattr(expression, attr, None))
+            if hasattr(expression, "get_source_expressions"):
+                for item in expression.get_source_expressions(): walk_expression(item)
+
+    if lst_model is None: lst_model = []
+    if isinstance(query, QuerySet): query = query.query
+    oTable = {x._meta.db_table: x for x in apps.get_models(include_auto_created=True)}
+    for alias in query.alias_map.values():
+        model = oTable.get(alias.table_name)
+        if not model is None and not model in lst_model:
+            lst_model.append(model)
+    walk_expression(query.where)
+    for expression in query.annotations.values():
+        walk_expression(expression)
+    return lst_model
+
 def make_ordering(qs, qd, order_default, order_cols, order_heads):
 
     oErr = ErrHandle()
@@ -866,6 +955,47 @@ def csv_to_excel(sCsvData, response):
 
 
 
+class EchoBuffer(object):
+    """File-like object that just returns what is written to it (for streaming csv)"""
+
+    def write(self, value):
+        return value
+
+
+class IdPageList(object):
+    """Sliceable list of model objects, backed by an ordered list of ids
+
+    The Paginator only asks for the length and for one slice, so that the
+    objects of one page are fetched with a single [id__in] query
+    """
+
+    ordered = True
+
+    def __init__(self, qs_base, id_list):
+        self.qs_base = qs_base
+        self.id_list = id_list
+
+    def __len__(self):
+        return len(self.id_list)
+
+    def count(self):
+        return len(self.id_list)
+
+    def __iter__(self):
+        return iter(self.get_objects(self.id_list))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.get_objects(self.id_list[key])
+        return self.get_objects([self.id_list[key]])[0]
+
+    def get_objects(self, ids):
+        """Fetch the objects with the indicated ids, keeping the order of [ids]"""
+
+        obj_dict = { obj.id: obj for obj in self.qs_base.filter(id__in=ids) }
+        return [obj_dict[x] for x in ids if x in obj_dict]
+
+
 # The views that are defined by 'basic'
 
 class BasicList(ListView):
@@ -918,6 +1048,11 @@ class BasicList(ListView):
     col_wrap = ""
     param_list = []
     qs = None
+    use_idpaging = False    # Paginate using a cached list of distinct ids instead of DISTINCT + COUNT
+    usersearch_models = []  # Models that adapt_search() reads, besides those the searches and the query use
+    usersearch_shared = False   # Results only depend on editor/user status, not on the user's own data
+    prefetch_columns = {}   # Per column: dict(select=[...], prefetch=[...], annotate={...}) needed to show it
+    id_list = None
     page_function = "ru.basic.search_paged_start"
 
     def initializations(self):
@@ -1362,7 +1497,7 @@ class BasicList(ListView):
                 # Allow user to adapt the list of search fields
                 oFields, lstExclude, qAlternative = self.adapt_search(oFields)
 
-                self.filters, lstQ, self.initial, lstExclude = make_search_list(self.filters, oFields, self.searches, self.qd, lstExclude)
+                self.filters, lstQ, self.initial, lstExclude = make_search_list(self.filters, oFields, self.searches, self.qd, lstExclude, self.model)
                 # qs = self.model.objects.filter(manuitems__itemsermons__goldsermons__goldsignatures__code__in = "AN Mt h 42")
 
                 # Combine exclude filters with logical or
@@ -1454,7 +1589,14 @@ class BasicList(ListView):
                         oHead['colwrap'] = True
 
         # Determine the length
-        self.entrycount = 0 if qs is None else qs.count()   # len(qs)
+        self.id_list = None
+        if qs is None:
+            self.entrycount = 0
+        else:
+            oResult = self.get_search_result(qs)
+            self.entrycount = oResult['entrycount']
+            if self.use_idpaging:
+                self.id_list = oResult['id_list']
         
         # Allow doing something additionally with the queryset
         self.view_queryset(qs)
@@ -1466,11 +1608,183 @@ class BasicList(ListView):
     def view_queryset(self, qs):
         return None
 
+    def get_search_id(self):
+        """Get the id of this search: the UserSearch id or a hash of the normalized parameters"""
+
+        if self.usersearch_id != "" and not self.usersearch_id is None:
+            sBack = "{}".format(self.usersearch_id)
+        else:
+            lParams = []
+            if hasattr(self.qd, "lists"):
+                lItems = self.qd.lists()
+            else:
+                lItems = [(k, [v]) for k, v in self.qd.items()]
+            for k, v_list in lItems:
+                if k not in idpaging_skip:
+                    v_list = [str(x) for x in v_list if not isempty(x)]
+                    if len(v_list) > 0:
+                        lParams.append("{}={}".format(k, "|".join(sorted(v_list))))
+            sParams = "{}?{}".format(self.request.path, json.dumps(sorted(lParams)))
+            sBack = "p{}".format(hashlib.md5(sParams.encode("utf-8")).hexdigest())
+        return sBack
+
+    def get_search_scope(self):
+        """Get the part of the result key that depends on the user"""
+
+        if self.usersearch_shared:
+            sBack = "edi" if user_is_ingroup(self.request, app_editor) else "usr"
+        else:
+            sBack = self.request.user.username
+        return sBack
+
+    def get_usersearch_models(self, qs):
+        """Get all models that the result of [qs] depends on"""
+
+        lBack = [self.model]
+        lModel = self.usersearch_models + get_search_models(self.model, self.searches) + get_query_models(qs)
+        for model in lModel:
+            if not model in lBack: lBack.append(model)
+        return lBack
+
+    def get_search_result(self, qs):
+        """Get the entrycount and (if id paging is used) the ordered list of distinct ids for [qs]
+
+        The result is kept in the cache per search and is invalidated when one of the models
+        it depends on changes. It is not cached when one of those models is not tracked.
+        """
+
+        oErr = ErrHandle()
+        oResult = None
+        search_id = None
+        try:
+            # Basket contents change all the time: do not cache those
+            if not self.basketview and UserSearch.cache_results:
+                depends = self.get_usersearch_models(qs)
+                if UserSearch.is_tracked(depends):
+                    search_id = self.get_search_id()
+                    scope = self.get_search_scope()
+                    order = self.qd.get("o", "")
+                    oResult = UserSearch.get_result(search_id, self.model, scope, order, depends)
+            if oResult is None or (self.use_idpaging and oResult.get("id_list") is None):
+                if self.use_idpaging:
+                    # One query for all ids; duplicates from ordering on related fields are skipped
+                    id_list = list(dict.fromkeys(qs.values_list('id', flat=True)))
+                    oResult = dict(entrycount=len(id_list), id_list=id_list)
+                else:
+                    oResult = dict(entrycount=qs.count(), id_list=None)
+                if not search_id is None:
+                    UserSearch.set_result(search_id, self.model, oResult['entrycount'], oResult['id_list'],
+                                          scope, order, depends)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("BasicList/get_search_result")
+            oResult = dict(entrycount=qs.count(), id_list=None)
+        return oResult
+
+    def get_page_plan(self):
+        """Combine the relations and aggregates of all the columns that are shown"""
+
+        lSelect = []
+        oPrefetch = {}
+        oAnnotate = {}
+        for head in self.order_heads:
+            sColumn = head.get('custom', head.get('field', ''))
+            oPlan = self.prefetch_columns.get(sColumn)
+            if not oPlan is None:
+                for item in oPlan.get('select', []):
+                    if not item in lSelect:
+                        lSelect.append(item)
+                for item in oPlan.get('prefetch', []):
+                    # A lookup may only be prefetched once
+                    lookup = item.prefetch_to if isinstance(item, Prefetch) else item
+                    if not lookup in oPrefetch:
+                        oPrefetch[lookup] = item
+                for k, v in oPlan.get('annotate', {}).items():
+                    oAnnotate[k] = v
+        return lSelect, list(oPrefetch.values()), oAnnotate
+
+    def plan_queryset(self, qs, annotate=True):
+        """Add the select_related, prefetch_related and annotate calls the columns need"""
+
+        lSelect, lPrefetch, oAnnotate = self.get_page_plan()
+        if len(lSelect) > 0:
+            qs = qs.select_related(*lSelect)
+        if len(lPrefetch) > 0:
+            qs = qs.prefetch_related(*lPrefetch)
+        # Aggregates are only safe on a queryset without filter joins
+        if annotate and len(oAnnotate) > 0:
+            qs = qs.annotate(**oAnnotate)
+        return qs
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate over [id_list] when that has been calculated"""
+
+        if self.id_list is None:
+            if isinstance(queryset, QuerySet):
+                queryset = self.plan_queryset(queryset, annotate=False)
+        else:
+            queryset = IdPageList(self.plan_queryset(self.model.objects.all()), self.id_list)
+        return super(BasicList, self).paginate_queryset(queryset, page_size)
+
+    def get_export_objects(self, qs):
+        """Walk the objects in [qs] in chunks of [export_chunk_size]
+
+        Each chunk is fetched with one [id__in] query, selecting the foreign keys that 
+        the [specification] needs, so that memory use stays constant
+        """
+
+        # Select the foreign keys that are needed
+        lSelect = []
+        for item in getattr(self.model, 'specification', []):
+            if item['type'] == "fk":
+                try:
+                    if self.model._meta.get_field(item['path']).is_relation:
+                        lSelect.append(item['path'])
+                except:
+                    pass
+        qs_base = self.model.objects.all()
+        if len(lSelect) > 0:
+            qs_base = qs_base.select_related(*lSelect)
+
+        # Get the ordered list of ids once
+        id_list = self.id_list
+        if id_list is None:
+            id_list = list(dict.fromkeys(qs.values_list('id', flat=True)))
+        oPage = IdPageList(qs_base, id_list)
+        for start in range(0, len(id_list), export_chunk_size):
+            for obj in oPage[start:start + export_chunk_size]:
+                yield obj
+
+    def get_export_rows(self, qs):
+        """Yield the header and then one row of values per object in [qs], based on [specification]"""
+
+        # Get the specification
+        specification = [x for x in getattr(self.model, 'specification') if x['type'] != ""]
+
+        # Need to know who this user (profile) is
+        user = self.request.user
+        username = user.username
+        profile = user.user_profiles.first()
+        team_group = app_editor
+        kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
+
+        # The header
+        headers = [x['name'] for x in specification]
+        headers.insert(0, "Id")
+        yield headers
+
+        # Walk the items in the queryset
+        for obj in self.get_export_objects(qs):
+            row = [ obj.id ]
+            for item in specification:
+                key, value = obj.custom_getkv(item, kwargs=kwargs)
+                row.append(value)
+            yield row
+
     def get_data(self, prefix, dtype, response=None):
-        """Gather the data as CSV, including a header line and comma-separated"""
+        """Gather the data as Excel (write-only workbook), including a header line"""
 
         # Initialize
-        lData = []
         sData = ""
         oErr = ErrHandle()
         try:
@@ -1478,48 +1792,27 @@ class BasicList(ListView):
             if not hasattr(self.model, 'specification'):
                 return sData
 
-            # Get the specification
-            specification = getattr(self.model, 'specification')
-
-            # Need to know who this user (profile) is
-            user = self.request.user
-            username = user.username
-            profile = user.user_profiles.first()
-            team_group = app_editor
-            kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
-
             # Get the queryset, which is based on the listview parameters
             qs = self.get_queryset()
 
-            # Start workbook
-            wb = openpyxl.Workbook()
+            # Start a write-only workbook: rows are written out as we go
+            wb = openpyxl.Workbook(write_only=True)
             # Create worksheet with data
-            ws = wb.active
-            ws.title = "Data"
-
-            # Create header cells
-            headers = [x['name'] for x in specification if x['type'] != "" ]
-            headers.insert(0, "Id")
-            for col_num in range(len(headers)):
-                c = ws.cell(row=1, column=col_num+1)
-                c.value = headers[col_num]
-                c.font = openpyxl.styles.Font(bold=True)
-                # Set width to a fixed size
-                ws.column_dimensions[get_column_letter(col_num+1)].width = 5.0        
-
-            row_num = 1
-            # Walk the items in the queryset
-            for obj in qs:
-                row_num += 1
-                # Add the object id
-                ws.cell(row=row_num, column=1).value = obj.id
-                col_num = 2
-                # Walk the items
-                for item in specification:
-                    if item['type'] != "":
-                        key, value = obj.custom_getkv(item, kwargs=kwargs)
-                        ws.cell(row=row_num, column=col_num).value = value
-                        col_num += 1
+            ws = wb.create_sheet("Data")
+
+            for row_num, row in enumerate(self.get_export_rows(qs)):
+                if row_num == 0:
+                    # Create header cells
+                    header = []
+                    for col_num, value in enumerate(row):
+                        c = WriteOnlyCell(ws, value=value)
+                        c.font = openpyxl.styles.Font(bold=True)
+                        header.append(c)
+                        # Set width to a fixed size
+                        ws.column_dimensions[get_column_letter(col_num+1)].width = 5.0        
+                    ws.append(header)
+                else:
+                    ws.append(row)
 
             # Save it
             wb.save(response)
@@ -1529,6 +1822,28 @@ class BasicList(ListView):
             oErr.DoError("get_data")
         return sData
 
+    def get_stream(self, dtype):
+        """Yield the data as tab-separated lines (csv) or as one JSON object per line (json)"""
+
+        oErr = ErrHandle()
+        try:
+            qs = self.get_queryset()
+            headers = None
+            writer = csv.writer(EchoBuffer(), dialect='excel-tab')
+            for row in self.get_export_rows(qs):
+                if headers is None:
+                    headers = row
+                    if dtype == "csv":
+                        yield writer.writerow(row)
+                elif dtype == "csv":
+                    yield writer.writerow(row)
+                else:
+                    oRow = { headers[idx]: value for idx, value in enumerate(row) }
+                    yield "{}\n".format(json.dumps(oRow, default=str))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("get_stream")
+
     def download_excel(self, dtype):
         """Create a generic Excel download based on [specification]"""
 
@@ -1541,12 +1856,13 @@ class BasicList(ListView):
             applname = APPLICATION_NAME
             sDbName = "{}_{}.xlsx".format(applname, downloadname)
 
+            # Write the workbook to a temporary file, which is then sent in chunks
+            tmp = tempfile.TemporaryFile()
+            sData = self.get_data('', dtype, tmp)
+            tmp.seek(0)
+            response = FileResponse(tmp, as_attachment=True, filename=sDbName)
             # Convert 'compressed_content' to an Excel worksheet
-            sContentType = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            response = HttpResponse(content_type=sContentType)
-            response['Content-Disposition'] = 'attachment; filename="{}"'.format(sDbName)    
-            # Get the Data
-            sData = self.get_data('', dtype, response)
+            response['Content-Type'] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
         except:
             msg = oErr.get_error_message()
@@ -1554,6 +1870,30 @@ class BasicList(ListView):
 
         return response
 
+    def download_stream(self, dtype):
+        """Create a generic streaming csv (tab-separated) or json (one object per line) download"""
+
+        response = None
+        oErr = ErrHandle()
+        try:
+            # Make a download name
+            downloadname = self.model.__name__
+            applname = APPLICATION_NAME
+            if dtype == "csv":
+                sDbName = "{}_{}.csv".format(applname, downloadname)
+                sContentType = "text/tab-separated-values"
+            else:
+                sDbName = "{}_{}.ndjson".format(applname, downloadname)
+                sContentType = "application/x-ndjson"
+
+            response = StreamingHttpResponse(self.get_stream(dtype), content_type=sContentType)
+            response['Content-Disposition'] = 'attachment; filename="{}"'.format(sDbName)    
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("download_stream")
+
+        return response
+
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             # Do not allow to get a good response
@@ -1578,6 +1918,9 @@ class BasicList(ListView):
                     # This is not the regular listview, but just a downloading action
                     # And it is only for excel downloading
                     response = self.download_excel(dtype)
+                elif dtype in ['csv', 'json']:
+                    # Streaming download: the first bytes are sent right away
+                    response = self.download_stream(dtype)
             else:
 
                 # Then check if we have a redirect or not
@@ -1,7 +1,9 @@
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
 from django.urls import reverse
 import re, copy
+import threading
 from lila.bible.utils import *
 
 LONG_STRING=255
@@ -55,12 +57,13 @@ class Book(models.Model):
         return self.abbr
 
     def get_abbr(idno):
-        sAbbr = ""
         # Get the abbreviation, given the IDNO of a book
-        obj = Book.objects.filter(idno=idno).first()
-        if obj != None:
-            sAbbr = obj.abbr
-        return sAbbr
+        return BibleTable.get().get_abbr(idno)
+
+    def get_book(idno):
+        """Get the Book with this IDNO (or None)"""
+
+        return BibleTable.get().books.get(idno)
 
     def get_idno(abbr):
         abbr_from = ["mt1", "matt.", "lc.", "jo."]
@@ -73,19 +76,13 @@ class Book(models.Model):
         if idx >= 0:
             abbr = abbr_to[idx]
 
-        # Get the abbreviation, given the IDNO of a book
-        obj = Book.objects.filter(Q(abbr__iexact=abbr)|Q(latabbr__iexact=abbr)).first()
-        if obj != None:
-            idno = obj.idno
+        # Get the IDNO, given the (English or Latin) abbreviation of a book
+        idno = BibleTable.get().idno.get(abbr, idno)
         return idno
 
     def get_chapters(idno):
-        chnum = 0
-        # Get the abbreviation, given the IDNO of a book
-        obj = Book.objects.filter(idno=idno).first()
-        if obj != None:
-            chnum = obj.chnum
-        return chnum
+        # Get the number of chapters, given the IDNO of a book
+        return BibleTable.get().get_chapters(idno)
     
 
 class Chapter(models.Model):
@@ -107,13 +104,82 @@ class Chapter(models.Model):
     def get_vss(idno, chn):
         """Get the number of verses for this chapter"""
 
-        vss = 0
-        obj = Chapter.objects.filter(book__idno=idno, number=chn).first()
-        if obj != None:
-            vss = obj.vsnum
-        else:
-            iStop = 1
-        return vss
+        return BibleTable.get().get_vss(idno, chn)
+
+
+class BibleTable():
+    """Process-wide table of the books and of the number of verses per chapter
+
+    The table is loaded once (two queries) and then only read. Saving or deleting
+    a Book or a Chapter throws it away, so that the next use loads it again.
+    """
+
+    current = None
+    lock = threading.Lock()
+
+    def __init__(self):
+        books = {}          # Book object per idno
+        idno = {}           # Idno per lower-case English or Latin abbreviation
+        for book in Book.objects.all().order_by('id'):
+            # Like a .first() query: the book with the lowest id wins
+            if not book.idno in books:
+                books[book.idno] = book
+            for abbr in [book.abbr, book.latabbr]:
+                if not abbr is None and abbr != "":
+                    idno.setdefault(abbr.lower(), book.idno)
+        size = max([x for x in books.keys()], default=0) + 1
+        self.books = books
+        self.idno = idno
+        self.abbr = tuple([books[x].abbr if x in books else "" for x in range(size)])
+        self.chnum = tuple([books[x].chnum if x in books else 0 for x in range(size)])
+
+        # The number of verses of each chapter, per book
+        vss = {}
+        qs = Chapter.objects.all().order_by('id').values_list('book__idno', 'number', 'vsnum')
+        for bk, ch, vsnum in qs:
+            if not bk is None and ch >= 0:
+                lst_vss = vss.setdefault(bk, [])
+                while len(lst_vss) <= ch:
+                    lst_vss.append(None)
+                if lst_vss[ch] is None:
+                    lst_vss[ch] = vsnum
+        self.vss = tuple([tuple([x or 0 for x in vss.get(bk, [])]) for bk in range(size)])
+
+    def get():
+        """Get the table of this process, loading it when needed"""
+
+        table = BibleTable.current
+        if table is None:
+            with BibleTable.lock:
+                if BibleTable.current is None:
+                    BibleTable.current = BibleTable()
+                table = BibleTable.current
+        return table
+
+    def reset(sender=None, **kwargs):
+        """Signal receiver: a Book or Chapter has changed"""
+
+        BibleTable.current = None
+
+    def get_abbr(self, idno):
+        if 0 <= idno < len(self.abbr):
+            return self.abbr[idno]
+        return ""
+
+    def get_chapters(self, idno):
+        if 0 <= idno < len(self.chnum):
+            return self.chnum[idno]
+        return 0
+
+    def get_vss(self, idno, chn):
+        if 0 <= idno < len(self.vss) and 0 <= chn < len(self.vss[idno]):
+            return self.vss[idno][chn]
+        return 0
+
+
+for sender in [Book, Chapter]:
+    post_save.connect(BibleTable.reset, sender=sender, dispatch_uid="bibletable_save_{}".format(sender.__name__))
+    post_delete.connect(BibleTable.reset, sender=sender, dispatch_uid="bibletable_delete_{}".format(sender.__name__))
 
 
 class BkChVs():
@@ -239,7 +305,7 @@ class Reference():
             first = sr[0]
             idno = int(first[0:3])
             # Get the book with this idno
-            book = Book.objects.filter(idno=idno).first()
+            book = Book.get_book(idno)
             # Convert the list of scripture references into a chvslist
             ch = -1
             vs = -1
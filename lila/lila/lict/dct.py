@@ -0,0 +1,190 @@
+"""
+Engine for the Dynamic Comparative Table (DCT) of a ResearchSet.
+
+All source lists of a research set are loaded with a few set-based queries.
+Per list, the position of each Austat is kept in a dictionary, so that the matches
+between the lists, the choice of the pivot and the rows of the table follow from
+set operations and dictionary lookups.
+The result is cached per version of the research set and of the data it depends on.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count
+import hashlib
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.basic.models import UserSearch
+from lila.seeker.models import Austat, Caned, Canwit, CanwitAustat, CanwitKeyword, Collection, Manuscript, MsItem
+from lila.lict.models import ResearchSet, SetList, get_item_austat, get_lilacode, get_list_matches
+
+DCT_TIMEOUT = 86400     # Seconds that a calculated DCT may be kept (it is invalidated earlier by versions)
+
+
+class DctEngine(object):
+    """Calculate (and cache) the lists, matches, pivot and table rows of one ResearchSet"""
+
+    # Any change in one of these models means that the DCT must be re-calculated
+    depends = [SetList, Austat, Caned, Canwit, CanwitAustat, CanwitKeyword, Collection, Manuscript, MsItem]
+
+    def __init__(self, rset):
+        self.rset = rset
+
+    def get_cache_key(self):
+        """The key depends on the research set's save date and on the versions of the models"""
+
+        lVersions = UserSearch.get_model_versions(self.depends)
+        sCombi = "{}|{}".format(self.rset.saved, ".".join(lVersions))
+        sHash = hashlib.md5(sCombi.encode("utf-8")).hexdigest()
+        sKey = "lict_dct_{}_{}".format(self.rset.id, sHash)
+        return sKey
+
+    def get_sizes(self, lst_setlist):
+        """Get the title size of each setlist: the number of Canwits or Austats"""
+
+        oSize = {}
+        manu_ids = [x.manuscript_id for x in lst_setlist if x.setlisttype == "manu" and not x.manuscript_id is None]
+        coll_ids = [x.collection_id for x in lst_setlist if x.setlisttype != "manu" and not x.collection_id is None]
+        oManu = {}
+        if len(manu_ids) > 0:
+            qs = Canwit.objects.filter(msitem__manu_id__in=manu_ids).values('msitem__manu_id').annotate(size=Count('id'))
+            oManu = {x['msitem__manu_id']: x['size'] for x in qs}
+        oColl = {}
+        if len(coll_ids) > 0:
+            qs = Caned.objects.filter(collection_id__in=coll_ids).values('collection_id').annotate(size=Count('id'))
+            oColl = {x['collection_id']: x['size'] for x in qs}
+        for setlist in lst_setlist:
+            if setlist.setlisttype == "manu":
+                oSize[setlist.id] = oManu.get(setlist.manuscript_id, 0)
+            else:
+                oSize[setlist.id] = oColl.get(setlist.collection_id, 0)
+        return oSize
+
+    def calculate_lists(self):
+        """Load all lists of the research set and calculate their matches
+
+        Returns a list of objects with the keys 'id', 'title', 'auslist', 'austatid' and 'unique_matches',
+        in the order of the setlists
+        """
+
+        oErr = ErrHandle()
+        lst_ssglists = []
+        try:
+            qs = self.rset.researchset_setlists.all().order_by('order').select_related(
+                'manuscript', 'manuscript__lcity', 'manuscript__library', 'manuscript__library__lcity', 'collection')
+            lst_setlist = list(qs)
+
+            # (1) The Austats of all lists at once
+            oAuslists = SetList.load_auslists(lst_setlist)
+            oSize = self.get_sizes(lst_setlist)
+
+            # (2) One object per list
+            for idx, setlist in enumerate(lst_setlist):
+                oSsgList = dict(id=setlist.id)
+                oSsgList['title'] = setlist.get_title_object(size=oSize.get(setlist.id))
+                oSsgList['auslist'] = oAuslists.get(setlist.id, [])
+                if idx > 0:
+                    # Calculate the matches with the first list
+                    oSsgList['title']['matches'] = get_list_matches(lst_ssglists[0], oSsgList)
+                # Always pass on the default order
+                oSsgList['title']['order'] = idx + 1
+                lst_ssglists.append(oSsgList)
+
+            # (3) The matches of each list with all other lists
+            lst_ssglists = self.rset.calculate_matches(lst_ssglists)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("DctEngine/calculate_lists")
+        return lst_ssglists
+
+    def calculate(self):
+        """Calculate the lists and the pivot (the 'order' value of the best list)"""
+
+        lst_ssglists = self.calculate_lists()
+        pivot = -1
+        if not lst_ssglists is None and len(lst_ssglists) > 0:
+            pivot = ResearchSet.choose_pivot(lst_ssglists)
+        oData = dict(ssglists=lst_ssglists, pivot=pivot)
+        return oData
+
+    def get_data(self):
+        """Get the lists and the pivot from the cache, or calculate them"""
+
+        oErr = ErrHandle()
+        oData = None
+        try:
+            # Without a shared cache, the versions of other processes are not seen: always calculate
+            sKey = self.get_cache_key() if UserSearch.cache_results else None
+            if not sKey is None:
+                try:
+                    oData = cache.get(sKey)
+                except:
+                    # The cache may not be available: just calculate
+                    oData = None
+            if oData is None:
+                oData = self.calculate()
+                if not sKey is None:
+                    try:
+                        cache.set(sKey, oData, DCT_TIMEOUT)
+                    except:
+                        pass
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("DctEngine/get_data")
+        return oData
+
+    def get_table(self, pivot_id=None):
+        """Create the DCT: the lists, with the one with SetList id [pivot_id] first, and the table rows
+
+        Each row holds the LiLaC code of a pivot Austat, its position in the pivot
+        and its position in each of the other lists (or an empty string)
+        """
+
+        oErr = ErrHandle()
+        oBack = None
+        try:
+            oData = self.get_data()
+            if oData is None or oData['ssglists'] is None or len(oData['ssglists']) < 2:
+                oErr.Status("Not enough SSG-lists to compare")
+                return None
+
+            # (1) The pivot goes first, the others follow in their order
+            lst_ssglists = oData['ssglists']
+            lst_pivot = [x for x in lst_ssglists if x['id'] == pivot_id]
+            lst_ssglists = lst_pivot + [x for x in lst_ssglists if x['id'] != pivot_id]
+
+            # (2) Add the SetList objects themselves (one query)
+            oSetList = SetList.objects.in_bulk([x['id'] for x in lst_ssglists])
+            lst_ssglists = [dict(x, obj=oSetList.get(x['id'])) for x in lst_ssglists]
+            oBack = dict(ssglists=lst_ssglists)
+
+            # (3) Per other list: the position of each Austat (its first occurrence)
+            lst_position = []
+            for oSsgList in lst_ssglists[1:]:
+                oPosition = {}
+                for oItem in oSsgList['auslist']:
+                    oPosition.setdefault(get_item_austat(oItem), oItem['order'])
+                lst_position.append(oPosition)
+
+            # (4) Create header row
+            rows = []
+            oRow = ['Gr/Cl/Ot']
+            for oSsgList in lst_ssglists:
+                # Add the title *object*
+                oRow.append(oSsgList['title'])
+            rows.append(oRow)
+
+            # (5) One row for each Austat in the pivot
+            for oPivot in lst_ssglists[0]['auslist']:
+                austat_id = get_item_austat(oPivot)
+                oRow = [get_lilacode(austat_id, oPivot.get('code')), oPivot['order']]
+                for oPosition in lst_position:
+                    oRow.append(oPosition.get(austat_id, ""))
+                rows.append(oRow)
+
+            # Make sure we return the right information
+            oBack['setlist'] = rows
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("DctEngine/get_table")
+        return oBack
@@ -13,13 +13,15 @@ from django.urls import reverse
 
 
 from markdown import markdown
+from collections import Counter
 import json, copy
 
 # Take from my own app
 from lila.utils import ErrHandle
 from lila.settings import TIME_ZONE
+from lila.basic.models import UserSearch
 from lila.seeker.models import get_current_datetime, get_crpp_date, build_abbr_list, COLLECTION_SCOPE, \
-    Collection, Manuscript, Profile, Caned, CanwitKeyword
+    Collection, Manuscript, Profile, Caned, Canwit, CanwitAustat, CanwitKeyword
 
 STANDARD_LENGTH=255
 ABBR_LENGTH = 5
@@ -30,16 +32,17 @@ def get_lilacode(austatu_id, austatu_code):
     code = austatu_code if austatu_code and austatu_code != "" else "(nocode_{})".format(austatu_id)
     return code
 
+def get_item_austat(oItem):
+    """Get the Austat id of an item in an auslist (older contents use the key 'super')"""
+    return oItem['austat'] if 'austat' in oItem else oItem.get('super')
+
 def get_list_matches(oPMlist, oAustatList):
     """Calculate the number of matches between the two lists"""
 
-    matches = 0
-    for oPm in oPMlist['auslist']:
-        austat = oPm['austat']
-        # Check how manu times this Austat appears in [oAustatList]
-        for oAustat in oAustatList['auslist']:
-            if austat == oAustat['austat']:
-                matches += 1
+    # Each occurrence in the PM list matches each occurrence in the other list
+    pm_count = Counter(get_item_austat(x) for x in oPMlist['auslist'])
+    austat_count = Counter(get_item_austat(x) for x in oAustatList['auslist'])
+    matches = sum(count * austat_count[austat] for austat, count in pm_count.items())
     return matches
 
 
@@ -108,46 +111,36 @@ class ResearchSet(models.Model):
         oErr = ErrHandle()
         lBack = []
         try:
-            # Preparation: create a list of SSG ids per list
+            # Preparation: the Austat ids per list, how often each occurs and in how many lists
+            lst_count = []
+            list_count = Counter()
             for oItem in auslists:
-                oItem['austatid'] = [x['austat'] for x in oItem['auslist']]
-                oItem['unique_matches'] = 0
+                oItem['austatid'] = [get_item_austat(x) for x in oItem['auslist']]
+                austat_count = Counter(oItem['austatid'])
+                lst_count.append(austat_count)
+                list_count.update(austat_count.keys())
 
             # Calculate the number of matches for each Austatlist
-            for idx_list in range(len(auslists)):
+            for idx_list, oItem in enumerate(auslists):
                 # Take this as the possible pivot list
-                lPivot = auslists[idx_list]['austatid']
+                pivot_count = lst_count[idx_list]
 
-                # Walk all lists that are not this pivot and count matches
-                lUnique = []
-                oMatches = {}
-                if 'matchset' in auslists[idx_list]['title']:
-                    oMatches = auslists[idx_list]['title']['matchset']
+                oMatches = oItem['title'].get('matchset', {})
                 for idx, setlist in enumerate(auslists):
                     if idx != idx_list:
-                        # Get this auslist
-                        lAustatId = setlist['austatid']
-
-                        # Start calculating the number of matches this list has with the currently suggested PM
-                        sKey = str(auslists[idx]['title']['order'])
-                        lMatches = []
-
-                        # Consider all ssg id's in this list
-                        for austat_id in lAustatId:
-                            # Global unique matches
-                            if austat_id in lPivot and not austat_id in lUnique:
-                                lUnique.append(austat_id)
-                            # Calculation with respect to the currently suggested PM
-                            if austat_id in lPivot: # and not austat_id in lMatches:
-                                lMatches.append(austat_id)
-                        # Keep track of the matches (for sorting)
-                        oMatches[sKey] = len(lMatches)
+                        # The number of Austats in this list that also occur in the pivot
+                        austat_count = lst_count[idx]
+                        if len(austat_count) > len(pivot_count):
+                            common = [x for x in pivot_count if x in austat_count]
+                        else:
+                            common = [x for x in austat_count if x in pivot_count]
+                        sKey = str(setlist['title']['order'])
+                        oMatches[sKey] = sum(austat_count[x] for x in common)
                 # Store the between-list matches
-                auslists[idx_list]['title']['matchset'] = oMatches
+                oItem['title']['matchset'] = oMatches
 
-                # Store the number of matches for this list
-                unique_matches = len(lUnique)
-                auslists[idx_list]['unique_matches'] = unique_matches
+                # Unique matches: the Austats of the pivot that occur in at least one other list
+                oItem['unique_matches'] = sum(1 for x in pivot_count if list_count[x] > 1)
 
             # What we return
             lBack = auslists
@@ -164,45 +157,12 @@ class ResearchSet(models.Model):
         oErr = ErrHandle()
         iBack = -1
         try:
-            # Get the lists that we have made
-            ssglists = self.get_austatlists()
-
-            # Calculate the matches
-            ssglists = self.calculate_matches(ssglists)
-
-            # Figure out what the first best list is
-            idx_pm = -1
-            max_matches = -1
-            min_order = len(ssglists) + 2
-            min_year_start = 3000
-            min_year_finish = 3000
-            for idx, oListItem in enumerate(ssglists):
-                unique_matches = oListItem['unique_matches']
-                year_start = oListItem['title']['yearstart']
-                year_finish = oListItem['title']['yearfinish']
-                order = oListItem['title']['order']
-
-                # Check which is the best so far
-                bTakeThis = False
-                bTakeThis = (unique_matches > max_matches)
-                if not bTakeThis and unique_matches == max_matches:
-                    bTakeThis = (year_start < min_year_start)
-                    if not bTakeThis and year_start == min_year_start:
-                        bTakeThis = (year_finish < min_year_finish)
-                        if not bTakeThis and year_finish == min_year_finish:
-                            bTakeThis = (order < min_order)
-
-                # Adapt if this is the one
-                if bTakeThis:
-                    max_matches = unique_matches
-                    min_year_start = year_start
-                    min_year_finish = year_finish
-                    min_order = order
-                    idx_pm = idx
-
-            # What we return is the 'order' value of the best matching list
-            iBack = ssglists[idx_pm]['title']['order']
+            from lila.lict.dct import DctEngine
 
+            # The engine keeps the lists, their matches and the pivot per version of the research set
+            oData = DctEngine(self).get_data()
+            if not oData is None:
+                iBack = oData['pivot']
         except:
             msg = oErr.get_error_message()
             oErr.DoError("ResearchSet/calculate_pm")
@@ -210,6 +170,42 @@ class ResearchSet(models.Model):
         # Return the PM that we have found
         return iBack
 
+    def choose_pivot(ssglists):
+        """Figure out which list is the best pivot: return its 'order' value"""
+
+        idx_pm = -1
+        max_matches = -1
+        min_order = len(ssglists) + 2
+        min_year_start = 3000
+        min_year_finish = 3000
+        for idx, oListItem in enumerate(ssglists):
+            unique_matches = oListItem['unique_matches']
+            year_start = oListItem['title']['yearstart']
+            year_finish = oListItem['title']['yearfinish']
+            order = oListItem['title']['order']
+
+            # Check which is the best so far
+            bTakeThis = False
+            bTakeThis = (unique_matches > max_matches)
+            if not bTakeThis and unique_matches == max_matches:
+                bTakeThis = (year_start < min_year_start)
+                if not bTakeThis and year_start == min_year_start:
+                    bTakeThis = (year_finish < min_year_finish)
+                    if not bTakeThis and year_finish == min_year_finish:
+                        bTakeThis = (order < min_order)
+
+            # Adapt if this is the one
+            if bTakeThis:
+                max_matches = unique_matches
+                min_year_start = year_start
+                min_year_finish = year_finish
+                min_order = order
+                idx_pm = idx
+
+        # What we return is the 'order' value of the best matching list
+        iBack = -1 if idx_pm < 0 else ssglists[idx_pm]['title']['order']
+        return iBack
+
     def get_created(self):
         """REturn the creation date in a readable form"""
 
@@ -283,37 +279,29 @@ class ResearchSet(models.Model):
         bResult = True
         lst_ssglists = []
         try:
-            oPMlist = None
-            # Get the lists of SSGs for each list in the set
-            for idx, setlist in enumerate(self.researchset_setlists.all().order_by('order')):
-                # Check for the contents
-                if force or setlist.contents == "" or len(setlist.contents) < 3 or setlist.contents[0] == "[":
-                    setlist.calculate_contents()
-
-                # Retrieve the SSG-list from the contents
-                oSsgList = json.loads(setlist.contents)
-
-                # If this is not the *first* setlist, calculate the number of matches with the first
-                if idx == 0:
-                    oPMlist = copy.copy(oSsgList)
-                else:
-                    # Calculate the matches
-                    oSsgList['title']['matches'] = get_list_matches(oPMlist, oSsgList)
-                # Always pass on the default order
-                oSsgList['title']['order'] = idx + 1
-
-                # Add the list object to the list
-                lst_ssglists.append(oSsgList)
-
-            # Calculate the unique_matches for each list
-            lst_ssglists = self.calculate_matches(lst_ssglists)
-
-            # Put it in the ResearchSet and save it
-            self.contents = json.dumps(lst_ssglists)
-            self.save()
-
-            # All related SetDef items should be warned
+            from lila.lict.dct import DctEngine
+
+            # Get the lists of SSGs for all lists in the set at once (including the matches)
+            lst_ssglists = DctEngine(self).calculate_lists()
+
+            # Keep the contents of each SetList up to date
+            lst_setlist = []
+            for setlist in self.researchset_setlists.all().order_by('order'):
+                for oSsgList in lst_ssglists:
+                    if oSsgList['id'] == setlist.id:
+                        setlist.contents = json.dumps(dict(title=oSsgList['title'], auslist=oSsgList['auslist']))
+                        lst_setlist.append(setlist)
+                        break
+
             with transaction.atomic():
+                if len(lst_setlist) > 0:
+                    SetList.objects.bulk_update(lst_setlist, ['contents'])
+
+                # Put it in the ResearchSet and save it
+                self.contents = json.dumps(lst_ssglists)
+                self.save()
+
+                # All related SetDef items should be warned
                 for obj in SetDef.objects.filter(researchset=self.id):
                     contents = json.loads(obj.contents)
                     contents['recalc'] = True
@@ -372,37 +360,34 @@ class SetList(models.Model):
 
         oErr = ErrHandle()
         lBack = None
-        collection_types = ['hist', 'ssgd']
         try:
-            if self.setlisttype == "manu":
-                # Create a list of SSG's from the manuscript
-                lBack = self.ssgs_manuscript(self.manuscript)
-            elif self.setlisttype in collection_types:
-                lBack = self.ssgs_collection(self.collection)
+            lBack = SetList.load_auslists([self]).get(self.id)
         except:
             msg = oErr.get_error_message()
             oErr.DoError("SetList/get_ssg_list")
         return lBack
 
-    def get_title_object(self):
+    def get_title_object(self, size=None):
         """Depending on the setlisttype, this provides the title of the setlist
         
         The title is stored in an object, to facilitate template rendering
+        The [size] may be passed on, if it has already been calculated
         """
 
         oBack = {"main": "", "size": 0, "yearstart": 0, "yearfinish": 3000, "matches": 0}
         if self.setlisttype == "manu":
             # This is a manuscript
             oBack = self.manuscript.get_full_name_html(field1="top", field2="middle", field3="main")
-            oBack['size'] = self.manuscript.get_sermon_count()
+            oBack['size'] = self.manuscript.get_canwit_count() if size is None else size
             oBack['url'] = reverse('manuscript_details', kwargs={'pk': self.manuscript.id})
             oBack['yearstart'] = self.manuscript.yearstart
             oBack['yearfinish'] = self.manuscript.yearfinish
+            oBack['matches'] = 0
         elif self.setlisttype == "hist":
             # Historical collection
             oBack['top'] = "hc"
             oBack['main'] = self.collection.name
-            oBack['size'] = self.collection.freqsuper()
+            oBack['size'] = self.collection.freqsuper() if size is None else size
             oBack['url'] = reverse('collhist_details', kwargs={'pk': self.collection.id})
         elif self.setlisttype == "ssgd":
             # Personal collection
@@ -411,7 +396,7 @@ class SetList(models.Model):
                 oBack['main'] = self.collection.name
             else:
                 oBack['main'] = self.name
-            oBack['size'] = self.collection.freqsuper()
+            oBack['size'] = self.collection.freqsuper() if size is None else size
             oBack['url'] = reverse('collpriv_details', kwargs={'pk': self.collection.id})
         else:
             # No idea what this is
@@ -420,190 +405,132 @@ class SetList(models.Model):
         # Return the result
         return oBack
 
-    def ssgs_collection(self, bDebug = False):
-        """Get the ordered list of SSGs in the [super] type collection"""
+    def load_auslists(lst_setlist):
+        """Get the ordered list of Austats for each setlist in [lst_setlist]
+
+        All lists are loaded with a fixed number of queries, independent of their number and size.
+        Returns a dictionary from SetList id to its list of Austat items
+        """
 
         oErr = ErrHandle()
-        lBack = None
-        code = None
+        oBack = {}
+        collection_types = ['hist', 'ssgd']
         try:
-            coll = self.collection
-            # Get the list of SSGs inside this collection
-            # Per issue #402 additional info needs to be there:
-            #   author, 
-            #   PASSIM code, 
-            #   incipit, explicit, HC (if the SSG is part of a historical collection), 
-            #   number of SGs contained in the equality set, 
-            #   number of links to other SSGs
-            # HC/PD specific:
-            #   name
-            #   description
-            #   size
-            # HC-specific:
-            #   literature
-            qs = Caned.objects.filter(collection=coll).order_by('order').values(
-                'order', 'collection__name', 'collection__descrip', 'collection__settype', 
-                'super', 'super__code', 'super__author__name',
-                'super__incipit', 'super__explicit', 'super__sgcount', 'super__ssgcount')
-            lBack = []
-            with transaction.atomic():
+            manu_ids = [x.manuscript_id for x in lst_setlist if x.setlisttype == "manu" and not x.manuscript_id is None]
+            coll_ids = [x.collection_id for x in lst_setlist if x.setlisttype in collection_types and not x.collection_id is None]
+            oManu = {x: [] for x in manu_ids}
+            oColl = {x: [] for x in coll_ids}
+
+            # (1) The Austats to which the canwits in the manuscripts point, in the order of the canwits
+            #     Per issue #402 additional info needs to be there:
+            #       author, LiLaC code, HC (if the Austat is part of a historical collection), 
+            #       number of Canwits and Austats in the equality set
+            #     And, for MANUSCRIPT source-lists, Canwit details the user may choose to show
+            #       (attributed author, section title, lectio, title, postscriptum, feast, 
+            #       bible reference, cod. notes, notes, keywords)
+            if len(manu_ids) > 0:
+                qs = CanwitAustat.objects.filter(manu_id__in=manu_ids).order_by('manu_id', 'canwit__msitem__order', 'id').values(
+                    'manu_id', 'canwit', 'canwit__msitem__order', 'austat', 'austat__code', 'austat__author__name',
+                    'austat__scount', 'austat__ssgcount',
+                    'canwit__author__name', 'canwit__sectiontitle', 'canwit__quote', 'canwit__title', 
+                    'canwit__postscriptum', 'canwit__feast__name', 
+                    'canwit__bibleref', 'canwit__additional', 'canwit__note')
+                for obj in qs:
+                    oManu[obj['manu_id']].append(obj)
+
+            # (2) The Austats in the collections, in their order
+            if len(coll_ids) > 0:
+                qs = Caned.objects.filter(collection_id__in=coll_ids).order_by('collection_id', 'order', 'id').values(
+                    'collection_id', 'order', 'collection__name', 'collection__descrip', 'collection__settype', 
+                    'austat', 'austat__code', 'austat__author__name', 'austat__scount', 'austat__ssgcount')
                 for obj in qs:
-                    # Get the order number
-                    order = obj['order']
-                    # Get the collection-specific information
-                    name = obj['collection__name']
-                    descr = obj['collection__descrip']
-                    settype = obj['collection__settype']
-                    # Get the SSG
-                    super = obj['super']
-                    code = obj['super__code']
-                    authorname = obj['super__author__name']
-                    incipit = obj['super__incipit']
-                    explicit = obj['super__explicit']
-                    sgcount = obj['super__sgcount']
-                    ssgcount = obj['super__ssgcount']
-                    # Get the name(s) of the HC
-                    lst_hc = Caned.objects.filter(super=super, collection__settype="hc").values(
-                        'collection__id', 'collection__name')
-                    hcs = ", ".join( [x['collection__name'] for x in lst_hc])
-                    # ======== DEBUGGING ============
-                    if hcs != "":
-                        iStop = 1
-                    # ===============================
-                    # Get a URL for this ssg
-                    url = reverse('equalgold_details', kwargs={'pk': super})
-
-                    ## Treat signatures for this SSG
-                    #sigbest = get_goldsig_dct(super)
-                    #if sigbest == "":
-                    #    sigbest = "ssg_{}".format(super)
-                    ## Signatures for this SSG: get the full list
-                    #siglist = get_goldsiglist_dct(super)
-                    ## Put into object
-                    #oItem = dict(super=super, sig=sigbest, siglist=siglist,
-                    #             name=name, descr=descr, type=settype,
-                    #             order=order, code=code, url=url, author=authorname,
-                    #             incipit=incipit, explicit=explicit, sgcount=sgcount, 
-                    #             ssgcount=ssgcount, hcs=hcs)
-                    # Add to list
-                    lBack.append(oItem)
-
-            # Debugging: print the list
-            if bDebug and not code is None:
-                print("Collection id={}".format(coll.id))
-                for oItem in lBack:
-                    order = oItem.get("order")
-                    austat = oItem.get("super")
-                    sig = oItem.get("sig")
-                    code = get_lilacode(austat, code)
-                    print("sermon {}: ssg={} sig=[{}]".format(order, code, sig))
+                    oColl[obj['collection_id']].append(obj)
+
+            # (3) The name(s) of the historical collections of all these Austats
+            oHc = {}
+            lstQ = []
+            if len(manu_ids) > 0:
+                lstQ.append(Q(austat__in=CanwitAustat.objects.filter(manu_id__in=manu_ids).values('austat')))
+            if len(coll_ids) > 0:
+                lstQ.append(Q(austat__in=Caned.objects.filter(collection_id__in=coll_ids).values('austat')))
+            if len(lstQ) > 0:
+                qFilter = lstQ[0] if len(lstQ) == 1 else lstQ[0] | lstQ[1]
+                qs = Caned.objects.filter(qFilter, collection__settype="hc").order_by('collection__name').values(
+                    'austat_id', 'collection__name')
+                for obj in qs:
+                    oHc.setdefault(obj['austat_id'], []).append(obj['collection__name'])
 
+            # (4) The keywords of all the canwits in the manuscripts
+            oKw = {}
+            if len(manu_ids) > 0:
+                qs = CanwitKeyword.objects.filter(canwit__msitem__manu_id__in=manu_ids).order_by('id').values(
+                    'canwit_id', 'keyword__name')
+                for obj in qs:
+                    oKw.setdefault(obj['canwit_id'], []).append(obj['keyword__name'])
+
+            # (5) Combine into one list of items per setlist
+            oUrl = {}
+            def get_url(austat_id):
+                url = oUrl.get(austat_id)
+                if url is None:
+                    url = reverse('austat_details', kwargs={'pk': austat_id})
+                    oUrl[austat_id] = url
+                return url
+
+            for setlist in lst_setlist:
+                lBack = []
+                if setlist.setlisttype == "manu":
+                    for obj in oManu.get(setlist.manuscript_id, []):
+                        austat = obj['austat']
+                        oItem = dict(austat=austat, hcs=", ".join(oHc.get(austat, [])), kws=", ".join(oKw.get(obj['canwit'], [])),
+                                     order=obj['canwit__msitem__order'], code=obj['austat__code'], url=get_url(austat), 
+                                     author=obj['austat__author__name'], type='ms',
+                                     scount=obj['austat__scount'], ssgcount=obj['austat__ssgcount'],
+                                     srm_author=obj['canwit__author__name'], srm_sectiontitle=obj['canwit__sectiontitle'], 
+                                     srm_lectio=obj['canwit__quote'], srm_title=obj['canwit__title'], 
+                                     srm_postscriptum=obj['canwit__postscriptum'], srm_feast=obj['canwit__feast__name'], 
+                                     srm_bibleref=obj['canwit__bibleref'], srm_codnotes=obj['canwit__additional'], 
+                                     srm_notes=obj['canwit__note'])
+                        lBack.append(oItem)
+                elif setlist.setlisttype in collection_types:
+                    for obj in oColl.get(setlist.collection_id, []):
+                        austat = obj['austat']
+                        oItem = dict(austat=austat, hcs=", ".join(oHc.get(austat, [])),
+                                     name=obj['collection__name'], descr=obj['collection__descrip'], type=obj['collection__settype'],
+                                     order=obj['order'], code=obj['austat__code'], url=get_url(austat), 
+                                     author=obj['austat__author__name'], 
+                                     scount=obj['austat__scount'], ssgcount=obj['austat__ssgcount'])
+                        lBack.append(oItem)
+                oBack[setlist.id] = lBack
         except:
             msg = oErr.get_error_message()
-            oErr.DoError("ssgs_collection")
+            oErr.DoError("SetList/load_auslists")
+        return oBack
+
+    def ssgs_collection(self, bDebug = False):
+        """Get the ordered list of SSGs in the [super] type collection"""
+
+        lBack = SetList.load_auslists([self]).get(self.id)
+
+        # Debugging: print the list
+        if bDebug and not lBack is None:
+            print("Collection id={}".format(self.collection_id))
+            for oItem in lBack:
+                code = get_lilacode(oItem.get("austat"), oItem.get("code"))
+                print("sermon {}: ssg={}".format(oItem.get("order"), code))
         return lBack
 
     def ssgs_manuscript(self, bDebug = False):
         """Get the ordered list of SSGs related to a manuscript"""
 
-        oErr = ErrHandle()
-        lBack = None
-        try:
-            manu = self.manuscript
-            # Get a list of SSGs to which the sermons in this manuscript point
-            # Per issue #402 additional info needs to be there:
-            #   author, 
-            #   PASSIM code, 
-            #   incipit, explicit, HC (if the SSG is part of a historical collection), 
-            #   number of SGs contained in the equality set, 
-            #   number of links to other SSGs
-            # Per issue #402, phase 2, even more info needs to be added:
-            #   for MANUSCRIPT source-lists, there should be an option for the user 
-            #       to select additional SERMON manifestation details fields to be shown 
-            #       (options: attributed author, section title, lectio, title, incipit, explicit, 
-            #       postscriptum, feast, bible reference, cod. notes, notes, keywords)
-            qs = manu.sermondescr_super.all().order_by('sermon__msitem__order').values(
-                'sermon', 'sermon__msitem__order', 'super', 'super__code', 'super__author__name',
-                'super__incipit', 'super__explicit', 'super__sgcount', 'super__ssgcount',
-                'sermon__author__name', 'sermon__sectiontitle', 'sermon__quote', 'sermon__title', 
-                'sermon__incipit', 'sermon__explicit', 'sermon__postscriptum', 'sermon__feast__name', 
-                'sermon__bibleref', 'sermon__additional', 'sermon__note')
-            # NOTE: the 'keywords' for issue #402 are a bit more cumbersome to collect...
-            lBack = []
-            with transaction.atomic():
-                for obj in qs:
-                    # Get the order number
-                    order = obj['sermon__msitem__order']
-                    # Get the SSG and all its characteristics
-                    super = obj['super']
-                    code = obj['super__code']
-                    authorname = obj['super__author__name']
-                    incipit = obj['super__incipit']
-                    explicit = obj['super__explicit']
-                    sgcount = obj['super__sgcount']
-                    ssgcount = obj['super__ssgcount']
-                    # Sermon characteristics
-                    sermon = obj['sermon']
-                    srm_author = obj['sermon__author__name']
-                    srm_sectiontitle = obj['sermon__sectiontitle']
-                    srm_lectio = obj['sermon__quote']
-                    srm_title = obj['sermon__title']
-                    srm_incipit = obj['sermon__incipit']
-                    srm_explicit = obj['sermon__explicit']
-                    srm_postscriptum = obj['sermon__postscriptum']
-                    srm_feast = obj['sermon__feast__name']
-                    srm_bibleref = obj['sermon__bibleref']
-                    srm_codnotes = obj['sermon__additional']
-                    srm_notes = obj['sermon__note']
-
-                    # Get the name(s) of the HC
-                    lst_hc = Caned.objects.filter(super=super, collection__settype="hc").values(
-                        'collection__id', 'collection__name')
-                    hcs = ", ".join( [x['collection__name'] for x in lst_hc])
-                    # ======== DEBUGGING ============
-                    if hcs != "":
-                        iStop = 1
-                    # ===============================
-
-                    # TODO: Get the keywords
-                    lst_kw = CanwitKeyword.objects.filter(canwit=sermon).values(
-                        'keyword__name')
-                    kws = ", ".join( [x['keyword__name'] for x in lst_kw])
-
-                    # Get a URL for this ssg
-                    url = reverse('equalgold_details', kwargs={'pk': super})
-
-                    ## Treat signatures for this SSG: get the best for showing
-                    #sigbest = get_goldsig_dct(super)
-                    #if sigbest == "":
-                    #    sigbest = "ssg_{}".format(super)
-                    ## Signatures for this SSG: get the full list
-                    #siglist = get_goldsiglist_dct(super)
-
-                    # Put into object
-                    oItem = dict(super=super, hcs=hcs, kws=kws,                                              # sig=sigbest, siglist=siglist
-                                 order=order, code=code, url=url, author=authorname, type='ms',
-                                 incipit=incipit, explicit=explicit, sgcount=sgcount, ssgcount=ssgcount,
-                                 srm_author=srm_author, srm_sectiontitle=srm_sectiontitle, srm_lectio=srm_lectio,
-                                 srm_title=srm_title, srm_incipit=srm_incipit, srm_explicit=srm_explicit,
-                                 srm_postscriptum=srm_postscriptum, srm_feast=srm_feast, 
-                                 srm_bibleref=srm_bibleref, srm_codnotes=srm_codnotes, srm_notes=srm_notes)
-                    # Add to list
-                    lBack.append(oItem)
-
-            # Debugging: print the list
-            if bDebug:
-                print("Manuscript id={}".format(manu.id))
-                for oItem in lBack:
-                    order = oItem.get("order")
-                    super = oItem.get("super")
-                    sig = oItem.get("sig")
-                    code = get_lilacode(super, code)
-                    print("sermon {}: ssg={} sig=[{}]".format(order, code, sig))
+        lBack = SetList.load_auslists([self]).get(self.id)
 
-        except:
-            msg = oErr.get_error_message()
-            oErr.DoError("ssgs_manuscript")
+        # Debugging: print the list
+        if bDebug and not lBack is None:
+            print("Manuscript id={}".format(self.manuscript_id))
+            for oItem in lBack:
+                code = get_lilacode(oItem.get("austat"), oItem.get("code"))
+                print("sermon {}: ssg={}".format(oItem.get("order"), code))
         return lBack
     
 
@@ -713,77 +640,15 @@ class SetDef(models.Model):
         oErr = ErrHandle()
         oBack = None
         try:
-            # Get to the research set
-            id_list = [x['id'] for x in self.researchset.researchset_setlists.all().order_by('order').values("id")]
-            lst_rset = []
-            if pivot_id != None and pivot_id in id_list:
-                lst_rset.append(pivot_id)
-            # Add the remaining ID's
-            for id in id_list:
-                if not id in lst_rset: lst_rset.append(id)
-
-            # Check the number of lists in the research set
-            if lst_rset == None or len(lst_rset) < 2:
-                oErr.Status("Not enough SSG-lists to compare")
-                return None
-
-            # We have enough lists: Get the lists of SSGs for each 
-            lst_ssglists = []
-            for setlist_id in lst_rset:
-                # Get the actual setlist
-                setlist = SetList.objects.filter(id=setlist_id).first()
-                if setlist != None:
-                    # Create an empty SSG-list
-                    oSsgList = {}
-                    # Add the object itself
-                    oSsgList['obj'] = setlist
-                    # Add the name object for this list
-                    oSsgList['title'] = setlist.get_title_object()
-                    # Get the list of SSGs for this list
-                    oSsgList['auslist'] = setlist.get_ssg_list()
-                    # Add the list object to the list
-                    lst_ssglists.append(oSsgList)
-            
-            # Return this list of lists
-            oBack = dict(ssglists=lst_ssglists)
-            # Prepare and create an appropriate table = list of rows
-            rows = []
-            # Create header row
-            oRow = []
-            oRow.append('Gr/Cl/Ot')
-            for oSsgList in lst_ssglists:
-                # Add the title *object*
-                oRow.append(oSsgList['title'])
-            rows.append(oRow)
-
-            # Start out with the pivot: the *first* one in 'auslist'
-            lst_pivot = lst_ssglists[0]
-            for oPivot in lst_pivot['auslist']:
-                # Create a row based on this pivot
-                oRow = []
-                # (1) row header
-                oRow.append(oPivot['sig'])
-                # (2) pivot SSG number
-                oRow.append(oPivot['order'])
-                # (3) SSG number in all other manuscripts
-                ssg_id = oPivot['super']
-                for lst_this in lst_ssglists[1:]:
-                    bFound = False
-                    order = ""
-                    for oItem in lst_this['auslist']:
-                        if ssg_id == oItem['super']:
-                            # Found it!
-                            order = oItem['order']
-                            bFound = True
-                            break
-                    oRow.append(order)
-                # (4) add the row to the list
-                rows.append(oRow)
-            # Make sure we return the right information
-            oBack['setlist'] = rows
+            from lila.lict.dct import DctEngine
+
+            # The engine loads (or takes from the cache) all lists of the research set
+            oBack = DctEngine(self.researchset).get_table(pivot_id)
         except:
             msg = oErr.get_error_message()
             oErr.DoError("SetDef/get_setlist")
         return oBack
 
 
+# The DCT of a research set depends on its lists
+UserSearch.track_models([SetList])
@@ -6,6 +6,7 @@ Replace this with more appropriate tests for your application.
 """
 
 import django
+import json
 from django.test import TestCase
 
 # TODO: Configure your database in settings.py and sync before running tests.
@@ -23,4 +24,59 @@ class SimpleTest(TestCase):
         """
         Tests that 1 + 1 always equals 2.
         """
-        self.assertEqual(1 + 1, 2)
\ No newline at end of file
+        self.assertEqual(1 + 1, 2)
+
+class DctEngineTests(TestCase):
+    """Test the matches, pivot and table of a research set"""
+
+    def add_link(self, manu, austat, order):
+        from lila.seeker.models import MsItem, Canwit, CanwitAustat
+        msitem = MsItem.objects.create(manu=manu, order=order)
+        canwit = Canwit.objects.create(msitem=msitem)
+        return CanwitAustat.objects.create(canwit=canwit, austat=austat)
+
+    def test_dct(self):
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from lila.seeker.models import Profile, Manuscript, Austat
+        from lila.lict.models import ResearchSet, SetList
+        from lila.lict.dct import DctEngine
+
+        user = User.objects.create(username="dct_tester")
+        profile = Profile.objects.create(user=user)
+        rset = ResearchSet.objects.create(name="dct", profile=profile)
+        austats = [Austat.objects.create(code="LILAC {}".format(x)) for x in range(5)]
+        lst_manu = []
+        # Manuscript 1: 0,1,2,3   Manuscript 2: 2,0,4   Manuscript 3: 4,4
+        for idx, lst_austat in enumerate([[0, 1, 2, 3], [2, 0, 4], [4, 4]]):
+            manu = Manuscript.objects.create(idno="DCT {}".format(idx), yearstart=900, yearfinish=1000)
+            for order, austat in enumerate(lst_austat):
+                self.add_link(manu, austats[austat], order + 1)
+            lst_manu.append(manu)
+            SetList.objects.create(researchset=rset, order=idx + 1, setlisttype="manu", manuscript=manu)
+
+        lst_ssglists = DctEngine(rset).calculate_lists()
+        self.assertEqual([x['austatid'] for x in lst_ssglists],
+                         [[austats[x].id for x in y] for y in [[0, 1, 2, 3], [2, 0, 4], [4, 4]]])
+        self.assertEqual([x['unique_matches'] for x in lst_ssglists], [2, 3, 1])
+        self.assertEqual(lst_ssglists[1]['title']['matchset'], {"1": 2, "3": 2})
+        self.assertEqual(lst_ssglists[2]['title']['matchset'], {"1": 0, "2": 1})
+        self.assertEqual(lst_ssglists[1]['title']['matches'], 2)
+        self.assertEqual(lst_ssglists[0]['title']['size'], 4)
+        self.assertEqual(rset.calculate_pm(), 2)
+        self.assertTrue(rset.update_austatlists())
+        self.assertEqual([x['unique_matches'] for x in rset.get_austatlists()], [2, 3, 1])
+        self.assertEqual(len(json.loads(SetList.objects.get(id=lst_ssglists[0]['id']).contents)['auslist']), 4)
+
+        # The table with the second manuscript as pivot
+        setlist_id = lst_ssglists[1]['id']
+        oTable = DctEngine(rset).get_table(setlist_id)
+        self.assertEqual(oTable['ssglists'][0]['obj'].manuscript_id, lst_manu[1].id)
+        self.assertEqual([x[1:] for x in oTable['setlist'][1:]], [[1, 3, ""], [2, 1, ""], [3, "", 1]])
+        self.assertEqual(oTable['setlist'][1][0], "LILAC 2")
+
+        # The number of queries does not depend on the size of the lists
+        with CaptureQueriesContext(connection) as ctx:
+            DctEngine(rset).calculate_lists()
+        self.assertLessEqual(len(ctx.captured_queries), 8)
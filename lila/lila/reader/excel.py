@@ -39,7 +39,7 @@ from lila.settings import APP_PREFIX, MEDIA_DIR
 from lila.utils import ErrHandle
 
 from lila.seeker.models import Manuscript, MsItem, Canwit, Profile, Report, Codico, Codhead, Location, LocationType, Library, \
-    Austat, Auwork, Collection, Colwit
+    Austat, Auwork, Collection, Colwit, LookupMap
 from lila.seeker.views import app_editor
 from lila.reader.views import ReaderImport
 from lila.reader.forms import UploadFileForm
@@ -82,7 +82,7 @@ class ManuscriptUploadExcel(ReaderImport):
             profile = Profile.get_user_profile(username)
             team_group = app_editor
             kwargs = {'profile': profile, 'username': username, 'team_group': team_group, 
-                      'keyfield': 'path', 'source': source}
+                      'keyfield': 'path', 'source': source, 'lookup': LookupMap(), 'batch_size': self.chunk_size}
 
             # Initialize column numbers
             for oDef in col_defs:
@@ -136,31 +136,46 @@ class ManuscriptUploadExcel(ReaderImport):
                                 # Get a list of all columns (in lower case)
                                 self.get_columns_excel(ws_manu, col_defs, col_number)
 
-                                # Walk through all rows
-                                bStop = False
-                                row_num = 2
-                                value = ws_manu.cell(row=row_num, column=1).value
-                                while not bStop and not value is None or value == "":
-                                    # Collect the data from this row
-                                    oManu = self.get_row_excel(ws_manu, row_num, col_number)
+                                # Read all rows at once
+                                lst_row = list(self.get_rows_excel(ws_manu, col_number))
 
+                                # Find out which of these manuscripts exist already, using one query
+                                set_idno, set_pair, set_man = self.get_existing_manuscripts(lst_row)
+
+                                lst_new = []
+                                lst_overwrite = []
+                                for oManu in lst_row:
                                     # Check if this manuscript already exists
                                     idno = oManu.get("idno")
                                     lilacode = oManu.get("lilacode")
                                     bExists = False
                                     if idno is None:
-                                        # Try to locate it by lilacode
-                                        if not lilacode is None:
-                                            bExists = Manuscript.objects.filter(lilacode__iexact=lilacode).exists()
+                                        # Without a shelfmark it cannot be added
+                                        bExists = True
+                                    elif lilacode is None:
+                                        # There is no lilacode
+                                        bExists = str(idno).lower() in set_idno
                                     else:
-                                        # Do we have a lilacode
-                                        if lilacode is None:
-                                            # There is no lilacode
-                                            bExists = Manuscript.objects.filter(idno__iexact=idno).exists()
-                                        else:
-                                            bExists = Manuscript.objects.filter(idno__iexact=idno, lilacode__iexact=lilacode).exists()
+                                        bExists = (str(idno).lower(), str(lilacode).lower()) in set_pair
 
                                     if not bExists:
+                                        # Next rows with the same shelfmark/lilacode are regarded as existing
+                                        set_idno.add(str(idno).lower())
+                                        if not lilacode is None:
+                                            set_pair.add((str(idno).lower(), str(lilacode).lower()))
+                                        if idno in set_man:
+                                            # A manuscript with this shelfmark is overwritten by custom_add()
+                                            lst_overwrite.append(oManu)
+                                        else:
+                                            lst_new.append(oManu)
+
+                                oStatus.set("adding", msg="file={} manuscripts={}".format(filename, len(lst_new) + len(lst_overwrite)))
+                                lst_manu = []
+                                with transaction.atomic():
+                                    # New manuscripts are added in bulk
+                                    lst_manu = Manuscript.bulk_add(lst_new, **kwargs)
+
+                                    for oManu in lst_overwrite:
                                         # Add this manuscript using custom_add()
                                         manu = Manuscript.custom_add(oManu, **kwargs)
 
@@ -177,26 +192,17 @@ class ManuscriptUploadExcel(ReaderImport):
                                                 oManu['name'] = oManu.get("title")
 
                                             codico = Codico.custom_add(oManu, **kwargs)
+                                        lst_manu.append(manu)
 
-                                        oResult['count'] += 1
-                                        oResult['manu'] = manu.id
-                                        oResult['idno'] = manu.idno
-                                        oResult['lilacode'] = manu.lilacode
-
-                                        # Add the result to the list of results
-                                        lResults.append(oResult)
-
-                                        # Create the [Report] results for this one
-                                        oRead = dict(status="ok", msg="read", manu_id=manu.id,
-                                                filename=filename, shelfmark=manu.idno, lilacode=manu.lilacode)
-                                        lst_read.append(oRead)
-
-                                    # Go to the next row
-                                    row_num += 1
-                                    # Get the values from there
-                                    value = ws_manu.cell(row=row_num, column=1).value
-
+                                for manu in lst_manu:
+                                    oResult['count'] += 1
+                                    # Add the result to the list of results
+                                    lResults.append(dict(count=oResult['count'], manu=manu.id, idno=manu.idno, lilacode=manu.lilacode))
 
+                                    # Create the [Report] results for this one
+                                    oRead = dict(status="ok", msg="read", manu_id=manu.id,
+                                            filename=filename, shelfmark=manu.idno, lilacode=manu.lilacode)
+                                    lst_read.append(oRead)
 
                         # Create a report and add it to what we return
                         oContents = {'headers': lHeader, 'list': lst_read}
@@ -210,6 +216,27 @@ class ManuscriptUploadExcel(ReaderImport):
             code = oErr.get_error_message()
         return bOkay, code
 
+    def get_existing_manuscripts(self, lst_row):
+        """Find the manuscripts that exist already for the shelfmarks in [lst_row]
+
+        Returns the lower-case shelfmarks, the lower-case (shelfmark, lilacode) pairs 
+        and the exact shelfmarks of existing manuscripts of type 'man'
+        """
+
+        set_idno = set()
+        set_pair = set()
+        set_man = set()
+        lst_idno = list(set([str(x.get("idno")).lower() for x in lst_row if not x.get("idno") is None]))
+        for start in range(0, len(lst_idno), self.chunk_size):
+            qs = Manuscript.objects.annotate(idno_l=Lower('idno')).filter(idno_l__in=lst_idno[start:start+self.chunk_size])
+            for idno, lilacode, mtype in qs.values_list('idno', 'lilacode', 'mtype'):
+                set_idno.add(idno.lower())
+                if not lilacode is None:
+                    set_pair.add((idno.lower(), lilacode.lower()))
+                if mtype == "man":
+                    set_man.add(idno)
+        return set_idno, set_pair, set_man
+
 
 class ManuscriptUploadCanwits(ReaderImport):
     """Specific parameters for importing canwits into an *EXISTING* manuscript from Excel"""
@@ -244,7 +271,7 @@ class ManuscriptUploadCanwits(ReaderImport):
             username = self.username
             profile = Profile.get_user_profile(username)
             team_group = app_editor
-            kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
+            kwargs = {'profile': profile, 'username': username, 'team_group': team_group, 'lookup': LookupMap()}
 
             # Initialize column numbers
             for oDef in col_defs:
@@ -351,24 +378,20 @@ class ManuscriptUploadCanwits(ReaderImport):
                                     if not msitem_last is None:
                                         order = msitem_last.order + 1
 
-                                    # Walk through all rows
-                                    bStop = False
-                                    row_num = 2
-                                    while not bStop:
-                                        value = ws.cell(row=row_num, column=1).value
-                                        bStop = (value is None or value == "")
-                                        if not bStop:
-                                            # Read the values for this row
-                                            oValue = self.get_row_excel(ws, row_num, col_number)
-                                            #oValue = {}
-                                            #for field_name, col_num in col_number.items():
-                                            #    if col_num > 0:
-                                            #        oValue[field_name] = ws.cell(row=row_num, column=col_num).value
+                                    # The full texts of the Canwits that are already in this manuscript (one query)
+                                    qs = Canwit.objects.filter(msitem__codico__manuscript=manu)
+                                    set_ftext = set(["" if x is None else x.lower() for x in qs.values_list('ftext', flat=True)])
+
+                                    # Remove MsItems without Canwit or Codhead only once, instead of for each Canwit
+                                    MsItem.objects.filter(codico__manuscript=manu, itemsermons__isnull=True, itemheads__isnull=True).delete()
 
+                                    # Walk through all rows
+                                    with transaction.atomic():
+                                        for oValue in self.get_rows_excel(ws, col_number):
                                             # We have all the values, process the essentials to create a CanWit (if it doesn't exist already)
                                             val_ftext = oValue['ftext']
-                                            canwit = Canwit.objects.filter(msitem__codico__manuscript=manu, ftext__iexact=val_ftext).first()
-                                            if canwit is None:
+                                            sKey = "" if val_ftext is None else str(val_ftext).lower()
+                                            if not sKey in set_ftext:
                                                 # Start creating a result
                                                 oResult = {}
                                                 oResult['order'] = order
@@ -377,7 +400,9 @@ class ManuscriptUploadCanwits(ReaderImport):
                                                 # Make sure to indicate that each row in the Excel is not a structural (hierarchy creating)
                                                 #    type, but an actual Canwit
                                                 oValue['type'] = 'canwit'
-                                                canwit = Canwit.custom_add(oValue, manuscript=manu, order=order, parent=parent)
+                                                canwit = Canwit.custom_add(oValue, manuscript=manu, order=order, parent=parent, 
+                                                                           lookup=kwargs['lookup'], clean_msitems=False)
+                                                set_ftext.add(sKey)
                                                 order += 1
 
                                                 oResult['canwit'] = canwit.id
@@ -387,8 +412,6 @@ class ManuscriptUploadCanwits(ReaderImport):
 
                                                 # Add the result to the list of results
                                                 lResults.append(oResult)
-                                        # Go to the next row
-                                        row_num += 1
                                     
 
                             else:
@@ -568,7 +591,7 @@ class AustatUploadExcel(ReaderImport):
             username = self.username
             profile = Profile.get_user_profile(username)
             team_group = app_editor
-            kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
+            kwargs = {'profile': profile, 'username': username, 'team_group': team_group, 'lookup': LookupMap()}
 
             # Initialize column numbers
             for oDef in col_defs:
@@ -634,35 +657,36 @@ class AustatUploadExcel(ReaderImport):
                                 # Make sure we at least have [ftext]
                                 if col_number['ftext'] >= 1:
 
-                                    # Walk through all rows
-                                    bStop = False
-                                    row_num = 2
-                                    while not bStop:
-                                        value = ws_austat.cell(row=row_num, column=1).value
-                                        bStop = (value is None or value == "")
-                                        if not bStop:
-                                            # Read the values for this row into dictionary [oValue]
-                                            oValue = self.get_row_excel(ws_austat, row_num, col_number)
-                                            #oValue = {}
-                                            #for field_name, col_num in col_number.items():
-                                            #    if col_num > 0:
-                                            #        oValue[field_name] = ws_austat.cell(row=row_num, column=col_num).value
+                                    # Read all rows at once
+                                    lst_row = list(self.get_rows_excel(ws_austat, col_number))
+                                    for oValue in lst_row:
+                                        # Split into Auwork.key (short Work key) and Austat.keycode (number)
+                                        oValue['work_key'], oValue['austat_key'] = Austat.split_key(oValue['key'])
+
+                                    # The (work key, keycode) combinations that exist already (one query per chunk)
+                                    set_key = set()
+                                    lst_work = list(set([x['work_key'] for x in lst_row if not x['work_key'] is None]))
+                                    for start in range(0, len(lst_work), self.chunk_size):
+                                        qs = Austat.objects.filter(auwork__key__in=lst_work[start:start+self.chunk_size])
+                                        for work_key, keycode in qs.values_list('auwork__key', 'keycode'):
+                                            set_key.add((work_key, keycode))
 
+                                    # Walk through all rows
+                                    with transaction.atomic():
+                                        for oValue in lst_row:
                                             # We have all the values, process the essentials to create a CanWit (if it doesn't exist already)
                                             val_key = oValue['key']
-                                            # Split into Auwork.key (short Work key) and Austat.keycode (number)
-                                            work_key, austat_key = Austat.split_key(val_key)
-                                            austat = Austat.objects.filter(auwork__key=work_key, keycode=austat_key).first()
-                                            if austat is None:
+                                            work_key = oValue['work_key']
+                                            austat_key = oValue['austat_key']
+                                            if not (work_key, austat_key) in set_key:
                                                 # Start creating a result
                                                 oResult = {}
                                                 oResult['key'] = val_key
 
                                                 # Make sure to indicate that each row in the Excel is an Austat description
                                                 oValue['type'] = 'austat'
-                                                oValue['work_key'] = work_key
-                                                oValue['austat_key'] = austat_key
-                                                austat = Austat.custom_add(oValue)
+                                                austat = Austat.custom_add(oValue, lookup=kwargs['lookup'])
+                                                set_key.add((work_key, austat_key))
 
                                                 # Not sure what to do with 'order'
                                                 # order += 1
@@ -673,8 +697,6 @@ class AustatUploadExcel(ReaderImport):
 
                                                 # Add the result to the list of results
                                                 lResults.append(oResult)
-                                        # Go to the next row
-                                        row_num += 1
 
  
                     # Set the status
@@ -717,7 +739,7 @@ class AuworkUploadExcel(ReaderImport):
             username = self.username
             profile = Profile.get_user_profile(username)
             team_group = app_editor
-            kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
+            kwargs = {'profile': profile, 'username': username, 'team_group': team_group, 'lookup': LookupMap(), 'batch_size': self.chunk_size}
 
             # Initialize column numbers in dictionary [col_number]
             for oDef in col_defs:
@@ -771,37 +793,28 @@ class AuworkUploadExcel(ReaderImport):
                                 # Make sure we at least have [key]
                                 if col_number['key'] >= 1:
 
-                                    # Walk through all rows
-                                    bStop = False
-                                    row_num = 2
-                                    while not bStop:
-                                        value = ws_auwork.cell(row=row_num, column=1).value
-                                        bStop = (value is None or value == "")
-                                        if not bStop:
-                                            # Read the values for this row into dictionary [oValue]
-                                            oValue = self.get_row_excel(ws_auwork, row_num, col_number)
-
-                                            # We have all the values, process the essentials to create a CanWit (if it doesn't exist already)
-                                            auwork_key = oValue['key']
-                                            auwork = Auwork.objects.filter(key=auwork_key).first()
-                                            # Only process if this Auwork has not yet been added!!!
-                                            if auwork is None:
-                                                # Start creating a result
-                                                oResult = {}
-                                                oResult['key'] = auwork_key
+                                    # Read all rows and skip the Auwork items that have already been added
+                                    set_key = set(Auwork.objects.values_list('key', flat=True))
+                                    lst_new = []
+                                    for oValue in self.get_rows_excel(ws_auwork, col_number):
+                                        auwork_key = oValue['key']
+                                        if not auwork_key in set_key:
+                                            lst_new.append(oValue)
+                                            set_key.add(auwork_key)
+
+                                    # Create the new works in bulk
+                                    for auwork in Auwork.bulk_add(lst_new, **kwargs):
+                                        # Start creating a result
+                                        oResult = {}
+                                        oResult['key'] = auwork.key
+
+                                        # Process what we get back
+                                        oResult['auwork'] = auwork.id
+                                        oResult['work'] = "-" if auwork.work is None else auwork.work
+                                        oResult['opus'] = "-" if auwork.opus is None else auwork.opus
 
-                                                # Create this work
-                                                auwork = Auwork.custom_add(oValue)
-
-                                                # Process what we get back
-                                                oResult['auwork'] = auwork.id
-                                                oResult['work'] = "-" if auwork.work is None else auwork.work
-                                                oResult['opus'] = "-" if auwork.opus is None else auwork.opus
-
-                                                # Add the result to the list of results
-                                                lResults.append(oResult)
-                                        # Go to the next row
-                                        row_num += 1
+                                        # Add the result to the list of results
+                                        lResults.append(oResult)
 
                     # Set the status
                     oStatus.set("finishing", msg="file={}".format(filename))
@@ -842,7 +855,7 @@ class ColwitUploadExcel(ReaderImport):
             username = self.username
             profile = Profile.get_user_profile(username)
             team_group = app_editor
-            kwargs = {'profile': profile, 'username': username, 'team_group': team_group}
+            kwargs = {'profile': profile, 'username': username, 'team_group': team_group, 'lookup': LookupMap()}
 
             # Initialize column numbers in dictionary [col_number]
             for oDef in col_defs:
@@ -897,15 +910,8 @@ class ColwitUploadExcel(ReaderImport):
                                 if col_number['key'] >= 1 and col_number['manuscript'] >= 1 and col_number['collection'] >= 1:
 
                                     # Walk through all rows
-                                    bStop = False
-                                    row_num = 2
-                                    while not bStop:
-                                        value = ws_colwit.cell(row=row_num, column=1).value
-                                        bStop = (value is None or value == "")
-                                        if not bStop:
-                                            # Read the values for this row into dictionary [oValue]
-                                            oValue = self.get_row_excel(ws_colwit, row_num, col_number)
-
+                                    with transaction.atomic():
+                                        for oValue in self.get_rows_excel(ws_colwit, col_number):
                                             # We have all the values, process the essentials to create a CanWit (if it doesn't exist already)
                                             colwit_key = oValue['key']
                                             colwit_manu = oValue['manuscript']
@@ -926,32 +932,22 @@ class ColwitUploadExcel(ReaderImport):
                                                 if colwit_key != lilacode:
                                                     oValue['key'] = lilacode
 
-                                                # Try to find this one
-                                                colwit = Colwit.objects.filter(lilacodefull__iexact=lilacode).first()
-                                                if colwit is None:
-                                                    # Create it
-                                                    colwit = Colwit.objects.filter(lilacodefull=lilacode)
-
-                                                # Make sure we can continue safely
-                                                if not colwit is None:
-                                                    # Start creating a result
-                                                    oResult = {}
-                                                    oResult['key'] = colwit_key
-
-                                                    # Create this work
-                                                    colwit = Colwit.custom_add(oValue, **kwargs)
-
-                                                    # Process what we get back
-                                                    oResult['colwit'] = colwit.id
-                                                    oResult['lilacode'] = colwit.lilacodefull
-                                                    oResult['manuscript'] = colwit_manu
-                                                    oResult['locus'] = colwit_locus
-                                                    oResult['collection'] = colwit_coll
-
-                                                    # Add the result to the list of results
-                                                    lResults.append(oResult)
-                                        # Go to the next row
-                                        row_num += 1
+                                                # Start creating a result
+                                                oResult = {}
+                                                oResult['key'] = colwit_key
+
+                                                # Create this work (or overwrite an existing one)
+                                                colwit = Colwit.custom_add(oValue, **kwargs)
+
+                                                # Process what we get back
+                                                oResult['colwit'] = colwit.id
+                                                oResult['lilacode'] = colwit.lilacodefull
+                                                oResult['manuscript'] = colwit_manu
+                                                oResult['locus'] = colwit_locus
+                                                oResult['collection'] = colwit_coll
+
+                                                # Add the result to the list of results
+                                                lResults.append(oResult)
 
                     # Set the status
                     oStatus.set("finishing", msg="file={}".format(filename))
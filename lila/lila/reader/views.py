@@ -14,7 +14,8 @@ from django.db.models.functions import Lower
 from django.db.models.query import QuerySet 
 from django.forms import formset_factory, modelformset_factory, inlineformset_factory, ValidationError
 from django.forms.models import model_to_dict
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse
+from django.core.files import File
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse, QueryDict
 from django.shortcuts import get_object_or_404, render, redirect
 from django.template.loader import render_to_string
 from django.template import Context
@@ -22,6 +23,8 @@ from django.views.generic.detail import DetailView
 from django.views.generic.base import RedirectView
 from django.views.generic import ListView, View
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.datastructures import MultiValueDict
+from django.utils.module_loading import import_string
 
 # General imports
 from datetime import datetime
@@ -31,6 +34,7 @@ from functools import reduce
 from time import sleep 
 import fnmatch
 import sys, os
+import tempfile
 import base64
 import json
 import csv, re
@@ -46,12 +50,12 @@ from xml.dom import minidom
 import xml.etree.ElementTree as ElementTree
  
 # ======= imports from my own application ======
-from lila.settings import APP_PREFIX, MEDIA_DIR, WRITABLE_DIR
+from lila.settings import APP_PREFIX, MEDIA_DIR, WRITABLE_DIR, USE_JOBS
 from lila.utils import ErrHandle
 from lila.reader.forms import UploadFileForm, UploadFilesForm
 from lila.seeker.models import Manuscript, Canwit, Status, SourceInfo, ManuscriptExt, Provenance, ProvenanceMan, \
     Library, Location, CanwitSignature, Author, Feast, Daterange, Comment, Profile, MsItem, Codhead, Origin, \
-    Report, Keyword, ManuscriptKeyword, ManuscriptProject, STYPE_IMPORTED, get_current_datetime
+    Report, Keyword, ManuscriptKeyword, ManuscriptProject, Job, STYPE_IMPORTED, get_current_datetime
 
 # ======= from RU-Basic ========================
 from lila.basic.views import BasicList, BasicDetails, BasicPart
@@ -141,6 +145,60 @@ def get_user_profile(username):
         profile = Profile.objects.filter(user=user).first()
         return profile
 
+def run_import_job(job):
+    """Perform a ReaderImport that has been queued with ReaderImport.add_job()"""
+
+    oErr = ErrHandle()
+    oResult = {}
+    lst_fp = []
+    try:
+        params = job.get_params()
+        # Re-create the view and a stand-in for its request
+        view = import_string(params['view'])()
+        post = QueryDict(mutable=True)
+        for k, v in params.get('post', {}).items():
+            post.setlist(k, v)
+        files = MultiValueDict()
+        for oFile in params.get('files', []):
+            fp = open(oFile['path'], "rb")
+            lst_fp.append(fp)
+            files.appendlist('files_field', File(fp, name=oFile['name']))
+        request = JobRequest(job.user, post, files)
+
+        view.initializations(request, params.get('pk'))
+        view.data = {'status': 'ok', 'html': ''}
+        view.username = job.user
+        view.oStatus = job.progress
+        if view.oStatus is None:
+            view.oStatus = Status.objects.create(user=job.user, type=view.import_type, status="preparing")
+
+        oResult = view.do_import(request)
+        if oResult.get('status') == "error":
+            view.oStatus.set("error", msg=oResult.get('html'))
+    except:
+        msg = oErr.get_error_message()
+        oErr.DoError("run_import_job")
+        raise
+    finally:
+        # The uploaded files are no longer needed
+        for fp in lst_fp:
+            fp.close()
+            if os.path.exists(fp.name):
+                os.remove(fp.name)
+    return oResult
+
+
+class JobRequest(object):
+    """The parts of a POST request that an import needs, as re-created by a background job"""
+
+    method = "POST"
+
+    def __init__(self, username, post, files):
+        self.user = User.objects.filter(username=username).first()
+        self.POST = post
+        self.GET = QueryDict()
+        self.FILES = files
+
 
 
 class ReaderImport(View):
@@ -159,6 +217,7 @@ class ReaderImport(View):
     username = ""
     model = None
     mForm = UploadFilesForm
+    chunk_size = 500        # Number of items per query or per bulk_create() batch
     
     def post(self, request, pk=None):
         # A POST request means we are trying to SAVE something
@@ -180,58 +239,14 @@ class ReaderImport(View):
             self.oStatus = oStatus
 
             form = self.mForm(request.POST, request.FILES)
-            lResults = []
             if form.is_valid():
                 # NOTE: from here a breakpoint may be inserted!
                 print('import_{}: valid form'.format(self.import_type))
-                oErr = ErrHandle()
-                try:
-                    # The list of headers to be shown
-                    lHeader = ['status', 'msg', 'name', 'yearstart', 'yearfinish', 'library', 'idno', 'filename', 'url']
-
-                    # Get profile 
-                    profile = Profile.get_user_profile(username) 
-                    
-                    # Create a SourceInfo object for this extraction
-                    source = SourceInfo.objects.create(url=self.sourceinfo_url, collector=username, profile = profile)
-
-                    # Process the request
-                    bOkay, code = self.process_files(request, source, lResults, lHeader)
-
-                    if bOkay:
-                        # Adapt the 'source' to tell what we did 
-                        source.code = code
-                        oErr.Status(code)
-                        source.save()
-                        # Indicate we are ready
-                        oStatus.set("readyclose")
-                        # Get a list of errors
-                        error_list = [str(item) for item in self.arErr]
-
-                        statuscode = "error" if len(error_list) > 0 else "completed"
-
-                        # Create the context
-                        context = dict(
-                            statuscode=statuscode,
-                            results=lResults,
-                            error_list=error_list
-                            )
-                    else:
-                        self.arErr.append(code)
-
-                    if len(self.arErr) == 0:
-                        # Get the HTML response
-                        self.data['html'] = render_to_string(self.template_name, context, request)
-                    else:
-                        lHtml = []
-                        for item in self.arErr:
-                            lHtml.append(item)
-                        self.data['html'] = "There are errors: {}".format("\n".join(lHtml))
-                except:
-                    msg = oErr.get_error_message()
-                    oErr.DoError("import_{}".format(self.import_type))
-                    self.data['html'] = msg
-                    self.data['status'] = "error"
+                if USE_JOBS:
+                    # Leave the actual import to the background worker
+                    self.add_job(request, pk)
+                else:
+                    self.do_import(request)
 
             else:
                 self.data['html'] = 'invalid form: {}'.format(form.errors)
@@ -244,6 +259,95 @@ class ReaderImport(View):
         # Return the information
         return JsonResponse(self.data)
 
+    def do_import(self, request):
+        """Process the uploaded files; [request] may also be the JobRequest of a background job"""
+
+        oErr = ErrHandle()
+        lResults = []
+        oStatus = self.oStatus
+        username = self.username
+        try:
+            # The list of headers to be shown
+            lHeader = ['status', 'msg', 'name', 'yearstart', 'yearfinish', 'library', 'idno', 'filename', 'url']
+
+            # Get profile 
+            profile = Profile.get_user_profile(username) 
+                    
+            # Create a SourceInfo object for this extraction
+            source = SourceInfo.objects.create(url=self.sourceinfo_url, collector=username, profile = profile)
+
+            # Process the request
+            bOkay, code = self.process_files(request, source, lResults, lHeader)
+
+            if bOkay:
+                # Adapt the 'source' to tell what we did 
+                source.code = code
+                oErr.Status(code)
+                source.save()
+                # Indicate we are ready
+                oStatus.set("readyclose")
+                # Get a list of errors
+                error_list = [str(item) for item in self.arErr]
+
+                statuscode = "error" if len(error_list) > 0 else "completed"
+
+                # Create the context
+                context = dict(
+                    statuscode=statuscode,
+                    results=lResults,
+                    error_list=error_list
+                    )
+            else:
+                self.arErr.append(code)
+
+            if len(self.arErr) == 0:
+                # Get the HTML response (a background job has no real request)
+                if not isinstance(request, HttpRequest): request = None
+                self.data['html'] = render_to_string(self.template_name, context, request)
+            else:
+                lHtml = []
+                for item in self.arErr:
+                    lHtml.append(item)
+                self.data['html'] = "There are errors: {}".format("\n".join(lHtml))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("import_{}".format(self.import_type))
+            self.data['html'] = msg
+            self.data['status'] = "error"
+        return self.data
+
+    def add_job(self, request, pk=None):
+        """Store the uploaded files and put the import on the job queue"""
+
+        oErr = ErrHandle()
+        try:
+            # The files are kept in the media directory until the job has read them
+            jobdir = os.path.abspath(os.path.join(MEDIA_DIR, "jobs"))
+            if not os.path.exists(jobdir):
+                os.makedirs(jobdir)
+            lst_file = []
+            for data_file in request.FILES.getlist('files_field'):
+                fd, sPath = tempfile.mkstemp(prefix="{}_".format(self.import_type), dir=jobdir)
+                with os.fdopen(fd, "wb") as fp:
+                    for chunk in data_file.chunks():
+                        fp.write(chunk)
+                lst_file.append(dict(name=data_file.name, path=sPath))
+
+            # Everything the job needs to re-create this view and its request
+            params = dict(view="{}.{}".format(self.__class__.__module__, self.__class__.__name__),
+                          pk=pk, files=lst_file,
+                          post={k: request.POST.getlist(k) for k in request.POST.keys()})
+            job = Job.add("lila.reader.views.run_import_job", self.username, params, self.oStatus)
+
+            self.data['jobid'] = job.id
+            self.data['progressurl'] = "{}?synctype={}".format(reverse('sync_progress'), self.import_type)
+            self.data['html'] = "The import has been queued as job {}: its progress can be followed below".format(job.id)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("ReaderImport/add_job")
+            self.data['html'] = msg
+            self.data['status'] = "error"
+
     def initializations(self, request, object_id):
         # Clear errors
         self.arErr = []
@@ -302,16 +406,12 @@ class ReaderImport(View):
         oErr = ErrHandle()
         bResult = True
         try:
-            # Get a list of all columns (in lower case)
-            row_num = 1
-            col_num = 1
-            bStop = False
-            while not bStop:
-                k = ws.cell(row=row_num, column=col_num).value
-                if k is None or k == "":
-                    bStop = True
-                else:
-                    col_name = k.lower()
+            # Get a list of all columns (in lower case) from the first row
+            for row in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+                for col_num, k in enumerate(row, 1):
+                    if k is None or k == "":
+                        break
+                    col_name = str(k).lower()
                     for oDef in col_defs:
                         name = oDef['name']
                         if col_number[name] < 0:
@@ -320,7 +420,6 @@ class ReaderImport(View):
                                     # Found it!
                                     col_number[name] = col_num
                                     break
-                col_num += 1
         except:
             msg = oErr.get_error_message()
             oErr.DoError("get_columns_excel")
@@ -344,6 +443,26 @@ class ReaderImport(View):
             bResult = False
         return oValue
     
+    def get_rows_excel(self, ws, col_number):
+        """Read the data rows of an excel, stopping at the first row without a value in column 1
+        
+        Note: iter_rows() reads a (read_only) worksheet sequentially, unlike ws.cell() for each value
+        """
+
+        oErr = ErrHandle()
+        try:
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                if len(row) == 0 or row[0] is None or row[0] == "":
+                    break
+                oValue = {}
+                for field_name, col_num in col_number.items():
+                    if col_num > 0:
+                        oValue[field_name] = row[col_num-1] if col_num <= len(row) else None
+                yield oValue
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("get_rows_excel")
+
     def process_files(self, request, source, lResults, lHeader):
         bOkay = True
         code = ""
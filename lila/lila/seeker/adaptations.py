@@ -7,6 +7,7 @@ import re
 import json
 
 # ======= imports from my own application ======
+from lila.settings import USE_JOBS
 from lila.utils import ErrHandle
 from lila.seeker.models import Colwit, get_crpp_date, get_current_datetime, process_lib_entries, get_searchable, get_now_time, \
     add_gold2equal, add_equal2equal, add_ssg_equal2equal, get_helptext, Information, Country, City, Author, Manuscript, \
@@ -15,7 +16,7 @@ from lila.seeker.models import Colwit, get_crpp_date, get_current_datetime, proc
     ManuscriptKeyword, Action, Austat, AustatLink, Location, LocationName, LocationIdentifier, LocationRelation, LocationType, \
     ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, Feast, Comment, AustatDist, \
     Basket, BasketMan, BasketAustat, Litref, LitrefMan, LitrefCol, Report,  \
-    Visit, Profile, Keyword, CanwitSignature, Status, Library, Collection, CollectionCanwit, \
+    Visit, Profile, Keyword, CanwitSignature, Status, Job, Library, Collection, CollectionCanwit, \
     CollectionMan, Caned, UserKeyword, Template, \
     ManuscriptCorpus, ManuscriptCorpusLock, AustatCorpus, \
     Codico, OriginCodico, CodicoKeyword, ProvenanceCod, Project, ManuscriptProject, CanwitProject, \
@@ -36,24 +37,47 @@ adaptation_list = {
 
 
 def listview_adaptations(lv):
-    """Perform adaptations specific for this listview"""
+    """Perform adaptations specific for this listview
+    
+    With USE_JOBS the adaptations are queued as background jobs, so that the listview does not wait for them
+    """
 
     oErr = ErrHandle()
     try:
         if lv in adaptation_list:
             for adapt in adaptation_list.get(lv):
                 sh_done  = Information.get_kvalue(adapt)
-                if sh_done == None or sh_done != "done":
-                    # Do the adaptation, depending on what it is
-                    method_to_call = "adapt_{}".format(adapt)
-                    bResult, msg = globals()[method_to_call]()
-                    if bResult:
-                        # Success
-                        Information.set_kvalue(adapt, "done")
+                if sh_done == None or not sh_done in ["done", "queued"]:
+                    if USE_JOBS:
+                        # Make sure the adaptation is only queued once
+                        Information.set_kvalue(adapt, "queued")
+                        Job.add("lila.seeker.adaptations.run_adaptation_job", "", dict(adapt=adapt))
+                    else:
+                        # Do the adaptation, depending on what it is
+                        method_to_call = "adapt_{}".format(adapt)
+                        bResult, msg = globals()[method_to_call]()
+                        if bResult:
+                            # Success
+                            Information.set_kvalue(adapt, "done")
     except:
         msg = oErr.get_error_message()
         oErr.DoError("listview_adaptations")
 
+def run_adaptation_job(job):
+    """Perform an adaptation that has been queued by listview_adaptations()"""
+
+    adapt = job.get_params().get('adapt')
+    method_to_call = "adapt_{}".format(adapt)
+    bResult, msg = globals()[method_to_call](job.progress)
+    if bResult:
+        Information.set_kvalue(adapt, "done")
+        oBack = dict(status="ok", msg="")
+    else:
+        # The next visit of the listview queues the adaptation again
+        Information.set_kvalue(adapt, "")
+        oBack = dict(status="error", msg=msg)
+    return oBack
+
 # =========== GENERAL PURPOSE ==========================
 
 def adapt_codicocopy(oStatus=None):
@@ -0,0 +1,190 @@
+"""
+Bulk copying of the item structure of a manuscript.
+
+Templates, manuscripts created from a template and manuscripts created from a historical
+collection all receive their MsItem tree (with one Canwit or Codhead per MsItem and the
+links from Canwit to Austat) in one go: the new rows are allocated with bulk_create(),
+and the parent/firstchild/next relations are rewired through a dictionary that maps
+the old ids onto the new ones.
+"""
+
+from django.db import transaction
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.basic.models import SearchTrigram, UserSearch
+from lila.seeker.models import Canwit, CanwitAustat, Codhead, Codico, ManuscriptAustats, MsItem, LINK_UNSPECIFIED, \
+    bulk_create_ids
+
+
+class ManuscriptCloner(object):
+    """Fill the manuscript [manu_dst] with bulk copies of MsItem, Canwit, Codhead and CanwitAustat rows"""
+
+    batch_size = 500        # Number of rows per bulk_create (sqlite allows at most 999 parameters)
+    update_size = 250       # Number of rows per bulk_update
+    relations = ['parent', 'firstchild', 'next']
+
+    def __init__(self, manu_dst):
+        self.manu_dst = manu_dst
+        # The codicological unit that receives the new MsItems
+        self.codico = Codico.objects.filter(manuscript=manu_dst).order_by('order').first()
+        # Mapping from old to new ids
+        self.msitem_map = {}
+        self.canwit_map = {}
+
+    def allocate(self, cls, lst_obj):
+        """Create the objects in [lst_obj] with bulk_create() and make sure each of them gets its id"""
+
+        return bulk_create_ids(cls, lst_obj, batch_size=self.batch_size)
+
+    def rewire(self, cls, lst_pair, oMap):
+        """Let the relations of each new object in [lst_pair] point to the new objects, via [oMap]"""
+
+        lst_update = []
+        for src, dst in lst_pair:
+            bChanged = False
+            for relation in self.relations:
+                old_id = getattr(src, "{}_id".format(relation))
+                if not old_id is None and old_id in oMap:
+                    setattr(dst, "{}_id".format(relation), oMap[old_id])
+                    bChanged = True
+            if bChanged:
+                lst_update.append(dst)
+        if len(lst_update) > 0:
+            cls.objects.bulk_update(lst_update, self.relations, batch_size=self.update_size)
+        return len(lst_update)
+
+    def finish(self, lst_canwit, lst_link):
+        """Do what save() would have done for the new canwits and links"""
+
+        # (1) The links and what depends on them
+        CanwitAustat.objects.bulk_create(lst_link, batch_size=self.batch_size)
+        if len(lst_link) > 0:
+            CanwitAustat.update_scounts([x.austat_id for x in lst_link])
+            ManuscriptAustats.update_manu(self.manu_dst.id)
+
+        # (2) The search index of the new canwits
+        SearchTrigram.add_objects(lst_canwit)
+
+        # (3) Cached search results of these models are outdated
+        for cls in [MsItem, Canwit, Codhead, CanwitAustat]:
+            UserSearch.bump_model_version(cls)
+        return None
+
+    def copy_canwit(self, canwit, msitem_id, mtype):
+        """Turn (the in-memory) [canwit] into an unsaved copy for the MsItem with id [msitem_id]"""
+
+        canwit.pk = None
+        canwit.msitem_id = msitem_id
+        canwit.mtype = mtype    # Change the type
+        canwit.stype = "imp"    # Imported
+        # A new Canwit starts without a calculated code (see Canwit.save)
+        canwit.lilacodefull = ""
+        # The relations are rewired later
+        for relation in self.relations:
+            setattr(canwit, "{}_id".format(relation), None)
+
+        # Issue #315: clear some fields after copying
+        if mtype == "man":
+            canwit.additional = ""
+        # Issue #420: 'locus' also for template creation
+        canwit.locus = ""
+        return canwit
+
+    def load_from(self, manu_src, mtype="tem"):
+        """Copy the MsItems of [manu_src], with their Canwit or Codhead and the Austat links"""
+
+        oErr = ErrHandle()
+        bBack = False
+        try:
+            manu_dst = self.manu_dst
+            with transaction.atomic():
+                # (1) The MsItems, keeping their order
+                lst_src = list(MsItem.objects.filter(manu=manu_src).order_by('order', 'id'))
+                lst_dst = [MsItem(manu=manu_dst, codico=self.codico, order=x.order) for x in lst_src]
+                self.allocate(MsItem, lst_dst)
+                self.msitem_map = {src.id: dst.id for src, dst in zip(lst_src, lst_dst)}
+                self.rewire(MsItem, zip(lst_src, lst_dst), self.msitem_map)
+
+                # (2) The first Canwit of each MsItem
+                lst_pair = []
+                done = set()
+                for canwit in Canwit.objects.filter(msitem__manu=manu_src).order_by('msitem_id', 'id'):
+                    if not canwit.msitem_id in done:
+                        done.add(canwit.msitem_id)
+                        # Keep the original relations in a separate (unsaved) instance
+                        src = Canwit(id=canwit.id, parent_id=canwit.parent_id, firstchild_id=canwit.firstchild_id, next_id=canwit.next_id)
+                        lst_pair.append((src, self.copy_canwit(canwit, self.msitem_map[canwit.msitem_id], mtype)))
+                lst_canwit = self.allocate(Canwit, [dst for src, dst in lst_pair])
+                self.canwit_map = {src.id: dst.id for src, dst in lst_pair}
+                self.rewire(Canwit, lst_pair, self.canwit_map)
+                done = set([dst.msitem_id for src, dst in lst_pair])
+
+                # (3) The first Codhead of each MsItem that has no Canwit
+                lst_head = []
+                for head in Codhead.objects.filter(msitem__manu=manu_src).order_by('msitem_id', 'id'):
+                    msitem_id = self.msitem_map[head.msitem_id]
+                    if not msitem_id in done:
+                        head.pk = None
+                        head.msitem_id = msitem_id
+                        # NOTE: a Codhead does *not* have an mtype or stype
+                        # Issue #420: 'locus' also for template creation
+                        head.locus = ""
+                        lst_head.append(head)
+                        done.add(msitem_id)
+                Codhead.objects.bulk_create(lst_head, batch_size=self.batch_size)
+
+                # (4) The links from the copied Canwits to the Austats
+                lst_link = []
+                qs = CanwitAustat.objects.filter(canwit__msitem__manu=manu_src).order_by('id').values_list('canwit_id', 'austat_id')
+                for canwit_id, austat_id in qs:
+                    if canwit_id in self.canwit_map:
+                        lst_link.append(CanwitAustat(
+                            canwit_id=self.canwit_map[canwit_id], austat_id=austat_id, manu=manu_dst, linktype=LINK_UNSPECIFIED))
+                self.finish(lst_canwit, lst_link)
+
+            # Issue #315: adapt Bible reference(s) linking based on copied field
+            if mtype == "man":
+                for canwit in lst_canwit:
+                    if not canwit.bibleref in [None, ""]:
+                        canwit.adapt_verses()
+            bBack = True
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("ManuscriptCloner/load_from")
+        return bBack
+
+    def load_austats(self, lst_austat, mtype="tem"):
+        """Create one MsItem with a Canwit for each Austat in [lst_austat], linked to that Austat"""
+
+        oErr = ErrHandle()
+        bBack = False
+        try:
+            manu_dst = self.manu_dst
+            with transaction.atomic():
+                # (1) One MsItem per Austat, each followed by the next one
+                lst_msitem = [MsItem(manu=manu_dst, codico=self.codico, order=idx+1) for idx in range(len(lst_austat))]
+                self.allocate(MsItem, lst_msitem)
+                for idx, msitem in enumerate(lst_msitem[:-1]):
+                    msitem.next_id = lst_msitem[idx+1].id
+                MsItem.objects.bulk_update(lst_msitem[:-1], ['next'], batch_size=self.update_size)
+
+                # (2) A Canwit based on each Austat
+                lst_canwit = []
+                for msitem, austat in zip(lst_msitem, lst_austat):
+                    lst_canwit.append(Canwit(
+                        msitem_id=msitem.id, author_id=austat.author_id,
+                        ftext=austat.ftext, srchftext=austat.srchftext,
+                        ftrans=austat.ftrans, srchftrans=austat.srchftrans,
+                        stype="imp", mtype=mtype, lilacodefull=""))
+                self.allocate(Canwit, lst_canwit)
+
+                # (3) A link from each Canwit to its Austat
+                lst_link = [CanwitAustat(canwit_id=canwit.id, austat_id=austat.id, manu=manu_dst, linktype=LINK_UNSPECIFIED)
+                            for canwit, austat in zip(lst_canwit, lst_austat)]
+                self.finish(lst_canwit, lst_link)
+            bBack = True
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("ManuscriptCloner/load_austats")
+        return bBack
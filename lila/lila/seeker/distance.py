@@ -0,0 +1,159 @@
+"""
+Calculation of the distances between Canwit and Austat texts.
+
+Each text (srchftext, srchftrans) is turned into a vector of character n-grams.
+The similarity of one Canwit to all Austat objects is then a single sparse matrix product,
+instead of a SequenceMatcher comparison per pair.
+"""
+
+from django.db import transaction
+from sklearn.feature_extraction.text import HashingVectorizer
+import numpy as np
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Austat, AustatDist, Canwit
+
+
+class AustatDistance(object):
+    """Character n-gram engine that determines the distance between Canwit and Austat objects
+
+    The distance follows the definition of the original [Canwit.do_distance]:
+        distance = 2 / (similarity(ftext) + similarity(ftrans))
+    where the similarity now is the cosine between the n-gram vectors.
+    """
+
+    ngram_range = (2, 4)        # Character n-grams that are used
+    n_features = 2 ** 20        # Size of the hashed feature space
+    chunk_size = 200            # Number of canwits handled in one matrix operation
+    batch_size = 500            # Number of AustatDist rows per bulk query
+    dist_max = 100000           # Distance when there is no similarity at all
+    sim_empty = 0.00001         # Similarity of an empty canwit text to a non-empty austat text
+
+    def __init__(self):
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=self.ngram_range, n_features=self.n_features,
+            alternate_sign=False, norm="l2", lowercase=True)
+        self.austat_ids = None
+        self.mat_ftext = None
+        self.mat_ftrans = None
+        self.empty_ftext = None
+        self.empty_ftrans = None
+
+    def get_texts(self, lst_value):
+        """Turn None into empty strings"""
+        return ["" if x is None else x for x in lst_value]
+
+    def load_austats(self):
+        """Vectorize the srchftext and srchftrans of all Austat objects"""
+
+        oErr = ErrHandle()
+        try:
+            lst_austat = list(Austat.objects.all().order_by('id').values_list('id', 'srchftext', 'srchftrans'))
+            self.austat_ids = np.array([x[0] for x in lst_austat], dtype=np.int64)
+            lst_ftext = self.get_texts([x[1] for x in lst_austat])
+            lst_ftrans = self.get_texts([x[2] for x in lst_austat])
+            self.mat_ftext = self.vectorizer.transform(lst_ftext).T.tocsr()
+            self.mat_ftrans = self.vectorizer.transform(lst_ftrans).T.tocsr()
+            self.empty_ftext = np.array([x == "" for x in lst_ftext], dtype=bool)
+            self.empty_ftrans = np.array([x == "" for x in lst_ftrans], dtype=bool)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("AustatDistance/load_austats")
+        return None
+
+    def get_similarity(self, lst_text, mat_austat, empty_austat):
+        """Calculate the [canwit x austat] similarity matrix for one of the two texts"""
+
+        lst_text = self.get_texts(lst_text)
+        mat_canwit = self.vectorizer.transform(lst_text)
+        sim = (mat_canwit @ mat_austat).toarray()
+        # Vectors are normalized, but rounding may just exceed 1
+        np.clip(sim, 0.0, 1.0, out=sim)
+        # An empty canwit text is fully similar to an empty austat text, and hardly to anything else
+        for idx, text in enumerate(lst_text):
+            if text == "":
+                sim[idx] = np.where(empty_austat, 1.0, self.sim_empty)
+        return sim
+
+    def get_distances(self, lst_ftext, lst_ftrans):
+        """Calculate the [canwit x austat] distance matrix"""
+
+        if self.austat_ids is None:
+            self.load_austats()
+        similarity = self.get_similarity(lst_ftext, self.mat_ftext, self.empty_ftext) + \
+                     self.get_similarity(lst_ftrans, self.mat_ftrans, self.empty_ftrans)
+        with np.errstate(divide="ignore"):
+            distances = np.where(similarity == 0.0, self.dist_max, 2.0 / similarity)
+        return distances
+
+    def update(self, canwits, bForceUpdate=False):
+        """Calculate and store the AustatDist rows for a batch of canwits
+
+        Existing rows are only re-calculated if [bForceUpdate] is set.
+        Returns the number of rows that were created or changed.
+        """
+
+        oErr = ErrHandle()
+        count = 0
+        try:
+            if self.austat_ids is None:
+                self.load_austats()
+            if len(self.austat_ids) == 0:
+                return count
+
+            # Take the batch in chunks, so that the dense distance matrix stays small
+            lst_chunk = []
+            for canwit in canwits:
+                lst_chunk.append(canwit)
+                if len(lst_chunk) >= self.chunk_size:
+                    count += self.update_chunk(lst_chunk, bForceUpdate)
+                    lst_chunk = []
+            if len(lst_chunk) > 0:
+                count += self.update_chunk(lst_chunk, bForceUpdate)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("AustatDistance/update")
+        return count
+
+    def update_chunk(self, lst_canwit, bForceUpdate):
+        """Store the distances for one chunk of canwits"""
+
+        count = 0
+        # (1) Get the existing rows of these canwits
+        lst_id = [x.id for x in lst_canwit]
+        existing = {}
+        for obj in AustatDist.objects.filter(canwit_id__in=lst_id):
+            existing[(obj.canwit_id, obj.austat_id)] = obj
+
+        # (2) Only look at canwits that have a text or already have distances
+        set_present = set(x[0] for x in existing.keys())
+        lst_canwit = [x for x in lst_canwit if x.srchftext or x.srchftrans or x.id in set_present]
+        if len(lst_canwit) == 0:
+            return count
+
+        # (3) Calculate all distances of this chunk in one go
+        distances = self.get_distances([x.srchftext for x in lst_canwit], [x.srchftrans for x in lst_canwit])
+
+        # (4) Divide into new and changed rows
+        lst_new = []
+        lst_upd = []
+        lst_austat_id = self.austat_ids.tolist()
+        for row, canwit in enumerate(lst_canwit):
+            lst_dist = distances[row].tolist()
+            for austat_id, dist in zip(lst_austat_id, lst_dist):
+                obj = existing.get((canwit.id, austat_id))
+                if obj is None:
+                    lst_new.append(AustatDist(canwit_id=canwit.id, austat_id=austat_id, distance=dist))
+                elif bForceUpdate and obj.distance != dist:
+                    obj.distance = dist
+                    lst_upd.append(obj)
+
+        # (5) Write them in bulk
+        with transaction.atomic():
+            if len(lst_new) > 0:
+                AustatDist.objects.bulk_create(lst_new, batch_size=self.batch_size)
+            if len(lst_upd) > 0:
+                AustatDist.objects.bulk_update(lst_upd, ['distance'], batch_size=self.batch_size)
+        count = len(lst_new) + len(lst_upd)
+        return count
@@ -0,0 +1,335 @@
+"""
+Reading and saving the hierarchy of MsItems of a manuscript.
+
+HierarchyList creates the list that the details page shows: all rows it needs are loaded
+with a fixed number of queries, and the depth, first children, parents, codicological unit
+starts and column spans are worked out in memory.
+
+HierarchySaver stores the list that comes from the drag-and-drop tree editor. The MsItems,
+the Codheads and the Canwit ids of the manuscript are loaded up front, the ids in the list
+of the editor (also those of new elements) are resolved through dictionaries, and only
+the changed fields are written, with bulk_update().
+"""
+
+from django.db import transaction
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.basic.models import UserSearch
+from lila.seeker.models import Canwit, Codhead, Codico, Colwit, MsItem, bulk_create_ids
+
+
+class HierarchyList(object):
+    """The MsItems of one or more containers (a Manuscript or Codicos), with their hierarchical information
+
+    Each container is a queryset with all its MsItems: the siblings and children of an item
+    are looked for in its own container. The items with an order of zero or more are shown.
+    """
+
+    chunk = 500             # Number of ids per query (sqlite allows at most 999 parameters)
+
+    def __init__(self, lst_container):
+        self.lst_container = lst_container
+        self.msitems = {}       # MsItem per id (including ancestors outside the containers)
+        self.depth = {}         # Depth per MsItem id
+
+    def get_first(self, qs, field, lst_id, value_field=None):
+        """Get the first object (by id) of [qs] per value of [field] in [lst_id]"""
+
+        oBack = {}
+        for idx in range(0, len(lst_id), self.chunk):
+            qs_chunk = qs.filter(**{"{}__in".format(field): lst_id[idx:idx+self.chunk]}).order_by('id')
+            if value_field is None:
+                for obj in qs_chunk:
+                    oBack.setdefault(getattr(obj, field), obj)
+            else:
+                for key, value in qs_chunk.values_list(field, value_field):
+                    oBack.setdefault(key, value)
+        return oBack
+
+    def add_ancestors(self):
+        """Load the parents that are not part of the containers"""
+
+        missing = set([x.parent_id for x in self.msitems.values() if not x.parent_id is None]) - set(self.msitems.keys())
+        while len(missing) > 0:
+            lst_id = list(missing)
+            for idx in range(0, len(lst_id), self.chunk):
+                for obj in MsItem.objects.filter(id__in=lst_id[idx:idx+self.chunk]):
+                    self.msitems[obj.id] = obj
+            # Only continue with parents that exist
+            missing = set([self.msitems[x].parent_id for x in lst_id if x in self.msitems and not self.msitems[x].parent_id is None])
+            missing -= set(self.msitems.keys())
+
+    def get_depth(self, msitem):
+        """Get the depth of [msitem], repairing an item that is its own parent (see MsItem.getdepth)"""
+
+        lst_path = []
+        node = msitem
+        depth = 0
+        while not node is None:
+            if node.id in self.depth:
+                depth = self.depth[node.id]
+                break
+            if node.parent_id == node.id:
+                # This is not correct -- need to repair
+                node.parent_id = None
+                node.save()
+            lst_path.append(node)
+            parent = self.msitems.get(node.parent_id)
+            # Safe guard against a circle of parents
+            node = None if parent in lst_path else parent
+        for node in reversed(lst_path):
+            depth += 1
+            self.depth[node.id] = depth
+        return self.depth[msitem.id]
+
+    def get_list(self, username, team_group):
+        """Create the list of MsItems with hierarchical information"""
+
+        canwit_list = []
+        maxdepth = 0
+
+        # (1) All MsItems of the containers, and the ancestors that are outside of them
+        lst_items = []
+        first_child = {}
+        lst_isparent = set()
+        for qs in self.lst_container:
+            lst_all = sorted(qs, key=lambda x: (x.order, x.id))
+            for msitem in lst_all:
+                self.msitems[msitem.id] = msitem
+                if not msitem.parent_id is None:
+                    lst_isparent.add((len(lst_items), msitem.parent_id))
+                    # The first child of a parent (within this container)
+                    first_child.setdefault((len(lst_items), msitem.parent_id), msitem.id)
+            lst_items.append([x for x in lst_all if x.order >= 0])
+        self.add_ancestors()
+
+        # (2) The Canwit, Codhead and Colwit of each MsItem
+        lst_id = [x.id for items in lst_items for x in items]
+        oCanwit = self.get_first(Canwit.objects.all(), 'msitem_id', lst_id)
+        oHead = self.get_first(Codhead.objects.all(), 'msitem_id', lst_id)
+        oColwit = self.get_first(Colwit.objects.all(), 'codhead_id', [x.id for x in oHead.values()])
+        oHcs = Canwit.get_hcs_plain_dict([x.id for x in oCanwit.values()], username, team_group)
+
+        # (3) The first MsItem of each codicological unit
+        lst_codi = list(set([x.codico_id for items in lst_items for x in items if not x.codico_id is None]))
+        oCodiStart = {}
+        oCodico = {}
+        for idx in range(0, len(lst_codi), self.chunk):
+            lst_chunk = lst_codi[idx:idx+self.chunk]
+            qs = MsItem.objects.filter(codico_id__in=lst_chunk).order_by('order', 'id').values_list('codico_id', 'id')
+            for codico_id, msitem_id in qs:
+                oCodiStart.setdefault(codico_id, msitem_id)
+            for codico in Codico.objects.filter(id__in=lst_chunk):
+                oCodico[codico.id] = codico
+
+        # (4) One pass over the MsItems
+        number = 0
+        for container, items in enumerate(lst_items):
+            for msitem in items:
+                level = self.get_depth(msitem)
+                parent = self.msitems.get(msitem.parent_id)
+                oSermon = dict(obj=msitem, sermon=oCanwit.get(msitem.id), shead=oHead.get(msitem.id), colwit=None)
+                if not oSermon['shead'] is None:
+                    oSermon['colwit'] = oColwit.get(oSermon['shead'].id)
+                number += 1
+                oSermon['nodeid'] = msitem.order + 1
+                oSermon['number'] = number
+                oSermon['childof'] = 1 if parent is None else parent.order + 1
+                oSermon['level'] = level
+                oSermon['pre'] = (level-1) * 20
+                # If this is a new level, indicate it
+                oSermon['group'] = (not parent is None and first_child.get((container, parent.id)) == msitem.id)
+                # Is this one a parent of others?
+                oSermon['isparent'] = ((container, msitem.id) in lst_isparent)
+                codi = None
+                if not msitem.codico_id is None and oCodiStart.get(msitem.codico_id) == msitem.id:
+                    codi = oCodico.get(msitem.codico_id)
+                oSermon['codistart'] = "" if codi == None else codi.id
+                oSermon['codiorder'] = -1 if codi == None else codi.order
+                # Add the user-dependent list of associated collections to this sermon descriptor
+                oSermon['hclist'] = [] if oSermon['sermon'] == None else oHcs.get(oSermon['sermon'].id, "")
+                canwit_list.append(oSermon)
+                if level > maxdepth: maxdepth = level
+
+        # (5) Review them all and fill in the colspan
+        for oSermon in canwit_list:
+            oSermon['cols'] = maxdepth - oSermon['level'] + 1
+            if oSermon['group']: oSermon['cols'] -= 1
+        return canwit_list
+
+
+class HierarchySaver(object):
+    """Apply the list [hlist] of the hierarchy editor to the MsItems of manuscript [manu]"""
+
+    batch_size = 500        # Number of rows per bulk_create (sqlite allows at most 999 parameters)
+    update_size = 250       # Number of rows per bulk_update
+    fields = ['codico', 'order', 'parent', 'firstchild', 'next']
+
+    def __init__(self, manu):
+        self.manu = manu
+        self.msitems = {}       # MsItem per id
+        self.heads = {}         # First Codhead per MsItem id
+        self.canwits = {}       # First Canwit id per MsItem id
+        self.codicos = {}       # Codico per id
+        self.new_ids = {}       # Id of the MsItem that has been created for a new element
+
+    def load(self):
+        """Load the MsItems, Codheads, Canwit ids and Codicos of the manuscript"""
+
+        self.msitems = {x.id: x for x in MsItem.objects.filter(manu=self.manu)}
+        for head in Codhead.objects.filter(msitem__manu=self.manu).order_by('id'):
+            self.heads.setdefault(head.msitem_id, head)
+        qs = Canwit.objects.filter(msitem__manu=self.manu).order_by('id').values_list('msitem_id', 'id')
+        for msitem_id, canwit_id in qs:
+            self.canwits.setdefault(msitem_id, canwit_id)
+        self.codicos = {x.id: x for x in Codico.objects.filter(manuscript=self.manu)}
+
+    def get_codico(self, codi_id):
+        codi = self.codicos.get(codi_id)
+        if codi is None:
+            codi = Codico.objects.filter(id=codi_id).first()
+        return codi
+
+    def get_ordered_codicos(self):
+        return sorted(self.codicos.values(), key=lambda x: (x.order, x.id))
+
+    def get_id(self, value):
+        """Get the MsItem id for [value] from the editor (None if there is no such MsItem)"""
+
+        value = "" if value is None else str(value)
+        if value == "":
+            return None
+        if "new" in value:
+            return self.new_ids.get(value)
+        if value.isdigit() and int(value) in self.msitems:
+            return int(value)
+        return None
+
+    def add_new(self, hlist):
+        """Create an MsItem with a Codhead for each new structural element in [hlist]"""
+
+        lst_new = [x for x in hlist if 'new' in x['id']]
+        if len(lst_new) > 0:
+            # A new MsItem goes into the last codicological unit (see MsItem.save)
+            lst_codi = self.get_ordered_codicos()
+            codi = None if len(lst_codi) == 0 else lst_codi[-1]
+            lst_msitem = bulk_create_ids(MsItem, [MsItem(manu=self.manu, codico=codi) for x in lst_new], batch_size=self.batch_size)
+            lst_head = []
+            for item, msitem in zip(lst_new, lst_msitem):
+                self.new_ids[item['id']] = msitem.id
+                self.msitems[msitem.id] = msitem
+                head = Codhead(msitem=msitem, title=item['title'])
+                self.heads[msitem.id] = head
+                lst_head.append(head)
+            Codhead.objects.bulk_create(lst_head, batch_size=self.batch_size)
+            # Make sure these Codheads get their ids, so that bulk_update() can change them
+            oHead = {x.msitem_id: x.id for x in Codhead.objects.filter(msitem_id__in=list(self.new_ids.values()))}
+            for head in lst_head:
+                head.id = oHead.get(head.msitem_id)
+        return len(lst_new)
+
+    def save(self, hlist):
+        """Store the hierarchy in [hlist]; returns the log of the changes of parent and next per canwit"""
+
+        oErr = ErrHandle()
+        hierarchy = []
+        with transaction.atomic():
+            # (1) Delete what needs to be deleted
+            deletables = [x['id'] for x in hlist if x.get("action") == "delete" and not 'new' in x['id']]
+            hlist = [x for x in hlist if x.get("action") != "delete"]
+            if len(deletables) > 0:
+                MsItem.objects.filter(id__in=deletables).delete()
+
+            # (2) Load what is there, and add the new structural elements
+            self.load()
+            self.add_new(hlist)
+
+            # (3) Walk the list
+            lst_msitem = []
+            lst_head = []
+            codi = None
+            for idx, item in enumerate(hlist):
+                if item.get("id") == "codi":
+                    # THis is the start of a codicological unit
+                    codi_id = item.get("codi")
+                    if not codi_id is None:
+                        codi_id = int(codi_id)
+                        if codi is None or codi.id != codi_id:
+                            codi = self.get_codico(codi_id)
+                    if codi is None:
+                        oErr.Status("HierarchySaver: codi is none")
+                    continue
+
+                # This must be an MsItem definition
+                msitem = self.msitems.get(self.get_id(item['id']))
+                if msitem is None:
+                    oErr.Status("HierarchySaver: unknown MsItem {}".format(item['id']))
+                    continue
+                next_id = self.get_id(item.get('nextid'))
+                firstchild_id = self.get_id(item.get('firstchild'))
+                parent_id = self.get_id(item.get('parent'))
+                bNeedSaving = False
+
+                # Possibly set the msitem codi
+                codi_id = None if codi is None else codi.id
+                if msitem.codico_id != codi_id:
+                    msitem.codico_id = codi_id
+                    bNeedSaving = True
+                elif codi is None and msitem.codico_id is None:
+                    # This MsItem is inserted before something that may already have a codico
+                    lst_codi = self.get_ordered_codicos()
+                    if len(lst_codi) > 0:
+                        codi = lst_codi[0]
+                        msitem.codico_id = codi.id
+                        bNeedSaving = True
+
+                # Possibly adapt the [shead] title and locus
+                itemhead = self.heads.get(msitem.id)
+                if itemhead and 'title' in item and 'locus' in item:
+                    title = item['title'].strip()
+                    locus = item['locus']
+                    if itemhead.title != title or itemhead.locus != locus:
+                        itemhead.title = title
+                        itemhead.locus = locus
+                        lst_head.append(itemhead)
+
+                sermonlog = dict(sermon=self.canwits.get(msitem.id, "none"))
+                bAddSermonLog = False
+
+                # Check if anything changed
+                order = idx + 1
+                if msitem.order != order:
+                    msitem.order = order
+                    bNeedSaving = True
+                if msitem.parent_id != parent_id:
+                    # Track the change
+                    sermonlog['parent_new'] = "none" if parent_id is None else parent_id
+                    sermonlog['parent_old'] = "none" if msitem.parent_id is None else msitem.parent_id
+                    bAddSermonLog = True
+                    msitem.parent_id = parent_id
+                    bNeedSaving = True
+                if msitem.firstchild_id != firstchild_id:
+                    msitem.firstchild_id = firstchild_id
+                    bNeedSaving = True
+                if msitem.next_id != next_id:
+                    # Track the change
+                    sermonlog['next_new'] = "none" if next_id is None else next_id
+                    sermonlog['next_old'] = "none" if msitem.next_id is None else msitem.next_id
+                    bAddSermonLog = True
+                    msitem.next_id = next_id
+                    bNeedSaving = True
+
+                if bNeedSaving:
+                    lst_msitem.append(msitem)
+                    if bAddSermonLog:
+                        hierarchy.append(sermonlog)
+
+            # (4) Write the changes
+            MsItem.objects.bulk_update(lst_msitem, self.fields, batch_size=self.update_size)
+            Codhead.objects.bulk_update(lst_head, ['title', 'locus'], batch_size=self.update_size)
+
+        # Cached search results of these models are outdated
+        for cls in [MsItem, Codhead]:
+            UserSearch.bump_model_version(cls)
+        return hierarchy
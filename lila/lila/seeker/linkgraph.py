@@ -0,0 +1,211 @@
+"""
+In-memory graph of the links between Austats (the AustatLink table).
+
+The links are kept as a compact adjacency structure (CSR): the sorted Austat ids,
+per node the range of its outgoing links, the destination of each link and the
+linktype, spectype and alternatives of each link as small integer codes.
+The graph is built once per process and shared by all requests. It is rebuilt when
+the version of AustatLink changes (see UserSearch.bump_model_version), and it is
+thrown away directly by AustatLink.save() and AustatLink.delete().
+
+A k-hop walk from one Austat handles a whole level of the walk at once with numpy.
+"""
+
+import numpy as np
+import threading
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.basic.models import UserSearch
+from lila.seeker.models import AustatLink, Caned, FieldChoice, Austat
+
+GRAPH_CHUNK = 500       # Number of Austat ids per query (sqlite allows at most 999 parameters)
+
+
+class AustatLinkGraph(object):
+    """CSR adjacency of all AustatLink rows, with the link attributes as small integer codes"""
+
+    # The graph that is shared by the requests of this process
+    current = None
+    lock = threading.Lock()
+
+    def __init__(self, version=None):
+        self.version = version
+        self.ids = np.zeros(0, dtype=np.int64)          # Sorted Austat ids: the nodes
+        self.indptr = np.zeros(1, dtype=np.int64)       # Links of node i: indptr[i] up to indptr[i+1]
+        self.indices = np.zeros(0, dtype=np.int32)      # Node index of the destination of each link
+        self.linktype = np.zeros(0, dtype=np.int8)      # Index in [linktypes]
+        self.spectype = np.zeros(0, dtype=np.int8)      # Index in [spectypes], or -1
+        self.alternatives = np.zeros(0, dtype=np.int8)  # Index in [alternative_values], or -1
+        self.notes = {}                                 # Note of a link (by link index), if it has one
+        self.linktypes = []
+        self.spectypes = []
+        self.alternative_values = []
+        # Display names of the linktype and spectype abbreviations
+        self.link_dict = {}
+        self.spec_dict = {}
+
+    def get_graph():
+        """Get the graph of this process, (re-)building it when AustatLink has changed"""
+
+        try:
+            version = UserSearch.get_model_versions([AustatLink])[0]
+        except:
+            # No cache available: only the explicit invalidation counts
+            version = None
+        with AustatLinkGraph.lock:
+            graph = AustatLinkGraph.current
+            if graph is None or graph.version != version:
+                graph = AustatLinkGraph(version).build()
+                AustatLinkGraph.current = graph
+        return graph
+
+    def invalidate():
+        """Throw away the graph of this process (after a change in AustatLink)"""
+
+        AustatLinkGraph.current = None
+
+    def encode(self, value, lst_value):
+        """Get the code of [value] in [lst_value], extending the list if needed; None becomes -1"""
+
+        if value is None:
+            return -1
+        if not value in lst_value:
+            lst_value.append(value)
+        return lst_value.index(value)
+
+    def build(self):
+        """Read the AustatLink table (one query) and turn it into the CSR arrays"""
+
+        oErr = ErrHandle()
+        try:
+            # (1) The display names
+            for obj in FieldChoice.objects.filter(field__in=["seeker.spectype", "seeker.linktype"]):
+                if obj.field == "seeker.spectype":
+                    self.spec_dict[obj.abbr] = obj.english_name
+                else:
+                    self.link_dict[obj.abbr] = obj.english_name
+
+            # (2) All links, ordered by source and destination
+            qs = AustatLink.objects.all().order_by('src_id', 'dst_id', 'id').values_list(
+                'src_id', 'dst_id', 'linktype', 'spectype', 'alternatives', 'note')
+            lst_src = []
+            lst_dst = []
+            lst_linktype = []
+            lst_spectype = []
+            lst_alternatives = []
+            for idx, (src, dst, linktype, spectype, alternatives, note) in enumerate(qs.iterator()):
+                lst_src.append(src)
+                lst_dst.append(dst)
+                lst_linktype.append(self.encode(linktype, self.linktypes))
+                lst_spectype.append(self.encode(spectype, self.spectypes))
+                lst_alternatives.append(self.encode(alternatives, self.alternative_values))
+                if not note is None:
+                    self.notes[idx] = note
+
+            # (3) The nodes and the CSR arrays
+            src = np.array(lst_src, dtype=np.int64)
+            dst = np.array(lst_dst, dtype=np.int64)
+            self.ids = np.unique(np.concatenate([src, dst]))
+            src_index = np.searchsorted(self.ids, src)
+            self.indices = np.searchsorted(self.ids, dst).astype(np.int32)
+            self.indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src_index, minlength=len(self.ids)), out=self.indptr[1:])
+            self.linktype = np.array(lst_linktype, dtype=np.int8)
+            self.spectype = np.array(lst_spectype, dtype=np.int8)
+            self.alternatives = np.array(lst_alternatives, dtype=np.int8)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("AustatLinkGraph/build")
+        return self
+
+    def get_index(self, austat_id):
+        """Get the node index of [austat_id], or -1 if it has no links"""
+
+        idx = int(np.searchsorted(self.ids, austat_id))
+        if idx < len(self.ids) and self.ids[idx] == austat_id:
+            return idx
+        return -1
+
+    def walk(self, austat_id, degree):
+        """Walk [degree] levels of links, starting from [austat_id]
+
+        Every path is followed, so a link is counted once for each path that reaches its source.
+        Returns the distance of each node from the start (-1 if it is not reached) and
+        the number of times each link has been walked
+        """
+
+        dist = np.full(len(self.ids), -1, dtype=np.int32)
+        value = np.zeros(len(self.indices), dtype=np.float64)
+        start = self.get_index(austat_id)
+        if start >= 0:
+            dist[start] = 0
+            walks = np.zeros(len(self.ids), dtype=np.float64)
+            walks[start] = 1
+            for depth in range(degree):
+                active = np.flatnonzero(walks)
+                counts = self.indptr[active + 1] - self.indptr[active]
+                total = int(counts.sum())
+                if total == 0:
+                    break
+                # The indices of all links that leave the active nodes
+                offsets = np.cumsum(counts) - counts
+                links = np.arange(total) - np.repeat(offsets, counts) + np.repeat(self.indptr[active], counts)
+                weights = np.repeat(walks[active], counts)
+                value[links] += weights
+                # The number of paths that reach each node on the next level
+                walks = np.bincount(self.indices[links], weights=weights, minlength=len(self.ids))
+                dist[(walks > 0) & (dist < 0)] = depth + 1
+        return dist, value
+
+    def get_links(self, value):
+        """Get the walked links as (source, target, link index, value), one per source and target
+
+        The attributes of a link are those of the first AustatLink between source and target
+        """
+
+        lst_back = []
+        lst_link = np.flatnonzero(value)
+        if len(lst_link) > 0:
+            src_index = np.searchsorted(self.indptr, lst_link, side="right") - 1
+            dst_index = self.indices[lst_link]
+            # Links between the same source and target are adjacent
+            pair = src_index.astype(np.int64) * len(self.ids) + dst_index
+            _, first = np.unique(pair, return_index=True)
+            totals = np.add.reduceat(value[lst_link], first)
+            for idx, total in zip(first, totals):
+                lst_back.append((int(self.ids[src_index[idx]]), int(self.ids[dst_index[idx]]), int(lst_link[idx]), int(total)))
+        return lst_back
+
+    def get_link_attributes(self, link):
+        """Get the linktype, spectype, alternatives and note of the link with index [link]"""
+
+        linktype = self.linktypes[self.linktype[link]]
+        oBack = dict(linktype=linktype, link=self.link_dict.get(linktype, linktype),
+                     spectype="", spec="", alternatives=False, note=self.notes.get(link))
+        if self.spectype[link] >= 0:
+            spectype = self.spectypes[self.spectype[link]]
+            oBack['spectype'] = spectype
+            oBack['spec'] = self.spec_dict.get(spectype, spectype)
+        if self.alternatives[link] >= 0:
+            oBack['alternatives'] = self.alternative_values[self.alternatives[link]]
+        return oBack
+
+    def get_nodes(self, lst_id):
+        """Get the Austats in [lst_id] and the historical collections they are part of
+
+        Returns a dictionary of Austat objects (with code, keycodefull and scount) and
+        a dictionary with the list of (id, name) of the HCs per Austat
+        """
+
+        oAustat = {}
+        oHc = {}
+        for start in range(0, len(lst_id), GRAPH_CHUNK):
+            lst_chunk = lst_id[start:start + GRAPH_CHUNK]
+            for obj in Austat.objects.filter(id__in=lst_chunk).only('id', 'code', 'keycodefull', 'scount'):
+                oAustat[obj.id] = obj
+            qs = Caned.objects.filter(austat_id__in=lst_chunk, collection__settype="hc").order_by('id').values_list(
+                'austat_id', 'collection_id', 'collection__name')
+            for austat_id, hc_id, name in qs:
+                oHc.setdefault(austat_id, []).append((hc_id, name))
+        return oAustat, oHc
@@ -0,0 +1,37 @@
+"""
+(Re-)build the BibInterval rows that are used to search for Bible references.
+
+The intervals are made from the existing BibVerse rows where a BibRange has them, and
+otherwise from its book and chvslist. With --drop-verses the BibVerse rows are removed
+afterwards, since searching does not need them anymore.
+
+Run this once on a database that has BibVerse rows: until it has run, the searches also
+look at the verse rows (see BibInterval.is_built).
+
+Usage:  python manage.py bibintervals [--drop-verses]
+"""
+
+from django.core.management.base import BaseCommand
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import BibInterval, BibVerse
+
+
+class Command(BaseCommand):
+    help = "Build the Bible reference intervals of all BibRange objects"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drop-verses", action="store_true", help="Remove the BibVerse rows afterwards")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            count = BibInterval.rebuild()
+            oErr.Status("bibintervals: {} interval(s) created".format(count))
+            if options['drop_verses']:
+                BibVerse.objects.all().delete()
+                oErr.Status("bibintervals: verse rows removed")
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("bibintervals")
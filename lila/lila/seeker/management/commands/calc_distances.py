@@ -0,0 +1,32 @@
+"""
+Calculate the distances between all Canwit and Austat objects (table AustatDist).
+
+Usage:  python manage.py calc_distances [--force] [--chunk N]
+"""
+
+from django.core.management.base import BaseCommand
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Canwit
+from lila.seeker.distance import AustatDistance
+
+
+class Command(BaseCommand):
+    help = "Calculate the Canwit-to-Austat distances for all canwits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-calculate existing distances too")
+        parser.add_argument('--chunk', type=int, default=AustatDistance.chunk_size, help="Number of canwits per matrix operation")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            engine = AustatDistance()
+            engine.chunk_size = options['chunk']
+            canwits = Canwit.objects.all().order_by('id').only('id', 'srchftext', 'srchftrans')
+            count = engine.update(canwits.iterator(), options['force'])
+            oErr.Status("calc_distances: {} distance(s) stored".format(count))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("calc_distances")
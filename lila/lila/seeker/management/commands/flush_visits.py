@@ -0,0 +1,27 @@
+"""
+Move the buffered visits (see VisitLog) to the database.
+
+The web processes flush their buffers themselves in the background; this command is meant
+for a Redis buffer that should be emptied from a scheduled task, or before a restart.
+
+Usage:  python manage.py flush_visits
+"""
+
+from django.core.management.base import BaseCommand
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.visits import VisitLog
+
+
+class Command(BaseCommand):
+    help = "Store the buffered visits in the database"
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            count = VisitLog.flush()
+            oErr.Status("flush_visits: {} visit(s) stored".format(count))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("flush_visits")
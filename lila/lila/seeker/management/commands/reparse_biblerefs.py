@@ -0,0 +1,30 @@
+"""
+Re-parse the Bible references of all Canwits.
+
+The verses of each Canwit, its BibRange objects and their BibInterval rows are brought up to
+date in bulk, a chunk of Canwits at a time. The book and chapter tables are read only once.
+
+Usage:  python manage.py reparse_biblerefs [--chunk 500]
+"""
+
+from django.core.management.base import BaseCommand
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import BibRange
+
+
+class Command(BaseCommand):
+    help = "Re-parse the Bible references of all Canwits"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=500, help="Number of Canwits per batch")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            count = BibRange.reparse(options['chunk'])
+            oErr.Status("reparse_biblerefs: the verses of {} canwit(s) have changed".format(count))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("reparse_biblerefs")
@@ -0,0 +1,93 @@
+"""
+Worker that executes the background jobs (imports, synchronisations) queued in the Job table.
+
+Several workers may run at the same time. While a job runs, its worker regularly updates the
+heartbeat of the job; a running job without a heartbeat for --stale seconds is assumed to belong
+to a worker that has died, and it is queued again.
+
+Usage:  python manage.py run_jobs [--workers N] [--stale SECONDS] [--once]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import django
+import time
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Job
+
+
+def init_worker():
+    """Make sure Django is available in the worker process (needed on platforms that spawn)"""
+    django.setup()
+
+def run_job(job_id):
+    """Run one job in a worker process, which must not share database connections with its parent"""
+    connections.close_all()
+    try:
+        Job.run(job_id)
+    finally:
+        connections.close_all()
+    return job_id
+
+
+class Command(BaseCommand):
+    help = "Execute the queued background jobs in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks of the queue")
+        parser.add_argument('--stale', type=float, default=300.0, help="Seconds without heartbeat after which a running job is queued again")
+        parser.add_argument('--once', action='store_true', help="Stop as soon as the queue is empty")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        workers = options['workers']
+        poll = options['poll']
+        stale = max(options['stale'], 5 * poll)
+        bOnce = options['once']
+        running = {}
+        last_check = 0
+        try:
+            # (1) The child processes must not inherit open database connections
+            connections.close_all()
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                while True:
+                    # (2) Show that our jobs are alive, and take over the jobs of workers that have died
+                    Job.heartbeat(list(running.values()))
+                    if time.time() - last_check >= stale:
+                        count = Job.requeue_stale(stale)
+                        if count > 0:
+                            oErr.Status("run_jobs: re-queued {} interrupted job(s)".format(count))
+                        last_check = time.time()
+
+                    # (3) Fill the free slots with queued jobs
+                    while len(running) < workers:
+                        job_id = Job.claim()
+                        if job_id is None:
+                            break
+                        connections.close_all()
+                        running[pool.submit(run_job, job_id)] = job_id
+
+                    if len(running) == 0:
+                        if bOnce:
+                            break
+                        # Nothing to do: wait for new jobs
+                        connections.close_all()
+                        time.sleep(poll)
+                        continue
+
+                    # (4) Wait until one of the jobs has finished (or the poll interval has passed)
+                    done, not_done = wait(list(running.keys()), timeout=poll, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = running.pop(future)
+                        if not future.exception() is None:
+                            oErr.Status("run_jobs: job {} failed: {}".format(job_id, future.exception()))
+        except KeyboardInterrupt:
+            oErr.Status("run_jobs: interrupted")
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("run_jobs")
@@ -0,0 +1,47 @@
+"""
+Record the Zotero library in a JSON file, or replay such a file as a local stand-in of the API.
+
+Usage:  python manage.py zotero_fixture --record FILE
+        python manage.py zotero_fixture --serve FILE [--port N]
+
+To let the synchronisation use the stand-in, set the Information key 'zotero_endpoint'
+to http://127.0.0.1:N (and clear it again afterwards).
+"""
+
+from django.core.management.base import BaseCommand
+import time
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Information
+from lila.seeker.zotero_sync import ZoteroSync, ZoteroFixtureServer
+
+
+class Command(BaseCommand):
+    help = "Record the Zotero library in a file, or serve such a file as a local Zotero API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--record', type=str, default=None, help="File in which the library is saved")
+        parser.add_argument('--serve', type=str, default=None, help="File with the items that are served")
+        parser.add_argument('--port', type=int, default=8765, help="Port of the local API")
+
+    def handle(self, *args, **options):
+        oErr = ErrHandle()
+        try:
+            if not options['record'] is None:
+                oSync = ZoteroSync(Information.get_kvalue("zotero_libraryid"), Information.get_kvalue("zotero_apikey"))
+                count = ZoteroFixtureServer.record(oSync, options['record'])
+                oErr.Status("zotero_fixture: {} item(s) saved in {}".format(count, options['record']))
+            elif not options['serve'] is None:
+                server = ZoteroFixtureServer(port=options['port'])
+                server.load(options['serve'])
+                server.start()
+                oErr.Status("zotero_fixture: serving {} at {}".format(options['serve'], server.endpoint))
+                try:
+                    while True:
+                        time.sleep(1)
+                except KeyboardInterrupt:
+                    server.stop()
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("zotero_fixture")
@@ -7,19 +7,22 @@ from django.apps.config import AppConfig
 from django.apps import apps
 from django.db import models, transaction
 from django.contrib.auth.models import User, Group
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.db.models.functions import Lower
 from django.db.models.query import QuerySet 
+from django.db.models.signals import post_delete
 from django.utils.html import mark_safe
 from django.utils import timezone
+from django.utils.module_loading import import_string
 from django.forms.models import model_to_dict
 import pytz
 from django.urls import reverse
-from datetime import datetime
+from datetime import datetime, timedelta
 from markdown import markdown
 import sys, os, io, re
 import copy
 import json
+import hashlib
 import time
 import fnmatch
 import csv
@@ -40,7 +43,7 @@ from lila.utils import *
 from lila.settings import APP_PREFIX, WRITABLE_DIR, TIME_ZONE
 from lila.seeker.excel import excel_to_list
 from lila.bible.models import Reference, Book, BKCHVS_LENGTH, BkChVs, BOOK_NAMES
-from lila.basic.models import Custom
+from lila.basic.models import Custom, SearchTrigram, UserSearch
 
 
 re_number = r'\d+'
@@ -52,6 +55,9 @@ ABBR_LENGTH = 5
 LILAC_CODE_LENGTH = 20
 VISIT_MAX = 1400
 VISIT_REDUCE = 1000
+BIBVERSE_ROWS = False   # Also keep one BibVerse row per verse (searching only needs the BibInterval rows)
+BIBINTERVAL_SPAN = 999  # A BibInterval stays within one chapter, so its end is at most this far from its start
+BIBINTERVAL_BUILT = "v1"    # Information value that marks the BibInterval rows of all BibRanges as complete
 
 COLLECTION_SCOPE = "seeker.colscope"
 COLLECTION_TYPE = "seeker.coltype" 
@@ -193,6 +199,24 @@ def get_current_datetime():
     """Get the current time"""
     return timezone.now()
 
+def bulk_create_ids(cls, lst_obj, batch_size=500):
+    """Create the objects in [lst_obj] with bulk_create() and make sure each of them gets its id
+
+    Some backends (PostgreSQL) return the ids of a bulk insert. Otherwise the ids of a batch are
+    read in the transaction that inserts it: SQLite allows only one writer at a time, so until
+    that transaction ends, the newest ids are those of the batch.
+    """
+
+    for start in range(0, len(lst_obj), batch_size):
+        lst_batch = lst_obj[start:start + batch_size]
+        with transaction.atomic():
+            cls.objects.bulk_create(lst_batch)
+            if lst_batch[0].pk is None:
+                lst_id = list(cls.objects.order_by('-id').values_list('id', flat=True)[:len(lst_batch)])
+                for obj, obj_id in zip(lst_batch, reversed(lst_id)):
+                    obj.id = obj_id
+    return lst_obj
+
 def get_default_loctype():
     """Get a default value for the loctype"""
 
@@ -951,6 +975,84 @@ def send_email(subject, profile, contents, add_team=False):
     return True
 
 
+def get_fk_instance(cls, fkfield, value, lookup=None):
+    """Find the instance of [cls] whose [fkfield] equals [value], possibly using a LookupMap"""
+
+    if lookup is None:
+        instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+    else:
+        instance = lookup.get(cls, fkfield, value)
+    return instance
+
+
+class LookupMap(object):
+    """In-memory maps from field values to objects, used by bulk imports
+    
+    Each (model, field) combination is read with one query, the first time it is needed
+    """
+
+    def __init__(self):
+        self.maps = {}
+        self.matches = {}
+
+    def get_value(self, value):
+        """Spreadsheets give whole numbers as floats: the cell 12 must match (and be stored as) "12" """
+
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return value
+
+    def get_key(self, value, iexact):
+        value = self.get_value(value)
+        sKey = "" if value is None else str(value)
+        if iexact:
+            sKey = sKey.lower()
+        return sKey
+
+    def get_map(self, cls, field, iexact=False):
+        map_key = (cls, field, iexact)
+        oMap = self.maps.get(map_key)
+        if oMap is None:
+            oMap = {}
+            # Like .first(): the object with the lowest id wins
+            for obj in cls.objects.all().order_by('id'):
+                sKey = self.get_key(getattr(obj, field), iexact)
+                if not sKey in oMap:
+                    oMap[sKey] = obj
+            self.maps[map_key] = oMap
+        return oMap
+
+    def get(self, cls, field, value, iexact=False, create=False, **kwargs):
+        """Get the object of [cls] with [field] = [value], possibly creating it (with extra [kwargs])"""
+
+        value = self.get_value(value)
+        oMap = self.get_map(cls, field, iexact)
+        sKey = self.get_key(value, iexact)
+        obj = oMap.get(sKey)
+        if obj is None and create and sKey != "":
+            obj = cls.objects.create(**{field: value}, **kwargs)
+            self.add(cls, field, obj)
+        return obj
+
+    def add(self, cls, field, obj):
+        """Make a newly created object known to the maps of [cls] and [field]"""
+
+        for iexact in [False, True]:
+            oMap = self.maps.get((cls, field, iexact))
+            if not oMap is None:
+                sKey = self.get_key(getattr(obj, field), iexact)
+                if not sKey in oMap:
+                    oMap[sKey] = obj
+
+    def get_best_match(self, sCountry, sCity, sLibrary):
+        """Library.get_best_match() for each combination only once"""
+
+        match_key = (sCountry, sCity, sLibrary)
+        if not match_key in self.matches:
+            self.matches[match_key] = Library.get_best_match(sCountry, sCity, sLibrary)
+        return self.matches[match_key]
+
+
 
 # =================== HELPER models ===================================
 class Status(models.Model):
@@ -982,6 +1084,129 @@ class Status(models.Model):
         self.save()
 
 
+class Job(models.Model):
+    """A long-running task (import, synchronisation, adaptation) that is executed by the [run_jobs] worker
+    
+    The web request only enqueues the job; progress is reported through the linked Status
+    """
+
+    # [1] Dotted path to the function that performs the job: it receives the Job as argument
+    jobtype = models.CharField("Job type", max_length=255)
+    # [1] Parameters for the job (as stringified JSON object)
+    params = models.TextField("Parameters", default="{}")
+    # [1] Status of the job: queued, running, done, error
+    status = models.CharField("Status", max_length=50, default="queued")
+    # [0-1] User
+    user = models.CharField("User", max_length=255, default="")
+    # [0-1] The Status object through which progress is reported
+    progress = models.ForeignKey(Status, null=True, blank=True, on_delete=models.SET_NULL, related_name="status_jobs")
+    # [1] The result of the job (as stringified JSON object)
+    result = models.TextField("Result", default="{}")
+    # [0-1] Error message (if any)
+    msg = models.TextField("Error message", blank=True, null=True)
+
+    # [1] Moments of creation, start and finish
+    created = models.DateTimeField(default=get_current_datetime)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # [0-1] Last sign of life of the worker that runs the job
+    beat = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        sBack = "{}: {} ({})".format(self.id, self.jobtype, self.status)
+        return sBack
+
+    def add(jobtype, username, params=None, oStatus=None):
+        """Put a new job on the queue"""
+
+        oErr = ErrHandle()
+        obj = None
+        try:
+            if params is None: params = {}
+            obj = Job.objects.create(jobtype=jobtype, user=username, params=json.dumps(params), progress=oStatus)
+            if not oStatus is None:
+                oStatus.set("queued")
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("Job/add")
+        return obj
+
+    def claim():
+        """Claim the oldest queued job, returning its id (or None)
+        
+        The status is changed with a conditional UPDATE, so that two workers never claim the same job
+        """
+
+        job_id = None
+        lst_queued = Job.objects.filter(status="queued").order_by('created', 'id').values_list('id', flat=True)[:10]
+        for queued_id in lst_queued:
+            now = get_current_datetime()
+            if Job.objects.filter(id=queued_id, status="queued").update(status="running", started=now, beat=now) == 1:
+                job_id = queued_id
+                break
+        return job_id
+
+    def heartbeat(lst_id):
+        """Show that the jobs in [lst_id] are still being worked on"""
+
+        if len(lst_id) > 0:
+            Job.objects.filter(id__in=lst_id, status="running").update(beat=get_current_datetime())
+
+    def requeue_stale(seconds):
+        """Queue the running jobs again whose worker has shown no sign of life for [seconds]
+
+        Returns the number of jobs that have been queued again
+        """
+
+        cutoff = get_current_datetime() - timedelta(seconds=seconds)
+        qs = Job.objects.filter(status="running").filter(Q(beat__lt=cutoff) | Q(beat__isnull=True, started__lt=cutoff))
+        return qs.update(status="queued", started=None, beat=None)
+
+    def run(job_id):
+        """Execute the job with this id (in a worker process started by [run_jobs])"""
+
+        oErr = ErrHandle()
+        job = None
+        try:
+            job = Job.objects.filter(id=job_id).first()
+            if not job is None:
+                oErr.Status("Job/run: starting {}".format(job))
+                func = import_string(job.jobtype)
+                oResult = func(job)
+                if isinstance(oResult, dict) and oResult.get('status') == "error":
+                    # The job has handled its own failure, but it has failed nonetheless
+                    msg = oResult.get('msg') or oResult.get('html', "")
+                    job.set("error", oResult, msg=msg)
+                    if not job.progress is None:
+                        job.progress.set("error", msg=msg)
+                else:
+                    job.set("done", oResult)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("Job/run")
+            if not job is None:
+                job.set("error", msg=msg)
+                if not job.progress is None:
+                    job.progress.set("error", msg=msg)
+        return job_id
+
+    def set(self, sStatus, oResult=None, msg=None):
+        self.status = sStatus
+        if oResult != None:
+            self.result = json.dumps(oResult)
+        if msg != None:
+            self.msg = msg
+        if sStatus in ["done", "error"]:
+            self.finished = get_current_datetime()
+        self.save()
+
+    def get_params(self):
+        return json.loads(self.params)
+
+    def get_result(self):
+        return json.loads(self.result)
+
+
 class Action(models.Model):
     """Track actions made by users"""
 
@@ -1214,54 +1439,51 @@ class Profile(models.Model, Custom):
         """Process one visit in an adaptation of the stack"""
 
         oErr = ErrHandle()
-        bNeedSaving = False
         try:
-            # Check if this is a menu choice
-            if is_menu:
-                # Rebuild the stack
-                path_home = reverse("home")
-                oStack = []
-                oStack.append({'name': "Home", 'url': path_home })
-                if path != path_home:
-                    oStack.append({'name': name, 'url': path })
-                self.stack = json.dumps(oStack)
-                bNeedSaving = True
-            else:
-                # Unpack the current stack
-                lst_stack = json.loads(self.stack)
-                # Check if this path is already on the stack
-                bNew = True
-                for idx, item in enumerate(lst_stack):
-                    # Check if this item is on it already
-                    if item['url'] == path:
-                        # The url is on the stack, so cut off the stack from here
-                        lst_stack = lst_stack[0:idx+1]
-                        # But make sure to add any kwargs
-                        if kwargs != None:
-                            item['kwargs'] = kwargs
-                        bNew = False
-                        break
-                    elif item['name'] == name:
-                        # Replace the url
-                        item['url'] = path
-                        # But make sure to add any kwargs
-                        if kwargs != None:
-                            item['kwargs'] = kwargs
-                        bNew = False
-                        break
-                if bNew:
-                    # Add item to the stack
-                    lst_stack.append({'name': name, 'url': path })
-                # Add changes
-                self.stack = json.dumps(lst_stack)
-                bNeedSaving = True
-            # All should have been done by now...
-            if bNeedSaving:
-                self.save()
+            lst_stack = Profile.get_visit_stack(json.loads(self.stack), name, path, is_menu, **kwargs)
+            self.stack = json.dumps(lst_stack)
+            self.save()
         except:
             msg = oErr.get_error_message()
             oErr.DoError("profile/add_visit")
 
+    def get_visit_stack(lst_stack, name, path, is_menu, **kwargs):
+        """Get the stack (list) that results from one visit to [path]"""
+
+        # Check if this is a menu choice
+        if is_menu:
+            # Rebuild the stack
+            path_home = reverse("home")
+            lst_stack = []
+            lst_stack.append({'name': "Home", 'url': path_home })
+            if path != path_home:
+                lst_stack.append({'name': name, 'url': path })
+        else:
+            # Check if this path is already on the stack
+            bNew = True
+            for idx, item in enumerate(lst_stack):
+                # Check if this item is on it already
+                if item['url'] == path:
+                    # The url is on the stack, so cut off the stack from here
+                    lst_stack = lst_stack[0:idx+1]
+                    # But make sure to add any kwargs
+                    if kwargs != None:
+                        item['kwargs'] = kwargs
+                    bNew = False
+                    break
+                elif item['name'] == name:
+                    # Replace the url
+                    item['url'] = path
+                    # But make sure to add any kwargs
+                    if kwargs != None:
+                        item['kwargs'] = kwargs
+                    bNew = False
+                    break
+            if bNew:
+                # Add item to the stack
+                lst_stack.append({'name': name, 'url': path })
+        return lst_stack
+
     def custom_get(self, path, **kwargs):
         sBack = ""
         oErr = ErrHandle()
@@ -1381,6 +1603,11 @@ class Profile(models.Model, Custom):
             oStack = []
             oStack.append({'name': "Home", 'url': path_home })
             return oStack
+        # The most recent stack is kept in the cache (see VisitLog)
+        from lila.seeker.visits import VisitLog
+        lst_stack = VisitLog.get_stack(username)
+        if not lst_stack is None:
+            return lst_stack
         # Get the user
         user = User.objects.filter(username=username).first()
         # Get to the profile of this user
@@ -1538,45 +1765,18 @@ class Visit(models.Model):
         return msg
 
     def add(username, name, path, is_menu = False, **kwargs):
-        """Add a visit from user [username]"""
+        """Add a visit from user [username]
 
-        oErr = ErrHandle()
-        try:
-            # Sanity check
-            if username == "": return True
-            # Get the user
-            user = User.objects.filter(username=username).first()
-            # Adapt the path if there are kwargs
-            # Add an item
-            obj = Visit(user=user, name=name, path=path)
-            obj.save()
-            # Get to the stack of this user
-            profile = Profile.objects.filter(user=user).first()
-            if profile == None:
-                # There is no profile yet, so make it
-                profile = Profile(user=user)
-                profile.save()
-
-            # Process this visit in the profile
-            profile.add_visit(name, path, is_menu, **kwargs)
-            # Possibly throw away an overflow of visit logs?
-            user_visit_count = Visit.objects.filter(user=user).count()
-            if user_visit_count > VISIT_MAX:
-                # Check how many to remove
-                removing = user_visit_count - VISIT_REDUCE
-                # Find the ID of the first one to remove
-                id_list = Visit.objects.filter(user=user).order_by('id').values('id')
-                below_id = id_list[removing]['id']
-                # Remove them
-                Visit.objects.filter(user=user, id__lte=below_id).delete()
-            # Return success
-            result = True
-        except:
-            msg = oErr.get_error_message()
-            oErr.DoError("visit/add")
-            result = False
-        # Return the result
-        return result
+        The visit is buffered and written to the database later on (see VisitLog),
+        so that a page view does not need to write anything
+        """
+
+        # Import here, to prevent circular imports
+        from lila.seeker.visits import VisitLog
+
+        # Sanity check
+        if username == "": return True
+        return VisitLog.add(username, name, path, is_menu, **kwargs)
 
 
 class Stype(models.Model):
@@ -2622,8 +2822,11 @@ class Litref(models.Model, Custom):
             sBack = adapt_markdown(self.short, lowercase=False)
         return sBack
 
-    def read_zotero(self, data=None):
-        """Process the information from zotero"""
+    def read_zotero(self, data=None, save=True):
+        """Process the information from zotero
+
+        With [save] False the fields are adapted, but the caller saves them (e.g. with bulk_update)
+        """
 
         def may_use_authors(authors, editors):
             """Figure out whether 'authors' should be used or 'editors'"""
@@ -2801,7 +3004,7 @@ class Litref(models.Model, Custom):
                             pass
 
                     # Now update this item
-                    if bNeedShortSave:
+                    if bNeedShortSave and save:
                         self.save()
                     
                     result = ""
@@ -2991,7 +3194,7 @@ class Litref(models.Model, Custom):
                         bNeedFullSave = True
 
                     # Now update this item
-                    if bNeedFullSave:
+                    if bNeedFullSave and save:
                         self.save()
                 else:
                     # This item type is not yet supported
@@ -3015,7 +3218,13 @@ class Litref(models.Model, Custom):
         return response
 
     def sync_zotero(force=False, oStatus=None):
-        """Read all stuff from Zotero"""
+        """Read all stuff from Zotero that has changed since the last synchronisation
+        
+        With [force] all items are read again and processed
+        """
+
+        # Import here, to prevent circular imports
+        from lila.seeker.zotero_sync import ZoteroSync
 
         libid = Information.get_kvalue("zotero_libraryid")
         libtype = "group"
@@ -3026,100 +3235,21 @@ class Litref(models.Model, Custom):
             # Cannot proceed, but we'll return True anyway
             return True
 
-        zot = zotero.Zotero(libid, libtype, apikey)
-        group_size = 25
         oBack = dict(status="ok", msg="")
-        bBack = True
-        msg = ""
-        changes = 0
-        additions = 0
-        oErr = ErrHandle()
-        try:
-            oBack['total'] = "Checking for literature references that have not been completely processed..."
-            if oStatus != None: oStatus.set("ok", oBack)
-            # Now walk all Litrefs again to see where fields are missing
-            processing = 0
-            for obj in Litref.objects.all():
-                sData = obj.data
-                if not sData is None and sData != "":
-                    oData = json.loads(obj.data)
-                    if oData.get('itemType') in Litref.ok_types and obj.full == "" and obj.short == "":
-                        # Do this one again
-                        obj.read_zotero(data=oData)
-                        processing += 1
-                        # Update status
-                        oBack['processed'] = processing
-                        if oStatus != None: oStatus.set("ok", oBack)
-            if processing > 0:
-                oBack['processed'] = processing
-                    
-            # Get the total number of items
-            total_count = zot.count_items()
-            # Initial status
-            oBack['total'] = "There are {} references in the lila Zotero library".format(total_count)
-            if oStatus != None: oStatus.set("ok", oBack)
-
-            # Read them in groups of 25
-            total_groups = math.ceil(total_count / group_size)
-            for grp_num in range( total_groups):
-                # Show where we are
-                oErr.Status("Sync zotero {}/{}".format(grp_num, total_groups))
-                # Calculate the umber to start from
-                start = grp_num * group_size
-                # Fetch these publications
-                for item in zot.items(start=start, limit=25):
-                    # Get the itemid
-                    sData = json.dumps( item['data'])
-                    itemid = item['key']
-                    # Check if the item is in Litref
-                    obj = Litref.objects.filter(itemid=itemid).first()
-                    if obj == None:
-                        # Add it
-                        obj = Litref(itemid=itemid, data=sData)
-                        obj.save()
-                        additions += 1
-                    # Check if it needs processing
-                    if force or obj.short == "" or obj.data != sData:
-                        # Do a complete check on all KV pairs
-                        oDataZotero = item['data']
-                        oDataLitref = json.loads(obj.data)
-                        if force or obj.short == "":
-                            bNeedChanging = True
-                        else:
-                            bNeedChanging = False
-                            for k,v in oDataZotero.items():
-                                # Find the corresponding in Litref
-                                if k in oDataLitref:
-                                    if v != oDataLitref[k]:
-                                        oErr.Status("Litref/sync_zotero: value on [{}] differs [{}] / [{}]".format(k, v, oDataLitref[k]))
-                                        bNeedChanging = True
-                                else:
-                                    # The key is not even found
-                                    oErr.Status("Litref/sync_zotero: key not found {}".format(k))
-                                    bNeedChanging = True
-                                    break
-                        if bNeedChanging:
-                            # It needs processing
-                            obj.data = sData
-                            obj.save()
-                            obj.read_zotero(data=item['data'])
-                            changes += 1
-                    elif obj.data != sData:
-                        obj.data = sData
-                        obj.save()
-                        obj.read_zotero(data=item['data'])
-                        changes += 1
+        oErr = ErrHandle()
+        try:
+            # The library version of the last synchronisation
+            since = Information.get_kvalue("zotero_version")
+            since = 0 if force or since is None or since == "" else int(since)
+
+            oSync = ZoteroSync(libid, apikey, libtype, endpoint=Information.get_kvalue("zotero_endpoint"))
+            oBack = oSync.sync(since, force, oStatus)
 
-                # Update the status information
-                oBack['group'] = "Group {}/{}".format(grp_num+1, total_groups)
-                oBack['changes'] = changes
-                oBack['additions'] = additions
-                if oStatus != None: oStatus.set("ok", oBack)
+            # Remember where we are for the next time
+            Information.set_kvalue("zotero_version", str(oBack['version']))
 
             # Make sure to set the status to finished
             oBack['group'] = "Everything has been done"
-            oBack['changes'] = changes
-            oBack['additions'] = additions
             if oStatus != None: oStatus.set("finished", oBack)
         except:
             print("sync_zotero error")
@@ -3846,7 +3976,7 @@ class Manuscript(models.Model, Custom):
                                 # Find an item with the name for the particular model
                                 cls = apps.app_configs['seeker'].get_model(model)
                                 if type == "fk":
-                                    instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                                    instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                                 else:
                                     instance = cls.objects.filter(**{"id".format(fkfield): value}).first()
                                 if instance != None:
@@ -3870,7 +4000,11 @@ class Manuscript(models.Model, Custom):
                             obj.custom_set(path, value, **kwargs)
 
                 # Check what we now have for Country/City/Library
-                lcountry, lcity, library = Library.get_best_match(country, city, library)
+                lookup = kwargs.get("lookup")
+                if lookup is None:
+                    lcountry, lcity, library = Library.get_best_match(country, city, library)
+                else:
+                    lcountry, lcity, library = lookup.get_best_match(country, city, library)
                 if lcountry != None and lcountry != obj.lcountry:
                     obj.lcountry = lcountry
                 if lcity != None and lcity != obj.lcity:
@@ -3886,6 +4020,129 @@ class Manuscript(models.Model, Custom):
             oErr.DoError("Manuscript/add_one")
         return obj
 
+    def bulk_add(lst_manu, **kwargs):
+        """Add a list of *new* manuscripts (e.g. from an Excel import) with bulk_create()
+
+        Each item in [lst_manu] is a dictionary as used by custom_add() with keyfield 'path'.
+        The caller makes sure that these manuscripts do not exist yet.
+        Returns the list of created manuscripts in the order of [lst_manu]
+        """
+
+        oErr = ErrHandle()
+        lst_obj = []
+        try:
+            profile = kwargs.get("profile")
+            source = kwargs.get("source")
+            batch_size = kwargs.get("batch_size", 500)
+            lookup = kwargs.get("lookup")
+            if lookup is None:
+                lookup = LookupMap()
+                kwargs['lookup'] = lookup
+            now = get_current_datetime()
+            lst_func = []
+
+            # (1) Create the manuscripts in memory
+            for oManu in lst_manu:
+                # Supply an alternative title
+                if oManu.get("name") is None and not oManu.get("lilacode") is None:
+                    oManu['name'] = oManu.get("lilacode")
+                obj = Manuscript(idno=oManu.get("idno"), stype="imp", mtype="man", source=source, saved=now)
+                country = ""
+                city = ""
+                library = ""
+                for oField in Manuscript.specification:
+                    path = oField.get("path")
+                    type = oField.get("type")
+                    field = path.lower() if type != "fk_id" else "{}_id".format(path.lower())
+                    value = oManu.get(field)
+                    if value != None and value != "" and not oField.get('readonly', False):
+                        if "target" in oField:
+                            path = oField.get("target")
+                        if type == "field":
+                            setattr(obj, path, value)
+                        elif type == "fk" or type == "fk_id":
+                            cls = apps.app_configs['seeker'].get_model(oField.get("model"))
+                            fkfield = oField.get("fkfield") if type == "fk" else "id"
+                            instance = lookup.get(cls, fkfield, value)
+                            if instance != None:
+                                setattr(obj, path, instance)
+                            # Keep track of country/city/library for further fine-tuning
+                            if type == "fk":
+                                if path == "lcountry":
+                                    country = value
+                                elif path == "lcity":
+                                    city = value
+                                elif path == "library":
+                                    library = value
+                        elif type == "func":
+                            # This needs the id of the manuscript
+                            lst_func.append((len(lst_obj), path, value))
+
+                # Check what we now have for Country/City/Library
+                lcountry, lcity, library = lookup.get_best_match(country, city, library)
+                if lcountry != None: obj.lcountry = lcountry
+                if lcity != None: obj.lcity = lcity
+                if library != None: obj.library = library
+                lst_obj.append(obj)
+
+            with transaction.atomic():
+                # (2) Save them in batches
+                bulk_create_ids(Manuscript, lst_obj, batch_size)
+
+                # (3) Link them to the default projects
+                if not profile is None:
+                    projects = profile.get_defaults()
+                    if isinstance(projects, Project): projects = [ projects ]
+                    lst_link = [ManuscriptProject(manuscript=obj, project=project) for obj in lst_obj for project in projects]
+                    ManuscriptProject.objects.bulk_create(lst_link, batch_size=batch_size)
+
+                # (4) Each manuscript gets its first codicological unit
+                lst_codico = []
+                for obj, oManu in zip(lst_obj, lst_manu):
+                    codico = Codico(manuscript=obj, name="SUPPLY A NAME", stype="imp", order=1, pagefirst=1, pagelast=1, saved=now)
+                    name = oManu.get("name")
+                    if not name is None and name != "": codico.name = name
+                    # The manuscript's 'size' could serve as 'format' for the codico
+                    format = oManu.get("format")
+                    if format is None: format = oManu.get("size")
+                    if not format is None and format != "": codico.format = format
+                    for path in ['support', 'extent']:
+                        value = oManu.get(path)
+                        if not value is None and value != "": setattr(codico, path, value)
+                    lst_codico.append(codico)
+                Codico.objects.bulk_create(lst_codico, batch_size=batch_size)
+
+                # (5) The related items of the manuscripts and codicos are set one by one
+                for idx, path, value in lst_func:
+                    lst_obj[idx].custom_set(path, value, **kwargs)
+                oCodico = {}
+                for codico in Codico.objects.filter(manuscript__in=lst_obj):
+                    oCodico[codico.manuscript_id] = codico
+                for obj, oManu in zip(lst_obj, lst_manu):
+                    codico = oCodico.get(obj.id)
+                    for path in ['dateranges', 'origins', 'provenances']:
+                        value = oManu.get(path)
+                        if not codico is None and value != None and value != "":
+                            codico.custom_set(path, value, **kwargs)
+
+                # (6) Adapt the number of manuscripts of the libraries involved
+                lst_library = set([obj.library_id for obj in lst_obj if not obj.library_id is None])
+                qs = Manuscript.objects.filter(library__in=lst_library).values('library').annotate(mcount=Count('id'))
+                oCount = {x['library']: x['mcount'] for x in qs}
+                for library in Library.objects.filter(id__in=lst_library):
+                    if library.mcount != oCount.get(library.id):
+                        library.mcount = oCount.get(library.id)
+                        library.save()
+
+            # (7) Cached search results of these models are outdated (save() has been bypassed)
+            for cls in [Manuscript, Codico, ManuscriptProject]:
+                UserSearch.bump_model_version(cls)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("Manuscript/bulk_add")
+            lst_obj = []
+        return lst_obj
+
     def custom_get(self, path, **kwargs):
         sBack = ""
         oErr = ErrHandle()
@@ -4426,92 +4683,21 @@ class Manuscript(models.Model, Custom):
     def get_canwit_list(self, username, team_group):
         """Create a list of sermons with hierarchical information"""
 
+        # Import here, to prevent circular imports
+        from lila.seeker.hierarchy import HierarchyList
+
         oErr = ErrHandle()
         canwit_list = []
-        maxdepth = 0
-        msitem_dict = {}
-
-        method = "canwit"  # OLD: each manuscript had a number of Canwit directly
-
-        if self.mtype == "rec":
-            method = "codicos"      # NEW: Take codicological unites as a starting point
-        else:
-            method = "msitem"       # CURRENT: there is a level of [MsItem] between Manuscript and Canwit/Codhead
 
         try:
-            # Create a well sorted list of sermons
-            if method == "msitem":
-                qs = self.manuitems.filter(order__gte=0).order_by('order')
-            elif method == "codicos":
-                # Look for the Reconstruction codico's
+            if self.mtype == "rec":
+                # NEW: Take codicological unites as a starting point
                 codico_lst = [x['codico__id'] for x in self.manuscriptreconstructions.order_by('order').values('codico__id')]
-                # Create a list of MsItem objects that belong to this reconstruction manuscript
-                qs = []
-                for codico_id in codico_lst:
-                    codico = Codico.objects.filter(id=codico_id).first()
-                    for obj in MsItem.objects.filter(codico__id=codico_id, order__gte=0).order_by('order'):
-                        qs.append(obj)
-                        # Make sure to put this MsItem in the dictionary with the right Codico target
-                        msitem_dict[obj.id] = codico
-            prev_level = 0
-            for idx, sermon in enumerate(qs):
-                # Need this first, because it also REPAIRS possible parent errors
-                level = sermon.getdepth()
-
-                parent = sermon.parent
-                firstchild = False
-                if parent:
-                    if method == "msitem":
-                        qs_siblings = self.manuitems.filter(parent=parent).order_by('order')
-                    elif method == "codicos":
-                        # N.B: note that 'sermon' is not really a sermon but the MsItem
-                        qs_siblings = msitem_dict[sermon.id].codicoitems.filter(parent=parent).order_by('order')
-                    if sermon.id == qs_siblings.first().id:
-                        firstchild = True
-
-                # Only then continue!
-                oSermon = {}
-                if method == "msitem" or method == "codicos":
-                    # The 'obj' always is the MsItem itself
-                    oSermon['obj'] = sermon
-                    # Now we need to add a reference to the actual Canwit object
-                    oSermon['sermon'] = sermon.itemsermons.first()
-                    # And we add a reference to the Codhead object
-                    oSermon['shead'] = sermon.itemheads.first()
-                    oSermon['colwit'] = None
-                    # If this is a codhead
-                    if not oSermon['shead'] is None:
-                        # Check if there is a ColWit attached to this
-                        oSermon['colwit'] = Colwit.objects.filter(codhead = oSermon['shead']).first()
-                        
-                oSermon['nodeid'] = sermon.order + 1
-                oSermon['number'] = idx + 1
-                oSermon['childof'] = 1 if sermon.parent == None else sermon.parent.order + 1
-                oSermon['level'] = level
-                oSermon['pre'] = (level-1) * 20
-                # If this is a new level, indicate it
-                oSermon['group'] = firstchild   # (sermon.firstchild != None)
-                # Is this one a parent of others?
-                if method == "msitem" or method == "codicos":
-                    if method == "msitem":
-                        oSermon['isparent'] = self.manuitems.filter(parent=sermon).exists()
-                    elif method == "codicos":
-                        oSermon['isparent'] = msitem_dict[sermon.id].codicoitems.filter(parent=sermon).exists()
-                    codi = sermon.get_codistart()
-                    oSermon['codistart'] = "" if codi == None else codi.id
-                    oSermon['codiorder'] = -1 if codi == None else codi.order
-
-                # Add the user-dependent list of associated collections to this sermon descriptor
-                oSermon['hclist'] = [] if oSermon['sermon'] == None else oSermon['sermon'].get_hcs_plain(username, team_group)
-
-                canwit_list.append(oSermon)
-                # Bookkeeping
-                if level > maxdepth: maxdepth = level
-                prev_level = level
-            # Review them all and fill in the colspan
-            for oSermon in canwit_list:
-                oSermon['cols'] = maxdepth - oSermon['level'] + 1
-                if oSermon['group']: oSermon['cols'] -= 1
+                lst_container = [MsItem.objects.filter(codico__id=codico_id) for codico_id in codico_lst]
+            else:
+                # CURRENT: there is a level of [MsItem] between Manuscript and Canwit/Codhead
+                lst_container = [self.manuitems.all()]
+            canwit_list = HierarchyList(lst_container).get_list(username, team_group)
         except:
             msg = oErr.get_error_message()
             oErr.DoError("Manuscript/get_canwit_list")
@@ -4662,120 +4848,21 @@ class Manuscript(models.Model, Custom):
     def load_sermons_from(self, manu_src, mtype = "tem", profile=None):
         """Copy sermons from [manu_src] into myself"""
 
-        # Indicate what the destination manuscript object is
-        manu_dst = self
-        repair = ['parent', 'firstchild', 'next']
+        # Import here, to prevent circular imports
+        from lila.seeker.clone import ManuscriptCloner
 
-        # Figure out what the codico of me is
-        codico = Codico.objects.filter(manuscript=self).first()
-
-        # copy all the sermons...
-        msitems = []
-        with transaction.atomic():
-            # Walk over all MsItem stuff
-            for msitem in manu_src.manuitems.all().order_by('order'):
-                dst = msitem
-                src_id = msitem.id
-                dst.pk = None
-                dst.manu = manu_dst     # This sets the destination's FK for the manuscript
-                                        # Does this leave the original unchanged? I hope so...:)
-                # Make sure the codico is set correctly
-                dst.codico = codico
-                dst.save()
-                src = MsItem.objects.filter(id=src_id).first()
-                msitems.append(dict(src=src, dst=dst))
-
-        # Repair all the relationships from sermon to sermon
-        with transaction.atomic():
-            for msitem in msitems:
-                src = msitem['src']
-                dst = msitem['dst']  
-                # Repair 'parent', 'firstchild' and 'next', which are part of MsItem
-                for relation in repair:
-                    src_rel = getattr(src, relation)
-                    if src_rel and src_rel.order:
-                        # Retrieve the target MsItem from the [manu_dst] by looking for the order number!!
-                        relation_target = manu_dst.manuitems.filter(order=src_rel.order).first()
-                        # Correct the MsItem's [dst] field now
-                        setattr(dst, relation, relation_target)
-                        dst.save()
-                # Copy and save a Canwit if needed
-                sermon_src = src.itemsermons.first()
-                if sermon_src != None:
-                    # COpy it
-                    sermon_dst = sermon_src
-                    sermon_dst.pk = None
-                    sermon_dst.msitem = dst
-                    sermon_dst.mtype = mtype   # Change the type
-                    sermon_dst.stype = "imp"   # Imported
-
-                    # Issue #315: clear some fields after copying
-                    if mtype == "man":                        
-                        sermon_dst.additional = ""
-                    # Issue #420: 'locus' also for template creation
-                    sermon_dst.locus = ""
-
-                    # Save the copy
-                    sermon_dst.save()
-                else:
-                    head_src = src.itemheads.first()
-                    if head_src != None:
-                        # COpy it
-                        head_dst = head_src
-                        head_dst.pk = None
-                        head_dst.msitem = dst
-                        # NOTE: a Codhead does *not* have an mtype or stype
-
-                        # Issue #420: 'locus' also for template creation
-                        head_dst.locus = ""
-
-                        # Save the copy
-                        head_dst.save()
-
-        # Walk the msitems again, and make sure SSG-links are copied!!
-        with transaction.atomic():
-            for msitem in msitems:
-                src = msitem['src']
-                dst = msitem['dst']  
-                sermon_src = src.itemsermons.first()
-                if sermon_src != None:
-                    # Make sure we also have the destination
-                    sermon_dst = dst.itemsermons.first()
-                    # Walk the SSG links tied with sermon_src
-                    for eq in sermon_src.austats.all():
-                        # Add it to the destination sermon
-                        CanwitAustat.objects.create(sermon=sermon_dst, super=eq, linktype=LINK_UNSPECIFIED)
-
-                    # Issue #315: adapt Bible reference(s) linking based on copied field
-                    if mtype == "man":
-                        sermon_dst.adapt_verses()
-
-                    # Issue #315 note: 
-                    #   this is *NOT* working, because templates do not contain 
-                    #     keywords nor do they contain Gryson/Clavis codes
-                    #   Alternative: 
-                    #     Store the keywords and signatures in a special JSON field in the template
-                    #     Then do the copying based on this JSON field
-                    #     Look at Manuscript.custom_...() procedures to see how this goes
-                    # ===============================================================================
-
-                    ## Issue #315: copy USER keywords - only if there is a profile
-                    #if profile != None:
-                    #    for ukw in sermon_src.canwit_userkeywords.all():
-                    #        # Copy the user-keyword to a new one attached to [sermon_dst]
-                    #        keyword = UserKeyword.objects.create(
-                    #            keyword=ukw.keyword, sermo=sermon_dst, type=ukw.type, profile=profile)
-                    ## Copy KEYWORDS per sermon
-                    #for kw in sermon_src.keywords.all():
-                    #    skw = CanwitKeyword.objects.create(sermon=sermon_dst, keyword=kw.keyword)
-
-                    ## Issue #315: copy manual Gryson/Clavis-codes
-                    #for msig in sermon_src.canwitsignatures.all():
-                    #    usig = CanwitSignature.objects.create(
-                    #        code=msig.code, editype=msig.editype, gsig=msig.gsig, sermon=sermon_dst)
+        # Copy all MsItems with their Canwit/Codhead and the SSG-links in bulk
+        # Issue #315 note: 
+        #   templates do not contain keywords nor Gryson/Clavis codes, so these are not copied
+        #   Alternative: 
+        #     Store the keywords and signatures in a special JSON field in the template
+        #     Then do the copying based on this JSON field
+        #     Look at Manuscript.custom_...() procedures to see how this goes
+        oCloner = ManuscriptCloner(self)
+        bBack = oCloner.load_from(manu_src, mtype=mtype)
 
         # Return okay
-        return True
+        return bBack
 
     def order_calculate(self):
         """Re-calculate the order of the MsItem stuff"""
@@ -4993,7 +5080,7 @@ class Codico(models.Model, Custom):
                             if fkfield != None and model != None:
                                 # Find an item with the name for the particular model
                                 cls = apps.app_configs['seeker'].get_model(model)
-                                instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                                instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                                 if instance != None:
                                     old_value = getattr(obj,path)
                                     if instance != old_value:
@@ -5128,113 +5215,15 @@ class Codico(models.Model, Custom):
     def get_canwit_list(self, username, team_group):
         """Create a list of sermons with hierarchical information"""
 
+        # Import here, to prevent circular imports
+        from lila.seeker.hierarchy import HierarchyList
+
         oErr = ErrHandle()
         canwit_list = []
-        maxdepth = 0
-        msitem_dict = {}
 
         try:
-            if self.manuscript.mtype == "rec":
-                method = "codicos"      # NEW: Take codicological unites as a starting point
-            else:
-                method = "msitem"       # CURRENT: there is a level of [MsItem] between Manuscript and Canwit/Codhead
-
-            # Create a well sorted list of canwits for this codico
-            if method == "msitem":
-                # OLD: qs = self.manuitems.filter(order__gte=0).order_by('order')
-
-                # Create a list of MsItem objects that belong to this codicological unit
-                qs = []
-                for obj in self.codicoitems.filter(order__gte=0).order_by('order'):
-                    qs.append(obj)
-                    # Make sure to put this MsItem in the dictionary with the right Codico target
-                    msitem_dict[obj.id] = self
-
-            elif method == "codicos":
-                # TODO: check this adaptation - I think it works the same now 'per codico'
-
-                # Create a list of MsItem objects that belong to this codicological unit
-                qs = []
-                for obj in self.codicoitems.filter(order__gte=0).order_by('order'):
-                    qs.append(obj)
-                    # Make sure to put this MsItem in the dictionary with the right Codico target
-                    msitem_dict[obj.id] = self
-                ## Look for the Reconstruction codico's
-                #codico_lst = [x['codico__id'] for x in self.manuscriptreconstructions.order_by('order').values('codico__id')]
-                ## Create a list of MsItem objects that belong to this reconstruction manuscript
-                #qs = []
-                #for codico_id in codico_lst:
-                #    codico = Codico.objects.filter(id=codico_id).first()
-                #    for obj in MsItem.objects.filter(codico__id=codico_id, order__gte=0).order_by('order'):
-                #        qs.append(obj)
-                #        # Make sure to put this MsItem in the dictionary with the right Codico target
-                #        msitem_dict[obj.id] = codico
-
-
-            prev_level = 0
-            for idx, sermon in enumerate(qs):
-                # Need this first, because it also REPAIRS possible parent errors
-                level = sermon.getdepth()
-
-                parent = sermon.parent
-                firstchild = False
-                if parent:
-                    if method == "msitem":
-                        # Old: qs_siblings = self.manuitems.filter(parent=parent).order_by('order')
-
-                        # New method for Lilac: per codico
-                        # N.B: note that 'sermon' is not really a sermon but the MsItem
-                        qs_siblings = msitem_dict[sermon.id].codicoitems.filter(parent=parent).order_by('order')
-                    elif method == "codicos":
-                        # N.B: note that 'sermon' is not really a sermon but the MsItem
-                        qs_siblings = msitem_dict[sermon.id].codicoitems.filter(parent=parent).order_by('order')
-                    if sermon.id == qs_siblings.first().id:
-                        firstchild = True
-
-                # Only then continue!
-                oSermon = {}
-                if method == "msitem" or method == "codicos":
-                    # The 'obj' always is the MsItem itself
-                    oSermon['obj'] = sermon
-                    # Now we need to add a reference to the actual Canwit object
-                    oSermon['sermon'] = sermon.itemsermons.first()
-                    # And we add a reference to the Codhead object
-                    oSermon['shead'] = sermon.itemheads.first()
-                    oSermon['colwit'] = None
-                    # If this is a codhead
-                    if not oSermon['shead'] is None:
-                        # Check if there is a ColWit attached to this
-                        oSermon['colwit'] = Colwit.objects.filter(codhead = oSermon['shead']).first()
-                oSermon['nodeid'] = sermon.order + 1
-                oSermon['number'] = idx + 1
-                oSermon['childof'] = 1 if sermon.parent == None else sermon.parent.order + 1
-                oSermon['level'] = level
-                oSermon['pre'] = (level-1) * 20
-                # If this is a new level, indicate it
-                oSermon['group'] = firstchild   # (sermon.firstchild != None)
-                # Is this one a parent of others?
-                if method == "msitem" or method == "codicos":
-                    if method == "msitem":
-                        # OLD: oSermon['isparent'] = self.manuitems.filter(parent=sermon).exists()
-                        # New method for Lilac
-                        oSermon['isparent'] = msitem_dict[sermon.id].codicoitems.filter(parent=sermon).exists()
-                    elif method == "codicos":
-                        oSermon['isparent'] = msitem_dict[sermon.id].codicoitems.filter(parent=sermon).exists()
-                    codi = sermon.get_codistart()
-                    oSermon['codistart'] = "" if codi == None else codi.id
-                    oSermon['codiorder'] = -1 if codi == None else codi.order
-
-                # Add the user-dependent list of associated collections to this sermon descriptor
-                oSermon['hclist'] = [] if oSermon['sermon'] == None else oSermon['sermon'].get_hcs_plain(username, team_group)
-
-                canwit_list.append(oSermon)
-                # Bookkeeping
-                if level > maxdepth: maxdepth = level
-                prev_level = level
-            # Review them all and fill in the colspan
-            for oSermon in canwit_list:
-                oSermon['cols'] = maxdepth - oSermon['level'] + 1
-                if oSermon['group']: oSermon['cols'] -= 1
+            # Both for manifestations and for reconstructions: the MsItems of this codicological unit
+            canwit_list = HierarchyList([self.codicoitems.all()]).get_list(username, team_group)
         except:
             msg = oErr.get_error_message()
             oErr.DoError("Codico/get_canwit_list")
@@ -6185,13 +6174,12 @@ class Auwork(models.Model, Custom):
             response = super(Auwork, self).save(force_insert, force_update, using, update_fields)
 
             # Scan all relevant Austat items
-            qs = Austat.objects.filter(auwork__isnull=True)
+            qs = Austat.objects.filter(auwork__isnull=True, keycode=self.key)
             with transaction.atomic():
                 for obj in qs:
-                    if obj.keycode == self.key:
-                        # Set the FK
-                        obj.auwork = self
-                        obj.save()
+                    # Set the FK
+                    obj.auwork = self
+                    obj.save()
             
             # Return the initial save response
             return response
@@ -6200,7 +6188,7 @@ class Auwork(models.Model, Custom):
             oErr.DoError("Auwork.save")
             return None
 
-    def add_genres(self, genres):
+    def add_genres(self, genres, lookup=None):
         """Possiblyl add genres to the Auwork object"""
 
         bResult = True
@@ -6214,10 +6202,14 @@ class Auwork(models.Model, Custom):
                     lst_genres = [x.strip() for x in genres.split(",")]
                 for sGenre in lst_genres:
                     # Check if this exists or not
-                    genre = Genre.objects.filter(name__iexact=sGenre).first()
+                    if lookup is None:
+                        genre = Genre.objects.filter(name__iexact=sGenre).first()
+                    else:
+                        genre = lookup.get(Genre, "name", sGenre, iexact=True)
                     if genre is None:
                         # Add it as a CPL (=gryson), because this is from Austat
                         genre = Genre.objects.create(name=sGenre)
+                        if not lookup is None: lookup.add(Genre, "name", genre)
                     # Check if the link is already there or not
                     link = AuworkGenre.objects.filter(auwork=self, genre=genre).first()
                     if link is None:
@@ -6228,7 +6220,7 @@ class Auwork(models.Model, Custom):
             oErr.DoError("Auwork/add_genres")
         return bResult
 
-    def add_keywords(self, keywords):
+    def add_keywords(self, keywords, lookup=None):
         """Possiblyl add keywords to the Auwork object"""
 
         bResult = True
@@ -6242,10 +6234,14 @@ class Auwork(models.Model, Custom):
                     lst_keywords = [x.strip() for x in keywords.split(",")]
                 for sKeyword in lst_keywords:
                     # Check if this exists or not
-                    keyword = Keyword.objects.filter(name__iexact=sKeyword).first()
+                    if lookup is None:
+                        keyword = Keyword.objects.filter(name__iexact=sKeyword).first()
+                    else:
+                        keyword = lookup.get(Keyword, "name", sKeyword, iexact=True)
                     if keyword is None:
                         # Add it as a CPL (=gryson), because this is from Austat
                         keyword = Keyword.objects.create(name=sKeyword)
+                        if not lookup is None: lookup.add(Keyword, "name", keyword)
                     # Check if the link is already there or not
                     link = AuworkKeyword.objects.filter(auwork=self, keyword=keyword).first()
                     if link is None:
@@ -6256,7 +6252,7 @@ class Auwork(models.Model, Custom):
             oErr.DoError("Auwork/add_keywords")
         return bResult
 
-    def add_signatures(self, signatures):
+    def add_signatures(self, signatures, lookup=None):
         """Possiblyl add signatures to the Auwork object"""
 
         bResult = True
@@ -6270,10 +6266,14 @@ class Auwork(models.Model, Custom):
                     lst_signatures = [x.strip() for x in signatures.split(",")]
                 for sSignature in lst_signatures:
                     # Check if this exists or not
-                    signature = Signature.objects.filter(code__iexact=sSignature).first()
+                    if lookup is None:
+                        signature = Signature.objects.filter(code__iexact=sSignature).first()
+                    else:
+                        signature = lookup.get(Signature, "code", sSignature, iexact=True)
                     if signature is None:
                         # Add it as a CPL (=gryson), because this is from Austat
                         signature = Signature.objects.create(code=sSignature, editype="cpl")
+                        if not lookup is None: lookup.add(Signature, "code", signature)
                     # Check if the link is already there or not
                     link = AuworkSignature.objects.filter(auwork=self, signature=signature).first()
                     if link is None:
@@ -6330,21 +6330,99 @@ class Auwork(models.Model, Custom):
                         if fkfield != None and model != None:
                             # Find an item with the name for the particular model
                             cls = apps.app_configs['seeker'].get_model(model)
-                            instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                            instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                             if instance != None:
                                 setattr(obj, path, instance)
                     elif type == "func":
                         # Set the KV in a special way
-                        obj.custom_set(path, value)
+                        obj.custom_set(path, value, **kwargs)
 
-                # Be sure to save the object
-                obj.save()
+            # Be sure to save the object
+            obj.save()
 
         except:
             msg = oErr.get_error_message()
             oErr.DoError("Auwork/custom_add")
         return obj
 
+    def bulk_add(lst_auwork, **kwargs):
+        """Add a list of *new* Auwork items (e.g. from an Excel import) with bulk_create()
+
+        The caller makes sure that no Auwork with these keys exists yet.
+        Returns the list of created Auwork items in the order of [lst_auwork]
+        """
+
+        oErr = ErrHandle()
+        lst_obj = []
+        try:
+            batch_size = kwargs.get("batch_size", 500)
+            lookup = kwargs.get("lookup")
+            if lookup is None:
+                lookup = LookupMap()
+            lst_func = []
+
+            # (1) Create the Auwork items in memory
+            for oAuwork in lst_auwork:
+                obj = Auwork(key=oAuwork.get("key"), stype="imp")
+                for oField in Auwork.specification:
+                    path = oField.get("path")
+                    type = oField.get("type")
+                    value = oAuwork.get(path.lower())
+                    if value != None and value != "" and not oField.get('readonly', False):
+                        if type == "field":
+                            setattr(obj, path, value)
+                        elif type == "fk":
+                            cls = apps.app_configs['seeker'].get_model(oField.get("model"))
+                            instance = lookup.get(cls, oField.get("fkfield"), value)
+                            if instance != None:
+                                setattr(obj, path, instance)
+                        elif type == "func":
+                            lst_func.append((obj, path, value))
+                lst_obj.append(obj)
+
+            with transaction.atomic():
+                # (2) Save them in batches
+                bulk_create_ids(Auwork, lst_obj, batch_size)
+
+                # (3) Genres, keywords and signatures are linked in bulk too
+                oLink = dict(genres=[], keywords=[], signatures=[])
+                lst_pair = set()
+                for obj, path, value in lst_func:
+                    for sValue in get_value_list(value):
+                        if path == "genres":
+                            genre = lookup.get(Genre, "name", sValue, iexact=True, create=True)
+                            if not genre is None and not (obj.id, path, genre.id) in lst_pair:
+                                oLink[path].append(AuworkGenre(auwork=obj, genre=genre))
+                                lst_pair.add((obj.id, path, genre.id))
+                        elif path == "keywords":
+                            keyword = lookup.get(Keyword, "name", sValue, iexact=True, create=True)
+                            if not keyword is None and not (obj.id, path, keyword.id) in lst_pair:
+                                oLink[path].append(AuworkKeyword(auwork=obj, keyword=keyword))
+                                lst_pair.add((obj.id, path, keyword.id))
+                        elif path == "signatures":
+                            signature = lookup.get(Signature, "code", sValue, iexact=True, create=True, editype="cpl")
+                            if not signature is None and not (obj.id, path, signature.id) in lst_pair:
+                                oLink[path].append(AuworkSignature(auwork=obj, signature=signature))
+                                lst_pair.add((obj.id, path, signature.id))
+                AuworkGenre.objects.bulk_create(oLink['genres'], batch_size=batch_size)
+                AuworkKeyword.objects.bulk_create(oLink['keywords'], batch_size=batch_size)
+                AuworkSignature.objects.bulk_create(oLink['signatures'], batch_size=batch_size)
+
+                # (4) Link the Austat items that were waiting for these keys (as Auwork.save() does)
+                oAuwork = {obj.key: obj for obj in lst_obj}
+                for austat in Austat.objects.filter(auwork__isnull=True, keycode__in=list(oAuwork.keys())):
+                    austat.auwork = oAuwork[austat.keycode]
+                    austat.save()
+
+            # (5) Cached search results of these models are outdated (save() has been bypassed)
+            for cls in [Auwork, AuworkGenre, AuworkKeyword, AuworkSignature]:
+                UserSearch.bump_model_version(cls)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("Auwork/bulk_add")
+            lst_obj = []
+        return lst_obj
+
     def custom_get(self, path, **kwargs):
         sBack = ""
         oErr = ErrHandle()
@@ -6377,13 +6455,14 @@ class Auwork(models.Model, Custom):
 
             # Note: we skip a number of fields that are determined automatically
             #       [ stype ]
+            lookup = kwargs.get("lookup")
             if path == "genres":
-                self.add_genres(value_lst)
+                self.add_genres(value_lst, lookup)
             elif path == "keywords":
-                self.add_keywords(value_lst)
+                self.add_keywords(value_lst, lookup)
             elif path == "signatures":
                 # Walk the signatures connected to me
-                self.add_signatures(value_lst)
+                self.add_signatures(value_lst, lookup)
             else:
                 # TODO: figure out what to do in this case
                 pass
@@ -6586,6 +6665,9 @@ class Austat(models.Model, Custom):
     # [m] Many-to-many: one manuscript can have a series of user-supplied comments
     comments = models.ManyToManyField(Comment, related_name="comments_super")
 
+    # Fields that are kept in the trigram search index
+    trigram_fields = ['srchftext', 'srchftrans']
+
     # SPecification for download/upload
     specification = [
         {'name': 'Key',                 'type': 'func',  'path': 'keycode'},
@@ -6672,6 +6754,10 @@ class Austat(models.Model, Custom):
 
             # Do the saving initially
             response = super(Austat, self).save(force_insert, force_update, using, update_fields)
+
+            # Keep the search index and the cached words up to date
+            SearchTrigram.update_object(self)
+            AustatWords.update_austat(self)
             return response
         except:
             msg = oErr.get_error_message()
@@ -6761,7 +6847,11 @@ class Austat(models.Model, Custom):
             austat_key = oAustat.get('austat_key')
 
             # Check if an Auwork is already existing
-            auwork = Auwork.objects.filter(key__iexact=work_key).first()
+            lookup = kwargs.get("lookup")
+            if lookup is None:
+                auwork = Auwork.objects.filter(key__iexact=work_key).first()
+            else:
+                auwork = lookup.get(Auwork, "key", work_key, iexact=True)
             if auwork is None:
                 # Need more information
                 opus = oAustat.get('opus')
@@ -6772,6 +6862,7 @@ class Austat(models.Model, Custom):
                 # There is no Auwork yet, so this will have to be made first, on the basis of fields:
                 #   work_key, opus, work, date, genre
                 auwork = Auwork.objects.create(key=work_key, opus=opus, work=work, date=date)
+                if not lookup is None: lookup.add(Auwork, "key", auwork)
 
             else:
                 # There alsready is an auwork, but does it need any changes?
@@ -6793,9 +6884,9 @@ class Austat(models.Model, Custom):
                     auwork.save()
 
             # Possibly add signatures: to Auwork
-            auwork.add_signatures(oAustat.get('signatures'))
+            auwork.add_signatures(oAustat.get('signatures'), lookup)
             # Possibly add genres: to Auwork
-            auwork.add_genres(oAustat.get("genres"))
+            auwork.add_genres(oAustat.get("genres"), lookup)
 
 
             # The Austat must be created on the basis of:
@@ -6828,12 +6919,12 @@ class Austat(models.Model, Custom):
                             if fkfield != None and model != None:
                                 # Find an item with the name for the particular model
                                 cls = apps.app_configs['seeker'].get_model(model)
-                                instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                                instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                                 if instance != None:
                                     setattr(obj, path, instance)
                         elif type == "func":
                             # Set the KV in a special way
-                            obj.custom_set(path, value)
+                            obj.custom_set(path, value, **kwargs)
 
                 # Be sure to save the object
                 obj.save()
@@ -6915,12 +7006,17 @@ class Austat(models.Model, Custom):
                 self.do_ranges()
             elif path == "genres":
                 genres = value_lst
+                lookup = kwargs.get("lookup")
                 for sGenre in genres:
                     # Find the genre by string
-                    genre = Genre.objects.filter(name__iexact=sGenre).first()
+                    if lookup is None:
+                        genre = Genre.objects.filter(name__iexact=sGenre).first()
+                    else:
+                        genre = lookup.get(Genre, "name", sGenre, iexact=True)
                     # If the genre is not existing yet: create it
                     if genre is None:
                         genre = Genre.objects.create(name=sGenre)
+                        if not lookup is None: lookup.add(Genre, "name", genre)
                     # Double check to see if there is no link between [self] and [genre] yet
                     obj = AustatGenre.objects.filter(austat=self, genre=genre).first()
                     if obj is None:
@@ -6928,12 +7024,17 @@ class Austat(models.Model, Custom):
                         obj = AustatGenre.objects.create(austat=self, genre=genre)
             elif path == "keywords":
                 keywords = value_lst
+                lookup = kwargs.get("lookup")
                 for kw in keywords:
                     # Find the keyword
-                    keyword = Keyword.objects.filter(name__iexact=kw).first()
+                    if lookup is None:
+                        keyword = Keyword.objects.filter(name__iexact=kw).first()
+                    else:
+                        keyword = lookup.get(Keyword, "name", kw, iexact=True)
                     if keyword is None:
                         # Create it
                         keyword = Keyword.objects.create(name=kw)
+                        if not lookup is None: lookup.add(Keyword, "name", keyword)
                     # Double check to see if there is no link between [self] and [genre] yet
                     obj = AustatKeyword.objects.filter(equal=self, keyword=keyword).first()
                     if obj is None:
@@ -7105,7 +7206,11 @@ class Austat(models.Model, Custom):
 
     def get_hclist_markdown(self):
         html = []
-        for hc in self.collections.filter(settype="hc", scope='publ').order_by('name').distinct():
+        # The list may have been prefetched (see AustatListView)
+        hc_list = getattr(self, "hc_publ", None)
+        if hc_list is None:
+            hc_list = self.collections.filter(settype="hc", scope='publ').order_by('name').distinct()
+        for hc in hc_list:
             url = reverse('collhist_details', kwargs={'pk': hc.id})
             html.append("<span class='collection clickable'><a href='{}'>{}</a></span>".format(url,hc.name))
         sBack = ", ".join(html)
@@ -7530,10 +7635,10 @@ class Austat(models.Model, Custom):
 
     def set_ascount(self):
         # Calculate and set the austat count
-        ascount = self.ascount
+        ascount = self.ssgcount
         iSize = self.relations.count()
         if iSize != ascount:
-            self.ascount = iSize
+            self.ssgcount = iSize
             self.save()
         return True
 
@@ -7603,6 +7708,8 @@ class AustatLink(models.Model):
             # Adapt the ssgcount
             self.src.set_ascount()
             self.dst.set_ascount()
+            # The in-memory link graph is outdated
+            AustatLink.invalidate_graph()
         # Return the actual save() method response
         return response
 
@@ -7611,8 +7718,17 @@ class AustatLink(models.Model):
         response = super(AustatLink, self).delete(using, keep_parents)
         for obj in eqg_list:
             obj.set_ascount()
+        # The in-memory link graph is outdated
+        AustatLink.invalidate_graph()
         return response
 
+    def invalidate_graph():
+        """Throw away the in-memory graph of the links of this process"""
+
+        # Import here, to prevent circular imports
+        from lila.seeker.linkgraph import AustatLinkGraph
+        AustatLinkGraph.invalidate()
+
     def get_label(self, do_incexpl=False):
         sBack = "{}: {}".format(self.get_linktype_display(), self.dst.get_label(do_incexpl))
         return sBack
@@ -7700,6 +7816,174 @@ class AustatCorpusItem(models.Model):
     # [1] Link to the corpus itself
     corpus = models.ForeignKey(AustatCorpus, related_name="corpusitems", on_delete=models.CASCADE)
 
+
+
+class AustatWords(models.Model):
+    """Shared cache of the word frequencies in the ftext and ftrans of one Austat
+
+    The cache is addressed by the content: [texthash] tells which texts the words were counted for.
+    """
+
+    # [1] The Austat
+    austat = models.OneToOneField(Austat, related_name="austatwords", on_delete=models.CASCADE)
+    # [1] Hash of the srchftext and srchftrans the words are based on
+    texthash = models.CharField("Text hash", max_length=LONG_STRING, default="")
+    # [1] Words in this Austat's ftext and ftrans with their frequency - stringified JSON
+    words = models.TextField("Words", default = "{}")
+
+    def __str__(self):
+        return "{}: {}".format(self.austat_id, self.texthash)
+
+    def get_texthash(srchftext, srchftrans):
+        """Get the content address of the two texts"""
+
+        sCombi = "{}|{}".format("" if srchftext is None else srchftext, "" if srchftrans is None else srchftrans)
+        return hashlib.md5(sCombi.encode("utf-8")).hexdigest()
+
+    def count_words(srchftext, srchftrans):
+        """Count the words in the two texts"""
+
+        oWords = {}
+        for sText in [srchftext, srchftrans]:
+            if not sText is None:
+                for item in sText.replace(",", "").replace("…", "").split(" "):
+                    if item != "":
+                        oWords[item] = oWords.get(item, 0) + 1
+        return oWords
+
+    def update_austat(austat):
+        """Make sure the cached words of [austat] reflect its current texts"""
+
+        oErr = ErrHandle()
+        try:
+            texthash = AustatWords.get_texthash(austat.srchftext, austat.srchftrans)
+            obj = AustatWords.objects.filter(austat=austat).first()
+            if obj is None or obj.texthash != texthash:
+                words = json.dumps(AustatWords.count_words(austat.srchftext, austat.srchftrans))
+                if obj is None:
+                    AustatWords.objects.create(austat=austat, texthash=texthash, words=words)
+                else:
+                    obj.texthash = texthash
+                    obj.words = words
+                    obj.save()
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("AustatWords/update_austat")
+        return None
+
+    def get_corpus(lst_austat_id):
+        """Get the corpus items (code, author, scount, words) of the Austats in the list
+
+        Words that are missing or out of date are (re)counted and stored
+        """
+
+        oErr = ErrHandle()
+        lst_item = []
+        try:
+            lst_new = []
+            lst_upd = []
+            qs = Austat.objects.filter(id__in=lst_austat_id).order_by('id').values(
+                'id', 'code', 'author__name', 'scount', 'srchftext', 'srchftrans',
+                'austatwords__id', 'austatwords__texthash', 'austatwords__words')
+            for item in qs:
+                texthash = AustatWords.get_texthash(item['srchftext'], item['srchftrans'])
+                if item['austatwords__texthash'] == texthash:
+                    words = json.loads(item['austatwords__words'])
+                else:
+                    words = AustatWords.count_words(item['srchftext'], item['srchftrans'])
+                    obj = AustatWords(austat_id=item['id'], texthash=texthash, words=json.dumps(words))
+                    if item['austatwords__id'] is None:
+                        lst_new.append(obj)
+                    else:
+                        obj.id = item['austatwords__id']
+                        lst_upd.append(obj)
+                authorname = "empty" if item['author__name'] is None else item['author__name']
+                lst_item.append(dict(equal__id=item['id'], equal__code=item['code'], authorname=authorname,
+                                     scount=item['scount'], words=words))
+
+            # Store the words that were counted just now
+            with transaction.atomic():
+                if len(lst_new) > 0:
+                    AustatWords.objects.bulk_create(lst_new, batch_size=250, ignore_conflicts=True)
+                if len(lst_upd) > 0:
+                    AustatWords.objects.bulk_update(lst_upd, ['texthash', 'words'], batch_size=250)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("AustatWords/get_corpus")
+        return lst_item
+
+
+class ManuscriptAustats(models.Model):
+    """Shared cache of the set of Austats to which the canwits of one manuscript are linked"""
+
+    # [1] The manuscript
+    manuscript = models.OneToOneField(Manuscript, related_name="manuscriptaustats", on_delete=models.CASCADE)
+    # [1] Sorted list of Austat ids - stringified JSON
+    austats = models.TextField("Austats", default = "[]")
+
+    def __str__(self):
+        return "{}: {}".format(self.manuscript_id, self.austats)
+
+    def update_manu(manu_id, create=True):
+        """Re-calculate the set of Austats for one manuscript
+
+        With [create] False only an existing row is updated: a missing row is
+        calculated by get_sets() when it is needed
+        """
+
+        oErr = ErrHandle()
+        try:
+            if not manu_id is None:
+                lst_austat = sorted(set(CanwitAustat.objects.filter(manu_id=manu_id).values_list('austat_id', flat=True)))
+                austats = json.dumps(lst_austat)
+                if not create:
+                    ManuscriptAustats.objects.filter(manuscript_id=manu_id).update(austats=austats)
+                    return None
+                obj = ManuscriptAustats.objects.filter(manuscript_id=manu_id).first()
+                if obj is None:
+                    ManuscriptAustats.objects.create(manuscript_id=manu_id, austats=austats)
+                elif obj.austats != austats:
+                    obj.austats = austats
+                    obj.save()
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("ManuscriptAustats/update_manu")
+        return None
+
+    def get_sets(lst_manu_id):
+        """Get a dictionary with the list of Austat ids per manuscript
+
+        Manuscripts that have not been cached yet are calculated (in one query) and stored
+        """
+
+        oErr = ErrHandle()
+        manu_set = {}
+        try:
+            for obj in ManuscriptAustats.objects.filter(manuscript_id__in=lst_manu_id):
+                manu_set[obj.manuscript_id] = json.loads(obj.austats)
+            lst_missing = [x for x in lst_manu_id if not x in manu_set]
+            if len(lst_missing) > 0:
+                oMissing = {x: set() for x in lst_missing}
+                qs = CanwitAustat.objects.filter(manu_id__in=lst_missing).values_list('manu_id', 'austat_id')
+                for manu_id, austat_id in qs:
+                    oMissing[manu_id].add(austat_id)
+                lst_new = []
+                for manu_id, austat_set in oMissing.items():
+                    manu_set[manu_id] = sorted(austat_set)
+                    lst_new.append(ManuscriptAustats(manuscript_id=manu_id, austats=json.dumps(manu_set[manu_id])))
+                ManuscriptAustats.objects.bulk_create(lst_new, batch_size=250, ignore_conflicts=True)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("ManuscriptAustats/get_sets")
+        return manu_set
+
+    def link_deleted(sender, instance, **kwargs):
+        """Signal receiver: a CanwitAustat link has been deleted (also when that happens through a cascade)"""
+
+        # Never create a row here: in the cascade of deleting a manuscript, its ManuscriptAustats
+        #   row may already be gone, and a new one would break the foreign key at commit
+        ManuscriptAustats.update_manu(instance.manu_id, create=False)
+
     
 class ManuscriptExt(models.Model):
     """External URL (link) that belongs to a particular manuscript"""
@@ -7991,6 +8275,9 @@ class Collection(models.Model, Custom):
             # THis is not the correct starting point
             return None
 
+        # Import here, to prevent circular imports
+        from lila.seeker.clone import ManuscriptCloner
+
         # Now we know that we're okay...
         profile = Profile.get_user_profile(username)
         source = SourceInfo.objects.create(
@@ -8005,36 +8292,9 @@ class Collection(models.Model, Custom):
         projects = profile.get_defaults()
         manu.set_projects(projects)
 
-        # Figure out  what the automatically created codico is
-        codico = Codico.objects.filter(manuscript=manu).first()
-        
-        # Create all the sermons based on the SSGs
-        msitems = []
-        with transaction.atomic():
-            order = 1
-            for ssg in self.collections_austat.all():
-                # Create a MsItem
-                msitem = MsItem.objects.create(manu=manu, codico=codico, order=order)
-                order += 1
-                # Add it to the list
-                msitems.append(msitem)
-                # Create a S based on this SSG
-                canwit = Canwit.objects.create(
-                    msitem=msitem, author=ssg.author, 
-                    ftext=ssg.ftext, srchftext=ssg.srchftext,
-                    ftrans=ssg.ftrans, srchftrans=ssg.srchftrans,
-                    stype="imp", mtype=mtype)
-                # Create a link from the S to this SSG
-                ssg_link = CanwitAustat.objects.create(canwit=canwit, austat=ssg, manu=manu, linktype=LINK_UNSPECIFIED)
-
-        # Now walk and repair the links
-        with transaction.atomic():
-            size = len(msitems)
-            for idx, msitem in enumerate(msitems):
-                # Check if this is not the last one
-                if idx < size-1:
-                    msitem.next = msitems[idx+1]
-                    msitem.save()
+        # Create all the sermons based on the SSGs, each linked to its SSG
+        oCloner = ManuscriptCloner(manu)
+        oCloner.load_austats(list(self.collections_austat.all()), mtype=mtype)
 
         # Okay, do we need to just make a manuscript, or a template?
         if mtype == "tem":
@@ -8650,15 +8910,15 @@ class Colwit(models.Model, Custom):
                             if fkfield != None and model != None:
                                 # Find an item with the name for the particular model
                                 cls = apps.app_configs['seeker'].get_model(model)
-                                instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                                instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                                 if instance != None:
                                     setattr(obj, path, instance)
                         elif type == "func":
                             # Set the KV in a special way
                             obj.custom_set(path, value, **kwargs)
 
-                    # Be sure to save the object
-                    obj.save()
+                # Be sure to save the object
+                obj.save()
 
         except:
             msg = oErr.get_error_message()
@@ -9074,6 +9334,9 @@ class Canwit(models.Model, Custom):
     # [0-1] Method
     method = models.CharField("Method", max_length=LONG_STRING, default="(OLD)")
 
+    # Fields that are kept in the trigram search index
+    trigram_fields = ['srchftext', 'srchftrans']
+
     # SPecification for download/upload
     specification = [
         {'name': 'Order',               'type': '',      'path': 'order'},
@@ -9213,12 +9476,9 @@ class Canwit(models.Model, Custom):
                     obj = Canwit.objects.filter(msitem__codico=codico, lilacode=lilacode, mtype="man").first()
             if obj == None:
                 # Remove any MsItems that are connected with this manuscript but not with Canwit or Canhead
-                delete_id = []
-                for msitem in MsItem.objects.filter(codico__manuscript=manuscript):
-                    if msitem.itemsermons.count() == 0 and msitem.itemheads.count() ==0:
-                        delete_id.append(msitem.id)
-                if len(delete_id) > 0:
-                    MsItem.objects.filter(id__in=delete_id).delete()
+                #   (a bulk import does this only once, and then passes clean_msitems=False)
+                if kwargs.get("clean_msitems", True):
+                    MsItem.objects.filter(codico__manuscript=manuscript, itemsermons__isnull=True, itemheads__isnull=True).delete()
 
 
                 # Create a MsItem, tying it with the manuscript as well as with the codico
@@ -9273,7 +9533,7 @@ class Canwit(models.Model, Custom):
                             if fkfield != None and model != None:
                                 # Find an item with the name for the particular model
                                 cls = apps.app_configs['seeker'].get_model(model)
-                                instance = cls.objects.filter(**{"{}".format(fkfield): value}).first()
+                                instance = get_fk_instance(cls, fkfield, value, kwargs.get("lookup"))
                                 if instance != None:
                                     setattr(obj, path, instance)
                         elif type == "func":
@@ -9508,46 +9768,14 @@ class Canwit(models.Model, Custom):
     def do_distance(self, bForceUpdate = False):
         """Calculate the distance from myself (sermon) to all currently available Austat SSGs"""
 
-        def get_dist(inc_s, exp_s, inc_eqg, exp_eqg):
-            # Get the inc and exp for the SSG
-            #inc_eqg = super.srchftext
-            #exp_eqg = super.srchftrans
-            # Calculate distances
-            similarity = similar(inc_s, inc_eqg) + similar(exp_s, exp_eqg)
-            if similarity == 0.0:
-                dist = 100000
-            else:
-                dist = 2 / similarity
-            return dist
+        # The engine is imported here, since it depends on these models
+        from lila.seeker.distance import AustatDistance
 
         oErr = ErrHandle()
         try:
-            # Get my own ftext and ftrans
-            inc_s = "" if self.srchftext == None else self.srchftext
-            exp_s = "" if self.srchftrans == None else self.srchftrans
-
             # Make sure we only start doing something if it is really needed
-            count = self.distances.count()
-            if inc_s != "" or exp_s != "" or count > 0:
-                # Get a list of the current Austat elements in terms of id, srchinc/srchexpl
-                eqg_list = Austat.objects.all().values('id', 'srchftext', 'srchftrans')
-
-                # Walk all Austat objects
-                with transaction.atomic():
-                    # for super in Austat.objects.all():
-                    for item in eqg_list:
-                        # Get an object
-                        austat_id = item['id']
-                        obj = AustatDist.objects.filter(sermon=self, super=austat_id).first()
-                        if obj == None:
-                            # Get the distance
-                            dist = get_dist(inc_s, exp_s, item['srchftext'], item['srchftrans'])
-                            # Create object and Set this distance
-                            obj = AustatDist.objects.create(sermon=self, austat_id=austat_id, distance=dist)
-                        elif bForceUpdate:
-                            # Calculate and change the distance
-                            obj.distance = get_dist(inc_s, exp_s, item['srchftext'], item['srchftrans'])
-                            obj.save()
+            if self.srchftext or self.srchftrans or self.canwitsuperdist.exists():
+                AustatDistance().update([self], bForceUpdate)
         except:
             msg = oErr.get_error_message()
             oErr.DoError("do_distance")
@@ -9579,6 +9807,7 @@ class Canwit(models.Model, Custom):
                         self.verses = verses
                         self.save()
                     # Check and add (if needed) the corresponding BibRange object
+                    oVerses = {}
                     for oScrref in lst_verses:
                         intro = oScrref.get("intro", None)
                         added = oScrref.get("added", None)
@@ -9586,27 +9815,28 @@ class Canwit(models.Model, Custom):
                         book, chvslist = oRef.get_chvslist(oScrref)
 
                         # Possibly create an appropriate Bibrange object (or emend it)
-                        # Note: this will also add BibVerse objects
                         obj = BibRange.get_range(self, book, chvslist, intro, added)
                         
                         if obj == None:
                             # Show that something went wrong
                             print("do_ranges0 unparsable: {}".format(self.bibleref), file=sys.stderr)
                         else:
-                            # Add BibVerse objects if needed
                             verses_new = oScrref.get("scr_refs", [])
-                            verses_old = [x.bkchvs for x in obj.bibrangeverses.all()]
-                            # Remove outdated verses
-                            deletable = []
-                            for item in verses_old:
-                                if item not in verses_new: deletable.append(item)
-                            if len(deletable) > 0:
-                                obj.bibrangeverses.filter(bkchvs__in=deletable).delete()
-                            # Add new verses
-                            with transaction.atomic():
-                                for item in verses_new:
-                                    if not item in verses_old:
-                                        verse = BibVerse.objects.create(bibrange=obj, bkchvs=item)
+                            oVerses[obj.id] = verses_new
+                            if BIBVERSE_ROWS:
+                                # Add BibVerse objects if needed
+                                verses_old = [x.bkchvs for x in obj.bibrangeverses.all()]
+                                # Remove outdated verses
+                                deletable = []
+                                for item in verses_old:
+                                    if item not in verses_new: deletable.append(item)
+                                if len(deletable) > 0:
+                                    obj.bibrangeverses.filter(bkchvs__in=deletable).delete()
+                                # Add new verses
+                                BibVerse.objects.bulk_create(
+                                    [BibVerse(bibrange=obj, bkchvs=x) for x in verses_new if not x in verses_old], batch_size=500)
+                    # The intervals that are used for searching
+                    BibInterval.set_ranges(oVerses)
                     print("do_ranges1: {} verses={}".format(self.bibleref, self.verses), file=sys.stderr)
                 else:
                     print("do_ranges2 unparsable: {}".format(self.bibleref), file=sys.stderr)
@@ -9775,19 +10005,28 @@ class Canwit(models.Model, Custom):
     def get_collection_list(self, settype):
         lBack = []
         lstQ = []
-        # Get all the Austats to which I link
-        lstQ.append(Q(austat_col__austat__in=self.austats.all()))
-        lstQ.append(Q(settype=settype))
-        # Make sure we restrict ourselves to the *public* datasets
-        lstQ.append(Q(scope="publ"))
-        # Get the collections in which these SSGs are
-        collections = Collection.objects.filter(*lstQ).order_by('name')
-        # Visit all datasets/collections linked to me via the SSGs
-        for col in collections:
-            # The collection must match the settype
-            if col.settype == settype:
-                # Then it is added to the list
-                lBack.append(col)
+        # The public HCs of my Austats may have been prefetched (see CanwitListView)
+        austat_hcs = getattr(self, "austat_hcs", None)
+        if settype == "hc" and not austat_hcs is None:
+            oColl = {}
+            for austat in austat_hcs:
+                for col in austat.hc_publ:
+                    oColl[col.id] = col
+            lBack = sorted(oColl.values(), key=lambda x: x.name)
+        else:
+            # Get all the Austats to which I link
+            lstQ.append(Q(austat_col__austat__in=self.austats.all()))
+            lstQ.append(Q(settype=settype))
+            # Make sure we restrict ourselves to the *public* datasets
+            lstQ.append(Q(scope="publ"))
+            # Get the collections in which these SSGs are
+            collections = Collection.objects.filter(*lstQ).order_by('name')
+            # Visit all datasets/collections linked to me via the SSGs
+            for col in collections:
+                # The collection must match the settype
+                if col.settype == settype:
+                    # Then it is added to the list
+                    lBack.append(col)
 
         return lBack
     
@@ -10053,27 +10292,33 @@ class Canwit(models.Model, Custom):
 
     def get_hcs_plain(self, username = None, team_group=None):
         """Get all the historical collections associated with this sermon"""
-        lHtml = []
-        # Get all the SSG's linked to this manifestation
-        qs_ssg = self.austats.all().values('id')
-        # qs_hc = self.collections.all()
-        lstQ = []
-        lstQ.append(Q(settype="hc"))
-        lstQ.append(Q(collections_austat__id__in=qs_ssg))
-        
+
+        return Canwit.get_hcs_plain_dict([self.id], username, team_group).get(self.id, "")
+
+    def get_hcs_plain_dict(lst_canwit_id, username = None, team_group=None):
+        """Get the historical collections associated with each of the canwits in [lst_canwit_id]
+
+        Returns a dictionary with the (HTML) list of collections per canwit id
+        """
+
+        oHtml = {}
         if username == None or team_group == None:
-            qs_hc = Collection.objects.filter(*lstQ )
+            qs_hc = Collection.objects.filter(settype="hc")
         else:
-            qs_hc = Collection.get_scoped_queryset("austat", username, team_group, settype="hc").filter(collections_austat__id__in=qs_ssg)
+            qs_hc = Collection.get_scoped_queryset("austat", username, team_group, settype="hc")
         # TODO: filter on (a) public only or (b) private but from the current user
-        for col in qs_hc:
-            # Determine where clicking should lead to
-            url = reverse('collhist_details', kwargs={'pk': col.id})
-            # Create a display for this topic
-            lHtml.append('<span class="badge signature ot"><a href="{}" >{}</a></span>'.format(url,col.name))
-
-        sBack = ", ".join(lHtml)
-        return sBack
+        for idx in range(0, len(lst_canwit_id), 500):
+            # One row per combination of canwit, SSG and collection
+            qs = qs_hc.filter(collections_austat__austat_canwits__id__in=lst_canwit_id[idx:idx+500]).order_by('id').values_list(
+                'collections_austat__austat_canwits__id', 'collections_austat__id', 'id', 'name').distinct()
+            for canwit_id, ssg_id, col_id, name in qs:
+                # Determine where clicking should lead to
+                url = reverse('collhist_details', kwargs={'pk': col_id})
+                # Create a display for this topic
+                oHtml.setdefault(canwit_id, []).append('<span class="badge signature ot"><a href="{}" >{}</a></span>'.format(url, name))
+        for canwit_id, lHtml in oHtml.items():
+            oHtml[canwit_id] = ", ".join(lHtml)
+        return oHtml
 
     def get_incexp_match(self, sMatch=""):
         html = []
@@ -10465,6 +10710,9 @@ class Canwit(models.Model, Custom):
                 self.siglist = siglist_new
                 # Only now do the actual saving...
                 response = super(Canwit, self).save(force_insert, force_update, using, update_fields)
+
+        # Keep the search index up to date
+        SearchTrigram.update_object(self)
         return response
 
     def set_projects(self, projects):
@@ -10993,6 +11241,104 @@ class BibRange(models.Model):
             obj = None
         return obj
 
+    def update_canwits(lst_canwit):
+        """Parse the bibleref of each Canwit in [lst_canwit] and bring its verses and ranges up to date in bulk
+
+        Each Canwit only needs [id], [bibleref] and [verses]. Ranges that no longer follow
+        from the bibleref are removed. Returns the number of Canwits whose verses have changed
+        """
+
+        # (1) Parse all references
+        oRanges = {}
+        lst_canwit_changed = []
+        for canwit in lst_canwit:
+            oRef = Reference(canwit.bibleref)
+            bResult, msg, lst_verses = oRef.parse()
+            if not bResult:
+                # Unparsable: leave this one as it is
+                continue
+            verses = "[]" if lst_verses == None else json.dumps(lst_verses)
+            if canwit.verses != verses:
+                canwit.verses = verses
+                lst_canwit_changed.append(canwit)
+            lst_range = []
+            for oScrref in lst_verses or []:
+                book, chvslist = oRef.get_chvslist(oScrref)
+                if not book is None:
+                    lst_range.append((book.id, chvslist, oScrref.get("intro", None), oScrref.get("added", None), oScrref.get("scr_refs", [])))
+            oRanges[canwit.id] = lst_range
+
+        # (2) The ranges that exist already (one query)
+        oExisting = {}
+        lst_stale = []
+        for obj in BibRange.objects.filter(canwit_id__in=list(oRanges.keys())).order_by('id'):
+            key = (obj.canwit_id, obj.book_id, obj.chvslist)
+            if key in oExisting:
+                lst_stale.append(obj.id)
+            else:
+                oExisting[key] = obj
+
+        # (3) Compare them with the ranges that should be there
+        lst_add = []
+        lst_change = []
+        lst_pair = []
+        used = set()
+        for canwit_id, lst_range in oRanges.items():
+            for book_id, chvslist, intro, added, scr_refs in lst_range:
+                key = (canwit_id, book_id, chvslist)
+                obj = oExisting.get(key)
+                if obj is None:
+                    obj = BibRange(canwit_id=canwit_id, book_id=book_id, chvslist=chvslist, intro=intro, added=added)
+                    oExisting[key] = obj
+                    lst_add.append(obj)
+                elif not key in used and (obj.intro != intro or obj.added != added):
+                    obj.intro = intro
+                    obj.added = added
+                    lst_change.append(obj)
+                used.add(key)
+                lst_pair.append((obj, scr_refs))
+        lst_stale.extend([obj.id for key, obj in oExisting.items() if not key in used])
+
+        # (4) Write everything, without going through save()
+        with transaction.atomic():
+            Canwit.objects.bulk_update(lst_canwit_changed, ['verses'], batch_size=250)
+            bulk_create_ids(BibRange, lst_add)
+            BibRange.objects.bulk_update(lst_change, ['intro', 'added'], batch_size=250)
+            if len(lst_stale) > 0:
+                BibRange.objects.filter(id__in=lst_stale).delete()
+            oVerses = {}
+            for obj, scr_refs in lst_pair:
+                oVerses.setdefault(obj.id, []).extend(scr_refs)
+            BibInterval.set_ranges(oVerses)
+        for cls in [Canwit, BibRange]:
+            UserSearch.bump_model_version(cls)
+        return len(lst_canwit_changed)
+
+    def reparse(chunk=500):
+        """Re-parse the bibleref of all Canwits, [chunk] Canwits at a time
+
+        Returns the number of Canwits whose verses have changed
+        """
+
+        oErr = ErrHandle()
+        iChanged = 0
+        try:
+            # (1) Canwits without a bibleref have no ranges
+            BibRange.objects.filter(Q(canwit__bibleref__isnull=True) | Q(canwit__bibleref="")).delete()
+
+            # (2) All others, in chunks (the ids are read first, since the Canwits are changed on the way)
+            qs = Canwit.objects.exclude(bibleref__isnull=True).exclude(bibleref="")
+            lst_id = list(qs.order_by('id').values_list('id', flat=True))
+            for idx in range(0, len(lst_id), chunk):
+                qs_chunk = Canwit.objects.filter(id__in=lst_id[idx:idx+chunk]).order_by('id')
+                lst_canwit = [Canwit(id=x, bibleref=y, verses=z) for x, y, z in qs_chunk.values_list('id', 'bibleref', 'verses')]
+                iChanged += BibRange.update_canwits(lst_canwit)
+                oErr.Status("BibRange/reparse: {}/{} canwits".format(min(idx + chunk, len(lst_id)), len(lst_id)))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("BibRange/reparse")
+        return iChanged
+
 
 class BibVerse(models.Model):
     """One verse that belongs to [BibRange]"""
@@ -11006,6 +11352,116 @@ class BibVerse(models.Model):
         return self.bkchvs
 
 
+class BibInterval(models.Model):
+    """One uninterrupted stretch of verses of a [BibRange]
+
+    Start and end are Bk/Ch/Vs codes as integers (BBBCCCVVV). An interval does not cross
+    the end of a chapter, so the intervals that overlap a search range are found with
+    a bounded range on the index of [start].
+    """
+
+    # [1] The first verse
+    start = models.IntegerField("Start", db_index=True)
+    # [1] The last verse
+    einde = models.IntegerField("End")
+    # [1] Each interval is part of a BibRange
+    bibrange = models.ForeignKey(BibRange, on_delete=models.CASCADE, related_name="bibrangeintervals")
+
+    def __str__(self):
+        return "{:09d}-{:09d}".format(self.start, self.einde)
+
+    def get_intervals(lst_bkchvs):
+        """Merge a list of Bk/Ch/Vs codes into a list of (start, einde) intervals"""
+
+        lst_back = []
+        for code in sorted(set([int(x) for x in lst_bkchvs])):
+            if len(lst_back) > 0 and code == lst_back[-1][1] + 1 and code // 1000 == lst_back[-1][1] // 1000:
+                # The next verse in the same chapter
+                lst_back[-1][1] = code
+            else:
+                lst_back.append([code, code])
+        return [tuple(x) for x in lst_back]
+
+    def is_built():
+        """Check whether all BibRanges have their intervals (see 'manage.py bibintervals')
+
+        A database without BibVerse rows never had anything but intervals
+        """
+
+        return Information.get_kvalue("bibintervals_built") == BIBINTERVAL_BUILT or not BibVerse.objects.exists()
+
+    def get_filter(start, einde, prefix=""):
+        """Get the condition for a BibRange (reached via [prefix]) that overlaps the verses [start] until [einde]"""
+
+        start = int(start)
+        einde = int(einde)
+        field = "{}bibrangeintervals__".format(prefix)
+        # All three in one Q, so that they apply to the same interval
+        qBib = Q(**{"{}start__gte".format(field): start - BIBINTERVAL_SPAN,
+                    "{}start__lte".format(field): einde,
+                    "{}einde__gte".format(field): start})
+        if not BibInterval.is_built():
+            # Older BibRanges only have their verse rows until the intervals have been built
+            field = "{}bibrangeverses__bkchvs".format(prefix)
+            qBib |= Q(**{"{}__gte".format(field): "{:09d}".format(start),
+                         "{}__lte".format(field): "{:09d}".format(einde)})
+        return qBib
+
+    def set_ranges(oVerses):
+        """Replace the intervals of each BibRange id in [oVerses] by those of its list of verses"""
+
+        lst_id = list(oVerses.keys())
+        lst_add = []
+        for bibrange_id, lst_bkchvs in oVerses.items():
+            for start, einde in BibInterval.get_intervals(lst_bkchvs):
+                lst_add.append(BibInterval(bibrange_id=bibrange_id, start=start, einde=einde))
+        with transaction.atomic():
+            for idx in range(0, len(lst_id), 500):
+                BibInterval.objects.filter(bibrange_id__in=lst_id[idx:idx+500]).delete()
+            BibInterval.objects.bulk_create(lst_add, batch_size=500)
+        UserSearch.bump_model_version(BibInterval)
+        return len(lst_add)
+
+    def rebuild(lst_id=None):
+        """(Re-)build the intervals of all BibRanges (or of those in [lst_id]) in bulk
+
+        The verses are taken from the BibVerse rows, if a range has them, and otherwise
+        from parsing the book and chvslist of the range
+        """
+
+        oErr = ErrHandle()
+        iCount = 0
+        try:
+            qs_range = BibRange.objects.all()
+            qs_verse = BibVerse.objects.all()
+            if not lst_id is None:
+                qs_range = qs_range.filter(id__in=lst_id)
+                qs_verse = qs_verse.filter(bibrange_id__in=lst_id)
+
+            # (1) The ranges that have verse rows
+            oVerses = {}
+            for bibrange_id, bkchvs in qs_verse.order_by('bibrange_id').values_list('bibrange_id', 'bkchvs').iterator():
+                oVerses.setdefault(bibrange_id, []).append(bkchvs)
+
+            # (2) The other ranges are parsed
+            for bibrange_id, abbr, chvslist in qs_range.values_list('id', 'book__abbr', 'chvslist').iterator():
+                if not bibrange_id in oVerses:
+                    lst_bkchvs = []
+                    bResult, msg, lst_verses = Reference("{} {}".format(abbr, chvslist or "").strip()).parse()
+                    if bResult and not lst_verses is None:
+                        for oScrref in lst_verses:
+                            lst_bkchvs.extend(oScrref.get("scr_refs", []))
+                    oVerses[bibrange_id] = lst_bkchvs
+            iCount = BibInterval.set_ranges(oVerses)
+            if lst_id is None:
+                # From now on searching only needs the intervals
+                Information.set_kvalue("bibintervals_built", BIBINTERVAL_BUILT)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("BibInterval/rebuild")
+        return iCount
+
+
 # =========================== KEYWORD RELATED ===================================
 
 
@@ -11201,6 +11657,30 @@ class CanwitAustat(models.Model):
             austat.save()
         return None
 
+    def update_scounts(lst_austat_id):
+        """Re-calculate the scount of the Austats in [lst_austat_id], e.g. after a bulk_create of links"""
+
+        oErr = ErrHandle()
+        try:
+            lst_austat_id = list(set(lst_austat_id))
+            lst_update = []
+            for start in range(0, len(lst_austat_id), 500):
+                lst_chunk = lst_austat_id[start:start+500]
+                qs = CanwitAustat.objects.filter(austat_id__in=lst_chunk).values('austat_id').annotate(scount=Count('id'))
+                oCount = {x['austat_id']: x['scount'] for x in qs}
+                for austat in Austat.objects.filter(id__in=lst_chunk).only('id', 'scount'):
+                    scount = oCount.get(austat.id, 0)
+                    if scount != austat.scount:
+                        austat.scount = scount
+                        lst_update.append(austat)
+            if len(lst_update) > 0:
+                Austat.objects.bulk_update(lst_update, ['scount'], batch_size=250)
+                UserSearch.bump_model_version(Austat)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("CanwitAustat/update_scounts")
+        return None
+
     def delete(self, using = None, keep_parents = False):
         response = None
         oErr = ErrHandle()
@@ -11220,12 +11700,17 @@ class CanwitAustat(models.Model):
     def save(self, force_insert = False, force_update = False, using = None, update_fields = None):
         # Automatically provide the value for the manuscript through the canwit
         manu = self.canwit.msitem.manu
+        manu_old_id = self.manu_id
         if self.manu != manu:
             self.manu = manu
         # First do the saving
         response = super(CanwitAustat, self).save(force_insert, force_update, using, update_fields)
         # Perform the scount
         self.do_scount(self.austat)
+        # Keep the cached set of austats per manuscript up to date
+        ManuscriptAustats.update_manu(self.manu_id)
+        if not manu_old_id is None and manu_old_id != self.manu_id:
+            ManuscriptAustats.update_manu(manu_old_id)
         # Return the proper response
         return response
 
@@ -11295,6 +11780,10 @@ class CanwitAustat(models.Model):
         return uniques
 
 
+# Deleted links (also through a cascade) change the cached set of austats of their manuscript
+post_delete.connect(ManuscriptAustats.link_deleted, sender=CanwitAustat, dispatch_uid="manuscriptaustats_link_deleted")
+
+
 class CanwitSignature(models.Model):
     """One CPL, Clavis or other code as taken up in an edition"""
 
@@ -11720,6 +12209,9 @@ class Caned(models.Model, Custom):
     # [0-1] The order number for this Austat within the collection
     order = models.IntegerField("Order", default = -1)
 
+    # Fields that are kept in the trigram search index
+    trigram_fields = ['srchftext', 'srchftrans']
+
     # Definitions for download/upload
     specification = [
         {'name': 'Authoritative statement', 'type': 'func',  'path': 'austat'   },
@@ -11735,6 +12227,12 @@ class Caned(models.Model, Custom):
         sItem = self.idno
         return sItem
 
+    def save(self, force_insert = False, force_update = False, using = None, update_fields = None):
+        response = super(Caned, self).save(force_insert, force_update, using, update_fields)
+        # Keep the search index up to date
+        SearchTrigram.update_object(self)
+        return response
+
     def custom_get(self, path, **kwargs):
         sBack = ""
         oErr = ErrHandle()
@@ -11924,29 +12422,90 @@ class CollOverlap(models.Model):
     def get_overlap(profile, collection, manuscript):
         """Calculate and set the overlap between collection and manuscript"""
 
-        obj = CollOverlap.objects.filter(profile=profile,collection=collection, manuscript=manuscript).first()
-        if obj == None:
-            obj = CollOverlap.objects.create(profile=profile,collection=collection, manuscript=manuscript)
-        # Get the ids of the SSGs in the collection
-        coll_list = [ collection ]
-        ssg_coll = Austat.objects.filter(collections__in=coll_list).values('id')
-        if len(ssg_coll) == 0:
-            ptc = 0
-        else:
-            # Get the id's of the SSGs in the manuscript: Manu >> MsItem >> Canwit >> SSG
-            ssg_manu = Austat.objects.filter(canwit_austat__canwit__msitem__manu=manuscript).values('id')
-            # Now calculate the overlap
-            count = 0
-            for item in ssg_coll:
-                if item in ssg_manu: count += 1
-            ptc = 100 * count // len(ssg_coll)
-        # Check if there is a change in percentage
-        if ptc != obj.overlap:
-            # Set the percentage
-            obj.overlap = ptc
-            obj.save()
+        oOverlap = CollOverlap.update_collection(profile, collection, [manuscript.id])
+        ptc = oOverlap.get(manuscript.id, 0)
         return ptc
 
+    def update_collection(profile, collection, manu_ids=None):
+        """Calculate and set the overlap between [collection] and all manuscripts at once
+
+        The overlap is the percentage of the collection's Austats that occur in the manuscript.
+        If [manu_ids] is given, only these manuscripts are considered; otherwise all manuscripts
+        (mtype="man", no templates) that share at least one Austat with the collection (and those
+        that already have a row).
+        Returns a dictionary from manuscript id to overlap percentage
+        """
+
+        oErr = ErrHandle()
+        oOverlap = {}
+        batch_size = 250
+        try:
+            # (1) The Austats in the collection
+            qs_coll = Caned.objects.filter(collection=collection).values('austat_id')
+            coll_size = qs_coll.order_by().distinct().count()
+
+            # (2) Count the distinct collection Austats per manuscript in one aggregated query
+            #     Manu >> MsItem >> Canwit >> CanwitAustat >> Austat
+            if coll_size > 0:
+                qs = CanwitAustat.objects.filter(austat_id__in=qs_coll)
+                if manu_ids is None:
+                    qs = qs.filter(canwit__msitem__manu__mtype="man")
+                else:
+                    qs = qs.filter(canwit__msitem__manu_id__in=manu_ids)
+                qs = qs.values('canwit__msitem__manu_id').annotate(count=Count('austat_id', distinct=True)).order_by()
+                for oItem in qs:
+                    manu_id = oItem['canwit__msitem__manu_id']
+                    if not manu_id is None:
+                        oOverlap[manu_id] = 100 * oItem['count'] // coll_size
+            if not manu_ids is None:
+                for manu_id in manu_ids:
+                    oOverlap.setdefault(manu_id, 0)
+
+            # (3) Upsert the CollOverlap rows of this profile and collection
+            qs = CollOverlap.objects.filter(profile=profile, collection=collection)
+            if manu_ids is None:
+                qs = qs.filter(manuscript__mtype="man")
+            else:
+                qs = qs.filter(manuscript_id__in=manu_ids)
+            lst_upd = []
+            oExisting = {}
+            saved = get_current_datetime()
+            for obj in qs:
+                if obj.manuscript_id in oExisting:
+                    continue
+                oExisting[obj.manuscript_id] = obj
+                ptc = oOverlap.setdefault(obj.manuscript_id, 0)
+                if ptc != obj.overlap:
+                    obj.overlap = ptc
+                    obj.saved = saved
+                    lst_upd.append(obj)
+            lst_new = [CollOverlap(profile=profile, collection=collection, manuscript_id=manu_id, overlap=ptc, saved=saved)
+                       for manu_id, ptc in oOverlap.items() if not manu_id in oExisting]
+            with transaction.atomic():
+                if len(lst_upd) > 0:
+                    CollOverlap.objects.bulk_update(lst_upd, ['overlap', 'saved'], batch_size=batch_size)
+                if len(lst_new) > 0:
+                    CollOverlap.objects.bulk_create(lst_new, batch_size=batch_size)
+            if len(lst_upd) > 0 or len(lst_new) > 0:
+                UserSearch.bump_model_version(CollOverlap)
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("CollOverlap/update_collection")
+        return oOverlap
+
+    def get_ranking(profile, collection, minimum=1, limit=None):
+        """Rank the manuscripts by their overlap with [collection]
+
+        Returns a list of (manuscript id, overlap percentage), best matching first
+        """
+
+        oOverlap = CollOverlap.update_collection(profile, collection)
+        lst_rank = [(manu_id, ptc) for manu_id, ptc in oOverlap.items() if ptc >= minimum]
+        lst_rank.sort(key=lambda x: (-x[1], x[0]))
+        if not limit is None:
+            lst_rank = lst_rank[:limit]
+        return lst_rank
+
     def save(self, force_insert = False, force_update = False, using = None, update_fields = None):
         # Adapt the save date
         self.saved = get_current_datetime()
@@ -12026,3 +12585,17 @@ class Template(models.Model):
             # Combine response
             sBack = "\n".join(html)
         return sBack
+
+
+# The models that cached search results (and the DCT and the link graph) depend on: saving or
+#   deleting one of them bumps its version counter. Housekeeping models (Visit, Status, Job etc.)
+#   are not tracked, so that saving them costs nothing extra.
+UserSearch.track_models([
+    Location, LocationType, LocationName, LocationRelation, Country, City, Library, Origin, SourceInfo, 
+    Litref, Project, Keyword, Comment, Manuscript, Codico, Reconstruction, Daterange, Author, Feast, Free, 
+    Genre, Provenance, Signature, Auwork, AuworkKeyword, AuworkGenre, AuworkSignature, Austat, AustatLink, 
+    AustatKeyword, AustatGenre, AustatProject, Collection, MsItem, Codhead, Colwit, ColwitKeyword, 
+    ColwitSignature, Canwit, CanwitKeyword, CanwitProject, BibRange, BibInterval, ManuscriptKeyword, 
+    CodicoKeyword, UserKeyword, ManuscriptProject, CanwitAustat, CanwitSignature, Basket, BasketMan, 
+    BasketAustat, ProvenanceMan, ProvenanceCod, OriginCodico, LitrefMan, LitrefCol, LitrefAustat, 
+    EdirefWork, CollectionCanwit, CollectionMan, Caned, CollectionProject, CollOverlap, Template])
@@ -1290,6 +1290,11 @@ var ru = (function ($, ru) {
           data: oData,      // This sends the parameters in the data object
           cache: false,
           success: function (json) {
+            if (json.status === "queued") {
+              // The synchronisation runs as a background job: keep on checking the progress
+              $("#sync_progress_" + sSyncType).html("Synchronization has been queued: " + sSyncType);
+              return;
+            }
             $("#sync_details_" + sSyncType).html("start >> sync_stop");
             ru.lila.sync_stop(sSyncType, json);
           },
@@ -5252,10 +5252,12 @@ var ru = (function ($, ru) {
             } else {
               switch (response.status) {
                 case "ready":
+                case "readyclose":
                 case "finished":
-                  // NO NEED for further action
-                  //// Indicate we are ready
-                  //$(elTarget).html("READY");
+                  // NO NEED for further action, unless a background job produced the result
+                  if ("html" in response) {
+                    $(elTarget).html(response.html);
+                  }
                   break;
                 case "error":
                   // Show the error
@@ -5508,6 +5510,11 @@ var ru = (function ($, ru) {
                       // Place the response here
                       $("#" + sTargetDiv).html(response.html);
                       $("#" + sTargetDiv).removeClass("hidden");
+                      // A background job reports its result through the progress URL
+                      if ("progressurl" in response && (progrurl === null || progrurl === undefined)) {
+                        loc_progr = [];
+                        window.setTimeout(function () { ru.lila.seeker.check_progress(response.progressurl, sTargetDiv); }, 2000);
+                      }
                     }
                     break;
                   default:
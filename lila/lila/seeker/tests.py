@@ -6,14 +6,47 @@ Replace this with more appropriate tests for your application.
 """
 
 import django
+import json
+from unittest import mock
 django.setup()                      # This is needed apparently
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from lila.seeker.models import City, Country
+from lila.basic.models import SearchTrigram, UserSearch
+from lila.basic.views import adapt_search, get_query_models
+from lila.bible.models import Book, Chapter, Reference
+from lila.seeker.models import City, Country, Library, Manuscript, Codico, Daterange, Job, Status, \
+    Austat, AustatDist, Canwit, CanwitAustat, MsItem, AustatWords, ManuscriptAustats, \
+    Profile, Collection, Caned, CollOverlap, BasketMan, Codhead, Visit, Information, Litref, AustatLink, \
+    BibRange, BibInterval, BibVerse, Keyword, Project, Provenance, Author
+from lila.seeker.views_main import ManuscriptListView, CanwitListView, AustatListView, BasketUpdateManu, adapt_regex_incexp
+from lila.seeker.visualizations import get_ssg_corpus, get_cooccurrence, AustatGraph, AustatOverlap
+from lila.seeker.linkgraph import AustatLinkGraph
+from lila.seeker.hierarchy import HierarchySaver
+from lila.seeker.visits import VisitLog
+from lila.seeker.zotero_sync import ZoteroFixtureServer
 
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
+def job_echo(job):
+    """Job function used by JobTests"""
+    params = job.get_params()
+    if params.get('fail'):
+        raise ValueError("failing job")
+    if params.get('error'):
+        return dict(status="error", msg="job reports an error")
+    return dict(echo=params.get('value'))
+
+def add_link(manu, austat):
+    """Link [austat] to a new canwit in a new MsItem of [manu]"""
+    msitem = MsItem.objects.create(manu=manu)
+    canwit = Canwit.objects.create(msitem=msitem)
+    return CanwitAustat.objects.create(canwit=canwit, austat=austat)
+
 class SimpleTest(TestCase):
     """Tests for the application views."""
 
@@ -91,3 +124,678 @@ class HomePageTests(TestCase):
             self.assertTemplateUsed(response, 'index.html')
             self.assertTemplateUsed(response, 'layout.html')
             self.assertTemplateUsed(response, 'topnav.html')
+
+class ListViewQueryTests(TestCase):
+    """Test that showing a page of a listview takes a fixed number of queries"""
+
+    max_queries = 10
+
+    def setUp(self):
+        library = Library.objects.create(name="Test library")
+        for idx in range(100):
+            manu = Manuscript.objects.create(idno="Test {}".format(idx), library=library)
+            codico = Codico.objects.filter(manuscript=manu).first()
+            Daterange.objects.create(codico=codico, yearstart=800, yearfinish=900)
+        # Canwits and Austats, each Austat in a historical collection
+        author = Author.objects.create(name="Test author")
+        coll = Collection.objects.create(name="Test HC", type="austat", settype="hc", scope="publ")
+        for idx in range(100):
+            austat = Austat.objects.create(code="LILAC {}".format(idx), ftext="Test {}".format(idx), author=author)
+            Caned.objects.create(collection=coll, austat=austat)
+            link = add_link(manu, austat)
+            Canwit.objects.filter(id=link.canwit_id).update(author=author)
+
+    def check_page_queries(self, view, model):
+        view.basic_name = model.__name__.lower()
+        view.request = RequestFactory().get("/")
+        view.request.user = User.objects.create(username="page_tester")
+        qs = view.plan_queryset(model.objects.all().order_by('id'))
+        with CaptureQueriesContext(connection) as context:
+            result_list = view.get_result_list(qs[:100])
+        self.assertEqual(len(result_list), 100)
+        self.assertLessEqual(len(context.captured_queries), self.max_queries)
+
+    def test_manuscript_page_queries(self):
+        self.check_page_queries(ManuscriptListView(), Manuscript)
+
+    def test_canwit_page_queries(self):
+        self.check_page_queries(CanwitListView(), Canwit)
+
+    def test_austat_page_queries(self):
+        # The drag-and-drop permission is determined once per page
+        self.check_page_queries(AustatListView(), Austat)
+
+class SearchResultCacheTests(TestCase):
+    """Test the models that a cached search result depends on"""
+
+    def test_depends(self):
+        from django.db.models.signals import post_save
+        view = ManuscriptListView()
+        qs = Manuscript.objects.filter(id__in=Caned.objects.values('austat__canwit_austat__canwit__msitem__manu_id'))
+        self.assertEqual(set(get_query_models(qs)), set([Manuscript, Caned, Austat, CanwitAustat, Canwit, MsItem]))
+        depends = view.get_usersearch_models(qs)
+        for model in [Manuscript, Austat, Collection, Caned, Keyword, Project, Provenance, CollOverlap, BibInterval]:
+            self.assertIn(model, depends)
+        self.assertTrue(UserSearch.is_tracked(depends))
+        self.assertFalse(UserSearch.is_tracked([Visit]))
+        self.assertFalse(post_save.has_listeners(Visit))
+
+        # A change in one of the models gives another key
+        sKey = UserSearch.get_result_key("test", Manuscript, depends=depends)
+        Keyword.objects.create(name="cache test")
+        self.assertNotEqual(UserSearch.get_result_key("test", Manuscript, depends=depends), sKey)
+
+class JobTests(TestCase):
+    """Test claiming and running background jobs"""
+
+    def test_claim_and_run(self):
+        oStatus = Status.objects.create(user="test", type="test", status="preparing")
+        job = Job.add("lila.seeker.tests.job_echo", "test", dict(value=12), oStatus)
+        self.assertEqual(Status.objects.get(id=oStatus.id).status, "queued")
+
+        # A job can only be claimed once
+        self.assertEqual(Job.claim(), job.id)
+        self.assertIsNone(Job.claim())
+
+        Job.run(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.get_result(), dict(echo=12))
+
+    def test_failing_job(self):
+        oStatus = Status.objects.create(user="test", type="test", status="preparing")
+        job = Job.add("lila.seeker.tests.job_echo", "test", dict(fail=True), oStatus)
+        Job.run(Job.claim())
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, "error")
+        self.assertEqual(Status.objects.get(id=oStatus.id).status, "error")
+
+        # A job that returns an error result has failed too
+        job = Job.add("lila.seeker.tests.job_echo", "test", dict(error=True))
+        Job.run(Job.claim())
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, "error")
+        self.assertEqual(job.msg, "job reports an error")
+
+    def test_requeue_stale(self):
+        from datetime import timedelta
+        from lila.seeker.models import get_current_datetime
+        job_live = Job.add("lila.seeker.tests.job_echo", "test")
+        job_dead = Job.add("lila.seeker.tests.job_echo", "test")
+        Job.claim()
+        Job.claim()
+        # Only the job without a recent heartbeat is queued again
+        Job.objects.filter(id=job_dead.id).update(beat=get_current_datetime() - timedelta(seconds=600))
+        Job.heartbeat([job_live.id])
+        self.assertEqual(Job.requeue_stale(300), 1)
+        self.assertEqual(Job.objects.get(id=job_live.id).status, "running")
+        self.assertEqual(Job.objects.get(id=job_dead.id).status, "queued")
+
+    def test_adaptation_job(self):
+        job = Job.add("lila.seeker.adaptations.run_adaptation_job", "", dict(adapt="lilacodefull"))
+        Job.run(Job.claim())
+        self.assertEqual(Job.objects.get(id=job.id).status, "done")
+        self.assertEqual(Information.get_kvalue("lilacodefull"), "done")
+
+class BulkImportTests(TestCase):
+    """Test adding imported manuscripts in bulk"""
+
+    def test_manuscript_bulk_add(self):
+        library = Library.objects.create(name="Test library")
+        lst_manu = [dict(idno="Bulk {}".format(idx), lilacode="B{}".format(idx), library="Test library", size="small")
+                    for idx in range(20)]
+        lst_obj = Manuscript.bulk_add(lst_manu)
+        self.assertEqual(len(lst_obj), 20)
+        manu = Manuscript.objects.get(idno="Bulk 3")
+        self.assertEqual(manu.id, lst_obj[3].id)
+        self.assertEqual(manu.library, library)
+        self.assertEqual(manu.name, "B3")
+        # Each manuscript has its first codicological unit
+        self.assertEqual(Codico.objects.filter(manuscript__in=lst_obj).count(), 20)
+        self.assertEqual(manu.manuscriptcodicounits.first().format, "small")
+        self.assertEqual(Library.objects.get(id=library.id).mcount, 20)
+
+        # Without a name, the codicological unit gets the default one
+        manu = Manuscript.bulk_add([dict(idno="Bulk nameless")])[0]
+        self.assertEqual(manu.manuscriptcodicounits.first().name, "SUPPLY A NAME")
+
+    def test_lookup_number(self):
+        from lila.seeker.models import LookupMap
+        library = Library.objects.create(name="12")
+        # A spreadsheet gives the number 12 as a float
+        self.assertEqual(LookupMap().get(Library, "name", 12.0), library)
+
+
+class DistanceTests(TestCase):
+    """Test the Canwit-to-Austat distance engine"""
+
+    def test_do_distance(self):
+        close = Austat.objects.create(ftext="In principio erat verbum", ftrans="In the beginning was the word")
+        far = Austat.objects.create(ftext="Beati pauperes spiritu", ftrans="Blessed are the poor in spirit")
+        empty = Austat.objects.create()
+        canwit = Canwit.objects.create(ftext="In principio erat verbum", ftrans="In the beginning was the word")
+        canwit.do_distance()
+        dist = {x.austat_id: x.distance for x in AustatDist.objects.filter(canwit=canwit)}
+        self.assertEqual(len(dist), 3)
+        self.assertAlmostEqual(dist[close.id], 1.0)
+        self.assertLess(dist[close.id], dist[far.id])
+        self.assertEqual(dist[empty.id], 100000)
+
+        # Existing distances only change when forced
+        canwit.ftext = "Beati pauperes spiritu"
+        canwit.ftrans = "Blessed are the poor in spirit"
+        canwit.save()
+        canwit.do_distance()
+        self.assertAlmostEqual(AustatDist.objects.get(canwit=canwit, austat=close).distance, dist[close.id])
+        canwit.do_distance(True)
+        self.assertAlmostEqual(AustatDist.objects.get(canwit=canwit, austat=far).distance, 1.0)
+
+
+class TrigramSearchTests(TestCase):
+    """Test that the trigram index gives the same results as the plain regular expression"""
+
+    def test_wildcard_search(self):
+        texts = ["In principio erat verbum", "Beati pauperes spiritu", "Caelum et terra transibunt",
+                 "Iustitia eius manet", "Vae vobis", "Verbum caro factum est", "Viakaek", ""]
+        for text in texts:
+            Canwit.objects.create(ftext=text)
+        # The index is only used when it is complete
+        self.assertIsNone(SearchTrigram.get_candidates(Canwit, "srchftext", "in princ*"))
+        SearchTrigram.rebuild(Canwit)
+        # Changes after the rebuild are kept up to date by save()
+        canwit = Canwit.objects.create(ftext="Ecce agnus dei")
+        canwit.ftext = "Ecce ancilla domini"
+        canwit.save()
+
+        for sValue in ["in princ*", "*uerbum*", "*jus*", "cel*", "*est", "#verbum#", "uae u*", "*spiritu", "*agnus*", "*ancill*", "*kaaec*", "*caec*"]:
+            qs_cand = SearchTrigram.get_candidates(Canwit, "srchftext", sValue)
+            self.assertIsNotNone(qs_cand, sValue)
+            q_regex = Q(srchftext__iregex=adapt_search(sValue, adapt_regex_incexp))
+            expected = set(Canwit.objects.filter(q_regex).values_list('id', flat=True))
+            found = set(Canwit.objects.filter(Q(id__in=qs_cand) & q_regex).values_list('id', flat=True))
+            self.assertEqual(found, expected, sValue)
+            self.assertLessEqual(qs_cand.count(), len(texts))
+        self.assertEqual(Canwit.objects.filter(id__in=SearchTrigram.get_candidates(Canwit, "srchftext", "*ancill*")).count(), 1)
+
+        # Patterns without three literal characters cannot use the index
+        self.assertIsNone(SearchTrigram.get_candidates(Canwit, "srchftext", "*a*"))
+
+        # Folding the text twice changes nothing
+        self.assertEqual(SearchTrigram.normalize("uiacec"), SearchTrigram.normalize("Viakaek"))
+        self.assertEqual(SearchTrigram.normalize(SearchTrigram.normalize("kaaaec")), SearchTrigram.normalize("kaaaec"))
+
+        # Deleted objects leave the index
+        canwit.delete()
+        self.assertFalse(SearchTrigram.objects.filter(model="seeker.canwit", objid=canwit.id).exists())
+
+
+class AustatCorpusCacheTests(TestCase):
+    """Test the shared caches of Austat words and of the Austats per manuscript"""
+
+    def test_corpus_cache(self):
+        manu1 = Manuscript.objects.create(idno="Cache 1")
+        manu2 = Manuscript.objects.create(idno="Cache 2")
+        austat1 = Austat.objects.create(ftext="In principio erat verbum")
+        austat2 = Austat.objects.create(ftext="Verbum caro", ftrans="The word")
+        austat3 = Austat.objects.create(ftext="Beati pauperes")
+        add_link(manu1, austat1)
+        add_link(manu1, austat2)
+        link = add_link(manu2, austat1)
+        add_link(manu2, austat3)
+
+        manu_set, corpus = get_ssg_corpus(austat1)
+        self.assertEqual(manu_set, {manu1.id: [austat1.id, austat2.id], manu2.id: [austat1.id, austat3.id]})
+        self.assertEqual([x['equal__id'] for x in corpus], [austat1.id, austat2.id, austat3.id])
+        self.assertEqual(corpus[1]['words'], {"verbum": 1, "caro": 1, "the": 1, "word": 1})
+
+        # Changing a text or removing a link updates the caches
+        austat2.ftext = "Verbum verbum"
+        austat2.save()
+        self.assertEqual(json.loads(AustatWords.objects.get(austat=austat2).words), {"verbum": 2, "the": 1, "word": 1})
+        link.canwit.delete()
+        self.assertEqual(json.loads(ManuscriptAustats.objects.get(manuscript=manu2).austats), [austat3.id])
+        manu_set, corpus = get_ssg_corpus(austat1)
+        self.assertEqual(list(manu_set.keys()), [manu1.id])
+        self.assertEqual([x['equal__id'] for x in corpus], [austat1.id, austat2.id])
+
+
+class ManuscriptAustatsDeleteTests(TransactionTestCase):
+    """Deleting a manuscript with linked canwits must not leave a ManuscriptAustats row behind"""
+
+    def test_delete_manuscript(self):
+        manu = Manuscript.objects.create(idno="Cache delete")
+        for idx in range(3):
+            add_link(manu, Austat.objects.create(ftext="Austat {}".format(idx)))
+        ManuscriptAustats.get_sets([manu.id])
+        self.assertEqual(ManuscriptAustats.objects.filter(manuscript=manu).count(), 1)
+        # Outside a test transaction, the foreign keys are checked at commit
+        manu.delete()
+        self.assertEqual(ManuscriptAustats.objects.count(), 0)
+        self.assertEqual(CanwitAustat.objects.count(), 0)
+
+class CooccurrenceTests(TestCase):
+    """Test the co-occurrence counts that are the links of the SSG graph"""
+
+    def test_cooccurrence(self):
+        manu_set = {1: [10, 20, 30], 2: [10, 30], 3: [20, 30, 40], 4: [10, 20, 30, 50]}
+        lst_ssg_id = [10, 20, 30, 40]
+        rows, cols, values = get_cooccurrence(manu_set, lst_ssg_id)
+        found = {(lst_ssg_id[r], lst_ssg_id[c]): v for r, c, v in zip(rows, cols, values)}
+        self.assertEqual(found, {(10, 20): 2, (10, 30): 3, (20, 30): 3, (20, 40): 1, (30, 40): 1})
+
+        # The graph only keeps the links of at least [min_value] manuscripts
+        corpus = [dict(equal__id=x, equal__code="LILAC 1.{}".format(x), authorname="a", scount=1) for x in lst_ssg_id]
+        node_list, link_list, max_value = AustatGraph().do_manu_method(corpus, manu_set, 2)
+        self.assertEqual(max_value, 3)
+        self.assertEqual([(x['source_id'], x['target_id'], x['value']) for x in link_list], [(10, 20, 2), (10, 30, 3), (20, 30, 3)])
+        self.assertEqual([x['id'] for x in node_list], ["1.10", "1.20", "1.30"])
+
+
+class CollOverlapTests(TestCase):
+    """Test the bulk calculation of the overlap between a collection and the manuscripts"""
+
+    def test_overlap(self):
+        user = User.objects.create(username="overlap_tester")
+        profile = Profile.objects.create(user=user)
+        coll = Collection.objects.create(name="HC overlap", type="austat", settype="hc")
+        austats = [Austat.objects.create(code="LILAC {}".format(x)) for x in range(5)]
+        for austat in austats[:4]:
+            Caned.objects.create(collection=coll, austat=austat)
+        manus = [Manuscript.objects.create(idno="Overlap {}".format(x)) for x in range(4)]
+        template = Manuscript.objects.create(idno="Overlap template", mtype="tem")
+        # 3 of 4, with a double link; 1 of 4; none of the collection; nothing at all
+        for manu, lst_austat in zip(manus + [template], [[0, 1, 1, 2], [3, 4], [4], [], [0]]):
+            for idx in lst_austat:
+                add_link(manu, austats[idx])
+
+        version = UserSearch.get_model_versions([CollOverlap])
+        # Templates are not ranked
+        self.assertEqual(CollOverlap.get_ranking(profile, coll), [(manus[0].id, 75), (manus[1].id, 25)])
+        self.assertEqual(CollOverlap.objects.filter(profile=profile, collection=coll).count(), 2)
+        self.assertNotEqual(UserSearch.get_model_versions([CollOverlap]), version)
+        self.assertEqual(CollOverlap.get_overlap(profile, coll, manus[3]), 0)
+
+        # Rows are updated when the manuscript changes
+        add_link(manus[1], austats[0])
+        self.assertEqual(CollOverlap.get_overlap(profile, coll, manus[1]), 50)
+        oOverlap = CollOverlap.update_collection(profile, coll)
+        self.assertEqual(oOverlap, {manus[0].id: 75, manus[1].id: 50, manus[3].id: 0})
+        self.assertEqual(CollOverlap.objects.get(profile=profile, collection=coll, manuscript=manus[1]).overlap, 50)
+
+class BasketTests(TestCase):
+    """Test the bulk operations on a basket"""
+
+    def test_basket(self):
+        user = User.objects.create(username="basket_tester")
+        profile = Profile.objects.create(user=user)
+        manus = [Manuscript.objects.create(idno="Basket {}".format(x)) for x in range(6)]
+        ids = [x.id for x in manus]
+        view = BasketUpdateManu()
+
+        def get_basket():
+            return sorted(BasketMan.objects.filter(profile=profile).values_list('manu_id', flat=True))
+
+        # Doubles in the search results and items already in the basket are skipped
+        self.assertEqual(view.basket_add(profile, ids[:3] + ids[:2]), 3)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(view.basket_add(profile, ids[2:5]), 2)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(get_basket(), ids[:5])
+
+        self.assertEqual(view.basket_remove(profile, [ids[1], ids[3], ids[5]]), 2)
+        self.assertEqual(get_basket(), [ids[0], ids[2], ids[4]])
+        self.assertEqual(view.basket_reset(profile), 3)
+        self.assertEqual(get_basket(), [])
+
+    def test_progress(self):
+        user = User.objects.create(username="basket_tester")
+        profile = Profile.objects.create(user=user)
+        ids = [Manuscript.objects.create(idno="Basket {}".format(x)).id for x in range(6)]
+        view = BasketUpdateManu()
+
+        # Large basket operations report through a Status that the browser can poll
+        with mock.patch("lila.seeker.views_main.BASKET_PROGRESS", 4), mock.patch("lila.seeker.views_main.BASKET_CHUNK", 2):
+            self.assertEqual(view.basket_add(profile, ids), 6)
+            oStatus = Status.objects.get(user=user.username, type="basket_manu")
+            self.assertEqual((oStatus.status, json.loads(oStatus.count)), ("finished", dict(done=6, total=6)))
+            self.assertEqual(view.basket_remove(profile, ids[:3]), 3)
+            self.assertEqual(Status.objects.filter(user=user.username, type="basket_manu").count(), 1)
+            self.assertEqual(view.basket_remove(profile, ids), 3)
+            oStatus = Status.objects.get(user=user.username, type="basket_manu")
+            self.assertEqual((oStatus.status, json.loads(oStatus.count)), ("finished", dict(done=6, total=6)))
+
+class CloneTests(TestCase):
+    """Test the bulk copying of the items of a manuscript"""
+
+    def test_load_sermons_from(self):
+        manu_src = Manuscript.objects.create(idno="Clone source")
+        austats = [Austat.objects.create(code="LILAC {}".format(x)) for x in range(3)]
+        # A heading with two canwits below it
+        head = MsItem.objects.create(manu=manu_src, order=1)
+        Codhead.objects.create(msitem=head, title="Head", locus="1r")
+        lst_msitem = [head]
+        for idx in range(2):
+            msitem = MsItem.objects.create(manu=manu_src, order=idx+2, parent=head)
+            canwit = Canwit.objects.create(msitem=msitem, ftext="Canwit {}".format(idx), locus="2r")
+            CanwitAustat.objects.create(canwit=canwit, austat=austats[idx])
+            CanwitAustat.objects.create(canwit=canwit, austat=austats[2])
+            lst_msitem.append(msitem)
+        head.firstchild = lst_msitem[1]
+        head.save()
+        lst_msitem[1].next = lst_msitem[2]
+        lst_msitem[1].save()
+
+        manu_dst = Manuscript.objects.create(idno="Clone destination")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(manu_dst.load_sermons_from(manu_src, mtype="tem"))
+        self.assertLess(len(ctx.captured_queries), 30)
+
+        lst_dst = list(manu_dst.manuitems.all().order_by('order'))
+        self.assertEqual([x.order for x in lst_dst], [1, 2, 3])
+        self.assertEqual(lst_dst[0].firstchild, lst_dst[1])
+        self.assertEqual(lst_dst[1].next, lst_dst[2])
+        self.assertEqual([x.parent for x in lst_dst], [None, lst_dst[0], lst_dst[0]])
+        self.assertEqual(lst_dst[0].itemheads.get().title, "Head")
+        canwit = lst_dst[2].itemsermons.get()
+        self.assertEqual((canwit.ftext, canwit.mtype, canwit.locus), ("Canwit 1", "tem", ""))
+        self.assertEqual(sorted(canwit.austats.values_list('code', flat=True)), ["LILAC 1", "LILAC 2"])
+        self.assertEqual(Austat.objects.get(id=austats[2].id).scount, 4)
+        self.assertEqual(json.loads(ManuscriptAustats.objects.get(manuscript=manu_dst).austats), sorted(x.id for x in austats))
+        # The source is left as it was
+        self.assertEqual(MsItem.objects.filter(manu=manu_src).count(), 3)
+
+    def test_hctemplate_copy(self):
+        user = User.objects.create(username="clone_tester")
+        profile = Profile.objects.create(user=user)
+        coll = Collection.objects.create(name="HC clone", type="austat", settype="hc")
+        austats = [Austat.objects.create(code="LILAC {}".format(x), ftext="Text {}".format(x)) for x in range(4)]
+        for austat in austats:
+            Caned.objects.create(collection=coll, austat=austat)
+        manu = coll.get_hctemplate_copy(user.username, "man")
+        lst_msitem = list(manu.manuitems.all().order_by('order'))
+        self.assertEqual(len(lst_msitem), 4)
+        self.assertEqual([x.next_id for x in lst_msitem], [x.id for x in lst_msitem[1:]] + [None])
+        self.assertEqual(CanwitAustat.objects.filter(manu=manu).count(), 4)
+        self.assertEqual(sorted(Canwit.objects.filter(msitem__manu=manu).values_list('ftext', flat=True)),
+                         ["Text {}".format(x) for x in range(4)])
+
+class VisitTests(TestCase):
+    """Test the write-behind logging of visits"""
+
+    def setUp(self):
+        VisitLog.background = False
+        VisitLog.flush()
+
+    def tearDown(self):
+        VisitLog.background = True
+
+    def test_visit(self):
+        user = User.objects.create(username="visit_tester")
+        path_home = reverse("home")
+        with CaptureQueriesContext(connection) as ctx:
+            Visit.add(user.username, "Manuscripts", "/manu/list/", True)
+            Visit.add(user.username, "Manuscript details", "/manu/details/1/", False)
+            Visit.add(user.username, "Manuscript details", "/manu/details/2/", False)
+        # Page views only read
+        self.assertFalse(any(not x['sql'].startswith("SELECT") for x in ctx.captured_queries))
+        self.assertEqual(Visit.objects.filter(user=user).count(), 0)
+        lst_stack = [{'name': "Home", 'url': path_home}, {'name': "Manuscripts", 'url': "/manu/list/"},
+                     {'name': "Manuscript details", 'url': "/manu/details/2/", 'kwargs': {}}]
+        self.assertEqual(Profile.get_stack(user.username), lst_stack)
+
+        # The flush stores the visits and the stack
+        self.assertEqual(VisitLog.flush(), 3)
+        self.assertEqual(list(Visit.objects.filter(user=user).order_by('id').values_list('path', flat=True)),
+                         ["/manu/list/", "/manu/details/1/", "/manu/details/2/"])
+        self.assertEqual(json.loads(Profile.objects.get(user=user).stack), lst_stack)
+        self.assertEqual(VisitLog.flush(), 0)
+
+    def test_store_error(self):
+        user = User.objects.create(username="visit_tester")
+        for idx in range(3):
+            Visit.add(user.username, "Manuscript details", "/manu/details/{}/".format(idx), False)
+        # A batch that cannot be stored goes back to the buffer
+        with mock.patch.object(VisitLog, "store", side_effect=Exception("database down")):
+            self.assertEqual(VisitLog.flush(), 0)
+        self.assertFalse(VisitLog.is_empty())
+        self.assertEqual(VisitLog.flush(), 3)
+        self.assertEqual(list(Visit.objects.filter(user=user).order_by('id').values_list('path', flat=True)),
+                         ["/manu/details/{}/".format(idx) for idx in range(3)])
+
+    def test_trim(self):
+        user = User.objects.create(username="visit_tester")
+        for idx in range(5):
+            Visit.add(user.username, "Manuscript details", "/manu/details/{}/".format(idx), False)
+        with mock.patch("lila.seeker.visits.VISIT_MAX", 4), mock.patch("lila.seeker.visits.VISIT_REDUCE", 2):
+            self.assertEqual(VisitLog.flush(), 5)
+        # Everything up to and including the (count - VISIT_REDUCE)th visit is removed
+        self.assertEqual(list(Visit.objects.filter(user=user).values_list('path', flat=True)), ["/manu/details/4/"])
+
+class ZoteroSyncTests(TestCase):
+    """Test the incremental Zotero synchronisation against a local stand-in of the API"""
+
+    def make_item(self, idx, version):
+        key = "KEY{:04d}".format(idx)
+        data = dict(key=key, version=version, itemType="book", title="Liber {}".format(idx), date="19{:02d}".format(idx % 100),
+                    creators=[dict(creatorType="author", lastName="Auctor{}".format(idx), firstName="A.")])
+        return dict(key=key, version=version, data=data)
+
+    def setUp(self):
+        self.server = ZoteroFixtureServer([self.make_item(idx, 1 + idx // 100) for idx in range(250)]).start()
+        Information.set_kvalue("zotero_libraryid", "12345")
+        Information.set_kvalue("zotero_apikey", "test")
+        Information.set_kvalue("zotero_endpoint", self.server.endpoint)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_sync(self):
+        # (1) The first synchronisation reads everything, in pages of 100
+        oBack, msg = Litref.sync_zotero()
+        self.assertEqual(oBack['status'], "ok")
+        self.assertEqual((oBack['additions'], oBack['changes']), (250, 0))
+        self.assertEqual(Litref.objects.count(), 250)
+        self.assertEqual(Litref.objects.filter(short="").count(), 0)
+        self.assertEqual(Information.get_kvalue("zotero_version"), "3")
+        self.assertEqual(len(self.server.requests), 3)
+
+        # (2) The next one only asks for what has changed
+        self.server.requests.clear()
+        self.server.change_item("KEY0007", dict(self.make_item(7, 4)['data'], title="Liber mutatus"))
+        oBack, msg = Litref.sync_zotero()
+        self.assertEqual((oBack['additions'], oBack['changes']), (0, 1))
+        self.assertEqual([x['params']['since'] for x in self.server.requests], ["3"])
+        self.assertIn("mutatus", Litref.objects.get(itemid="KEY0007").data)
+
+        # (3) Nothing has changed
+        oBack, msg = Litref.sync_zotero()
+        self.assertEqual((oBack['additions'], oBack['changes']), (0, 0))
+        self.assertEqual(Information.get_kvalue("zotero_version"), "4")
+
+        # (4) Forcing reads and processes everything again
+        oBack, msg = Litref.sync_zotero(force=True)
+        self.assertEqual((oBack['additions'], oBack['changes']), (0, 250))
+
+
+class LinkGraphTests(TestCase):
+    """Test the k-hop walk over the in-memory AustatLink graph"""
+
+    def setUp(self):
+        self.a, self.b, self.c, self.d = [Austat.objects.create(keycodefull="A.{}".format(idx)) for idx in range(4)]
+        for src, dst in [(self.a, self.b), (self.a, self.b), (self.b, self.c), (self.c, self.a), (self.c, self.d)]:
+            AustatLink.objects.create(src=src, dst=dst, linktype="eqs")
+
+    def get_overlap(self, austat, degree):
+        view = AustatOverlap()
+        view.obj = austat
+        node_list, link_list, hist_set, max_value, max_group = view.do_overlap(AustatLinkGraph.get_graph(), degree)
+        oGroup = {x['id']: x['group'] for x in node_list}
+        oValue = {(x['source'], x['target']): x['value'] for x in link_list}
+        return oGroup, oValue, max_value, max_group
+
+    def test_overlap(self):
+        a, b, c, d = self.a.id, self.b.id, self.c.id, self.d.id
+        # (1) Only the direct links; the double link counts twice
+        oGroup, oValue, max_value, max_group = self.get_overlap(self.a, 1)
+        self.assertEqual(oGroup, {a: 1, b: 2})
+        self.assertEqual(oValue, {(a, b): 2})
+
+        # (2) Each path to a source counts
+        oGroup, oValue, max_value, max_group = self.get_overlap(self.a, 3)
+        self.assertEqual(oGroup, {a: 1, b: 2, c: 3, d: 4})
+        self.assertEqual(oValue, {(a, b): 2, (b, c): 2, (c, a): 2, (c, d): 2})
+        self.assertEqual((max_value, max_group), (2, 4))
+
+        # (3) An Austat without links is a network of its own
+        oGroup, oValue, max_value, max_group = self.get_overlap(Austat.objects.create(), 2)
+        self.assertEqual(len(oGroup), 1)
+        self.assertEqual(oValue, {})
+
+    def test_invalidate(self):
+        graph = AustatLinkGraph.get_graph()
+        self.assertIs(AustatLinkGraph.get_graph(), graph)
+        AustatLink.objects.create(src=self.d, dst=self.a, linktype="eqs")
+        graph = AustatLinkGraph.get_graph()
+        self.assertEqual(graph.get_index(self.d.id) >= 0, True)
+        self.assertEqual(graph.indptr[-1], 6)
+
+
+class BibIntervalTests(TestCase):
+    """Test the search for Bible references through the BibInterval rows"""
+
+    def setUp(self):
+        book = Book.objects.create(name="Genesis", abbr="GEN", latabbr="Gn", idno=1, chnum=50)
+        Chapter.objects.create(book=book, number=1, vsnum=31)
+        Chapter.objects.create(book=book, number=2, vsnum=25)
+        manu = Manuscript.objects.create(idno="Bible references")
+        self.canwit = Canwit.objects.create(msitem=MsItem.objects.create(manu=manu, order=1), bibleref="GEN 1:30-2:2")
+        self.canwit.do_ranges(force=True)
+
+    def get_canwits(self, start, einde):
+        return list(Canwit.objects.filter(BibInterval.get_filter(start, einde, "canwitbibranges__")).distinct())
+
+    def test_search(self):
+        # One interval per chapter, and no verse rows
+        qs = BibInterval.objects.filter(bibrange__canwit=self.canwit).order_by('start')
+        self.assertEqual([(x.start, x.einde) for x in qs], [(1001030, 1001031), (1002001, 1002002)])
+        self.assertEqual(BibVerse.objects.count(), 0)
+        self.assertEqual(self.get_canwits("001001031", "001001031"), [self.canwit])
+        self.assertEqual(self.get_canwits("001002002", "001002010"), [self.canwit])
+        self.assertEqual(self.get_canwits("001001001", "001001029"), [])
+        self.assertEqual(self.get_canwits("001002003", "001050001"), [])
+
+    def test_rebuild(self):
+        BibInterval.objects.all().delete()
+        self.assertEqual(BibInterval.rebuild(), 2)
+        self.assertEqual(self.get_canwits("001001001", "001001030"), [self.canwit])
+
+    def test_not_built(self):
+        # A range of an existing database, with verse rows and without intervals
+        BibInterval.objects.all().delete()
+        bibrange = BibRange.objects.get(canwit=self.canwit)
+        BibVerse.objects.bulk_create([BibVerse(bibrange=bibrange, bkchvs=x) for x in ["001001030", "001001031", "001002001"]])
+        self.assertFalse(BibInterval.is_built())
+        self.assertEqual(self.get_canwits("001001031", "001002010"), [self.canwit])
+        self.assertEqual(self.get_canwits("001002002", "001002010"), [])
+
+        # After 'manage.py bibintervals' only the intervals are used
+        BibInterval.rebuild()
+        self.assertTrue(BibInterval.is_built())
+        BibVerse.objects.all().delete()
+        self.assertEqual(self.get_canwits("001001031", "001001031"), [self.canwit])
+
+    def test_reparse(self):
+        # Parsing needs no queries once the book and chapter tables are loaded
+        with CaptureQueriesContext(connection) as ctx:
+            bResult, msg, lst_verses = Reference("GEN 1:31; 2:1-3").parse()
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(lst_verses[1]['scr_refs'], ["001002001", "001002002", "001002003"])
+
+        Canwit.objects.filter(id=self.canwit.id).update(bibleref="GEN 2:1-3")
+        self.assertEqual(BibRange.reparse(), 1)
+        self.assertEqual([x.chvslist for x in BibRange.objects.filter(canwit=self.canwit)], ["2:1-3"])
+        self.assertEqual(self.get_canwits("001001030", "001001031"), [])
+        self.assertEqual(self.get_canwits("001002003", "001002003"), [self.canwit])
+        self.assertIn("001002003", Canwit.objects.get(id=self.canwit.id).verses)
+
+
+class HierarchyTests(TestCase):
+    """Test saving the hierarchy of a manuscript in bulk"""
+
+    def test_save(self):
+        manu = Manuscript.objects.create(idno="Hierarchy")
+        codi = Codico.objects.create(manuscript=manu, order=1)
+        a, b, c = [MsItem.objects.create(manu=manu, codico=codi, order=idx+1) for idx in range(3)]
+        canwit_b = Canwit.objects.create(msitem=b)
+        a.next = b
+        a.save()
+        b.next = c
+        b.save()
+
+        # A new heading after [a], with [c] and [b] (in that order) below it
+        hlist = [dict(id="codi", codi=codi.id),
+                 dict(id=str(a.id), nextid="new_1", firstchild="", parent=""),
+                 dict(id="new_1", title=" Head ", locus="3r", nextid="", firstchild=str(c.id), parent=""),
+                 dict(id=str(c.id), nextid=str(b.id), firstchild="", parent="new_1"),
+                 dict(id=str(b.id), nextid="", firstchild="", parent="new_1")]
+        with CaptureQueriesContext(connection) as ctx:
+            hierarchy = HierarchySaver(manu).save(hlist)
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        head = Codhead.objects.get(msitem__manu=manu)
+        self.assertEqual((head.title, head.locus), ("Head", "3r"))
+        new = head.msitem
+        lst_msitem = list(manu.manuitems.all().order_by('order'))
+        self.assertEqual(lst_msitem, [a, new, c, b])
+        self.assertEqual([x.order for x in lst_msitem], [2, 3, 4, 5])
+        self.assertEqual([x.parent_id for x in lst_msitem], [None, None, new.id, new.id])
+        self.assertEqual([x.next_id for x in lst_msitem], [new.id, None, b.id, None])
+        self.assertEqual(new.firstchild_id, c.id)
+        self.assertIn(dict(sermon=canwit_b.id, parent_new=new.id, parent_old="none", next_new="none", next_old=c.id), hierarchy)
+
+        # Deleting [b]
+        hlist = [dict(x) for x in hlist]
+        hlist[2]['id'] = str(new.id)
+        hlist[3]['parent'] = str(new.id)
+        hlist[4]['action'] = "delete"
+        hlist[3]['nextid'] = ""
+        HierarchySaver(manu).save(hlist)
+        self.assertEqual(list(manu.manuitems.all().order_by('order')), [a, new, c])
+        self.assertEqual(Canwit.objects.filter(id=canwit_b.id).count(), 0)
+
+    def test_canwit_list(self):
+        manu = Manuscript.objects.create(idno="Hierarchy list")
+        codi = Codico.objects.create(manuscript=manu, order=1)
+        head = MsItem.objects.create(manu=manu, codico=codi, order=1)
+        Codhead.objects.create(msitem=head, title="Head")
+        lst_child = [MsItem.objects.create(manu=manu, codico=codi, order=idx+2, parent=head) for idx in range(2)]
+        grandchild = MsItem.objects.create(manu=manu, codico=codi, order=4, parent=lst_child[1])
+        canwit = Canwit.objects.create(msitem=lst_child[0])
+        hc = Collection.objects.create(name="HC", settype="hc")
+        austat = Austat.objects.create()
+        Caned.objects.create(collection=hc, austat=austat)
+        CanwitAustat.objects.create(canwit=canwit, austat=austat)
+
+        with CaptureQueriesContext(connection) as ctx:
+            canwit_list = manu.get_canwit_list(None, None)
+        count = len(ctx.captured_queries)
+        self.assertEqual([x['obj'] for x in canwit_list], [head] + lst_child + [grandchild])
+        self.assertEqual([x['level'] for x in canwit_list], [1, 2, 2, 3])
+        self.assertEqual([x['group'] for x in canwit_list], [False, True, False, True])
+        self.assertEqual([x['isparent'] for x in canwit_list], [True, False, True, False])
+        self.assertEqual([x['childof'] for x in canwit_list], [1, 2, 2, 4])
+        self.assertEqual([x['cols'] for x in canwit_list], [3, 1, 2, 0])
+        self.assertEqual([x['codistart'] for x in canwit_list], [codi.id, "", "", ""])
+        self.assertEqual(canwit_list[0]['shead'].title, "Head")
+        self.assertEqual(canwit_list[1]['sermon'], canwit)
+        self.assertIn(">HC<", canwit_list[1]['hclist'])
+        self.assertEqual(codi.get_canwit_list(None, None)[3]['level'], 3)
+
+        # The number of queries does not depend on the number of items
+        for idx in range(20):
+            msitem = MsItem.objects.create(manu=manu, codico=codi, order=idx+5, parent=grandchild)
+            Canwit.objects.create(msitem=msitem)
+        with CaptureQueriesContext(connection) as ctx:
+            canwit_list = manu.get_canwit_list(None, None)
+        self.assertEqual(len(ctx.captured_queries), count)
+        self.assertEqual(canwit_list[-1]['level'], 4)
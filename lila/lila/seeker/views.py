@@ -76,7 +76,7 @@ from lila.seeker.models import AuworkSignature, get_crpp_date, get_current_datet
     User, Group, Origin, Canwit, MsItem, Codhead, CanwitKeyword, CanwitAustat, NewsItem, \
     SourceInfo, AustatKeyword, ManuscriptExt, AuworkGenre, AuworkKeyword, Signature,  \
     ManuscriptKeyword, Action, Austat, AustatLink, Location, LocationName, LocationIdentifier, LocationRelation, LocationType, \
-    ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, Feast, Comment, AustatDist, \
+    ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, BibInterval, Feast, Comment, AustatDist, \
     Basket, BasketMan, BasketAustat, Litref, LitrefMan, LitrefCol, Report, \
     Visit, Profile, Keyword, CanwitSignature, Status, Library, Collection, CollectionCanwit, \
     CollectionMan, Caned, UserKeyword, Template, Genre, Auwork, EdirefWork, \
@@ -521,7 +521,7 @@ def search_generic(s_view, cls, form, qd, username=None, team_group=None):
                     oFields['mtype'] = "man"
                                  
                 # Create the search based on the specification in searches
-                filters, lstQ, qd, lstExclude = make_search_list(filters, oFields, searches, qd, lstExclude)
+                filters, lstQ, qd, lstExclude = make_search_list(filters, oFields, searches, qd, lstExclude, cls)
 
                 # Calculate the final qs
                 if len(lstQ) == 0:
@@ -2697,10 +2697,8 @@ class BibRangeListView(BasicList):
             start, einde = Reference.get_startend(bibrefchvs, book=bibrefbk)
  
             # Find out which sermons have references in this range
-            lstQ = []
-            lstQ.append(Q(bibrangeverses__bkchvs__gte=start))
-            lstQ.append(Q(bibrangeverses__bkchvs__lte=einde))
-            sermonlist = [x.id for x in BibRange.objects.filter(*lstQ).order_by('id').distinct()]
+            qBib = BibInterval.get_filter(start, einde)
+            sermonlist = list(BibRange.objects.filter(qBib).order_by('id').values_list('id', flat=True).distinct())
 
             fields['bibrefbk'] = Q(id__in=sermonlist)
 
@@ -25,6 +25,7 @@ from django.views.generic import ListView, View
 from django.views.decorators.csrf import csrf_exempt
 
 # ======= imports from my own application ======
+from lila.settings import USE_JOBS
 from lila.utils import ErrHandle
 from lila.seeker.models import get_crpp_date, get_current_datetime, process_lib_entries, get_searchable, get_now_time, \
     add_gold2equal, add_equal2equal, add_ssg_equal2equal, get_helptext, Information, Country, City, Author, Manuscript, \
@@ -33,7 +34,7 @@ from lila.seeker.models import get_crpp_date, get_current_datetime, process_lib_
     ManuscriptKeyword, Action, Austat, AustatLink, Location, LocationName, LocationIdentifier, LocationRelation, LocationType, \
     ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, Feast, Comment, AustatDist, \
     Basket, BasketMan, BasketAustat, Litref, LitrefMan, LitrefCol, Report, \
-    Visit, Profile, Keyword, CanwitSignature, Status, Library, Collection, CollectionCanwit, \
+    Visit, Profile, Keyword, CanwitSignature, Status, Job, Library, Collection, CollectionCanwit, \
     CollectionMan, Caned, UserKeyword, Template, \
     ManuscriptCorpus, ManuscriptCorpusLock, AustatCorpus, ProjectEditor, \
     Codico, ProvenanceCod, OriginCodico, CodicoKeyword, Reconstruction, \
@@ -378,7 +379,13 @@ def sync_start(request):
             # Formulate a response
             data['status'] = 'done'
 
-            if synctype == "zotero":
+            if synctype == "zotero" and USE_JOBS:
+                # Leave the synchronisation to the background worker
+                job = Job.add("lila.seeker.views_api.run_zotero_job", username, dict(force=force), oStatus)
+                data['status'] = 'queued'
+                data['jobid'] = job.id
+
+            elif synctype == "zotero":
                 # Use the synchronisation object that contains all relevant information
                 oStatus.set("loading")
 
@@ -437,6 +444,19 @@ def sync_progress(request):
                 data['msg'] = oStatus.msg
                 data['count'] = oStatus.count
 
+                # Is this being processed by a background job?
+                job = oStatus.status_jobs.order_by('-id').first()
+                if not job is None:
+                    data['jobid'] = job.id
+                    data['jobstatus'] = job.status
+                    if job.status in ["queued", "running"] and data['status'] in ["ready", "readyclose", "finished"]:
+                        # The job still has to store its result
+                        data['status'] = "finishing"
+                    elif job.status == "done":
+                        oResult = job.get_result()
+                        if 'html' in oResult:
+                            data['html'] = oResult['html']
+
         # Return this response
         return JsonResponse(data)
     except:
@@ -446,6 +466,18 @@ def sync_progress(request):
     # Return this response
     return JsonResponse(data)
 
+def run_zotero_job(job):
+    """Perform a Zotero synchronisation that has been queued by sync_start()"""
+
+    params = job.get_params()
+    oStatus = job.progress
+    if not oStatus is None:
+        oStatus.set("loading")
+    oResult, msg = Litref.sync_zotero(force=params.get('force', False), oStatus=oStatus)
+    if oResult is None or not 'status' in oResult:
+        raise Exception("sync_zotero: {}".format(msg))
+    return oResult
+
 def redo_zotero(request):
     oErr = ErrHandle()
     data = {'status': 'preparing'}
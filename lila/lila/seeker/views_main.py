@@ -44,7 +44,7 @@ from lila.seeker.models import Auwork, DraggingAustat, LitrefAustat, get_crpp_da
     User, Group, Origin, Canwit, MsItem, Codhead, CanwitKeyword, CanwitAustat, NewsItem, \
     SourceInfo, AustatKeyword, AustatGenre, ManuscriptExt, Colwit, Free, LitrefAustat, \
     ManuscriptKeyword, Action, Austat, AustatLink, Location, LocationName, LocationIdentifier, LocationRelation, LocationType, \
-    ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, Feast, Comment, AustatDist, \
+    ProvenanceMan, Provenance, Daterange, CollOverlap, BibRange, BibInterval, Feast, Comment, AustatDist, \
     Basket, BasketMan, BasketAustat, Litref, LitrefMan, LitrefCol, Report, \
     Visit, Profile, Keyword, Signature, CanwitSignature, ColwitSignature, \
     Status, Library, Collection, CollectionCanwit, \
@@ -69,8 +69,10 @@ from lila.reader.views import reader_uploads
 from lila.seeker.views import get_usercomments, search_generic
 from lila.seeker.views_utils import lila_action_add, lila_get_history
 from lila.seeker.adaptations import listview_adaptations, add_codico_to_manuscript
+from lila.seeker.hierarchy import HierarchySaver
 
 # ======= from RU-Basic ========================
+from lila.basic.models import UserSearch
 from lila.basic.views import BasicPart, BasicList, BasicDetails, make_search_list, add_rel_item, adapt_search, \
    adapt_m2m, adapt_m2o, app_editor, app_userplus, treat_bom, \
    user_is_ingroup, user_is_authenticated, user_is_superuser, \
@@ -79,6 +81,8 @@ from lila.basic.views import BasicPart, BasicList, BasicDetails, make_search_lis
 
 # ======= Settings for the Main views ==========
 PAGINATE_BY_VALUE = 100
+BASKET_CHUNK = 500          # Number of basket items per bulk query (sqlite allows at most 999 parameters)
+BASKET_PROGRESS = 2000      # Basket operations on more items report their progress through a Status
 
 
 def adapt_regex_incexp(value):
@@ -894,14 +898,6 @@ class ManuscriptHierarchy(ManuscriptDetails):
     def custom_init(self, instance):
         errHandle = ErrHandle()
 
-        def getid(item, key, mapping):
-            id_value = item[key]
-            if "new" in id_value:
-                id_value = mapping[id_value]
-            obj = MsItem.objects.filter(id=id_value).first()
-            id = None if obj == None else obj.id
-            return id
-
         # Note: use [errHandle]
         try:
             # Make sure to set the correct redirect page
@@ -913,140 +909,9 @@ class ManuscriptHierarchy(ManuscriptDetails):
             if 'manu-hlist' in self.qd:
                 # Interpret the list of information that we receive
                 hlist = json.loads(self.qd['manu-hlist'])
-                # Debugging:
-                str_hlist = json.dumps(hlist, indent=2)
-
-                # Step 1: Convert any new hierarchical elements into [MsItem] with Codhead
-                head_to_id = {}
-                deletables = []
-                with transaction.atomic():
-                    for idx, item in enumerate(hlist):
-                        if 'new' in item['id']:
-                            # This is a new structural element - Create an MsItem
-                            msitem = MsItem.objects.create(manu=instance)
-                            # Create a new MsHead item
-                            shead = Codhead.objects.create(msitem=msitem,title=item['title'])
-                            # Make a mapping
-                            head_to_id[item['id']] = msitem.id
-                            # Testing
-                            id=getid(item, "id", head_to_id)
-                        elif 'action' in item and item['action'] == "delete":
-                            # This one must be deleted
-                            deletables.append(item['id'])
-
-                # Step 1b: adapt the list with deletables
-                hlist[:] = [x for x in hlist if x.get("action") != "delete"]
-
-                # Step 1c: delete those that need it
-                MsItem.objects.filter(id__in=deletables).delete()
-
-                # Step 2: store the hierarchy
-                changes = {}
-                hierarchy = []
-                codi = None
-                with transaction.atomic():
-                    for idx, item in enumerate(hlist):
-                        bNeedSaving = False
-
-                        # Figure out whether this is the start of a Codi or an MsItem
-                        if item.get("id") == "codi":
-                            # THis is the start of a codicological unit
-
-                            # Get a possible codi id
-                            codi_id = item.get("codi")
-                            if codi_id != None:
-                                if codi == None or codi.id != codi_id:
-                                    codi = Codico.objects.filter(id=codi_id).first()
 
-                            # Safe guarding
-                            if codi is None:
-                                errHandle.Status("ManuscriptHierarchy: codi is none")
-                                x = msitem.itemsermons.first()
-
-                        else:
-                            # This must be an MsItem definition
-
-                            # Get the msitem of this item
-                            msitem = MsItem.objects.filter(id=getid(item, "id", head_to_id)).first()
-                            # Get the next if any
-                            next = None if item['nextid'] == "" else MsItem.objects.filter(id=getid(item, "nextid", head_to_id)).first()
-                            # Get the first child
-                            firstchild = None if item['firstchild'] == "" else MsItem.objects.filter(id=getid(item, "firstchild", head_to_id)).first()
-                            # Get the parent
-                            parent = None if item['parent'] == "" else MsItem.objects.filter(id=getid(item, "parent", head_to_id)).first()
-
-                            # Possibly set the msitem codi
-                            if msitem.codico != codi:
-                                msitem.codico = codi
-                                bNeedSaving = True
-                            elif codi == None and msitem.codico == None:
-                                # This MsItem is inserted before something that may already have a codico
-                                codi = instance.manuscriptcodicounits.order_by('order').first()
-                                if codi != None:
-                                    msitem.codico = codi
-                                    bNeedSaving = True
-
-                            # Possibly adapt the [shead] title and locus
-                            itemhead = msitem.itemheads.first()
-                            if itemhead and 'title' in item and 'locus' in item:
-                                title= item['title'].strip()
-                                locus = item['locus']
-                                if itemhead.title != title or itemhead.locus != locus:
-                                    itemhead.title = title.strip()
-                                    itemhead.locus = locus
-                                    # Save the itemhead
-                                    itemhead.save()
-                            
-                            order = idx + 1
-
-                            sermon_id = "none"
-                            if msitem.itemsermons.count() > 0:
-                                sermon_id = msitem.itemsermons.first().id
-                            sermonlog = dict(sermon=sermon_id)
-                            bAddSermonLog = False
-
-                            # Check if anytyhing changed
-                            if msitem.order != order:
-                                # Implement the change
-                                msitem.order = order
-                                bNeedSaving =True
-                            if msitem.parent is not parent:
-                                # Track the change
-                                old_parent_id = "none" if msitem.parent == None else msitem.parent.id
-                                new_parent_id = "none" if parent == None else parent.id
-                                if old_parent_id != new_parent_id:
-                                    # Track the change
-                                    sermonlog['parent_new'] = new_parent_id
-                                    sermonlog['parent_old'] = old_parent_id
-                                    bAddSermonLog = True
-
-                                    # Implement the change
-                                    msitem.parent = parent
-                                    bNeedSaving = True
-                                else:
-                                    no_change = 1
-
-                            if msitem.firstchild != firstchild:
-                                # Implement the change
-                                msitem.firstchild = firstchild
-                                bNeedSaving =True
-                            if msitem.next != next:
-                                # Track the change
-                                old_next_id = "none" if msitem.next == None else msitem.next.id
-                                new_next_id = "none" if next == None else next.id
-                                sermonlog['next_new'] = new_next_id
-                                sermonlog['next_old'] = old_next_id
-                                bAddSermonLog = True
-
-                                # Implement the change
-                                msitem.next = next
-                                bNeedSaving =True
-                            # Do we need to save this one?
-                            if bNeedSaving:
-                                msitem.save()
-                                if bAddSermonLog:
-                                    # Store the changes
-                                    hierarchy.append(sermonlog)
+                # Store the hierarchy in bulk
+                hierarchy = HierarchySaver(instance).save(hlist)
 
                 details = dict(id=instance.id, savetype="change", changes=dict(hierarchy=hierarchy))
                 lila_action_add(self, instance, details, "save")
@@ -1186,6 +1051,10 @@ class ManuscriptListView(BasicList):
     has_select2 = True
     use_team_group = True
     paginate_by = PAGINATE_BY_VALUE
+    use_idpaging = True
+    usersearch_shared = True
+    # Read by adapt_search(); the models of the searches and the query are added to these
+    usersearch_models = [Austat, CanwitAustat, Canwit, MsItem, Keyword, CollOverlap, BibRange, BibInterval]
     bUseFilter = True
     prefix = "manu"
     basketview = False
@@ -1203,6 +1072,14 @@ class ManuscriptListView(BasicList):
                    {'name': 'Until',    'order': 'o=7', 'type': 'int', 'custom': 'until',   'align': 'right'},
                    {'name': 'Status',   'order': 'o=8', 'type': 'str', 'custom': 'status'},
                    {'name': '',         'order': '',    'type': 'str', 'custom': 'links'}]
+    prefetch_columns = {
+        'city':     {'select': ['library__lcity', 'library__location']},
+        'library':  {'select': ['library']},
+        'name':     {'prefetch': ['manuscriptcodicounits']},
+        'count':    {'annotate': {'canwit_count': Count('manuitems__itemsermons', distinct=True)}},
+        'from':     {'prefetch': ['manuscriptcodicounits__codico_dateranges']},
+        'until':    {'prefetch': ['manuscriptcodicounits__codico_dateranges']},
+        }
     filters = [ 
         {"name": "Shelfmark",       "id": "filter_manuid",           "enabled": False},
         {"name": "Country",         "id": "filter_country",          "enabled": False},
@@ -1391,8 +1268,11 @@ class ManuscriptListView(BasicList):
                 sTitle = lib      
         elif custom == "name":
             html.append("<span class='manuscript-idno'>{}</span>".format(instance.idno))
-            # THe name should come from the codico unit!!!
-            codico = Codico.objects.filter(manuscript=instance).first()
+            # THe name should come from the codico unit!!! (the first one - possibly prefetched)
+            codico = None
+            for obj in instance.manuscriptcodicounits.all():
+                if codico is None or obj.id < codico.id:
+                    codico = obj
             if codico != None and codico.name != None:
                 html.append("<span class='manuscript-title'>| {}</span>".format(codico.name[:100]))
                 sTitle = codico.name
@@ -1400,13 +1280,16 @@ class ManuscriptListView(BasicList):
             html.append(instance.get_lilacode())
         elif custom == "count":
             # html.append("{}".format(instance.manusermons.count()))
-            html.append("{}".format(instance.get_canwit_count()))
+            count = getattr(instance, "canwit_count", None)
+            if count is None:
+                count = instance.get_canwit_count()
+            html.append("{}".format(count))
         elif custom == "from":
             # Walk all codico's
-            for item in Daterange.objects.filter(codico__manuscript=instance):
+            for item in self.get_dateranges(instance):
                 html.append("<div>{}</div>".format(item.yearstart))
         elif custom == "until":
-            for item in Daterange.objects.filter(codico__manuscript=instance):
+            for item in self.get_dateranges(instance):
                 html.append("<div>{}</div>".format(item.yearfinish))
         elif custom == "status":
             # html.append("<span class='badge'>{}</span>".format(instance.stype[:1]))
@@ -1422,6 +1305,16 @@ class ManuscriptListView(BasicList):
         sBack = "\n".join(html)
         return sBack, sTitle
 
+    def get_dateranges(self, instance):
+        """Get the dateranges of all codico's of this manuscript (possibly prefetched)"""
+
+        lBack = []
+        for codico in instance.manuscriptcodicounits.all():
+            for item in codico.codico_dateranges.all():
+                lBack.append(item)
+        lBack.sort(key=lambda x: x.id)
+        return lBack
+
     def adapt_search(self, fields):
         
         def get_overlap_ptc(base_ssgs, comp_ssgs):
@@ -1487,20 +1380,11 @@ class ManuscriptListView(BasicList):
 
                         # Make sure to actually *calculate* the overlap between the different collections and manuscripts
                 
-                        # (1) Possible manuscripts only filter on: mtype=man, prjlist
-                        lstQ = []
-                        # if prjlist != None: lstQ.append(Q(project__in=prjlist))
-                        lstQ.append(Q(mtype="man"))
-                        lstQ.append(Q(manuitems__itemsermons__austats__collections__in=coll_list))
-                        manu_list = Manuscript.objects.filter(*lstQ)
-
                         # We also need to have the profile
                         profile = Profile.get_user_profile(self.request.user.username)
-                        # Now calculate the overlap for all
-                        with transaction.atomic():
-                            for coll in coll_list:
-                                for manu in manu_list:
-                                    ptc = CollOverlap.get_overlap(profile, coll, manu)
+                        # Now calculate the overlap for all manuscripts at once (per collection)
+                        for coll in coll_list:
+                            CollOverlap.update_collection(profile, coll)
                 if 'cmpmanuidlist' in fields and fields['cmpmanuidlist'] != None:
                     # The base manuscripts with which the comparison goes
                     base_manu_list = fields['cmpmanuidlist']
@@ -1550,10 +1434,8 @@ class ManuscriptListView(BasicList):
             start, einde = Reference.get_startend(bibrefchvs, book=bibrefbk)
 
             # Find out which manuscripts have sermons having references in this range
-            lstQ = []
-            lstQ.append(Q(manuitems__itemsermons__sermonbibranges__bibrangeverses__bkchvs__gte=start))
-            lstQ.append(Q(manuitems__itemsermons__sermonbibranges__bibrangeverses__bkchvs__lte=einde))
-            manulist = [x.id for x in Manuscript.objects.filter(*lstQ).order_by('id').distinct()]
+            qBib = BibInterval.get_filter(start, einde, "manuitems__itemsermons__canwitbibranges__")
+            manulist = list(Manuscript.objects.filter(qBib).order_by('id').values_list('id', flat=True).distinct())
 
             fields['bibrefbk'] = Q(id__in=manulist)
 
@@ -3075,7 +2957,7 @@ class CanwitEdit(BasicDetails):
 
             # Then check if all distances have been calculated in AustatDist
             if method == "superdist":
-                qs = AustatDist.objects.filter(sermon=instance)
+                qs = AustatDist.objects.filter(canwit=instance)
                 if qs.count() == 0:
                     # These distances need calculation...
                     instance.do_distance()
@@ -3726,6 +3608,10 @@ class CanwitListView(BasicList):
     has_select2 = True
     use_team_group = True
     paginate_by = PAGINATE_BY_VALUE
+    use_idpaging = True
+    usersearch_shared = True
+    # Read by adapt_search(); the models of the searches and the query are added to these
+    usersearch_models = [Reconstruction, Codico, Keyword, BibRange, BibInterval, Free]
     bUseFilter = True
     prefix = "canwi"
     new_button = False      # Don't show the [Add new canwit] button here. It is shown under the Manuscript Details view.
@@ -3749,6 +3635,14 @@ class CanwitListView(BasicList):
         # 'allowwrap': True,    'autohide': "on", 'filter': 'filter_sectiontitle'},
         {'name': 'Locus',       'order': '',    'type': 'str', 'field':  'locus' },
         {'name': 'Status',      'order': 'o=9', 'type': 'str', 'custom': 'status'}]
+    prefetch_columns = {
+        'lilacode':     {'select': ['msitem__codico__manuscript'], 
+                         'prefetch': [Prefetch('austats', to_attr='austat_hcs', queryset=Austat.objects.prefetch_related(
+                            Prefetch('collections', to_attr='hc_publ', 
+                                     queryset=Collection.objects.filter(settype="hc", scope="publ"))))]},
+        'author':       {'select': ['author']},
+        'manuscript':   {'select': ['msitem__manu']},
+        }
 
     filters = [ {"name": "Author",           "id": "filter_author",         "enabled": False},
                 {"name": "Author type",      "id": "filter_autype",         "enabled": False},
@@ -3976,10 +3870,8 @@ class CanwitListView(BasicList):
                 start, einde = Reference.get_startend(bibrefchvs, book=bibrefbk)
  
                 # Find out which sermons have references in this range
-                lstQ = []
-                lstQ.append(Q(sermonbibranges__bibrangeverses__bkchvs__gte=start))
-                lstQ.append(Q(sermonbibranges__bibrangeverses__bkchvs__lte=einde))
-                sermonlist = [x.id for x in Canwit.objects.filter(*lstQ).order_by('id').distinct()]
+                qBib = BibInterval.get_filter(start, einde, "canwitbibranges__")
+                sermonlist = list(Canwit.objects.filter(qBib).order_by('id').values_list('id', flat=True).distinct())
 
                 fields['bibrefbk'] = Q(id__in=sermonlist)
 
@@ -5163,6 +5055,13 @@ class AustatListView(BasicList):
          'title': "Number of historical collections associated with this Authoritative statement"},
         {'name': 'Status',                  'order': 'o=8',   'type': 'str', 'custom': 'status'}        
         ]
+    prefetch_columns = {
+        'author':   {'select': ['author']},
+        'keycode':  {'select': ['auwork']},
+        'hclist':   {'prefetch': [Prefetch('collections', to_attr='hc_publ', 
+                                           queryset=Collection.objects.filter(settype="hc", scope="publ").order_by('name').distinct())]},
+        }
+    maydragdrop = None
     filters = [
         {"name": "Author",          "id": "filter_author",            "enabled": False},
         {"name": "Key code",        "id": "filter_keycode",           "enabled": False},
@@ -5345,7 +5244,10 @@ class AustatListView(BasicList):
                 # We also need the URL of austat details
                 url = reverse("austat_details", kwargs={'pk': instance.id})
 
-                maydragdrop = False if self is None else ( user_is_authenticated(self.request) and user_is_ingroup(self.request, app_editor) )
+                # Only determine this once per page
+                if self.maydragdrop is None:
+                    self.maydragdrop = ( user_is_authenticated(self.request) and user_is_ingroup(self.request, app_editor) )
+                maydragdrop = self.maydragdrop
 
                 if self is None or not maydragdrop:
                     html.append("<span class='badge signature'><a class='nostyle' href='{}'>{}</a></span>".format(
@@ -7522,10 +7424,8 @@ class CollectionListView(BasicList):
                 start, einde = Reference.get_startend(bibrefchvs, book=bibrefbk)
 
                 # Find out which sermons have references in this range
-                lstQ = []
-                lstQ.append(Q(austat_col__austat__austat_canwits__sermonbibranges__bibrangeverses__bkchvs__gte=start))
-                lstQ.append(Q(austat_col__austat__austat_canwits__sermonbibranges__bibrangeverses__bkchvs__lte=einde))
-                collectionlist = [x.id for x in Collection.objects.filter(*lstQ).order_by('id').distinct()]
+                qBib = BibInterval.get_filter(start, einde, "austat_col__austat__austat_canwits__canwitbibranges__")
+                collectionlist = list(Collection.objects.filter(qBib).order_by('id').values_list('id', flat=True).distinct())
 
                 fields['bibrefbk'] = Q(id__in=collectionlist)
             
@@ -7693,83 +7593,34 @@ class BasketUpdate(BasicPart):
                     search_id = []
                     if search_s != None and search_s != "" and search_s[0] == "[":
                         search_id = json.loads(search_s)
-                    search_count = len(search_id)
-
-                    kwargs = {'profile': profile}
-
-                    # NOTE PROBLEM - we don't have the [oFields] at this point...
-
-                    # Action depends on the operation specified
-                    if search_count > 0 and operation == "create":
-                        # Remove anything there
-                        self.clsBasket.objects.filter(profile=profile).delete()
-                        # Add
-                        with transaction.atomic():
-                            for item in search_id:
-                                kwargs["{}_id".format(self.s_field)] = item
-                                self.clsBasket.objects.create(**kwargs)
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif search_count > 0  and operation == "add":
-                        # Add
-                        with transaction.atomic():
-                            for item in search_id:
-                                kwargs["{}_id".format(self.s_field)] = item
-                                obj = self.clsBasket.objects.filter(**kwargs).first()
-                                if obj == None:
-                                    self.clsBasket.objects.create(**kwargs)
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif search_count > 0  and operation == "remove":
-                        # Add
-                        with transaction.atomic():
-                            for item in search_id:
-                                kwargs["{}_id".format(self.s_field)] = item
-                                self.clsBasket.objects.filter(**kwargs).delete()
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif operation == "reset":
-                        # Remove everything from our basket
-                        self.clsBasket.objects.filter(profile=profile).delete()
-                        # Reset the history for this one
-                        profile.history(operation, self.colltype)
-
                 else:
-                    
-                    kwargs = {'profile': profile}
-
-                    # Action depends on the operation specified
-                    if qs and operation == "create":
-                        # Remove anything there
-                        self.clsBasket.objects.filter(profile=profile).delete()
-                        # Add
-                        with transaction.atomic():
-                            for item in qs:
-                                kwargs[self.s_field] = item
-                                self.clsBasket.objects.create(**kwargs)
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif qs and operation == "add":
-                        # Add
-                        with transaction.atomic():
-                            for item in qs:
-                                kwargs[self.s_field] = item
-                                self.clsBasket.objects.create(**kwargs)
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif qs and operation == "remove":
-                        # Add
-                        with transaction.atomic():
-                            for item in qs:
-                                kwargs[self.s_field] = item
-                                self.clsBasket.objects.filter(**kwargs).delete()
-                        # Process history
-                        profile.history(operation, self.colltype, oFields)
-                    elif operation == "reset":
-                        # Remove everything from our basket
-                        self.clsBasket.objects.filter(profile=profile).delete()
-                        # Reset the history for this one
-                        profile.history(operation, self.colltype)
+                    # NOTE PROBLEM - we don't have the [oFields] at this point...
+                    search_id = [] if not qs else list(qs.values_list('id', flat=True))
+                search_count = len(search_id)
+
+                # Action depends on the operation specified
+                # NOTE: no transaction around the chunks of a large basket, so that its progress can be followed
+                if search_count > 0 and operation == "create":
+                    # Replace the basket contents by the search results
+                    self.basket_reset(profile)
+                    self.basket_add(profile, search_id)
+                    # Process history
+                    profile.history(operation, self.colltype, oFields)
+                elif search_count > 0  and operation == "add":
+                    # Add what is not in the basket yet
+                    self.basket_add(profile, search_id)
+                    # Process history
+                    profile.history(operation, self.colltype, oFields)
+                elif search_count > 0  and operation == "remove":
+                    # Remove
+                    self.basket_remove(profile, search_id)
+                    # Process history
+                    profile.history(operation, self.colltype, oFields)
+                elif operation == "reset":
+                    # Remove everything from our basket
+                    self.basket_reset(profile)
+                    # Reset the history for this one
+                    profile.history(operation, self.colltype)
 
             elif operation in lst_basket_source:
                 # Queryset: the basket contents
@@ -7910,6 +7761,88 @@ class BasketUpdate(BasicPart):
         # Return the updated context
         return context
 
+    def get_progress(self, profile, total):
+        """Get a Status through which the progress on a large basket can be followed (or None)
+
+        The browser can poll it with sync_progress, using synctype 'basket_[colltype]'
+        """
+
+        oStatus = None
+        if total > BASKET_PROGRESS:
+            synctype = "basket_{}".format(self.colltype)
+            username = profile.user.username
+            Status.objects.filter(user=username, type=synctype).delete()
+            oStatus = Status.objects.create(user=username, type=synctype, status="working",
+                                            count=json.dumps(dict(done=0, total=total)))
+        return oStatus
+
+    def basket_add(self, profile, lst_id):
+        """Add the items with an id in [lst_id] to the basket of [profile], if they are not there yet"""
+
+        oErr = ErrHandle()
+        oStatus = None
+        count = 0
+        try:
+            field_id = "{}_id".format(self.s_field)
+            # (1) One lookup of what is already in the basket
+            existing = set(self.clsBasket.objects.filter(profile=profile).values_list(field_id, flat=True))
+            # (2) Keep the order of the search results, without doubles
+            lst_new = []
+            for item in lst_id:
+                if not item in existing:
+                    existing.add(item)
+                    lst_new.append(item)
+            # (3) Bulk create in chunks, reporting progress on large baskets
+            total = len(lst_new)
+            oStatus = self.get_progress(profile, total)
+            for start in range(0, total, BASKET_CHUNK):
+                lst_add = [self.clsBasket(profile=profile, **{field_id: item}) for item in lst_new[start:start+BASKET_CHUNK]]
+                self.clsBasket.objects.bulk_create(lst_add)
+                count += len(lst_add)
+                if oStatus != None:
+                    oStatus.set("working", dict(done=count, total=total))
+            if count > 0:
+                UserSearch.bump_model_version(self.clsBasket)
+            if oStatus != None:
+                oStatus.set("finished", dict(done=count, total=total))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("BasketUpdate/basket_add")
+            if oStatus != None:
+                oStatus.set("error", msg=msg)
+        return count
+
+    def basket_remove(self, profile, lst_id):
+        """Remove the items with an id in [lst_id] from the basket of [profile]"""
+
+        oErr = ErrHandle()
+        oStatus = None
+        count = 0
+        try:
+            field_id = "{}_id__in".format(self.s_field)
+            lst_id = list(set(lst_id))
+            total = len(lst_id)
+            oStatus = self.get_progress(profile, total)
+            for start in range(0, total, BASKET_CHUNK):
+                qs = self.clsBasket.objects.filter(profile=profile, **{field_id: lst_id[start:start+BASKET_CHUNK]})
+                count += qs.delete()[0]
+                if oStatus != None:
+                    oStatus.set("working", dict(done=min(start + BASKET_CHUNK, total), total=total))
+            if oStatus != None:
+                oStatus.set("finished", dict(done=total, total=total))
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("BasketUpdate/basket_remove")
+            if oStatus != None:
+                oStatus.set("error", msg=msg)
+        return count
+
+    def basket_reset(self, profile):
+        """Remove everything from the basket of [profile]"""
+
+        count = self.clsBasket.objects.filter(profile=profile).delete()[0]
+        return count
+
     def get_basketsize(self, profile):
         # Adapt the basket size
         basketsize = profile.basketitems.count()
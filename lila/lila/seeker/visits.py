@@ -0,0 +1,221 @@
+"""
+Write-behind log of the visits of users to the pages of the application.
+
+A page view only adds its visit to a buffer and keeps the breadcrumb stack of the user
+in the cache: it does not write to the database. The buffer is a Redis list when the
+cache is Redis (shared by all processes), and a list in memory otherwise.
+A background flusher regularly moves the buffered visits to the database in batches,
+stores the latest stack of each user in the Profile and trims overflowing visit logs.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+import atexit
+import json
+import threading
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Profile, Visit, get_current_datetime, VISIT_MAX, VISIT_REDUCE
+
+VISIT_FLUSH_SECONDS = 10    # Time between two flushes of the buffer by the background flusher
+VISIT_BATCH = 500           # Number of visits that are moved to the database in one batch
+VISIT_STACK_TIMEOUT = 86400 # Seconds that the breadcrumb stack of a user is kept in the cache
+
+
+class VisitLog(object):
+    """Buffer, stack cache and background flusher for the visits"""
+
+    buffer_key = "visit_buffer"
+    # Set [background] to False to only flush explicitly (e.g. in tests)
+    background = True
+
+    # The buffer that is used when there is no Redis
+    local = []
+    lock = threading.Lock()
+    timer = None
+    redis = False
+
+    def get_redis():
+        """Get a connection to Redis, if that is what the cache uses"""
+
+        if VisitLog.redis is False:
+            try:
+                from django_redis import get_redis_connection
+                VisitLog.redis = get_redis_connection("default")
+            except:
+                # No django_redis, or the cache is not a Redis cache
+                VisitLog.redis = None
+        return VisitLog.redis
+
+    def get_stack_key(username):
+        return "visit_stack_{}".format(username)
+
+    def get_stack(username):
+        """Get the breadcrumb stack of [username] from the cache (or None)"""
+
+        try:
+            return cache.get(VisitLog.get_stack_key(username))
+        except:
+            return None
+
+    def set_stack(username, lst_stack):
+        try:
+            cache.set(VisitLog.get_stack_key(username), lst_stack, VISIT_STACK_TIMEOUT)
+        except:
+            pass
+
+    def add(username, name, path, is_menu=False, **kwargs):
+        """Buffer one visit and adapt the stack of [username] in the cache"""
+
+        oErr = ErrHandle()
+        bBack = True
+        try:
+            # (1) Adapt the stack
+            lst_stack = VisitLog.get_stack(username)
+            if lst_stack is None:
+                lst_stack = Profile.get_stack(username)
+            lst_stack = Profile.get_visit_stack(lst_stack, name, path, is_menu, **kwargs)
+            VisitLog.set_stack(username, lst_stack)
+
+            # (2) Buffer the visit, together with the stack that results from it
+            sItem = json.dumps(dict(username=username, name=name, path=path, when=get_current_datetime().isoformat(), stack=lst_stack))
+            redis = VisitLog.get_redis()
+            if redis is None:
+                with VisitLog.lock:
+                    VisitLog.local.append(sItem)
+            else:
+                redis.rpush(VisitLog.buffer_key, sItem)
+
+            # (3) Make sure the buffer is flushed
+            if VisitLog.background:
+                VisitLog.start_flusher()
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("VisitLog/add")
+            bBack = False
+        return bBack
+
+    def take(size):
+        """Take at most [size] visits from the buffer"""
+
+        redis = VisitLog.get_redis()
+        if redis is None:
+            with VisitLog.lock:
+                lst_item = VisitLog.local[:size]
+                del VisitLog.local[:size]
+        else:
+            # LRANGE + LTRIM in one transaction, so that two flushers never take the same visits
+            pipe = redis.pipeline()
+            pipe.lrange(VisitLog.buffer_key, 0, size - 1)
+            pipe.ltrim(VisitLog.buffer_key, size, -1)
+            lst_item, _ = pipe.execute()
+        return [json.loads(x) for x in lst_item]
+
+    def put_back(lst_visit):
+        """Put the visits in [lst_visit] back at the front of the buffer, in their original order"""
+
+        lst_item = [json.dumps(x) for x in lst_visit]
+        redis = VisitLog.get_redis()
+        if redis is None:
+            with VisitLog.lock:
+                VisitLog.local[:0] = lst_item
+        else:
+            # LPUSH inserts one by one at the head, so push the last one first
+            redis.lpush(VisitLog.buffer_key, *reversed(lst_item))
+
+    def store(lst_visit):
+        """Move the visits in [lst_visit] to the database"""
+
+        # (1) The users involved
+        lst_username = list(set([x['username'] for x in lst_visit]))
+        oUser = {x.username: x.id for x in User.objects.filter(username__in=lst_username).only('id', 'username')}
+
+        with transaction.atomic():
+            # (2) The visits themselves
+            lst_add = []
+            oStack = {}
+            for oVisit in lst_visit:
+                user_id = oUser.get(oVisit['username'])
+                if not user_id is None:
+                    lst_add.append(Visit(user_id=user_id, name=oVisit['name'], path=oVisit['path'], when=parse_datetime(oVisit['when'])))
+                    # The last stack of each user is the one that counts
+                    oStack[user_id] = json.dumps(oVisit['stack'])
+            Visit.objects.bulk_create(lst_add, batch_size=VISIT_BATCH)
+
+            # (3) The stacks of the profiles (which are created when needed)
+            lst_profile = list(Profile.objects.filter(user_id__in=list(oStack.keys())).only('id', 'user_id', 'stack'))
+            lst_new = set(oStack.keys()) - set([x.user_id for x in lst_profile])
+            if len(lst_new) > 0:
+                Profile.objects.bulk_create([Profile(user_id=x, stack=oStack[x]) for x in lst_new])
+            lst_update = []
+            for profile in lst_profile:
+                if profile.stack != oStack[profile.user_id]:
+                    profile.stack = oStack[profile.user_id]
+                    lst_update.append(profile)
+            Profile.objects.bulk_update(lst_update, ['stack'], batch_size=250)
+
+            # (4) Throw away an overflow of visit logs
+            qs = Visit.objects.filter(user_id__in=list(oStack.keys())).values('user_id').annotate(count=Count('id'))
+            for item in qs.filter(count__gt=VISIT_MAX):
+                # Find the ID of the last one to remove
+                removing = item['count'] - VISIT_REDUCE
+                below_id = Visit.objects.filter(user_id=item['user_id']).order_by('id').values_list('id', flat=True)[removing]
+                Visit.objects.filter(user_id=item['user_id'], id__lte=below_id).delete()
+        return len(lst_add)
+
+    def flush():
+        """Move all buffered visits to the database; returns the number of stored visits"""
+
+        oErr = ErrHandle()
+        count = 0
+        try:
+            while True:
+                lst_visit = VisitLog.take(VISIT_BATCH)
+                if len(lst_visit) == 0:
+                    break
+                try:
+                    count += VisitLog.store(lst_visit)
+                except:
+                    # Do not lose the batch: the next flush tries again
+                    VisitLog.put_back(lst_visit)
+                    raise
+        except:
+            msg = oErr.get_error_message()
+            oErr.DoError("VisitLog/flush")
+        return count
+
+    def is_empty():
+        redis = VisitLog.get_redis()
+        if redis is None:
+            return len(VisitLog.local) == 0
+        return redis.llen(VisitLog.buffer_key) == 0
+
+    def start_flusher():
+        """Start the background flusher of this process, unless it is running already"""
+
+        with VisitLog.lock:
+            if VisitLog.timer is None:
+                VisitLog.timer = threading.Timer(VISIT_FLUSH_SECONDS, VisitLog.run_flusher)
+                VisitLog.timer.daemon = True
+                VisitLog.timer.start()
+
+    def run_flusher():
+        """Flush in the background thread, and keep on flushing as long as visits come in"""
+
+        try:
+            VisitLog.flush()
+        finally:
+            # The background thread has its own database connection
+            connection.close()
+            with VisitLog.lock:
+                VisitLog.timer = None
+        if not VisitLog.is_empty():
+            VisitLog.start_flusher()
+
+
+# Visits that are still in the memory of this process are stored when it stops
+atexit.register(VisitLog.flush)
@@ -6,6 +6,8 @@ from django.db import transaction
 from django.db.models import Q, Prefetch, Count, F
 from django.template.loader import render_to_string
 import pandas as pd 
+import numpy as np
+from scipy import sparse
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 import json
@@ -24,8 +26,9 @@ from lila.seeker.models import get_crpp_date, get_current_datetime, process_lib_
     Project, Basket, BasketMan, BasketAustat, Litref, LitrefMan, LitrefCol, Report, \
     Visit, Profile, Keyword, CanwitSignature, Status, Library, Collection, CollectionCanwit, \
     CollectionMan, Caned, UserKeyword, Template, ManuscriptCorpus, ManuscriptCorpusLock, \
-    AustatCorpus, AustatCorpusItem, \
+    AustatCorpus, AustatCorpusItem, AustatWords, ManuscriptAustats, \
    LINK_EQUAL, LINK_PRT, LINK_BIDIR, LINK_PARTIAL, STYPE_IMPORTED, STYPE_EDITED, LINK_UNSPECIFIED
+from lila.seeker.linkgraph import AustatLinkGraph
 from lila.stylo.corpus import Corpus
 from lila.stylo.analysis import bootstrapped_distance_matrices, hierarchical_clustering, distance_matrix
 
@@ -49,40 +52,54 @@ COMMON_NAMES = ["Actibus", "Adiubante", "Africa", "Amen", "Andreas", "Apostoloru
                 "Spiritu", "Spiritus", "Stephanus", "Testamenti", "Therasiae", "Thomam", "Thomas"]
 
 
-def get_ssg_corpus(profile, instance):
-    oErr = ErrHandle()
-    lock_status = "new"
-    ssg_corpus = None
-    try:
-        
-        # Set the lock, or return if we are busy with this ssg_corpus
-        ssg_corpus = AustatCorpus.objects.filter(profile=profile, ssg=instance).last()
-        if ssg_corpus != None:
-            lock_status = ssg_corpus.status
-            # Check the status
-            if lock_status == "busy":
-                # Already busy
-                return context
-        else:
-            # Need to create a lock
-            ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance)
-            lock_status = "busy"
-
-        # Save the status
-        ssg_corpus.status = lock_status
-        ssg_corpus.save()
+def get_ssg_corpus(instance):
+    """Get the corpus of SSGs that occur in the same manuscripts as [instance]
 
-        if lock_status == "new":
-            # Remove earlier corpora made by me based on this SSG
-            AustatCorpus.objects.filter(profile=profile, ssg=instance).delete()
+    Returns the dictionary with the SSG ids per manuscript and the list of corpus items
+    (code, author, scount and words of each SSG), both taken from the shared caches
+    """
 
-            # Create a new one
-            ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance, status="busy")
+    oErr = ErrHandle()
+    manu_set = {}
+    corpus = []
+    try:
+        # Get the 'manuscript-corpus': all manuscripts in which a canwit is that belongs to this SSG
+        manu_list = CanwitAustat.objects.filter(austat=instance, manu__isnull=False).values_list('manu_id', flat=True)
+        manu_set = ManuscriptAustats.get_sets(sorted(set(manu_list)))
 
+        # The corpus consists of the SSGs in these manuscripts
+        ssg_list_id = sorted(set(itertools.chain.from_iterable(manu_set.values())))
+        corpus = AustatWords.get_corpus(ssg_list_id)
     except:
         msg = oErr.get_error_message()
         oErr.DoError("get_ssg_corpus")       
-    return ssg_corpus, lock_status
+    return manu_set, corpus
+
+def get_cooccurrence(manu_set, lst_ssg_id):
+    """Count in how many manuscripts each pair of SSGs occurs together
+
+    @manu_set   - dictionary with the list of SSG ids per manuscript
+    @lst_ssg_id - the SSGs that take part
+
+    Returns the row and column (index in lst_ssg_id, row < column) and the count for every pair that co-occurs
+    """
+
+    # Build the sparse [manuscript x SSG] incidence matrix
+    ssg_index = {ssg_id: idx for idx, ssg_id in enumerate(lst_ssg_id)}
+    rows = []
+    cols = []
+    for row, ssg_list_id in enumerate(manu_set.values()):
+        for ssg_id in ssg_list_id:
+            col = ssg_index.get(ssg_id)
+            if not col is None:
+                rows.append(row)
+                cols.append(col)
+    incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                  shape=(len(manu_set), len(lst_ssg_id)))
+
+    # The [SSG x SSG] co-occurrence counts: each pair only once, ordered by row and column
+    cooccur = sparse.triu(incidence.T @ incidence, k=1, format="csr").tocoo()
+    return cooccur.row, cooccur.col, cooccur.data
 
 def get_ssg_lila(ssg_id, obj=None):
     oErr = ErrHandle()
@@ -137,17 +154,9 @@ class AustatOverlap(BasicPart):
     def add_to_context(self, context):
 
         oErr = ErrHandle()
-        spec_dict = {}
-        link_dict = {}
         graph_template = 'seeker/super_graph_hist.html'
 
         try:
-            # Define the linktype and spectype
-            for obj in FieldChoice.objects.filter(field="seeker.spectype"):
-                spec_dict[obj.abbr]= obj.english_name
-            for obj in FieldChoice.objects.filter(field="seeker.linktype"):
-                link_dict[obj.abbr]= obj.english_name
-
             # Need to figure out who I am
             profile = Profile.get_user_profile(self.request.user.username)
             instance = self.obj
@@ -157,45 +166,11 @@ class AustatOverlap(BasicPart):
             if isinstance(networkslider, str):
                 networkslider = int(networkslider)
 
-            # Initializations
-            ssg_link = {}
-            bUseDirectionality = True
-
-            # Read the table with links from SSG to SSG
-            eqg_link = AustatLink.objects.all().order_by('src', 'dst').values(
-                'src', 'dst', 'spectype', 'linktype', 'alternatives', 'note')
-            # Transform into a dictionary with src as key and list-of-dst as value
-            for item in eqg_link:
-                src = item['src']
-                dst = item['dst']
-                if bUseDirectionality:
-                    spectype = item['spectype']
-                    linktype = item['linktype']
-                    note = item['note']
-                    alternatives = item['alternatives']
-                    if alternatives == None: alternatives = False
-                    # Make room for the SRC if needed
-                    if not src in ssg_link: ssg_link[src] = []
-                    # Add this link to the list
-                    oLink = {   'dst': dst, 
-                                'note': note,
-                                'spectype': "", 
-                                'linktype': linktype,
-                                'spec': "",
-                                'link': link_dict[linktype],
-                                'alternatives': alternatives}
-                    if spectype != None:
-                        oLink['spectype'] = spectype
-                        oLink['spec'] = spec_dict[spectype]
-                    ssg_link[src].append(oLink)
-                else:
-                    # Make room for the SRC if needed
-                    if not src in ssg_link: ssg_link[src] = []
-                    # Add this link to the list
-                    ssg_link[src].append(dst)
+            # The links from SSG to SSG are shared by all requests
+            graph = AustatLinkGraph.get_graph()
 
             # Create the overlap network
-            node_list, link_list, hist_set, max_value, max_group = self.do_overlap(ssg_link, networkslider)
+            node_list, link_list, hist_set, max_value, max_group = self.do_overlap(graph, networkslider)
 
             # Create the buttons for the historical collections
             hist_list=[{'id': k, 'name': v} for k,v in hist_set.items()]
@@ -220,109 +195,53 @@ class AustatOverlap(BasicPart):
 
         return context
 
-    def do_overlap(self, ssg_link, degree):
-        """Calculate the overlap network up until 'degree'"""
-
-        def add_nodeset(ssg_id, group):
-            node_key = ssg_id
-
-            # ---------- DEBUG --------------
-            if node_key == 4968:
-                iStop = 1
-            # -------------------------------
-
-            # Possibly add the node to the set
-            if not node_key in node_set:
-                code_sig = get_ssg_sig(ssg_id)
-                ssg = Austat.objects.filter(id=ssg_id).first()
-                code_pas = get_ssg_lila(ssg_id, ssg)
-                scount = ssg.scount
+    def do_overlap(self, graph, degree):
+        """Calculate the overlap network up until 'degree'
 
-                # Get a list of the HCs that this SSG is part of
-                hc_list = ssg.collections.filter(settype="hc").values("id", "name")
-                hcs = []
-                for oItem in hc_list:
-                    id = oItem['id']
-                    if not id in hist_set:
-                        hist_set[id] = oItem['name']
-                    hcs.append(id)
+        The value of a link is the number of paths (of less than 'degree' steps) that reach its source;
+        the group of a node is one more than its distance from this SSG
+        """
 
-                node_value = dict(label=code_sig, id=ssg_id, group=group, 
-                                  lila=code_pas, scount=scount, hcs=hcs)
-                node_set[node_key] = node_value
-                
         node_list = []
         link_list = []
-        node_set = {}
-        link_set = {}
         hist_set = {}
         max_value = 0
         max_group = 1
         oErr = ErrHandle()
 
         try:
-            # Degree 0: direct contacts
             ssg_id = self.obj.id
 
-            ssg_queue = [ ssg_id ]
-            ssg_add = []
-            group = 1
-            degree -= 1
-            while len(ssg_queue) > 0 and degree >= 0:
-                # Get the next available node
-                node_key = ssg_queue.pop()
-
-                # Possibly add the node to the set
-                add_nodeset(node_key, group)
-
-                # Add links from this SSG to others
-                if node_key in ssg_link:
-                    dst_list = ssg_link[node_key]
-                    for oDst in dst_list:
-                        dst = oDst['dst']
-                        # Add this one to the add list
-                        ssg_add.append(dst)
-                        link_key = "{}_{}".format(node_key, dst)
-                        if not link_key in link_set:
-                            oLink = dict(source=node_key,
-                                         target=dst,
-                                         spectype=oDst['spectype'],
-                                         linktype=oDst['linktype'],
-                                         spec=oDst['spec'],
-                                         link=oDst['link'],
-                                         alternatives = oDst['alternatives'],
-                                         note=oDst['note'],
-                                         value=0)
-                            # Add the link to the set
-                            link_set[link_key] = oLink
-                            # Add the destination node to nodeset
-                            add_nodeset(dst, group + 1)
-
-                        # Increment the link value
-                        link_set[link_key]['value'] += 1
-
-                # Go to the next degree
-                if len(ssg_queue) == 0 and degree >= 0:
-                    # Decrement the degree
-                    degree -= 1
-
-                    group += 1
-                    # Add the items from ssg_add into the queue
-                    while len(ssg_add) > 0:
-                        ssg_queue.append(ssg_add.pop())
-
-
-            # Turn the sets into lists
-            node_list = [v for k,v in node_set.items()]
-            link_list = [v for k,v in link_set.items()]
-
-            # Calculate max_value
-            for oItem in link_list:
-                value = oItem['value']
-                if value > max_value: max_value = value
-            for oItem in node_list:
-                group = oItem['group']
+            # (1) Walk the graph: all levels at once
+            dist, value = graph.walk(ssg_id, degree)
+            lst_node = [(int(graph.ids[idx]), int(dist[idx]) + 1) for idx in np.flatnonzero(dist >= 0)]
+            if len(lst_node) == 0:
+                # This SSG has no links at all
+                lst_node = [(ssg_id, 1)]
+
+            # (2) The attributes of the nodes (a few queries for all of them)
+            oAustat, oHc = graph.get_nodes([x[0] for x in lst_node])
+            for node_id, group in lst_node:
+                ssg = oAustat.get(node_id)
+                if ssg is None:
+                    continue
+                hcs = []
+                for id, name in oHc.get(node_id, []):
+                    if not id in hist_set:
+                        hist_set[id] = name
+                    hcs.append(id)
+                # The label is the full key code, if there is one
+                code_sig = "ssg_{}".format(node_id) if ssg.keycodefull is None else ssg.keycodefull
+                node_list.append(dict(label=code_sig, id=node_id, group=group, 
+                                      lila=get_ssg_lila(node_id, ssg), scount=ssg.scount, hcs=hcs))
                 if group > max_group: max_group = group
+
+            # (3) The links that have been walked
+            for src, dst, link, link_value in graph.get_links(value):
+                oLink = dict(source=src, target=dst, value=link_value)
+                oLink.update(graph.get_link_attributes(link))
+                link_list.append(oLink)
+                if link_value > max_value: max_value = link_value
             
         except:
             msg = oErr.get_error_message()
@@ -356,36 +275,10 @@ class AustatTrans(BasicPart):
             if isinstance(networkslider, str):
                 networkslider = int(networkslider)
 
-            # Get the 'manuscript-corpus': all manuscripts in which a sermon is that belongs to the same SSG
-            manu_list = CanwitAustat.objects.filter(super=instance).distinct().values("manu_id")
-            manu_dict = {}
-            for idx, manu in enumerate(manu_list):
-                manu_dict[manu['manu_id']] = idx + 1
+            # Get the manuscripts with their SSGs and the corpus of SSGs from the shared caches
+            manu_set, ssg_corpus = get_ssg_corpus(instance)
 
-            ssg_corpus, lock_status = get_ssg_corpus(profile, instance)
-
-            if lock_status != "ready":
-
-                # Create an AustatCorpus based on the SSGs in these manuscripts
-                ssg_list = CanwitAustat.objects.filter(manu__id__in=manu_list).order_by(
-                    'austat_id').distinct().values('austat_id')
-                ssg_list_id = [x['austat_id'] for x in ssg_list]
-                with transaction.atomic():
-                    for ssg in Austat.objects.filter(id__in=ssg_list_id):
-                        # Get the name of the author
-                        authorname = "empty" if ssg.author==None else ssg.author.name
-                        # Get the scount
-                        scount = ssg.scount
-                        # Create new ssg_corpus item
-                        obj = AustatCorpusItem.objects.create(
-                            corpus=ssg_corpus, equal=ssg, 
-                            authorname=authorname, scount=scount)
-
-                # Add this list to the ssg_corpus
-                ssg_corpus.status = "ready"
-                ssg_corpus.save()
-
-            node_list, link_list, author_list, max_value = self.do_manu_method(ssg_corpus, manu_list, networkslider)
+            node_list, link_list, author_list, max_value = self.do_manu_method(ssg_corpus, manu_set, networkslider)
 
 
             # Add the information to the context in data
@@ -396,11 +289,6 @@ class AustatTrans(BasicPart):
                                    max_value=max_value,
                                    networkslider=networkslider,
                                    legend="SSG network")
-            
-            # Can remove the lock
-            ssg_corpus.status = "ready"
-            ssg_corpus.save()
-
 
         except:
             msg = oErr.get_error_message()
@@ -408,7 +296,7 @@ class AustatTrans(BasicPart):
 
         return context
 
-    def do_manu_method(self, ssg_corpus, manu_list, min_value):
+    def do_manu_method(self, ssg_corpus, manu_set, min_value):
         """Calculation like 'MedievalManuscriptTransmission' description
         
         The @min_value is the minimum link-value the user wants to see
@@ -432,8 +320,7 @@ class AustatTrans(BasicPart):
             title_set = {}      # Link from title to SSG_ID
 
             # Walk the ssg_corpus: each SSG is one 'text', having a title and a category (=author code)
-            for idx, item in enumerate(AustatCorpusItem.objects.filter(corpus=ssg_corpus).values(
-                'authorname', 'scount', 'equal__code', 'equal__id')):
+            for idx, item in enumerate(ssg_corpus):
                 # Determine the name for this row
                 category = item['authorname']
                 ssg_id = item['equal__id']
@@ -468,27 +355,15 @@ class AustatTrans(BasicPart):
             author_list = [dict(category=k, count=v) for k,v in author_dict.items()]
             author_list = sorted(author_list, key=lambda x: (-1 * x['count'], x['category'].lower()))
 
-            # Create a dictionary of manuscripts, each having a list of SSG ids
-            manu_set = {}
-            for manu_item in manu_list:
-                manu_id = manu_item["manu_id"]
-                # Get a list of all SSGs in this manuscript
-                ssg_list = CanwitAustat.objects.filter(manu__id=manu_id).order_by(
-                    'austat_id').distinct()
-                # Add the SSG id list to the manuset
-                manu_set[manu_id] = [x.austat for x in ssg_list]
-
-            # Create a list of edges based on the above
+            # Create a list of edges based on the dictionary of manuscripts, each having a list of SSG ids
             link_dict = {}
             for manu_id, ssg_list in manu_set.items():
                 # Only treat ssg_lists that are larger than 1
                 if len(ssg_list) > 1:
                     # itertool.combinations creates all combinations of SSG to SSG in one manuscript
                     for subset in itertools.combinations(ssg_list, 2):
-                        source = subset[0]
-                        target = subset[1]
-                        source_id = source.id
-                        target_id = target.id
+                        source_id = subset[0]
+                        target_id = subset[1]
                         link_code = "{}_{}".format(source_id, target_id)
                         if link_code in link_dict:
                             oLink = link_dict[link_code]
@@ -560,78 +435,10 @@ class AustatGraph(BasicPart):
             if isinstance(networkslider, str):
                 networkslider = int(networkslider)
 
-            # Get the 'manuscript-corpus': the manuscripts in which the same kind of sermon like me is
-            manu_list = CanwitAustat.objects.filter(super=instance).distinct().values("manu_id")
-            manu_dict = {}
-            for idx, manu in enumerate(manu_list):
-                manu_dict[manu['manu_id']] = idx + 1
-            author_dict = {}
-
-            lock_status = "new"
-            # Set the lock, or return if we are busy with this ssg_corpus
-            ssg_corpus = AustatCorpus.objects.filter(profile=profile, ssg=instance).last()
-            if ssg_corpus != None:
-                lock_status = ssg_corpus.status
-                # Check the status
-                if lock_status == "busy":
-                    # Already busy
-                    return context
-            else:
-                # Need to create a lock
-                ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance)
-                lock_status = "busy"
-
-            # Save the status
-            ssg_corpus.status = lock_status
-            ssg_corpus.save()
-
-            if lock_status == "new":
-                # Remove earlier corpora made by me based on this SSG
-                AustatCorpus.objects.filter(profile=profile, ssg=instance).delete()
-
-                # Create a new one
-                ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance, status="busy")
-
-            if lock_status != "ready":
-
-                # Create an AustatCorpus based on the SSGs in these manuscripts
-                ssg_list = CanwitAustat.objects.filter(manu__id__in=manu_list).order_by(
-                    'austat_id').distinct().values('austat_id')
-                ssg_list_id = [x['austat_id'] for x in ssg_list]
-                all_words = {}
-                with transaction.atomic():
-                    for ssg in Austat.objects.filter(id__in=ssg_list_id):
-                        # Add this item to the ssg_corpus
-                        latin = {}
-                        if ssg.incipit != None:
-                            for item in ssg.srchftext.replace(",", "").replace("…", "").split(" "): 
-                                add_to_dict(latin, item)
-                                add_to_dict(all_words, item)
-                        if ssg.explicit != None:
-                            for item in ssg.srchftrans.replace(",", "").replace("…", "").split(" "): 
-                                add_to_dict(latin, item)
-                                add_to_dict(all_words, item)
-                        # Get the name of the author
-                        authorname = "empty" if ssg.author==None else ssg.author.name
-                        # Get the scount
-                        scount = ssg.scount
-                        # Create new ssg_corpus item
-                        obj = AustatCorpusItem.objects.create(
-                            corpus=ssg_corpus, words=json.dumps(latin), equal=ssg, 
-                            authorname=authorname, scount=scount)
-
-                # What are the 100 MFWs in all_words?
-                mfw = [dict(word=k, count=v) for k,v in all_words.items()]
-                mfw_sorted = sorted(mfw, key = lambda x: -1 * x['count'])
-                mfw_cento = mfw_sorted[:100]
-                mfw = []
-                for item in mfw_cento: mfw.append(item['word'])
-                # Add this list to the ssg_corpus
-                ssg_corpus.mfw = json.dumps(mfw)
-                ssg_corpus.status = "ready"
-                ssg_corpus.save()
-
-            node_list, link_list, max_value = self.do_manu_method(ssg_corpus, manu_list, networkslider)
+            # Get the manuscripts with their SSGs and the corpus of SSGs from the shared caches
+            manu_set, ssg_corpus = get_ssg_corpus(instance)
+
+            node_list, link_list, max_value = self.do_manu_method(ssg_corpus, manu_set, networkslider)
 
 
             # Add the information to the context in data
@@ -641,11 +448,6 @@ class AustatGraph(BasicPart):
                                    max_value=max_value,
                                    networkslider=networkslider,
                                    legend="SSG network")
-            
-            # Can remove the lock
-            ssg_corpus.status = "ready"
-            ssg_corpus.save()
-
 
         except:
             msg = oErr.get_error_message()
@@ -653,7 +455,7 @@ class AustatGraph(BasicPart):
 
         return context
 
-    def do_manu_method(self, ssg_corpus, manu_list, min_value):
+    def do_manu_method(self, ssg_corpus, manu_set, min_value):
         """Calculation like Manuscript_Transmission_Of_se172
         
         The @min_value is the minimum link-value the user wants to see
@@ -663,32 +465,16 @@ class AustatGraph(BasicPart):
         link_list = []
         max_value = 0       # Maximum number of manuscripts in which an SSG occurs
         max_scount = 1      # Maximum number of sermons associated with one SSG
-        manu_count = []
-
-        def get_nodes(crp):
-            nodes = []
-            for idx, item in enumerate(crp.target_ints):
-                oNode = dict(group=item, author=crp.target_idx[item], id=crp.titles[idx])
-                nodes.append(oNode)
-            return nodes
 
         try:
-            # Create a pystyl-corpus object (see above)
-            sty_corpus = Corpus(texts=[], titles=[], target_ints=[], target_idx=[])
-
-            ssg_dict = {}
-            link_dict = {}
+            lst_ssg_id = []     # The SSGs that take part, in the order of the corpus
+            node_listT = []     # One node per SSG in [lst_ssg_id]
+            title_dict = {}     # Link from title to SSG_ID
+            group_dict = {}     # Link from category (=author) to group number
             scount_dict = {}
-            node_listT = []
-            link_listT = []
-
-            # Initialize manu_count: the number of SSG co-occurring in N manuscripts
-            for item in manu_list:
-                manu_count.append(0)
 
             # Walk the ssg_corpus: each SSG is one 'text', having a title and a category (=author code)
-            for idx, item in enumerate(AustatCorpusItem.objects.filter(corpus=ssg_corpus).values(
-                'words', 'authorname', 'scount', 'equal__code', 'equal__id')):
+            for idx, item in enumerate(ssg_corpus):
                 # Determine the name for this row
                 category = item['authorname']
                 code = item['equal__code']
@@ -696,85 +482,42 @@ class AustatGraph(BasicPart):
                     title = "eqg{}".format(item['equal__id'])
                 else:
                     title = code.split(" ")[1]
-                # The text = the words
-                text = " ".join(json.loads(item['words']))
                 
                 # the scount and store it in a dictionary
                 scount_dict[title] = item['scount']
                 if item['scount'] > max_scount:
                     max_scount = item['scount']
 
-                # Add the text to the corpus
-                if title in sty_corpus.titles:
-                    ssg_id = -1
-                    bFound = False
-                    for k,v in ssg_dict.items():
-                        if v == title:
-                            ssg_id = k
-                            bFound = True
-                            break
+                if title in title_dict:
                     oErr.Status("AustatGraph/do_manu_method: attempt to add same title '{}' for {} and {}".format(
-                        title, ssg_id, item['equal__id']))
+                        title, title_dict[title], item['equal__id']))
                 else:
-                    # Also make sure to buidl an SSG-dictionary
-                    ssg_dict[item['equal__id']] = title
+                    title_dict[title] = item['equal__id']
+                    if not category in group_dict:
+                        group_dict[category] = len(group_dict)
+                    lst_ssg_id.append(item['equal__id'])
+                    node_listT.append(dict(group=group_dict[category], author=category, id=title))
 
-                    sty_corpus.add_text(text, title, category)
+            # Count the manuscripts in which each pair of SSGs occurs together
+            rows, cols, values = get_cooccurrence(manu_set, lst_ssg_id)
+            if len(values) > 0:
+                max_value = int(values.max())
 
-            # Get a list of nodes
-            node_listT = get_nodes(sty_corpus)
-
-            # Walk the manuscripts
-            for manu_item in manu_list:
-                manu_id = manu_item["manu_id"]
-                # Get a list of all SSGs in this manuscript
-                ssg_list = CanwitAustat.objects.filter(manu__id=manu_id).order_by(
-                    'austat_id').distinct().values('austat_id')
-                ssg_list_id = [x['austat_id'] for x in ssg_list]
-                # evaluate links between a source and target SSG
-                for idx_s, source_id in enumerate(ssg_list_id):
-                    # sanity check
-                    if source_id in ssg_dict:
-                        # Get the title of the source
-                        source = ssg_dict[source_id]
-                        for idx_t in range(idx_s+1, len(ssg_list_id)-1):
-                            target_id = ssg_list_id[idx_t]
-                            # Double check
-                            if target_id in ssg_dict:
-                                # Get the title of the target
-                                target = ssg_dict[target_id]
-                                # Retrieve or create a link from the link_listT
-                                link_code = "{}_{}".format(source_id, target_id)
-                                if link_code in link_dict:
-                                    oLink = link_listT[link_dict[link_code]]
-                                else:
-                                    oLink = dict(source=source, source_id=source_id,
-                                                 target=target, target_id=target_id,
-                                                 value=0)
-                                    link_listT.append(oLink)
-                                    link_dict[link_code] = len(link_listT) - 1
-                                # Now add to the value
-                                oLink['value'] += 1
-                                if oLink['value'] > max_value:
-                                    max_value = oLink['value']
-            
             # Only accept the links that have a value >= min_value
-            node_dict = []
-            for oItem in link_listT:
-                if oItem['value'] >= min_value:
-                    link_list.append(copy.copy(oItem))
-                    # Take note of the nodes
-                    src = oItem['source']
-                    dst = oItem['target']
-                    if not src in node_dict: node_dict.append(src)
-                    if not dst in node_dict: node_dict.append(dst)
-            # Walk the nodes
-            for oItem in node_listT:
-                if oItem['id'] in node_dict:
-                    oItem['scount'] = 100 * scount_dict[oItem['id']] / max_scount
-                    node_list.append(copy.copy(oItem))
+            keep = (values >= min_value)
+            rows = rows[keep]
+            cols = cols[keep]
+            for row, col, value in zip(rows.tolist(), cols.tolist(), values[keep].tolist()):
+                link_list.append(dict(source=node_listT[row]['id'], source_id=lst_ssg_id[row],
+                                      target=node_listT[col]['id'], target_id=lst_ssg_id[col],
+                                      value=value))
+
+            # Walk the nodes that take part in a link
+            for idx in np.union1d(rows, cols).tolist():
+                oItem = copy.copy(node_listT[idx])
+                oItem['scount'] = 100 * scount_dict[oItem['id']] / max_scount
+                node_list.append(oItem)
 
- 
         except:
             msg = oErr.get_error_message()
             oErr.DoError("do_hier_method1")
@@ -811,73 +554,8 @@ class AustatPca(BasicPart):
             profile = Profile.get_user_profile(self.request.user.username)
             instance = self.obj
 
-            # Get the 'manuscript-corpus': the manuscripts in which the same kind of sermon like me is
-            manu_list = CanwitAustat.objects.filter(super=instance).distinct().values("manu_id")
-            manu_dict = {}
-            for idx, manu in enumerate(manu_list):
-                manu_dict[manu['manu_id']] = idx + 1
-            author_dict = {}
-
-            lock_status = "new"
-            # Set the lock, or return if we are busy with this ssg_corpus
-            ssg_corpus = AustatCorpus.objects.filter(profile=profile, ssg=instance).last()
-            if ssg_corpus != None:
-                lock_status = ssg_corpus.status
-                # Check the status
-                if lock_status == "busy":
-                    # Already busy
-                    return context
-            else:
-                # Need to create a lock
-                ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance)
-                lock_status = "busy"
-
-            # Save the status
-            ssg_corpus.status = lock_status
-            ssg_corpus.save()
-
-            if lock_status == "new":
-                # Remove earlier corpora made by me based on this SSG
-                AustatCorpus.objects.filter(profile=profile, ssg=instance).delete()
-
-                # Create a new one
-                ssg_corpus = AustatCorpus.objects.create(profile=profile, ssg=instance, status="busy")
-
-            if lock_status != "ready":
-
-                # Create an AustatCorpus based on the SSGs in these manuscripts
-                ssg_list = CanwitAustat.objects.filter(manu__id__in=manu_list).order_by(
-                    'austat_id').distinct().values('austat_id')
-                ssg_list_id = [x['austat_id'] for x in ssg_list]
-                all_words = {}
-                with transaction.atomic():
-                    for ssg in Austat.objects.filter(id__in=ssg_list_id):
-                        # Add this item to the ssg_corpus
-                        latin = {}
-                        if ssg.incipit != None:
-                            for item in ssg.srchftext.replace(",", "").replace("…", "").split(" "): 
-                                add_to_dict(latin, item)
-                                add_to_dict(all_words, item)
-                        if ssg.explicit != None:
-                            for item in ssg.srchftrans.replace(",", "").replace("…", "").split(" "): 
-                                add_to_dict(latin, item)
-                                add_to_dict(all_words, item)
-                        # Get the name of the author
-                        authorname = "empty" if ssg.author==None else ssg.author.name
-                        # Create new ssg_corpus item
-                        obj = AustatCorpusItem.objects.create(
-                            corpus=ssg_corpus, words=json.dumps(latin), equal=ssg, authorname=authorname)
-
-                # What are the 100 MFWs in all_words?
-                mfw = [dict(word=k, count=v) for k,v in all_words.items()]
-                mfw_sorted = sorted(mfw, key = lambda x: -1 * x['count'])
-                mfw_cento = mfw_sorted[:100]
-                mfw = []
-                for item in mfw_cento: mfw.append(item['word'])
-                # Add this list to the ssg_corpus
-                ssg_corpus.mfw = json.dumps(mfw)
-                ssg_corpus.status = "ready"
-                ssg_corpus.save()
+            # Get the corpus of SSGs from the shared caches
+            manu_set, ssg_corpus = get_ssg_corpus(instance)
 
             node_list, link_list, max_value = self.do_hier_method3(ssg_corpus, names_list)
 
@@ -888,10 +566,6 @@ class AustatPca(BasicPart):
                                    watermark=get_watermark(),
                                    max_value=max_value,
                                    legend="SSG network")
-            
-            # Can remove the lock
-            ssg_corpus.status = "ready"
-            ssg_corpus.save()
 
         except:
             msg = oErr.get_error_message()
@@ -948,8 +622,7 @@ class AustatPca(BasicPart):
             ssg_dict = {}
 
             # Walk the ssg_corpus: each SSG is one 'text', having a title and a category (=author code)
-            for idx, item in enumerate(AustatCorpusItem.objects.filter(corpus=ssg_corpus).values(
-                'words', 'authorname', 'equal__code', 'equal__id')):
+            for idx, item in enumerate(ssg_corpus):
                 # Determine the name for this row
                 category = item['authorname']
                 code = item['equal__code']
@@ -958,10 +631,10 @@ class AustatPca(BasicPart):
                 else:
                     title = code.split(" ")[1]
                 # The text = the words
-                text = " ".join(json.loads(item['words']))
+                text = " ".join(item['words'])
 
                 # Add the text to the corpus
-                if title in sty_corpus.titles:
+                if sty_corpus.has_title(title):
                     ssg_id = -1
                     bFound = False
                     for k,v in ssg_dict.items():
@@ -0,0 +1,277 @@
+"""
+Incremental synchronisation of the Litref table with the shared Zotero library.
+
+The Zotero Web API (v3) tells the version of the library with each response.
+That version is stored after a successful synchronisation, and the next one only asks
+for the items that have changed since then (parameter 'since'). The pages of items are
+fetched concurrently by a small pool of threads; each page is handled with one query
+for the existing Litref objects, one bulk_create and one bulk_update.
+
+The endpoint can be pointed to a local stand-in of the API (see ZoteroFixtureServer),
+so that the synchronisation can be tested offline.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import transaction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import math
+import requests
+import threading
+import time
+
+# ======= imports from my own application ======
+from lila.utils import ErrHandle
+from lila.seeker.models import Information, Litref, get_current_datetime
+
+ZOTERO_ENDPOINT = "https://api.zotero.org"
+ZOTERO_PAGE_SIZE = 100      # The maximum number of items per request that the API allows
+ZOTERO_WORKERS = 4          # Number of pages that are fetched at the same time
+ZOTERO_RETRIES = 3          # Number of attempts for one page when the server asks to back off
+ZOTERO_TIMEOUT = 30         # Seconds to wait for a response
+
+
+class ZoteroSync(object):
+    """Synchronise Litref with (the changes in) a Zotero library"""
+
+    fields = ['data', 'short', 'full', 'year', 'saved']
+
+    def __init__(self, libid, apikey, libtype="group", endpoint=None, workers=ZOTERO_WORKERS, page_size=ZOTERO_PAGE_SIZE):
+        if endpoint is None or endpoint == "":
+            endpoint = ZOTERO_ENDPOINT
+        self.url = "{}/{}s/{}/items".format(endpoint.rstrip("/"), libtype, libid)
+        self.headers = {'Zotero-API-Version': "3"}
+        if not apikey is None and apikey != "":
+            self.headers['Zotero-API-Key'] = apikey
+        self.workers = workers
+        self.page_size = page_size
+        # Each thread has its own HTTP session
+        self.local = threading.local()
+
+    def get_session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self.local.session = session
+        return session
+
+    def get_page(self, start, since=0, if_version=None):
+        """Fetch one page of the items changed after library version [since]
+
+        Returns a tuple (items, total, version); items is None if nothing changed after [if_version]
+        """
+
+        params = dict(format="json", start=start, limit=self.page_size, since=since)
+        headers = {}
+        if not if_version is None:
+            headers['If-Modified-Since-Version'] = str(if_version)
+        for attempt in range(ZOTERO_RETRIES):
+            response = self.get_session().get(self.url, params=params, headers=headers, timeout=ZOTERO_TIMEOUT)
+            if response.status_code in [429, 503] and attempt < ZOTERO_RETRIES - 1:
+                # The server asks us to wait a little while
+                time.sleep(float(response.headers.get("Retry-After", 1 + attempt)))
+                continue
+            break
+        version = int(response.headers.get("Last-Modified-Version", 0))
+        if response.status_code == 304:
+            return None, 0, version
+        response.raise_for_status()
+        total = int(response.headers.get("Total-Results", 0))
+        return response.json(), total, version
+
+    def update_page(self, lst_item, force=False):
+        """Store one page of Zotero items: returns the number of (additions, changes)"""
+
+        now = get_current_datetime()
+        oItem = {item['key']: item['data'] for item in lst_item}
+        # (1) The Litref objects that exist already (one query)
+        oLitref = {obj.itemid: obj for obj in Litref.objects.filter(itemid__in=list(oItem.keys()))}
+        lst_add = []
+        lst_update = []
+        for itemid, oData in oItem.items():
+            sData = json.dumps(oData)
+            obj = oLitref.get(itemid)
+            if obj is None:
+                # (2) A new item
+                obj = Litref(itemid=itemid, data=sData, saved=now)
+                obj.read_zotero(data=oData, save=False)
+                lst_add.append(obj)
+            elif force or obj.short == "" or obj.data != sData:
+                # (3) An item that needs processing
+                obj.data = sData
+                obj.read_zotero(data=oData, save=False)
+                obj.saved = now
+                lst_update.append(obj)
+        with transaction.atomic():
+            Litref.objects.bulk_create(lst_add, batch_size=ZOTERO_PAGE_SIZE)
+            Litref.objects.bulk_update(lst_update, self.fields, batch_size=ZOTERO_PAGE_SIZE)
+        return len(lst_add), len(lst_update)
+
+    def update_incomplete(self):
+        """Process the Litref objects that have data, but that have no short or full reference yet"""
+
+        now = get_current_datetime()
+        lst_update = []
+        qs = Litref.objects.filter(short="", full="").exclude(data="")
+        for obj in qs.iterator():
+            oData = json.loads(obj.data)
+            if oData.get('itemType') in Litref.ok_types:
+                obj.read_zotero(data=oData, save=False)
+                obj.saved = now
+                lst_update.append(obj)
+        Litref.objects.bulk_update(lst_update, self.fields, batch_size=ZOTERO_PAGE_SIZE)
+        return len(lst_update)
+
+    def sync(self, since=0, force=False, oStatus=None):
+        """Fetch and store all items that changed after library version [since]
+
+        Returns an object with the counts and the library 'version' that has been reached
+        """
+
+        oErr = ErrHandle()
+        oBack = dict(status="ok", msg="", since=since, changes=0, additions=0)
+
+        # (1) Process what has not been completely processed before
+        oBack['total'] = "Checking for literature references that have not been completely processed..."
+        if oStatus != None: oStatus.set("ok", oBack)
+        oBack['processed'] = self.update_incomplete()
+
+        # (2) The first page tells how many items have changed (if any)
+        lst_item, total, version = self.get_page(0, since, None if force else since)
+        oBack['version'] = version
+        if lst_item is None:
+            total = 0
+        oBack['total'] = "There are {} changed references in the lila Zotero library".format(total)
+        if oStatus != None: oStatus.set("ok", oBack)
+        total_groups = math.ceil(total / self.page_size)
+
+        if total_groups > 0:
+            additions, changes = self.update_page(lst_item, force)
+            oBack['additions'] += additions
+            oBack['changes'] += changes
+            done = 1
+
+            # (3) The other pages are fetched concurrently, but stored one by one
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                lst_future = [pool.submit(self.get_page, grp_num * self.page_size, since) for grp_num in range(1, total_groups)]
+                for future in as_completed(lst_future):
+                    lst_item, total_page, version_page = future.result()
+                    if version_page != version:
+                        # The library has changed in the meantime, so pages may have shifted:
+                        #   the next synchronisation starts from [since] again
+                        oBack['version'] = since
+                    additions, changes = self.update_page(lst_item, force)
+                    oBack['additions'] += additions
+                    oBack['changes'] += changes
+                    done += 1
+                    # Show where we are
+                    oErr.Status("Sync zotero {}/{}".format(done, total_groups))
+                    oBack['group'] = "Group {}/{}".format(done, total_groups)
+                    if oStatus != None: oStatus.set("ok", oBack)
+        return oBack
+
+
+class ZoteroFixtureHandler(BaseHTTPRequestHandler):
+    """Answer the item requests of ZoteroSync from the items of the server"""
+
+    def do_GET(self):
+        server = self.server
+        oUrl = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(oUrl.query).items()}
+        server.requests.append(dict(path=oUrl.path, params=params))
+        if not oUrl.path.endswith("/items"):
+            self.send_error(404)
+            return
+        since = int(params.get("since", 0))
+        start = int(params.get("start", 0))
+        limit = int(params.get("limit", 25))
+        if_version = self.headers.get("If-Modified-Since-Version")
+        if not if_version is None and int(if_version) >= server.version:
+            self.send_response(304)
+            self.send_header("Last-Modified-Version", str(server.version))
+            self.end_headers()
+            return
+        lst_item = [x for x in server.items if x['version'] > since]
+        sBody = json.dumps(lst_item[start:start+limit]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(sBody)))
+        self.send_header("Total-Results", str(len(lst_item)))
+        self.send_header("Last-Modified-Version", str(server.version))
+        self.end_headers()
+        self.wfile.write(sBody)
+
+    def log_message(self, format, *args):
+        # Keep quiet
+        pass
+
+
+class ZoteroFixtureServer(object):
+    """Local stand-in for the items part of the Zotero Web API
+
+    The items are a list of objects with 'key', 'version' and 'data', as the API returns them.
+    A set of items can be recorded from a real library with record(), saved as JSON and replayed
+    with load(). Each request is kept in [requests], so that tests can check what was asked.
+    """
+
+    def __init__(self, items=None, port=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), ZoteroFixtureHandler)
+        self.httpd.items = []
+        self.httpd.version = 0
+        self.httpd.requests = []
+        self.thread = None
+        if not items is None:
+            self.set_items(items)
+
+    def set_items(self, items):
+        """Replace the items; the library version is that of the most recent item"""
+
+        self.httpd.items = sorted(items, key=lambda x: x['version'])
+        self.httpd.version = max([x['version'] for x in items], default=0)
+
+    def change_item(self, key, data):
+        """Change (or add) one item, which raises the library version"""
+
+        version = self.httpd.version + 1
+        items = [x for x in self.httpd.items if x['key'] != key]
+        items.append(dict(key=key, version=version, data=dict(data, key=key, version=version)))
+        self.set_items(items)
+        return version
+
+    def load(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            self.set_items(json.load(f))
+
+    def record(sync, path):
+        """Save all items of the library of [sync] (a ZoteroSync) in a file that load() can replay"""
+
+        items = []
+        start = 0
+        while True:
+            lst_item, total, version = sync.get_page(start)
+            items.extend([dict(key=x['key'], version=x['version'], data=x['data']) for x in lst_item])
+            start += sync.page_size
+            if start >= total:
+                break
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(items, f, indent=2)
+        return len(items)
+
+    @property
+    def endpoint(self):
+        return "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -43,6 +43,9 @@ MEDIA_DIR = os.path.abspath(os.path.join(WRITABLE_DIR, "../media/"))
 
 APP_PREFIX = ""
 USE_REDIS = False
+# Imports and synchronisations run as background jobs: only switch this on where a
+#   'manage.py run_jobs' service is running, since queued jobs otherwise wait forever
+USE_JOBS = False
 ADMIN_SITE_URL = ""
 if "d:" in WRITABLE_DIR or "D:" in WRITABLE_DIR or "c:" in WRITABLE_DIR or "C:" in WRITABLE_DIR or bUseTunnel:
     APP_PREFIX = ""
@@ -4,13 +4,96 @@ import sys
 from tempfile import mkdtemp
 
 import numpy as np
-from sklearn.decomposition import PCA
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, svds
+from sklearn.decomposition import PCA, TruncatedSVD
 from sklearn.manifold import TSNE
 from sklearn.metrics.pairwise import pairwise_distances
+from sklearn.utils.extmath import svd_flip
 
-from . distance_metrics import minmax
+from . distance_metrics import minmax, pairwise_distance_matrix, METRICS
 from . clustering.cluster import VNClusterer, Clusterer
 
+# Sparse input for t-SNE is first reduced to this nb of dimensions
+TSNE_PCA_DIMENSIONS = 50
+
+def sparse_pca(X, nb_dimensions=2, random_state=1985):
+    """
+    Principal Components Analysis of a sparse matrix,
+    without densifying it: the column means are
+    subtracted implicitly, inside the matrix products
+    of a truncated SVD (ARPACK).
+    Parameters
+    ----------
+    X : sparse matrix, [n_texts, n_features]
+        The vectorized texts.
+    nb_dimensions : int, default=2
+        The nb of components desired.
+    Returns
+    ----------
+    (pca_matrix, pca_loadings): tuple
+        As returned by `pca`.
+    """
+    X = sp.csr_matrix(X, dtype=np.float64)
+    if nb_dimensions >= min(X.shape):
+        # ARPACK needs fewer components than texts and features: 
+        # with that few texts (or features) the dense matrix is small
+        prin_comp = PCA(n_components=nb_dimensions)
+        pca_matrix = prin_comp.fit_transform(X.toarray())
+        return pca_matrix, prin_comp.components_.transpose()
+    mean = np.asarray(X.mean(axis=0)).ravel()
+    ones = np.ones(X.shape[0])
+
+    def matvec(v):
+        v = np.asarray(v).ravel()
+        return X @ v - ones * (mean @ v)
+
+    def rmatvec(v):
+        v = np.asarray(v).ravel()
+        return X.T @ v - mean * v.sum()
+
+    def matmat(V):
+        return X @ V - np.outer(ones, mean @ V)
+
+    def rmatmat(V):
+        return X.T @ V - np.outer(mean, V.sum(axis=0))
+
+    X_centered = LinearOperator(X.shape, matvec=matvec, rmatvec=rmatvec,
+                                matmat=matmat, rmatmat=rmatmat, dtype=np.float64)
+    U, S, Vt = svds(X_centered, k=nb_dimensions, random_state=random_state)
+    # svds returns the components in ascending order of importance
+    order = np.argsort(S)[::-1]
+    U, S, Vt = U[:, order], S[order], Vt[order]
+    U, Vt = svd_flip(U, Vt)
+    return U * S, Vt.transpose()
+
+def truncated_svd(corpus, nb_dimensions=2, random_state=1985):
+    """
+    Apply dimension reduction to the vectorized
+    texts in the corpus, using a randomized truncated
+    SVD (also known as LSA). Unlike PCA, the data are
+    not centered, so that sparse input stays sparse.
+    Parameters
+    ----------
+    corpus : string, default=None
+        The corpus to be analyzed.
+        Expects that the corpus has been vectorized.
+    nb_dimensions : int, default=2
+        The nb of components desired.
+    Returns
+    ----------
+    (svd_matrix, svd_loadings): tuple
+        As returned by `pca`.
+    """
+    try:
+        X = corpus.vectorizer.X
+    except AttributeError:
+        ValueError('Your corpus does not seem to have been vectorized yet.')
+    svd = TruncatedSVD(n_components=nb_dimensions, algorithm='randomized', random_state=random_state)
+    svd_matrix = svd.fit_transform(X)
+    svd_loadings = svd.components_.transpose()
+    return svd_matrix, svd_loadings
+
 def pca(corpus, nb_dimensions=2):
     """
     Apply dimension reduction to the vectorized
@@ -36,12 +119,12 @@ def pca(corpus, nb_dimensions=2):
         X = corpus.vectorizer.X
     except AttributeError:
         ValueError('Your corpus does not seem to have been vectorized yet.')
-    prin_comp = PCA(n_components=nb_dimensions)
-    try:
-        pca_matrix = prin_comp.fit_transform(X.toarray()) # unsparsify
-    except AttributeError:
-        pca_matrix = prin_comp.fit_transform(X) # input not sparse
+    if sp.issparse(X):
+        # sparse input is not densified
+        return sparse_pca(X, nb_dimensions=nb_dimensions)
 
+    prin_comp = PCA(n_components=nb_dimensions)
+    pca_matrix = prin_comp.fit_transform(X) # input not sparse
     pca_loadings = prin_comp.components_.transpose()
     return pca_matrix, pca_loadings
 
@@ -73,10 +156,14 @@ def tsne(corpus, nb_dimensions=2):
     except AttributeError:
         ValueError('Your corpus does not seem to have been vectorized yet.')
     tsne = TSNE(n_components=nb_dimensions)
-    try:
-        return tsne.fit_transform(X.toarray()) # unsparsify
-    except AttributeError:
-        return tsne.fit_transform(X) # input already sparse
+    if sp.issparse(X):
+        # reduce sparse input with PCA first, instead of densifying all features
+        nb_reduced = min(TSNE_PCA_DIMENSIONS, min(X.shape) - 1)
+        if nb_reduced < X.shape[1]:
+            X, loadings = sparse_pca(X, nb_dimensions=nb_reduced)
+        else:
+            X = X.toarray()
+    return tsne.fit_transform(X)
 
 def distance_matrix(corpus=None, X=None, metric='manhattan'):
     """
@@ -91,7 +178,7 @@ def distance_matrix(corpus=None, X=None, metric='manhattan'):
         The distance metric to be used for the pairwise
         distance calculations. Currently supports:
         'manhattan', 'cityblock', 'euclidean',
-        'cosine', 'minmax'.
+        'cosine', 'minmax', 'burrows'.
     Returns
     ----------
     distance_matrix : 2D-array, [n_texts, n_texts]
@@ -108,27 +195,21 @@ def distance_matrix(corpus=None, X=None, metric='manhattan'):
       (at NAACL HLT 2015), 2015.
     - Koppel et al., Determining if two documents are written by
       the same author, JASIST 2014 (minmax in particular).
+    The distances are calculated in blocks of rows by
+    `distance_metrics.pairwise_distance_matrix`; large
+    sparse input is not densified.
     """
 
-    if not metric in ('manhattan', 'cityblock', 'euclidean', 'cosine', 'minmax'):
+    if not metric in METRICS:
         raise ValueError('Unsupported distance metric: %s' %(metric))
 
-    # we unsparsify here to make it easier for contributors
-    # to add distance functions (in `pystyl.distance_metrics.py`).
     if corpus:     
         try:
             X = corpus.vectorizer.X
-            try:
-                X = X.toarray()
-            except AttributeError:
-                pass
         except AttributeError:
             ValueError('Your corpus does not seem to have been vectorized yet.')
 
-    if metric == 'minmax':
-        return pairwise_distances(X, metric=minmax)
-    else:
-        return pairwise_distances(X, metric=metric)
+    return pairwise_distance_matrix(X, metric=metric)
 
 def hierarchical_clustering(distance_matrix, linkage, verbose=0):
     """
@@ -184,10 +265,9 @@ def bootstrapped_distance_matrices(corpus, n_iter=100, random_prop=0.50,
     dms = []
     try:
         X = corpus.vectorizer.X
-        try:
-            X = X.toarray()
-        except AttributeError:
-            pass
+        if sp.issparse(X):
+            # column selection below is done on the sparse matrix
+            X = sp.csc_matrix(X)
     except AttributeError:
         ValueError('Your corpus does not seem to have been vectorized yet.')
     full_size = X.shape[1]
@@ -0,0 +1,147 @@
+"""
+Benchmarks of the stylometry code.
+
+The 'distance' task compares the blocked distance matrix engine
+(`distance_metrics.pairwise_distance_matrix`) with the previous path,
+which densified the matrix and called sklearn's `pairwise_distances`
+with the pure-Python `minmax` as metric.
+
+Usage:  python -m lila.stylo.benchmark [--sizes 500 2000 10000] [--features 200]
+                                       [--metric minmax] [--old-max 500]
+
+The previous path is quadratic in interpreted Python: above --old-max texts
+its time is estimated from the largest size that was measured.
+
+The 'memory' task compares the peak memory (measured with tracemalloc) of the
+'tf_std' vectorization followed by PCA, with the sparse StdDevScaler and sparse
+PCA, against the previous path that densified the matrix in both steps.
+
+Usage:  python -m lila.stylo.benchmark --task memory [--sizes 1000 4000] [--features 10000]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import PCA
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import pairwise_distances
+
+from lila.stylo.distance_metrics import minmax, pairwise_distance_matrix, METRICS
+from lila.stylo.vectorization import Vectorizer
+from lila.stylo.analysis import sparse_pca
+
+
+def make_matrix(n_texts, n_features, density=0.3, random_state=1985):
+    """Random sparse tf-like matrix: a fraction [density] of the features occurs in a text"""
+    rng = np.random.RandomState(random_state)
+    X = sp.random(n_texts, n_features, density=density, format='csr', random_state=rng)
+    X.data = np.round(X.data * 20.0) / 1000.0
+    return X
+
+def old_distance_matrix(X, metric):
+    """The previous implementation of `analysis.distance_matrix`"""
+    X = X.toarray()
+    if metric == 'minmax':
+        return pairwise_distances(X, metric=minmax)
+    return pairwise_distances(X, metric=metric)
+
+def make_texts(n_texts, n_vocabulary, n_words=400, random_state=1985):
+    """Random tokenized texts, with a Zipfian distribution over a vocabulary of [n_vocabulary] words"""
+    rng = np.random.RandomState(random_state)
+    vocabulary = np.array(["w{}".format(i) for i in range(n_vocabulary)])
+    prob = 1.0 / np.arange(1, n_vocabulary + 1)
+    prob /= prob.sum()
+    return [list(vocabulary[rng.choice(n_vocabulary, size=n_words, p=prob)]) for i in range(n_texts)]
+
+def old_vectorize_pca(texts, mfi):
+    """The previous 'tf_std' vectorization and PCA, which both densified the matrix"""
+    v = TfidfVectorizer(max_features=mfi, tokenizer=lambda y: y, token_pattern=None,
+                        lowercase=False, use_idf=False)
+    X = v.fit_transform(texts)
+    weights = np.std(X.toarray(), axis=0)
+    X = X.toarray()
+    X /= weights
+    X = sp.csr_matrix(X)
+    return PCA(n_components=2).fit_transform(X.toarray())
+
+def new_vectorize_pca(texts, mfi):
+    """The sparse 'tf_std' vectorization and PCA"""
+    v = Vectorizer(mfi=mfi, ngram_type='word', vector_space='tf_std')
+    X = v.fit_transform(texts)
+    pca_matrix, pca_loadings = sparse_pca(X, nb_dimensions=2)
+    return pca_matrix
+
+def measure(fn, *args):
+    """Run [fn] and return its result, the time and the peak of the traced memory in MB"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024.0 * 1024.0)
+
+def main_memory(args):
+    print("vectorization 'tf_std' + PCA, features (mfi)={}".format(args.features))
+    print("{:>8} {:>10} {:>12} {:>14} {:>14}".format("texts", "sparse (s)", "sparse (MB)", "previous (s)", "previous (MB)"))
+    for n in args.sizes:
+        texts = make_texts(n, 2 * args.features)
+        # the results are not compared: on random texts the spectrum is flat, so that the
+        # (randomized) dense PCA and the exact sparse PCA may pick different components
+        res_new, t_new, mem_new = measure(new_vectorize_pca, texts, args.features)
+        res_old, t_old, mem_old = measure(old_vectorize_pca, texts, args.features)
+        print("{:>8} {:10.2f} {:12.1f} {:14.2f} {:14.1f}".format(n, t_new, mem_new, t_old, mem_old))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stylometry distance matrix and vectorization")
+    parser.add_argument('--task', default='distance', choices=['distance', 'memory'], help="What to benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=None, help="Numbers of texts")
+    parser.add_argument('--features', type=int, default=None, help="Number of features (mfi)")
+    parser.add_argument('--metric', default='minmax', choices=METRICS, help="Distance metric")
+    parser.add_argument('--old-max', type=int, default=500, help="Largest number of texts for which the old path is run")
+    args = parser.parse_args()
+
+    if args.task == 'memory':
+        args.sizes = args.sizes or [1000, 4000]
+        args.features = args.features or 10000
+        main_memory(args)
+        return
+    args.sizes = args.sizes or [500, 2000, 10000]
+    args.features = args.features or 200
+
+    print("metric={} features={}".format(args.metric, args.features))
+    print("{:>8} {:>12} {:>14} {:>10}".format("texts", "engine (s)", "previous (s)", "speed-up"))
+    old_ref = None
+    for n in args.sizes:
+        X = make_matrix(n, args.features)
+
+        start = time.perf_counter()
+        dm = pairwise_distance_matrix(X, metric=args.metric)
+        t_new = time.perf_counter() - start
+
+        if n <= args.old_max:
+            start = time.perf_counter()
+            dm_old = old_distance_matrix(X, args.metric)
+            t_old = time.perf_counter() - start
+            if not np.allclose(dm, dm_old):
+                print("WARNING: results differ for n={}".format(n))
+            old_ref = (n, t_old)
+            sOld = "{:14.3f}".format(t_old)
+        elif old_ref is not None:
+            # the number of pairs grows quadratically
+            t_old = old_ref[1] * (n / old_ref[0]) ** 2
+            sOld = "{:13.1f}*".format(t_old)
+        else:
+            t_old = None
+            sOld = "{:>14}".format("-")
+        sSpeed = "-" if t_old is None else "{:.0f}x".format(t_old / t_new)
+        print("{:>8} {:12.3f} {} {:>10}".format(n, t_new, sOld, sSpeed))
+    if old_ref is not None and max(args.sizes) > args.old_max:
+        print("* estimated from the measurement for {} texts".format(old_ref[0]))
+
+if __name__ == "__main__":
+    main()
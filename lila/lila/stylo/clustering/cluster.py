@@ -16,6 +16,7 @@ from itertools import combinations, product
 from . api import AbstractClusterer
 from . dendrogram import Dendrogram
 from . linkage import linkage_fn
+from . nnchain import nn_chain, NN_CHAIN_LINKAGES
 from . distance import *
 
 from sklearn.metrics.pairwise import pairwise_distances
@@ -165,6 +166,9 @@ class Clusterer(AbstractClusterer):
     have the smallest distance according to function LINKAGE. This continues
     until there is only one cluster.
     """
+    # Use the nearest-neighbour chain for the linkages that allow it
+    use_nn_chain = True
+
     def __init__(self, data, linkage='ward', num_clusters=1):
         self._num_clusters = num_clusters
         vector_ids = [[i] for i in range(len(data))]
@@ -172,6 +176,7 @@ class Clusterer(AbstractClusterer):
         numpy.fill_diagonal(data, numpy.inf)
         self._dist_matrix = data
         self.linkage = linkage_fn(linkage)
+        self.linkage_name = linkage
 
     def smallest_distance(self, clusters):
         """
@@ -198,6 +203,9 @@ class Clusterer(AbstractClusterer):
         ## if sum_ess and self.linkage.__name__ != "ward_link":
         ##     raise ValueError(
         ##         "Summing for method other than Ward makes no sense...")
+        if self.use_nn_chain and self.linkage_name in NN_CHAIN_LINKAGES:
+            self.cluster_nn_chain(verbose=verbose, sum_ess=sum_ess)
+            return
         clusters = copy.copy(self._dist_matrix)
         #clusters = self._dist_matrix
         summed_ess = 0.0
@@ -223,6 +231,33 @@ class Clusterer(AbstractClusterer):
             indices = indices[indices!=j]
             clusters = clusters.take(indices, axis=0).take(indices, axis=1)
 
+    def cluster_nn_chain(self, verbose=0, sum_ess=False):
+        """
+        Same as L{cluster}, but the merges are calculated with the
+        nearest-neighbour chain algorithm in O(n^2) instead of O(n^3).
+        The merges are then replayed on the dendrogram in order of
+        their distance, so that the dendrogram is the same.
+        """
+        merges = nn_chain(self._dist_matrix, self.linkage_name)
+        # The cluster that results from a merge is known by the slot of its second member
+        slots = list(range(len(self._dendrogram)))
+        summed_ess = 0.0
+        for a, b, best in merges:
+            if len(slots) <= max(self._num_clusters, 1):
+                break
+            if verbose >= 1:
+                print('k=%s' % len(slots))
+            pos_a, pos_b = slots.index(a), slots.index(b)
+            i, j = min(pos_a, pos_b), max(pos_a, pos_b)
+            if sum_ess:
+                summed_ess += best
+            else:
+                summed_ess = best
+            self._dendrogram.merge(i, j)
+            self._dendrogram[i].distance = summed_ess
+            slots[i] = b
+            del slots[j]
+
     def update_distmatrix(self, i, j, clusters):
         """
         Update the distance matrix using the specified linkage method so that
@@ -250,6 +285,9 @@ class VNClusterer(Clusterer):
     procedure, all clusters can be clustered with all other clusters. In this
     class, the clusters that are allowed to be clustered follow a specific order.
     """
+    # Only neighbouring clusters may merge: the NN-chain does not apply
+    use_nn_chain = False
+
     def __init__(self, data, linkage='ward', num_clusters=1):
         Clusterer.__init__(self, data, linkage, num_clusters=num_clusters)
 
@@ -258,11 +296,10 @@ class VNClusterer(Clusterer):
             yield i-1,i
 
     def smallest_distance(self, clusters):
-        best = None
-        for i, j in self.iterate_clusters(clusters):
-            if best is None or clusters[i][j] <= best[0]:
-                best = (clusters[i][j], i, j)
-        return best
+        # The pairs (i-1, i) lie on the first superdiagonal; on a tie the last pair wins
+        neighbours = numpy.diagonal(clusters, offset=1)
+        i = len(neighbours) - 1 - int(numpy.argmin(neighbours[::-1]))
+        return clusters[i, i+1], i, i+1
 
     def cluster(self, verbose=False):
         # we must sum the error sum of squares in order not to obtain
@@ -0,0 +1,107 @@
+# Hierarchical Agglomerative Cluster Analysis
+#
+# Nearest-neighbour chain implementation of the Lance-Williams updates.
+# See: Muellner, D., Modern hierarchical, agglomerative clustering
+# algorithms, arXiv:1109.2378, 2011.
+
+from __future__ import division
+import numpy as np
+
+# The linkage methods that satisfy the reducibility property: for those
+# the nearest-neighbour chain yields the same hierarchy as the greedy
+# 'merge the closest pair' procedure. Centroid and median do not.
+NN_CHAIN_LINKAGES = ('single', 'complete', 'average', 'ward')
+
+
+def _lance_williams(D, x, y, size, method):
+    """
+    Return the distances of the cluster that results from merging
+    clusters x and y to all other clusters (one vectorized row).
+    """
+    d_x, d_y, d_xy = D[x], D[y], D[x, y]
+    n_x, n_y = size[x], size[y]
+    if method == 'single':
+        return np.minimum(d_x, d_y)
+    elif method == 'complete':
+        return np.maximum(d_x, d_y)
+    elif method == 'average':
+        return (n_x * d_x + n_y * d_y) / (n_x + n_y)
+    elif method == 'ward':
+        n_xyk = n_x + n_y + size
+        return ((n_x + size) * d_x + (n_y + size) * d_y - size * d_xy) / n_xyk
+    raise ValueError("Linkage funtion '%s' is not supported by the NN-chain" % method)
+
+def nn_chain(dist_matrix, method='ward'):
+    """
+    Cluster a square distance matrix with the nearest-neighbour chain
+    algorithm, in O(n^2) time and memory.
+    @param dist_matrix: square matrix with the pairwise distances; the
+        diagonal is ignored and the matrix is not changed.
+    @type dist_matrix: C{numpy.ndarray}
+    @param method: one of L{NN_CHAIN_LINKAGES}
+    @type method: C{str}
+    @return: a list of (a, b, distance) tuples, one per merge, sorted by
+        distance. The clusters a and b are identified by the index of one
+        of their original members (a < b).
+    """
+    if not method in NN_CHAIN_LINKAGES:
+        raise ValueError("Linkage funtion '%s' is not supported by the NN-chain" % method)
+
+    D = np.array(dist_matrix, dtype=np.float64)
+    n = D.shape[0]
+    # Merged (inactive) clusters and the diagonal get an infinite distance
+    np.fill_diagonal(D, np.inf)
+    size = np.ones(n, dtype=np.float64)
+    active = np.ones(n, dtype=bool)
+    merges = []
+    chain = []
+
+    for step in range(n - 1):
+        if len(chain) == 0:
+            chain.append(int(np.argmax(active)))
+
+        # (1) Follow the nearest neighbours until two clusters are each other's nearest neighbour
+        while True:
+            x = chain[-1]
+            if len(chain) > 1:
+                y = chain[-2]
+                current = D[x, y]
+            else:
+                y = -1
+                current = np.inf
+            k = int(np.argmin(D[x]))
+            # On a tie the previous element of the chain is kept, otherwise the chain could cycle
+            if D[x, k] < current:
+                y = k
+            if len(chain) > 1 and y == chain[-2]:
+                break
+            if y < 0:
+                # Only inf (or nan) distances left: merge with any other active cluster
+                y = int(np.flatnonzero(active & (np.arange(n) != x))[0])
+                chain.append(y)
+                break
+            chain.append(y)
+
+        # (2) Merge the reciprocal nearest neighbours; the result takes slot y
+        chain.pop()
+        chain.pop()
+        if x > y:
+            x, y = y, x
+        merges.append((x, y, D[x, y]))
+        row = _lance_williams(D, x, y, size, method)
+        row[~active] = np.inf
+        row[x] = np.inf
+        row[y] = np.inf
+        D[y, :] = row
+        D[:, y] = row
+        D[x, :] = np.inf
+        D[:, x] = np.inf
+        size[y] += size[x]
+        active[x] = False
+
+    # (3) The chain finds the merges out of order: sort them by height (stable, so
+    #     a merge always follows the merges of its own subclusters)
+    order = sorted(range(len(merges)), key=lambda idx: merges[idx][2])
+    return [merges[idx] for idx in order]
+
+__all__ = ['NN_CHAIN_LINKAGES', 'nn_chain']
@@ -1,12 +1,16 @@
 
 import os
+import re
 import codecs
 import glob
+from array import array
 from operator import itemgetter
 from pkg_resources import resource_string
 import sys
 import pickle
 
+import numpy as np
+
 from lila.stylo.tokenize.regexp import WhitespaceTokenizer, RegexpTokenizer
 
 from lila.stylo.vectorization import Vectorizer
@@ -31,8 +35,65 @@ def get_tokenizer(option=None):
     else:
         raise ValueError('Invalid tokenization option: %s' %(option))
 
+# Characters that are removed by `preprocess(alpha_only=True)`:
+# everything that is neither alphabetic nor whitespace, apart
+# from the numbers that are not decimal digits (see `remove_non_alpha`)
+NON_ALPHA = re.compile(r'[^\w\s]+|[\d_]+')
+
+def remove_non_alpha(text):
+    """
+    Keep only the characters of [text] for which
+    `c.isalpha() or c.isspace()` holds.
+    """
+    text = NON_ALPHA.sub('', text)
+    if not text.isascii():
+        # \w also matches numbers such as '²' and '½'
+        text = ''.join([c for c in text if c.isalpha() or not c.isnumeric()])
+    return text
+
+
+class TokenizedTexts(object):
+    """
+    Read-only, list-like view on the tokenized texts of a corpus.
+    The tokens are stored as integer ids in one buffer: a text is
+    only turned into a list of strings when it is accessed.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def ids(self, idx):
+        """Return the token ids of text [idx] (a view on the buffer)"""
+        crp = self.corpus
+        return crp.token_ids[crp.starts[idx]:crp.stops[idx]]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        id2token = self.corpus.id2token
+        return [id2token[x] for x in self.ids(idx).tolist()]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __len__(self):
+        return len(self.corpus.starts)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
 class Corpus:
-    """Taken from pystyl"""
+    """Taken from pystyl
+
+    Unlike pystyl, the titles and categories are indexed by dictionaries,
+    and the tokenized texts are kept as integer ids in a single buffer
+    (`token_ids`), where text i runs from `starts[i]` to `stops[i]`.
+    Preprocessing is applied lazily, while the texts are tokenized.
+    """
 
     def __init__(self, texts=[], titles=[], target_ints=[],
                        target_idx=[], language=None, tokenized_texts=None):
@@ -41,13 +102,41 @@ class Corpus:
         that titles should be unique.
         """
         self.language = language
-        self.texts = texts
-        self.tokenized_texts = tokenized_texts
-        self.titles = titles                    # should be unique
-        self.target_ints = target_ints          # integers corresponding to category names
-        self.target_idx = target_idx            # actual category names as strings
+        self.texts = list(texts)
+        self.titles = list(titles)              # should be unique
+        self.target_ints = list(target_ints)    # integers corresponding to category names
+        self.target_idx = list(target_idx)      # actual category names as strings
+        self.title_index = {title: idx for idx, title in enumerate(self.titles)}
+        self.target_index = {name: idx for idx, name in enumerate(self.target_idx)}
         self.tokenizer_option = None
         self.vectorizer = None
+        # Preprocessing steps (alpha_only, lowercase) that are applied when tokenizing
+        self.preprocess_steps = []
+        # The vocabulary: token string <-> token id
+        self.vocabulary = {}
+        self.id2token = []
+        self.token_ids = None
+        self.starts = None
+        self.stops = None
+        self.tokenized_texts = tokenized_texts
+
+    @property
+    def tokenized_texts(self):
+        """The tokenized texts (a `TokenizedTexts` view), or None if not tokenized yet"""
+        if self.starts is None:
+            return None
+        return TokenizedTexts(self)
+
+    @tokenized_texts.setter
+    def tokenized_texts(self, tokenized_texts):
+        if tokenized_texts is None:
+            self.token_ids, self.starts, self.stops = None, None, None
+        else:
+            self.set_tokens(tokenized_texts)
+
+    def has_title(self, title):
+        """Check whether [title] is already in the corpus"""
+        return title in self.title_index
 
     def add_text(self, text, title, target_name):
         """
@@ -61,20 +150,30 @@ class Corpus:
         target_name : str
             Category of the text to be added.
         """
-        if title in self.titles:
+        if title in self.title_index:
             raise ValueError('Titles should be unique: %s is already in the corpus' %(title))
-        if target_name not in self.target_idx:
+        target_int = self.target_index.get(target_name)
+        if target_int is None:
+            target_int = len(self.target_idx)
             self.target_idx.append(target_name)
-                    
-        target_int = self.target_idx.index(target_name)
-                    
+            self.target_index[target_name] = target_int
+
+        self.title_index[title] = len(self.titles)
         self.texts.append(text)
         self.titles.append(title)
         self.target_ints.append(target_int)
 
+    def set_titles(self, titles, target_ints):
+        """Replace the titles and categories of the (tokenized) texts"""
+        self.titles = list(titles)
+        self.target_ints = list(target_ints)
+        self.title_index = {title: idx for idx, title in enumerate(self.titles)}
+
     def preprocess(self, alpha_only=True, lowercase=True):
         """
         Preprocess the (untokenized) texts in the corpus.
+        The preprocessing is applied when the texts are
+        tokenized, one text at a time (see `iter_texts`).
         Parameters
         ----------
         alpha_only : boolean, default=True
@@ -83,12 +182,47 @@ class Corpus:
         lowercase : boolean, default=True
             Whether or not to lowercase all characters.
         """
-        for idx, text in enumerate(self.texts):
-            if lowercase:
-                text = text.lower()
-            if alpha_only:
-                text = ''.join([c for c in text if c.isalpha() or c.isspace()])
-            self.texts[idx] = text
+        self.preprocess_steps.append((alpha_only, lowercase))
+
+    def iter_texts(self):
+        """
+        Generate the texts in the corpus, with the
+        preprocessing steps applied.
+        """
+        for text in self.texts:
+            for alpha_only, lowercase in self.preprocess_steps:
+                if lowercase:
+                    text = text.lower()
+                if alpha_only:
+                    text = remove_non_alpha(text)
+            yield text
+
+    def get_token_id(self, token):
+        """Return the id of [token], adding it to the vocabulary if needed"""
+        token_id = self.vocabulary.get(token)
+        if token_id is None:
+            token_id = len(self.id2token)
+            self.vocabulary[token] = token_id
+            self.id2token.append(token)
+        return token_id
+
+    def set_tokens(self, tokenized_texts):
+        """
+        Store (an iterable of) tokenized texts in
+        the buffer of token ids.
+        """
+        vocabulary = self.vocabulary
+        token_ids, starts, stops = array('i'), array('q'), array('q')
+        for tokens in tokenized_texts:
+            # first add the new tokens, so that the ids can be looked up in one go
+            for token in set(tokens).difference(vocabulary):
+                self.get_token_id(token)
+            starts.append(len(token_ids))
+            token_ids.extend(map(vocabulary.__getitem__, tokens))
+            stops.append(len(token_ids))
+        self.token_ids = np.frombuffer(token_ids, dtype=np.intc)
+        self.starts = np.frombuffer(starts, dtype=np.int64)
+        self.stops = np.frombuffer(stops, dtype=np.int64)
 
     def tokenize(self, min_size=0, max_size=0, tokenizer_option=None):
         """
@@ -124,16 +258,18 @@ class Corpus:
             self.tokenizer_option = tokenizer_option
         tokenizer = get_tokenizer(option=self.tokenizer_option)
 
-        self.tokenized_texts = []
-        for i, text in enumerate(self.texts):
-            tokens = tokenizer.tokenize(text)
-            if self.max_size:
-                tokens = tokens[:self.max_size] # cut
-            if self.min_size and len(tokens) < self.min_size:
-                print("Title: %s only has %d tokens (< min_size = %d) -> ignored" %
-                        (self.titles[i], len(tokens), min_size))
-                continue
-            self.tokenized_texts.append(tokens)
+        def generate_tokens():
+            for i, text in enumerate(self.iter_texts()):
+                tokens = tokenizer.tokenize(text)
+                if self.max_size:
+                    tokens = tokens[:self.max_size] # cut
+                if self.min_size and len(tokens) < self.min_size:
+                    print("Title: %s only has %d tokens (< min_size = %d) -> ignored" %
+                            (self.titles[i], len(tokens), min_size))
+                    continue
+                yield tokens
+
+        self.set_tokens(generate_tokens())
 
     def remove_tokens(self, rm_tokens=[], rm_pronouns=False, language=None):
         """
@@ -182,8 +318,15 @@ class Corpus:
             rm_tokens = set()
 
         rm = rm_tokens.union(pronouns)
-        for idx, text in enumerate(self.tokenized_texts):
-            self.tokenized_texts[idx] = [w for w in text if w.lower() not in rm]
+        rm_ids = [idx for idx, token in enumerate(self.id2token) if token.lower() in rm]
+        if len(rm_ids) == 0:
+            return
+        keep = ~np.isin(self.token_ids, rm_ids)
+        # the new position of each old position: works for overlapping segments as well
+        position = np.concatenate(([0], np.cumsum(keep)))
+        self.token_ids = self.token_ids[keep]
+        self.starts = position[self.starts]
+        self.stops = position[self.stops]
 
     def segment(self, segment_size=0, step_size=0):
         """
@@ -191,6 +334,8 @@ class Corpus:
         Subsequent calls will overwrite previous segmentations.
         Trailing tokens at the end of a text will be ignored
         if they cannot form an entire segment anymore.
+        The segments are windows on the token buffer:
+        the tokens themselves are not copied.
         Parameters
         ----------
         segment_size : int, default=0
@@ -226,21 +371,19 @@ class Corpus:
             if not self.step_size:
                 self.step_size = self.segment_size
 
-            tmp_texts, tmp_titles, tmp_target_ints = [], [], []
+            lengths = self.stops - self.starts
+            counts = np.where(lengths >= self.segment_size,
+                              (lengths - self.segment_size) // self.step_size + 1, 0)
+            text_idx = np.repeat(np.arange(len(counts)), counts)
+            # the number of the segment within its text (0-based)
+            sample = np.arange(len(text_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
 
-            for text, title, target_int in zip(self.tokenized_texts, self.titles, self.target_ints):
-                start_idx, end_idx, sample_cnt = 0, self.segment_size, 1
-                while end_idx <= len(text):
-                    tmp_texts.append(text[start_idx : end_idx])
-                    tmp_titles.append(title + "_" + str(sample_cnt))
-                    tmp_target_ints.append(target_int)
-                    # update:
-                    sample_cnt += 1
-                    start_idx += self.step_size
-                    end_idx += self.step_size
-
-            self.tokenized_texts, self.titles, self.target_ints = \
-                tmp_texts, tmp_titles, tmp_target_ints
+            starts = self.starts[text_idx] + sample * self.step_size
+            titles = [self.titles[idx] + "_" + str(cnt + 1) for idx, cnt in zip(text_idx.tolist(), sample.tolist())]
+            target_ints = [self.target_ints[idx] for idx in text_idx.tolist()]
+
+            self.starts, self.stops = starts, starts + self.segment_size
+            self.set_titles(titles, target_ints)
 
     def temporal_sort(self):
         """
@@ -260,12 +403,9 @@ class Corpus:
         if self.vectorizer:
             raise ValueError('You cannot sort the corpus after it has been vectorized')
 
-        zipped = [(int(self.target_idx[target_int]), text, title, target_int) \
-                       for text, title, target_int in \
-                            zip(self.tokenized_texts, self.titles, self.target_ints)]
-        zipped.sort(key=itemgetter(0), reverse=False)
-
-        _, self.tokenized_texts, self.titles, self.target_ints = zip(*zipped)
+        order = sorted(range(len(self.starts)), key=lambda idx: int(self.target_idx[self.target_ints[idx]]))
+        self.starts, self.stops = self.starts[order], self.stops[order]
+        self.set_titles([self.titles[idx] for idx in order], [self.target_ints[idx] for idx in order])
 
     def vectorize(self, mfi=500, ngram_type='word', ngram_size=1,
                  vector_space='tf', vocabulary=None,
@@ -292,14 +432,23 @@ class Corpus:
                                      min_df=min_df,
                                      max_df=max_df)
 
+        # The texts are streamed into the vectorizer, one at a time
         if ngram_type == 'word':
             self.vectorizer.vectorize(self.tokenized_texts)
         elif ngram_type in ('char', 'char_wb'):
-            self.vectorizer.vectorize(self.get_untokenized_texts())
+            self.vectorizer.vectorize(self.iter_untokenized_texts())
         else:
             raise ValueError('Unsupported feature type: %s' %(ngram_type))
         return self.vectorizer.feature_names
 
+    def iter_untokenized_texts(self):
+        """
+        Generate the tokenized texts in an untokenized version
+        (see `get_untokenized_texts`).
+        """
+        for tokens in self.tokenized_texts:
+            yield ' '.join(tokens)
+
     def get_untokenized_texts(self):
         """
         Get the tokenized texts in an untokenized version: 
@@ -311,7 +460,7 @@ class Corpus:
         untokenized_texts : list
             The names of the final features extracted by the vectorizer.
         """
-        return [' '.join(t) for t in self.tokenized_texts]
+        return list(self.iter_untokenized_texts())
 
     def __len__(self):
         """
@@ -1,3 +1,17 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import manhattan_distances, euclidean_distances
+from sklearn.preprocessing import normalize
+
+# Number of rows that are compared with the rest of the matrix at once
+BLOCK_SIZE = 512
+# Sparse input up to this number of elements (e.g. 10,000 texts x 400 mfi) is faster as dense array;
+# larger matrices (big vocabularies) stay sparse
+DENSE_LIMIT = 2 ** 22
+
+METRICS = ('manhattan', 'cityblock', 'euclidean', 'cosine', 'minmax', 'burrows')
+
+
 def minmax(x, y):
     mins, maxs = 0.0, 0.0
     for i in range(x.shape[0]):
@@ -10,4 +24,112 @@ def minmax(x, y):
             mins += a
     if maxs > 0.0:
         return 1.0 - (mins / maxs)
-    return 0.0
\ No newline at end of file
+    return 0.0
+
+def column_std(X):
+    """
+    Standard deviation of each column of a dense
+    or sparse matrix, without densifying it.
+    """
+    if sp.issparse(X):
+        mean = np.asarray(X.mean(axis=0)).ravel()
+        mean_sq = np.asarray(X.multiply(X).mean(axis=0)).ravel()
+        return np.sqrt(np.maximum(mean_sq - mean ** 2, 0.0))
+    return np.std(X, axis=0)
+
+def _prepare(X, metric):
+    """
+    Bring the matrix in the shape the block function of
+    the metric works with; returns the matrix and the
+    per-row values the metric needs (or None).
+    """
+    if sp.issparse(X) and X.shape[0] * X.shape[1] > DENSE_LIMIT:
+        X = sp.csr_matrix(X, dtype=np.float64)
+    elif sp.issparse(X):
+        X = X.toarray().astype(np.float64)
+    else:
+        X = np.asarray(X, dtype=np.float64)
+
+    extra = None
+    if metric == 'cosine':
+        # unit-length rows: the distance follows from a dot product
+        X = normalize(X, norm='l2', axis=1)
+    elif metric == 'minmax':
+        # the row sums: sum(min) and sum(max) follow from them and the manhattan distance
+        extra = np.asarray(X.sum(axis=1)).ravel()
+    elif metric == 'burrows':
+        # Delta is the mean manhattan distance between z-scores; the column means
+        # cancel out, so scaling by the standard deviation suffices (and keeps X sparse)
+        std = column_std(X)
+        weights = np.zeros_like(std)
+        weights[std > 0] = 1.0 / std[std > 0]
+        if sp.issparse(X):
+            X = sp.csr_matrix(X.multiply(weights.reshape(1, -1)))
+        else:
+            X = X * weights
+        extra = max(X.shape[1], 1)
+    return X, extra
+
+def _distance_block(A, B, metric, extra_a=None, extra_b=None):
+    """
+    Distances between the rows of A and the rows of B,
+    for matrices prepared by `_prepare`.
+    """
+    if metric in ('manhattan', 'cityblock'):
+        return manhattan_distances(A, B)
+    elif metric == 'euclidean':
+        return euclidean_distances(A, B)
+    elif metric == 'cosine':
+        sim = A @ B.T
+        if sp.issparse(sim):
+            sim = sim.toarray()
+        return np.clip(1.0 - sim, 0.0, 2.0)
+    elif metric == 'minmax':
+        # min(a,b) = (a+b-|a-b|)/2 and max(a,b) = (a+b+|a-b|)/2
+        l1 = manhattan_distances(A, B)
+        sums = extra_a.reshape(-1, 1) + extra_b.reshape(1, -1)
+        maxs = (sums + l1) / 2.0
+        mins = (sums - l1) / 2.0
+        dist = np.zeros_like(l1)
+        np.divide(mins, maxs, out=dist, where=maxs > 0.0)
+        return np.where(maxs > 0.0, 1.0 - dist, 0.0)
+    elif metric == 'burrows':
+        return manhattan_distances(A, B) / extra_a
+    raise ValueError('Unsupported distance metric: %s' %(metric))
+
+def pairwise_distance_matrix(X, metric='manhattan', block_size=BLOCK_SIZE):
+    """
+    Calculate the square distance matrix between the rows
+    of X in blocks of rows, using vectorized operations.
+    Parameters
+    ----------
+    X : array-like or sparse matrix, [n_texts, n_features]
+        The vectorized texts. Sparse input is only densified
+        when it has no more than DENSE_LIMIT elements.
+    metric : str, default='manhattan'
+        One of 'manhattan', 'cityblock', 'euclidean', 'cosine',
+        'minmax' or 'burrows' (Burrows's Delta).
+    block_size : int, default=BLOCK_SIZE
+        The number of rows handled per block; limits the
+        temporary memory to [block_size, n_texts].
+    Returns
+    ----------
+    distance_matrix : 2D-array, [n_texts, n_texts]
+    """
+    if not metric in METRICS:
+        raise ValueError('Unsupported distance metric: %s' %(metric))
+
+    X, extra = _prepare(X, metric)
+    n = X.shape[0]
+    dm = np.zeros((n, n), dtype=np.float64)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        # only the blocks on and above the diagonal: the matrix is symmetric
+        if metric == 'minmax':
+            block = _distance_block(X[start:stop], X[start:], metric, extra[start:stop], extra[start:])
+        else:
+            block = _distance_block(X[start:stop], X[start:], metric, extra, extra)
+        dm[start:stop, start:] = block
+        dm[start:, start:stop] = block.T
+    np.fill_diagonal(dm, 0.0)
+    return dm
@@ -23,3 +23,136 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class DistanceMatrixTests(TestCase):
+    """The blocked distance engine must give the same results as the per-pair metrics"""
+
+    def test_distance_matrix(self):
+        import numpy as np
+        import scipy.sparse as sp
+        from sklearn.metrics.pairwise import pairwise_distances
+        from lila.stylo import distance_metrics
+        from lila.stylo.analysis import distance_matrix
+
+        rng = np.random.RandomState(1)
+        X = rng.poisson(0.7, size=(37, 25)).astype(float)
+        X[3] = 0.0
+        # Burrows's Delta: mean absolute difference of the z-scores
+        Z = (X - X.mean(axis=0)) / X.std(axis=0)
+        dense_limit = distance_metrics.DENSE_LIMIT
+        try:
+            for limit in (dense_limit, 0):
+                # With limit 0 the sparse input stays sparse
+                distance_metrics.DENSE_LIMIT = limit
+                for metric in ('manhattan', 'euclidean', 'cosine', 'minmax', 'burrows'):
+                    if metric == 'burrows':
+                        expected = pairwise_distances(Z, metric='manhattan') / X.shape[1]
+                    else:
+                        expected = pairwise_distances(X, metric=distance_metrics.minmax if metric == 'minmax' else metric)
+                    for Xin in (X, sp.csr_matrix(X)):
+                        self.assertTrue(np.allclose(distance_matrix(X=Xin, metric=metric), expected), metric)
+                        dm = distance_metrics.pairwise_distance_matrix(Xin, metric=metric, block_size=10)
+                        self.assertTrue(np.allclose(dm, expected), metric)
+        finally:
+            distance_metrics.DENSE_LIMIT = dense_limit
+
+
+class ClusteringTests(TestCase):
+    """The nearest-neighbour chain must build the same dendrogram as the stepwise clusterer"""
+
+    def test_nn_chain(self):
+        import numpy as np
+        from scipy.cluster.hierarchy import linkage
+        from scipy.spatial.distance import squareform
+        from sklearn.metrics.pairwise import pairwise_distances
+        from lila.stylo.clustering.cluster import Clusterer
+
+        rng = np.random.RandomState(3)
+        D = pairwise_distances(rng.rand(40, 5))
+        # The stepwise clusterer assumes an exactly symmetric matrix
+        D = (D + D.T) / 2.0
+        for method in ('single', 'complete', 'average', 'ward'):
+            for num_clusters in (1, 3):
+                fast = Clusterer(D.copy(), linkage=method, num_clusters=num_clusters)
+                fast.cluster()
+                slow = Clusterer(D.copy(), linkage=method, num_clusters=num_clusters)
+                slow.use_nn_chain = False
+                slow.cluster()
+                self.assertEqual([sorted(x.id for x in node.leaves()) for node in fast.dendrogram],
+                                 [sorted(x.id for x in node.leaves()) for node in slow.dendrogram], method)
+                self.assertTrue(np.allclose([node.distance for node in fast.dendrogram],
+                                            [node.distance for node in slow.dendrogram]), method)
+                if num_clusters == 1:
+                    Z = fast.dendrogram.to_linkage_matrix()
+                    self.assertTrue(np.allclose(Z, slow.dendrogram.to_linkage_matrix()), method)
+                    if method != 'ward':
+                        # scipy applies Ward's update to the squared distances; the other heights must agree
+                        expected = linkage(squareform(D, checks=False), method)
+                        self.assertTrue(np.allclose(Z[:, 2], expected[:, 2]), method)
+
+
+class SparseVectorizationTests(TestCase):
+    """Sparse input must give the same scaling and PCA as dense input"""
+
+    def test_sparse_scaling_pca(self):
+        import numpy as np
+        import scipy.sparse as sp
+        from sklearn.decomposition import PCA
+        from lila.stylo.analysis import sparse_pca
+        from lila.stylo.vectorization import StdDevScaler
+
+        X = sp.random(60, 300, density=0.1, format='csr', random_state=2)
+        dense = X.toarray()
+        # Column 0 is constant: it is not scaled
+        dense[:, 0] = 0.5
+        X = sp.csr_matrix(dense)
+
+        scaled = StdDevScaler().fit_transform(X.copy())
+        self.assertTrue(sp.isspmatrix_csr(scaled))
+        expected = StdDevScaler().fit_transform(dense.copy())
+        self.assertTrue(np.allclose(scaled.toarray(), expected))
+        self.assertTrue(np.allclose(expected[:, 0], 0.5))
+
+        pca_matrix, pca_loadings = sparse_pca(X, nb_dimensions=3)
+        prin_comp = PCA(n_components=3, svd_solver='full')
+        expected = prin_comp.fit_transform(dense)
+        # The components are only defined up to their sign
+        self.assertTrue(np.allclose(np.abs(pca_matrix), np.abs(expected)))
+        self.assertTrue(np.allclose(np.abs(pca_loadings), np.abs(prin_comp.components_.T)))
+
+        # As many components as texts: ARPACK cannot do that, dense PCA can
+        pca_matrix, pca_loadings = sparse_pca(X[:2], nb_dimensions=2)
+        self.assertEqual(pca_matrix.shape, (2, 2))
+        self.assertEqual(pca_loadings.shape, (300, 2))
+
+
+class CorpusTests(TestCase):
+    """The corpus keeps token ids in a buffer, but must behave like lists of tokens"""
+
+    def test_corpus(self):
+        from lila.stylo.corpus import Corpus
+
+        corpus = Corpus(texts=[], titles=[], target_ints=[], target_idx=[])
+        corpus.add_text("In principio erat Verbum, et Verbum erat apud Deum 12", "jn1", "Johannes")
+        corpus.add_text("Omnia per ipsum facta sunt: et sine ipso factum est nihil", "jn3", "Johannes")
+        corpus.add_text("Liber generationis Iesu Christi² filii½ David", "mt1", "Matthaeus")
+        self.assertRaises(ValueError, corpus.add_text, "", "mt1", "Matthaeus")
+        self.assertTrue(corpus.has_title("jn3"))
+        self.assertEqual(corpus.target_ints, [0, 0, 1])
+
+        corpus.preprocess(alpha_only=True, lowercase=True)
+        corpus.tokenize()
+        self.assertEqual(corpus.tokenized_texts[0], "in principio erat verbum et verbum erat apud deum".split())
+        corpus.remove_tokens(rm_tokens=["ET", "Verbum"])
+        self.assertEqual(list(corpus.tokenized_texts), [
+            "in principio erat erat apud deum".split(),
+            "omnia per ipsum facta sunt sine ipso factum est nihil".split(),
+            "liber generationis iesu christi filii david".split()])
+
+        corpus.segment(segment_size=4, step_size=2)
+        self.assertEqual(corpus.titles, ["jn1_1", "jn1_2", "jn3_1", "jn3_2", "jn3_3", "jn3_4", "mt1_1", "mt1_2"])
+        self.assertEqual(corpus.tokenized_texts[1], "erat erat apud deum".split())
+        self.assertEqual(corpus.tokenized_texts[-1], "iesu christi filii david".split())
+        self.assertEqual(corpus.target_ints, [0, 0, 0, 0, 0, 0, 1, 1])
+        self.assertEqual(len(corpus), 8)
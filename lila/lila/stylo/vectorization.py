@@ -9,12 +9,23 @@ from sklearn.preprocessing import StandardScaler, MinMaxScaler
 import scipy.sparse as sp
 import numpy as np
 
+from . distance_metrics import column_std
+
 def identity(y):
     """
     Simple identity function.
     """
     return y
 
+def get_feature_names(vectorizer):
+    """
+    Feature names of a fitted sklearn vectorizer
+    (`get_feature_names` was renamed in sklearn 1.0).
+    """
+    if hasattr(vectorizer, 'get_feature_names_out'):
+        return vectorizer.get_feature_names_out().tolist()
+    return vectorizer.get_feature_names()
+
 
 class StdDevScaler(BaseEstimator, TransformerMixin):
     """
@@ -37,12 +48,13 @@ class StdDevScaler(BaseEstimator, TransformerMixin):
         ----------
         X : array-like, shape [n_samples, n_features]
             The data used to compute the column-wise
-            standard deviation. Acceprs
+            standard deviation. Accepts sparse input,
+            which is not densified: the deviations
+            follow from the sparse moments.
         """
-        if sp.isspmatrix_csr(X):
-            self.weights_ = np.std(X.toarray(), axis=0)
-        else:
-            self.weights_ = np.std(X, axis=0)
+        self.weights_ = column_std(X)
+        # Constant columns are left as they are, instead of becoming inf or nan
+        self.scale_ = np.where(self.weights_ > 0.0, self.weights_, 1.0)
         return self
 
     def transform(self, X):
@@ -63,13 +75,20 @@ class StdDevScaler(BaseEstimator, TransformerMixin):
         ----------
         X = array-like, shape [n_samples, n_features]
             The scaled input data in sparse format.
+        Notes
+        ----------
+        Like dense input, sparse input is scaled in place:
+        only the stored (non-zero) values are divided.
         """
-        if sp.isspmatrix_csr(X):
-            X = X.toarray()
-            X /= self.weights_
-            return sp.csr_matrix(X)
+        if sp.issparse(X):
+            if not sp.isspmatrix_csr(X):
+                X = sp.csr_matrix(X)
+            if not np.issubdtype(X.dtype, np.floating):
+                X = X.astype(np.float64)
+            X.data /= self.scale_[X.indices]
+            return X
         else:
-            X /= self.weights_
+            X /= self.scale_
             return X
 
     def fit_transform(self, X, y=None):
@@ -205,7 +224,7 @@ class Vectorizer:
             Vectorized texts in sparse format.
         """
         self.transformer.fit(texts)
-        self.feature_names = self.transformer.named_steps['s1'].get_feature_names()
+        self.feature_names = get_feature_names(self.transformer.named_steps['s1'])
 
     def transform(self, texts):
         """
@@ -244,7 +263,7 @@ class Vectorizer:
         """
         self.X = self.transformer.fit_transform(texts)
         # extract names for later convenience:
-        self.feature_names = self.transformer.named_steps['s1'].get_feature_names()
+        self.feature_names = get_feature_names(self.transformer.named_steps['s1'])
         return self.X
 
     vectorize = fit_transform